@@ -60,11 +60,22 @@ def main():
                 logger.error(f"❌ فشل إصلاح قاعدة البيانات: {e2}")
                 raise
         
+        # قناة التغييرات بين محطات العمل (إبطال الذاكرات وتحديث الشاشات فوراً)
+        from database.change_feed import change_feed
+        change_feed.start()
+
         # تشغيل نافذة تسجيل الدخول
         from ui.login_window import LoginWindow
         login_window = LoginWindow()
         login_window.run()
         
+        # كتابة سجلات النشاط المتبقية في الطابور قبل الخروج
+        from auth.audit_writer import audit_writer
+        audit_writer.shutdown()
+        change_feed.stop()
+        from modules.report_snapshots import report_scheduler
+        report_scheduler.stop()
+        
     except Exception as e:
         logger.error(f"خطأ في تشغيل البرنامج: {e}")
         messagebox.showerror("خطأ تشغيل", f"فشل تشغيل البرنامج: {str(e)}")
@@ -0,0 +1,323 @@
+# auth/audit_writer.py
+"""
+كاتب سجل النشاطات غير المتزامن.
+
+تُوضع سجلات النشاط في طابور داخل الذاكرة ويكتبها خيط خلفي إلى جدول
+activity_logs على دفعات (INSERT متعدد الصفوف) عند بلوغ حجم الدفعة أو
+انقضاء المهلة، وتُكتب المتبقية عند إغلاق البرنامج. إذا تعذر الوصول
+لقاعدة البيانات تُحفظ السجلات في ملف انتظار محلي (JSON Lines) ويُعاد
+إرسالها على دفعات مع أول كتابة ناجحة.
+
+إذا رُفضت دفعة بسبب خطأ في البيانات (مستخدم غير موجود، نص أطول من العمود،
+عنوان IP غير صالح...) تُعاد صفاً صفاً، ويُعزل الصف المرفوض في ملف رفض منفصل
+بدلاً من ملف الانتظار، فلا يوقف سجل تالف واحد الكتابة لما بعده.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from config.settings import AUDIT_LOG_CONFIG
+from database.connection import db
+
+logger = logging.getLogger(__name__)
+
+# الأعمدة الموجودة دائماً في activity_logs
+BASE_COLUMNS = ('user_id', 'action_type', 'description', 'ip_address', 'created_at')
+# أعمدة اختيارية تُضاف عند وجودها في الجدول
+SNAPSHOT_COLUMNS = ('before_snapshot', 'after_snapshot')
+
+# أخطاء البيانات: إعادة المحاولة لن تنجح، فالصف يُعزل بدلاً من انتظاره
+DATA_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError)
+
+_FLUSH = object()
+_STOP = object()
+
+
+class AuditLogWriter:
+    """كتابة سجلات النشاط على دفعات في خيط خلفي - Thread-safe"""
+
+    def __init__(self, db_obj=None, config: Optional[Dict[str, Any]] = None):
+        cfg = dict(AUDIT_LOG_CONFIG)
+        cfg.update(config or {})
+        self.db = db_obj if db_obj is not None else db
+        self.batch_size = max(1, int(cfg.get('batch_size', 100)))
+        self.flush_interval = float(cfg.get('flush_interval', 2.0))
+        self.spool_file = cfg.get('spool_file')
+        self.reject_file = cfg.get('reject_file')
+
+        self._queue = queue.Queue(maxsize=int(cfg.get('queue_max_size', 0)))
+        self._columns = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._spool_lock = threading.Lock()
+        self._reject_lock = threading.Lock()
+        self._stopped = False
+
+    # ------------------------------------------------------------------
+    # الواجهة العامة
+    # ------------------------------------------------------------------
+    def start(self):
+        """تشغيل الخيط الخلفي (مرة واحدة) وتحديد بنية الجدول"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped = False
+            self._thread = threading.Thread(
+                target=self._run, name='AuditLogWriter', daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    def log(self, user_id, action_type, description, ip_address=None,
+            before_snapshot=None, after_snapshot=None):
+        """إضافة سجل إلى الطابور دون انتظار قاعدة البيانات"""
+        record = {
+            'user_id': user_id,
+            'action_type': action_type,
+            'description': description,
+            'ip_address': ip_address,
+            'before_snapshot': before_snapshot,
+            'after_snapshot': after_snapshot,
+            # وقت الحدث الفعلي وليس وقت الكتابة
+            'created_at': datetime.now().isoformat(sep=' '),
+        }
+
+        if self._stopped:
+            # بعد الإغلاق: كتابة مباشرة إلى ملف الانتظار
+            self._spool([record])
+            return
+
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            logger.warning("طابور سجل النشاطات ممتلئ - حفظ السجل في ملف الانتظار")
+            self._spool([record])
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """كتابة كل السجلات المنتظرة الآن والانتظار حتى تنتهي"""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        self._queue.put((_FLUSH, done))
+        return done.wait(timeout)
+
+    def shutdown(self, timeout: float = 10.0):
+        """إيقاف الخيط بعد كتابة المتبقي (يُستدعى تلقائياً عند الخروج)"""
+        if self._stopped:
+            return
+        self._stopped = True
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.warning("انتهت مهلة إغلاق كاتب سجل النشاطات قبل كتابة كل السجلات")
+
+    # ------------------------------------------------------------------
+    # الخيط الخلفي
+    # ------------------------------------------------------------------
+    def _run(self):
+        batch: List[Dict[str, Any]] = []
+        deadline = None
+
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                batch.extend(self._drain())
+                self._write(batch)
+                return
+
+            if isinstance(item, tuple) and item and item[0] is _FLUSH:
+                batch.extend(self._drain())
+                self._write(batch)
+                batch, deadline = [], None
+                item[1].set()
+                continue
+
+            if item is not None:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._write(batch)
+                batch, deadline = [], None
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        """سحب كل السجلات الموجودة في الطابور (مع تنفيذ طلبات flush المعلقة)"""
+        items = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return items
+            if isinstance(item, dict):
+                items.append(item)
+            elif isinstance(item, tuple) and item and item[0] is _FLUSH:
+                item[1].set()
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        """كتابة دفعة إلى قاعدة البيانات أو إلى ملف الانتظار عند تعذر الاتصال"""
+        try:
+            self._replay_spool()
+        except Exception as e:
+            logger.error(f"تعذر إعادة إرسال ملف انتظار سجل النشاطات: {e}")
+            self._spool(batch)
+            return
+
+        for start in range(0, len(batch), self.batch_size):
+            try:
+                self._insert_chunk(batch[start:start + self.batch_size])
+            except Exception as e:
+                logger.error(f"تعذر كتابة سجل النشاطات إلى قاعدة البيانات: {e}")
+                self._spool(batch[start:])
+                return
+
+    def _detect_columns(self, cursor) -> tuple:
+        """تحديد أعمدة activity_logs مرة واحدة"""
+        if self._columns is None:
+            cursor.execute("""
+                SELECT column_name
+                FROM information_schema.columns
+                WHERE table_name = 'activity_logs'
+            """)
+            existing = {row['column_name'] for row in cursor.fetchall()}
+            self._columns = BASE_COLUMNS + tuple(
+                c for c in SNAPSHOT_COLUMNS if c in existing
+            )
+        return self._columns
+
+    def _insert(self, records: List[Dict[str, Any]]):
+        with self.db.get_cursor() as cursor:
+            columns = self._detect_columns(cursor)
+            execute_values(
+                cursor,
+                f"INSERT INTO activity_logs ({', '.join(columns)}) VALUES %s",
+                [tuple(r.get(c) for c in columns) for r in records],
+            )
+
+    def _insert_chunk(self, records: List[Dict[str, Any]]):
+        """
+        كتابة دفعة واحدة؛ عند خطأ بيانات تُعاد صفاً صفاً ويُعزل الصف المرفوض.
+        أخطاء الاتصال وغيرها تُرفع ليحفظ المستدعي الدفعة في ملف الانتظار.
+        """
+        try:
+            self._insert(records)
+            return
+        except DATA_ERRORS as e:
+            if len(records) == 1:
+                self._reject(records, e)
+                return
+            logger.warning(f"رفض دفعة سجل النشاطات ({e}) - إعادة الكتابة صفاً صفاً")
+
+        for record in records:
+            try:
+                self._insert([record])
+            except DATA_ERRORS as e:
+                self._reject([record], e)
+
+    # ------------------------------------------------------------------
+    # ملف الانتظار
+    # ------------------------------------------------------------------
+    def _spool(self, records: List[Dict[str, Any]]):
+        if not records or not self.spool_file:
+            return
+        try:
+            with self._spool_lock:
+                with open(self.spool_file, 'a', encoding='utf-8') as f:
+                    for record in records:
+                        f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+            logger.warning(f"تم حفظ {len(records)} سجل نشاط في ملف الانتظار: {self.spool_file}")
+        except Exception as e:
+            logger.error(f"فشل حفظ سجل النشاطات في ملف الانتظار: {e}", exc_info=True)
+
+    def _reject(self, records: List[Dict[str, Any]], error: Exception):
+        """عزل سجلات رفضتها قاعدة البيانات في ملف الرفض (لا يُعاد إرسالها)"""
+        logger.error(f"رفض سجل نشاط بسبب خطأ في البيانات: {error}")
+        if not self.reject_file:
+            return
+        try:
+            with self._reject_lock:
+                with open(self.reject_file, 'a', encoding='utf-8') as f:
+                    for record in records:
+                        line = dict(record, rejected_error=str(error).strip(),
+                                    rejected_at=datetime.now().isoformat(sep=' '))
+                        f.write(json.dumps(line, ensure_ascii=False, default=str) + '\n')
+        except Exception as e:
+            logger.error(f"فشل حفظ سجل النشاط المرفوض في ملف الرفض: {e}", exc_info=True)
+
+    def _replay_spool(self):
+        """
+        إعادة إرسال السجلات المحفوظة محلياً على دفعات. الملف يُنقل جانباً (.replay)
+        تحت القفل ثم يُرسل دون القفل؛ عند انقطاع الاتصال يُعاد ما لم يُرسل فقط إلى
+        بداية ملف الانتظار، ويُرفع الاستثناء.
+        """
+        if not self.spool_file:
+            return
+        replay_file = self.spool_file + '.replay'
+        with self._spool_lock:
+            # ملف .replay متبقٍ من إعادة إرسال انقطعت يُرسل أولاً
+            if not os.path.exists(replay_file):
+                if not os.path.exists(self.spool_file):
+                    return
+                os.replace(self.spool_file, replay_file)
+            records = self._read_spool(replay_file)
+
+        sent = 0
+        try:
+            for sent in range(0, len(records), self.batch_size):
+                self._insert_chunk(records[sent:sent + self.batch_size])
+            sent = len(records)
+        finally:
+            remaining = records[sent:]
+            with self._spool_lock:
+                if remaining:
+                    # ما لم يُرسل يسبق ما أُضيف لملف الانتظار أثناء الإرسال
+                    tmp_file = self.spool_file + '.tmp'
+                    with open(tmp_file, 'w', encoding='utf-8') as out:
+                        for record in remaining:
+                            out.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+                        if os.path.exists(self.spool_file):
+                            with open(self.spool_file, 'r', encoding='utf-8') as newer:
+                                shutil.copyfileobj(newer, out)
+                    os.replace(tmp_file, self.spool_file)
+                os.remove(replay_file)
+        if records:
+            logger.info(f"تمت إعادة إرسال {len(records)} سجل نشاط من ملف الانتظار")
+
+    @staticmethod
+    def _read_spool(path: str) -> List[Dict[str, Any]]:
+        records = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    logger.warning(f"تجاهل سطر تالف في ملف انتظار سجل النشاطات: {line[:80]}")
+        return records
+
+
+# كاتب مشترك للتطبيق
+audit_writer = AuditLogWriter()
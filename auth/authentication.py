@@ -8,9 +8,11 @@ import json  # أضف هذا الاستيراد
 from config.settings import SECRET_KEY
 from auth.session import Session
 from auth.permissions import require_permission
+from auth.audit_writer import AuditLogWriter, audit_writer
 import os
 # إزالة: from db import transaction, get_cursor
 from database.connection import db  # استخدام db فقط من هنا
+from database.reference_data import reference_data, USERS
 
 logger = logging.getLogger(__name__)
 
@@ -185,6 +187,7 @@ class Authentication:
                 ))
                 result = cursor.fetchone()
                 user_id = result['id'] if result else None
+            reference_data.invalidate(USERS)
 
             # تسجيل النشاط إن كان performed_by موجوداً
             if performed_by:
@@ -212,46 +215,30 @@ class Authentication:
     
     def log_activity(self, user_id, action, description, db_connection=None, 
                      ip_address=None, request_id=None, before_snapshot=None, after_snapshot=None):
-        """تسجيل نشاط المستخدم مع معلومات إضافية"""
+        """تسجيل نشاط المستخدم مع معلومات إضافية
+
+        يُضاف السجل إلى طابور كاتب السجلات الخلفي ويُكتب على دفعات، فلا ينتظر
+        المستخدم قاعدة البيانات. عند تمرير db_connection يُكتب السجل مباشرة عبره.
+        """
         try:
-            # استخدام db من database.connection إذا لم يتم تمرير اتصال
-            db_obj = db_connection if db_connection is not None else db
-            
-            with db_obj.get_cursor() as cursor:
-                # التحقق من وجود الأعمدة أولاً
-                cursor.execute("""
-                    SELECT column_name 
-                    FROM information_schema.columns 
-                    WHERE table_name = 'activity_logs'
-                """)
-                
-                columns = [row['column_name'] for row in cursor.fetchall()]
-                
-                if 'before_snapshot' in columns and 'after_snapshot' in columns:
-                    cursor.execute("""
-                        INSERT INTO activity_logs 
-                        (user_id, action_type, description, ip_address, before_snapshot, after_snapshot, created_at)
-                        VALUES (%s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
-                    """, (
-                        user_id,
-                        action,
-                        description,
-                        ip_address,
-                        before_snapshot,
-                        after_snapshot
-                    ))
-                else:
-                    # استخدام الاستعلام البسيط
-                    cursor.execute("""
-                        INSERT INTO activity_logs 
-                        (user_id, action_type, description, ip_address, created_at)
-                        VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
-                    """, (
-                        user_id,
-                        action,
-                        description,
-                        ip_address
-                    ))
+            if db_connection is None:
+                audit_writer.log(
+                    user_id, action, description,
+                    ip_address=ip_address,
+                    before_snapshot=before_snapshot,
+                    after_snapshot=after_snapshot
+                )
+                return
+
+            AuditLogWriter(db_obj=db_connection)._insert([{
+                'user_id': user_id,
+                'action_type': action,
+                'description': description,
+                'ip_address': ip_address,
+                'before_snapshot': before_snapshot,
+                'after_snapshot': after_snapshot,
+                'created_at': datetime.now()
+            }])
         except Exception as e:
             logger.error(f"خطأ في تسجيل النشاط: {e}", exc_info=True)
             
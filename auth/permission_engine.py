@@ -7,6 +7,7 @@
 """
 
 from database.connection import db
+from database.change_feed import change_feed, RESET
 import logging
 import time
 from typing import Optional, List, Dict, Any
@@ -19,7 +20,11 @@ class PermissionEngine:
     def __init__(self):
         self.db = db
         self._permissions_cache = {}  # user_id -> (timestamp, permissions_dict)
-        self._cache_ttl = 30  # seconds
+        self._cache_ttl = 30  # seconds (عند انقطاع قناة التغييرات فقط)
+        self._cache_generation = 0  # يزداد مع كل إبطال حتى لا يُخزَّن تحميل سبق الإبطال
+        
+        # مع قناة التغييرات تبقى الصلاحيات في الكاش حتى يصل إشعار بتعديلها
+        change_feed.subscribe(('role_permissions', 'user_permissions', 'users'), self._on_changes)
         
         # تأكد من هيكل الجدول عند بداية التشغيل
         self._ensure_permissions_table_structure()
@@ -82,7 +87,7 @@ class PermissionEngine:
         # 2. إذا لم يتم تمرير الدور، نحاول الحصول عليه من الكاش أولاً
         if user_role is None:
             cached = self._permissions_cache.get(user_id)
-            if cached and (time.time() - cached[0]) < self._cache_ttl:
+            if self._is_fresh(cached):
                 cached_role = cached[1].get('_role')
                 if cached_role == 'admin':
                     logger.debug(f"المستخدم {user_id} في الكاش هو admin، لديه كل الصلاحيات")
@@ -310,10 +315,11 @@ class PermissionEngine:
         """
         # 1. التحقق من الكاش أولاً
         cached = self._permissions_cache.get(user_id)
-        if cached and (time.time() - cached[0]) < self._cache_ttl:
+        if self._is_fresh(cached):
             logger.debug(f"استخدام صلاحيات الكاش للمستخدم {user_id}")
             return cached[1]
         
+        generation = self._cache_generation
         permissions = {}
         
         try:
@@ -357,12 +363,28 @@ class PermissionEngine:
         if not permissions:
             permissions = self._get_user_permissions_old(user_id)
         
-        # 4. تخزين في الكاش
-        self._permissions_cache[user_id] = (time.time(), permissions)
+        # 4. تخزين في الكاش (إلا إذا وصل إبطال أثناء التحميل)
+        if generation == self._cache_generation:
+            self._permissions_cache[user_id] = (time.time(), permissions)
         logger.debug(f"تم تخزين صلاحيات المستخدم {user_id} في الكاش ({len(permissions)} صلاحية)")
         
         return permissions
     
+    def _is_fresh(self, cached) -> bool:
+        """الكاش صالح دائماً والقناة متصلة، وإلا حسب مدة الصلاحية"""
+        return bool(cached) and (change_feed.live or (time.time() - cached[0]) < self._cache_ttl)
+
+    def _on_changes(self, table: str, changes: List[Dict[str, Any]]):
+        """إبطال الكاش حسب إشعارات قناة التغييرات (من خيط الاستماع)"""
+        self._cache_generation += 1
+        if table == 'user_permissions' and all(c['op'] != RESET for c in changes):
+            for change in changes:
+                if change['key'] is not None:
+                    self._permissions_cache.pop(change['key'], None)
+        else:
+            # تغيير صلاحيات دور أو دور مستخدم: الكاش صغير، نمسحه كله
+            self._permissions_cache.clear()
+
     def clear_cache(self, user_id: int | None = None):
         """مسح الكاش إما لمستخدم محدد أو الكل"""
         if user_id is None:
@@ -21,6 +21,8 @@ class Session:
     
     _local = threading.local()
     _last_refresh = {}  # {user_id: timestamp} آخر وقت تم فيه تحديث الجلسة
+    _stale_users = set()  # مستخدمون وصل إشعار بتعديلهم عبر قناة التغييرات
+    _watching = False
 
     @classmethod
     def login(cls, user: Dict[str, Any]):
@@ -36,6 +38,8 @@ class Session:
         if user:
             user_id = user.get('id')
             cls._last_refresh[user_id] = time.time()
+            cls._stale_users.discard(user_id)
+            cls._watch_user_changes()
         logger.info(f"تم تسجيل دخول المستخدم: {user.get('username')} (ID: {user.get('id')})")
 
     @classmethod
@@ -71,10 +75,28 @@ class Session:
         """
         return cls.get_current_user()
 
+    @classmethod
+    def _watch_user_changes(cls):
+        """الاشتراك في تغييرات جدول users (مرة واحدة) لتعليم الجلسات التي تحتاج تحديثاً"""
+        if cls._watching:
+            return
+        from database.change_feed import change_feed, RESET
+
+        def on_changes(table, changes):
+            for change in changes:
+                if change['op'] == RESET:
+                    cls._stale_users.update(cls._last_refresh.keys())
+                elif change['id'] is not None:
+                    cls._stale_users.add(change['id'])
+
+        change_feed.subscribe('users', on_changes)
+        cls._watching = True
+
     @classmethod
     def refresh_user_data(cls, force: bool = False) -> bool:
         """تحديث بيانات المستخدم من قاعدة البيانات"""
         from database.connection import db
+        from database.change_feed import change_feed
         
         user = cls.current_user
         if not user:
@@ -84,12 +106,18 @@ class Session:
         if not user_id:
             return False
         
-        # التحقق من وقت آخر تحديث (كل 10 ثوانٍ كحد أدنى)
+        # مع قناة التغييرات لا نستعلم إلا إذا وصل إشعار بتعديل المستخدم،
+        # وبدونها: كل 10 ثوانٍ كحد أدنى
         last_time = cls._last_refresh.get(user_id, 0)
         current_time = time.time()
         
-        if not force and (current_time - last_time) < 10:
-            return False  # لم يمر وقت كافٍ منذ آخر تحديث
+        if not force:
+            if change_feed.live:
+                if user_id not in cls._stale_users:
+                    return False
+            elif (current_time - last_time) < 10:
+                return False  # لم يمر وقت كافٍ منذ آخر تحديث
+        cls._stale_users.discard(user_id)
         
         try:
             with db.get_cursor() as cursor:
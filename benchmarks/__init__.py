@@ -0,0 +1,15 @@
+# benchmarks/__init__.py
+"""
+حزمة قياس أداء المسارات الساخنة في نظام الفواتير.
+
+- synthetic_data: مولد بيانات اصطناعية حتمي (قطاعات، هرمية مولدة ← علبة ← رئيسي ← زبون،
+  فواتير، سجل الزبائن، تأشيرات وقراءات وقود) في قاعدة بيانات PostgreSQL مؤقتة.
+- harness: تشغيل نقاط الدخول الساخنة مع قياس الزمن وكتابة النتائج بصيغة JSON
+  ومقارنتها بنتائج سابقة لاكتشاف التراجع قبل النشر.
+
+الاستخدام:
+    python -m benchmarks generate --scale 10k
+    python -m benchmarks run --scale 10k --output results.json --compare baseline.json
+
+يجب ألا تكون قاعدة البيانات المستهدفة قاعدة الإنتاج: المولد يمسح الجداول قبل التعبئة.
+"""
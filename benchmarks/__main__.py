@@ -0,0 +1,182 @@
+# benchmarks/__main__.py
+"""
+واجهة سطر الأوامر لقياس الأداء.
+
+    python -m benchmarks generate --scale 10k [--seed 42] [--recreate]
+    python -m benchmarks run --scale 10k --output results.json [--compare baseline.json]
+    python -m benchmarks compare baseline.json results.json
+    python -m benchmarks load --workers 8 --duration 60 [--mode process]
+    python -m benchmarks plans --output plans.json [--baseline plans_baseline.json]
+    python -m benchmarks drop
+
+يُضبط DB_NAME قبل استيراد وحدات التطبيق حتى يعمل كل شيء على قاعدة القياس.
+"""
+import argparse
+import logging
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# نفس القيمة في synthetic_data (لا يمكن استيرادها قبل ضبط DB_NAME)
+DEFAULT_DB_NAME = 'electricity_billing_bench'
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='قياس أداء نظام الفواتير')
+    parser.add_argument('--db-name', default=os.getenv('BENCH_DB_NAME', DEFAULT_DB_NAME),
+                        help='اسم قاعدة بيانات القياس (يجب أن يحتوي bench)')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    gen = sub.add_parser('generate', help='إنشاء قاعدة القياس وتعبئتها ببيانات اصطناعية')
+    gen.add_argument('--scale', default='10k', help='1k / 10k / 100k أو عدد الزبائن')
+    gen.add_argument('--seed', type=int, default=42)
+    gen.add_argument('--weeks', type=int, default=8)
+    gen.add_argument('--recreate', action='store_true', help='حذف قاعدة القياس وإعادة إنشائها')
+
+    run = sub.add_parser('run', help='تشغيل القياسات وكتابة النتائج JSON')
+    run.add_argument('--scale', default=None, help='وسم الحجم في ملف النتائج')
+    run.add_argument('--seed', type=int, default=None)
+    run.add_argument('--repeat', type=int, default=5)
+    run.add_argument('--warmup', type=int, default=1)
+    run.add_argument('--only', nargs='*', help='تشغيل الحالات التي يحتوي اسمها على هذه النصوص فقط')
+    run.add_argument('--output', default='benchmark_results.json')
+    run.add_argument('--compare', help='ملف نتائج سابق للمقارنة')
+    run.add_argument('--threshold', type=float, default=0.20)
+
+    cmp_parser = sub.add_parser('compare', help='مقارنة ملفي نتائج')
+    cmp_parser.add_argument('baseline')
+    cmp_parser.add_argument('current')
+    cmp_parser.add_argument('--threshold', type=float, default=0.20)
+
+    load = sub.add_parser('load', help='محاكاة أمناء صندوق متزامنين وقياس الإنتاجية والأقفال')
+    load.add_argument('--workers', type=int, default=8)
+    load.add_argument('--duration', type=float, default=60, help='المدة بالثواني')
+    load.add_argument('--mode', choices=('thread', 'process'), default='thread')
+    load.add_argument('--hot-customers', type=int, default=20)
+    load.add_argument('--hot-ratio', type=float, default=0.3, help='نسبة العمليات على الزبائن الساخنين')
+    load.add_argument('--think-time', type=float, default=0.0, help='أقصى انتظار عشوائي بين العمليات (ثانية)')
+    load.add_argument('--mix', nargs='*', metavar='OP=WEIGHT',
+                      help='أوزان العمليات مثل create_invoice=30 report_read=10')
+    load.add_argument('--seed', type=int, default=42)
+    load.add_argument('--output', default='load_results.json')
+
+    plans = sub.add_parser('plans', help='فحص خطط استعلامات التقارير والزبائن (EXPLAIN ANALYZE)')
+    plans.add_argument('--only', nargs='*', help='السيناريوهات التي يحتوي اسمها على هذه النصوص فقط')
+    plans.add_argument('--output', default='plan_results.json')
+    plans.add_argument('--baseline', help='ملف خطط سابق للمقارنة')
+    plans.add_argument('--large-table-rows', type=int, default=10000)
+    plans.add_argument('--cost-threshold', type=float, default=0.5)
+
+    sub.add_parser('drop', help='حذف قاعدة القياس')
+    return parser
+
+
+def report_comparison(baseline_path, current, threshold):
+    from benchmarks.harness import compare_results, format_comparison, load_results
+
+    comparison = compare_results(load_results(baseline_path), current, threshold)
+    print(format_comparison(comparison))
+    if comparison['regressions']:
+        logger.error(f"❌ تراجع في الأداء: {', '.join(comparison['regressions'])}")
+        return 1
+    return 0
+
+
+def run_load(args):
+    from benchmarks.harness import save_results
+    from benchmarks.load_simulator import DEFAULT_MIX, LoadSimulator
+
+    mix = None
+    if args.mix:
+        mix = {}
+        for item in args.mix:
+            op, _, weight = item.partition('=')
+            if op not in DEFAULT_MIX:
+                logger.error(f"عملية غير معروفة في --mix: {op} (المتاح: {', '.join(DEFAULT_MIX)})")
+                return 2
+            mix[op] = int(weight or 1)
+
+    report = LoadSimulator(
+        workers=args.workers, duration=args.duration, mode=args.mode, mix=mix,
+        hot_customers=args.hot_customers, hot_ratio=args.hot_ratio,
+        think_time=args.think_time, seed=args.seed
+    ).run()
+    save_results(report, args.output)
+    total = report['total']
+    logger.info(f"الإنتاجية: {total['throughput_per_sec']}/ث، p95={total['p95_ms']}ms، "
+                f"deadlocks={report['deadlocks']}، أقصى انتظار أقفال={report['lock_waits']['waiting_max']}")
+    logger.info(f"تم حفظ النتائج في {args.output}")
+    return 0
+
+
+def run_plans(args):
+    from benchmarks.harness import load_results, save_results
+    from benchmarks.plan_checker import PlanChecker, compare_plans, format_plan_report
+
+    report = PlanChecker(large_table_rows=args.large_table_rows).check(args.only)
+    save_results(report, args.output)
+    comparison = None
+    if args.baseline:
+        comparison = compare_plans(load_results(args.baseline), report, args.cost_threshold)
+    print(format_plan_report(report, comparison))
+    logger.info(f"تم حفظ الخطط في {args.output}")
+    if comparison and comparison['regressions']:
+        logger.error(f"❌ تراجع في خطط {len(comparison['regressions'])} استعلام")
+        return 1
+    return 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.command == 'compare':
+        from benchmarks.harness import load_results
+        return report_comparison(args.baseline, load_results(args.current), args.threshold)
+
+    # يجب ضبط اسم القاعدة قبل استيراد config.settings و database
+    if 'bench' not in args.db_name:
+        logger.error(f"اسم قاعدة القياس يجب أن يحتوي 'bench': {args.db_name}")
+        return 2
+    os.environ['DB_NAME'] = args.db_name
+
+    from benchmarks.synthetic_data import SyntheticDataGenerator, drop_database, ensure_database
+
+    if args.command == 'drop':
+        drop_database(args.db_name)
+        logger.info(f"تم حذف قاعدة القياس {args.db_name}")
+        return 0
+
+    if args.command == 'generate':
+        ensure_database(args.db_name, recreate=args.recreate)
+        result = SyntheticDataGenerator(args.scale, seed=args.seed, weeks=args.weeks).generate()
+        if not result['success']:
+            logger.error(f"فشل التوليد: {result['error']}")
+            return 1
+        logger.info(f"✅ {result['counts']} خلال {result['elapsed_seconds']} ثانية")
+        return 0
+
+    if args.command == 'load':
+        return run_load(args)
+
+    if args.command == 'plans':
+        return run_plans(args)
+
+    from benchmarks.harness import BenchmarkHarness, save_results
+
+    report = BenchmarkHarness(args.repeat, args.warmup, scale=args.scale, seed=args.seed).run(args.only)
+    save_results(report, args.output)
+    logger.info(f"تم حفظ النتائج في {args.output}")
+    failed = [name for name, r in report['results'].items() if not r['ok']]
+    if failed:
+        logger.warning(f"⚠️ حالات فشلت أثناء القياس: {', '.join(failed)}")
+    if args.compare:
+        return report_comparison(args.compare, report, args.threshold)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,334 @@
+# benchmarks/harness.py
+"""
+مشغل قياس الأداء للمسارات الساخنة.
+
+يشغل كل حالة عدة مرات (بعد تشغيلات إحماء) ويحسب min/median/mean/p95/max بالميلي ثانية،
+ويكتب النتائج بصيغة JSON مع بيانات البيئة (commit، إصدار PostgreSQL، حجم البيانات)
+لتمكين المقارنة بين الإصدارات عبر compare_results.
+"""
+import json
+import logging
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+RESULT_FORMAT = 1
+DEFAULT_THRESHOLD = 0.20   # تراجع بأكثر من 20% في الوسيط يعتبر regression
+COUNTED_TABLES = ('sectors', 'customers', 'invoices', 'customer_history', 'daily_readings')
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    if len(ordered) == 1:
+        return ordered[0]
+    k = (len(ordered) - 1) * pct
+    low = int(k)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+
+def _result_ok(result) -> bool:
+    """نجاح الاستدعاء حسب نمط الإرجاع في المشروع ({'success': ...} أو قيمة)"""
+    if isinstance(result, dict) and 'success' in result:
+        return bool(result['success'])
+    if isinstance(result, dict) and 'error' in result:
+        return False
+    return result is not None
+
+
+def _result_size(result) -> Optional[int]:
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, dict):
+        for key in ('customers', 'items', 'files', 'sectors', 'results'):
+            if isinstance(result.get(key), list):
+                return len(result[key])
+    return None
+
+
+class BenchmarkHarness:
+    """تشغيل حالات القياس على قاعدة بيانات القياس الحالية"""
+
+    def __init__(self, repeat: int = 5, warmup: int = 1, scale: str = None, seed: int = None):
+        self.repeat = max(1, repeat)
+        self.warmup = max(0, warmup)
+        self.scale = scale
+        self.seed = seed
+        self._export_dir = None
+
+    # ------------------------------------------------------------------
+    # الحالات
+    # ------------------------------------------------------------------
+    def _load_context(self) -> Dict[str, Any]:
+        """معاملات الحالات من البيانات الموجودة (أكبر قطاع، زبائن للفوترة، مصطلح بحث)"""
+        from database.connection import db
+
+        with db.get_cursor() as cursor:
+            cursor.execute("""
+                SELECT sector_id, COUNT(*) AS cnt
+                FROM customers
+                WHERE meter_type = 'زبون' AND is_active = TRUE
+                GROUP BY sector_id
+                ORDER BY cnt DESC, sector_id
+                LIMIT 1
+            """)
+            row = cursor.fetchone()
+            if not row:
+                raise RuntimeError("لا توجد بيانات في قاعدة القياس - شغّل generate أولاً")
+            sector_id = row['sector_id']
+
+            cursor.execute("""
+                SELECT id, sector_id, last_counter_reading
+                FROM customers
+                WHERE meter_type = 'زبون' AND is_active = TRUE
+                ORDER BY id
+                LIMIT %s
+            """, (self.repeat + self.warmup,))
+            invoice_customers = [dict(r) for r in cursor.fetchall()]
+
+            cursor.execute("SELECT id FROM users WHERE username = 'bench_admin'")
+            user = cursor.fetchone()
+            cursor.execute("SELECT MIN(payment_date) AS first, MAX(payment_date) AS last FROM invoices")
+            period = cursor.fetchone()
+
+        return {
+            'sector_id': sector_id,
+            'invoice_customers': invoice_customers,
+            'user_id': user['id'] if user else 1,
+            'start_date': period['first'],
+            'end_date': period['last'],
+        }
+
+    def _build_cases(self, ctx: Dict[str, Any]) -> Dict[str, Callable[[], Any]]:
+        from modules.collection_monitor import CollectionMonitor
+        from modules.export_manager import ExportManager
+        from modules.fast_operations import FastOperations
+        from modules.invoices import InvoiceManager
+        from modules.reports import ReportManager
+        from modules.waste_calculator import HierarchicalWasteCalculator
+
+        invoice_manager = InvoiceManager()
+        report_manager = ReportManager()
+        waste_calculator = HierarchicalWasteCalculator()
+        collection_monitor = CollectionMonitor()
+        self._export_dir = tempfile.mkdtemp(prefix='bench_export_')
+        export_manager = ExportManager(self._export_dir)
+        customers = iter(ctx['invoice_customers'])
+
+        def create_invoice():
+            # زبون مختلف في كل تشغيل حتى لا تتراكم الأقفال على نفس الصف؛
+            # create_invoice يحسب الكمية من new_reading ناقص آخر قراءة قبل process_invoice
+            customer = next(customers)
+            return invoice_manager.create_invoice({
+                'user_id': ctx['user_id'],
+                'customer_id': customer['id'],
+                'sector_id': customer['sector_id'],
+                'new_reading': float(customer['last_counter_reading'] or 0) + 50,
+                'price_per_kilo': 7200,
+                'visa_application': 0,
+                'discount': 0,
+            })
+
+        return {
+            'invoice.create_invoice': create_invoice,
+            'fast_operations.fast_search_customers': lambda: FastOperations.fast_search_customers(
+                'محمد', sector_id=ctx['sector_id'], limit=50),
+            'reports.get_cut_lists_report': lambda: report_manager.get_cut_lists_report(
+                sector_id=ctx['sector_id']),
+            'reports.get_visa_sheets_report': lambda: report_manager.get_visa_sheets_report(
+                sector_id=ctx['sector_id']),
+            'reports.get_cycle_inventory_report': lambda: report_manager.get_cycle_inventory_report(
+                ctx['start_date'], ctx['end_date']),
+            'waste.analyze_sector_hierarchy': lambda: waste_calculator.analyze_sector_hierarchy(
+                ctx['sector_id']),
+            'collection_monitor.get_all_classifications': lambda: collection_monitor.get_all_classifications(
+                sector_id=ctx['sector_id']),
+            'export.export_customers_by_sector': export_manager.export_customers_by_sector,
+        }
+
+    # ------------------------------------------------------------------
+    # التشغيل
+    # ------------------------------------------------------------------
+    def _measure(self, func: Callable[[], Any]) -> Dict[str, Any]:
+        timings, errors = [], []
+        size = None
+        ok = True
+        for run in range(self.warmup + self.repeat):
+            started = time.perf_counter()
+            try:
+                result = func()
+                success = _result_ok(result)
+                if not success:
+                    errors.append(str(result.get('error', 'success=False')) if isinstance(result, dict)
+                                  else 'لا توجد نتيجة')
+                size = _result_size(result)
+            except Exception as e:
+                success = False
+                errors.append(f"{type(e).__name__}: {e}")
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if run >= self.warmup:
+                timings.append(round(elapsed_ms, 3))
+                ok = ok and success
+
+        if not ok:
+            # زمن حالة فاشلة يقيس الخطأ لا المسار: لا يُنشر ولا يصلح أساساً للمقارنة
+            return {'ok': False, 'errors': sorted(set(errors))[:3], 'result_size': size}
+
+        return {
+            'ok': ok,
+            'errors': sorted(set(errors))[:3],
+            'result_size': size,
+            'timings_ms': timings,
+            'min_ms': round(min(timings), 3),
+            'median_ms': round(statistics.median(timings), 3),
+            'mean_ms': round(statistics.mean(timings), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'max_ms': round(max(timings), 3),
+        }
+
+    def run(self, only: Optional[List[str]] = None) -> Dict[str, Any]:
+        """تشغيل كل الحالات (أو المحددة بالاسم أو بجزء منه) وإرجاع تقرير JSON-ready"""
+        ctx = self._load_context()
+        cases = self._build_cases(ctx)
+        if only:
+            cases = {name: f for name, f in cases.items() if any(o in name for o in only)}
+
+        results = {}
+        try:
+            for name, func in cases.items():
+                logger.info(f"قياس {name} ...")
+                results[name] = self._measure(func)
+                if results[name]['ok']:
+                    logger.info(f"✅ {name}: median={results[name]['median_ms']}ms")
+                else:
+                    logger.error(f"❌ {name}: فشلت - بلا زمن منشور ({'; '.join(results[name]['errors'])})")
+        finally:
+            if self._export_dir:
+                shutil.rmtree(self._export_dir, ignore_errors=True)
+
+        return {
+            'format': RESULT_FORMAT,
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': self._git_commit(),
+            'scale': self.scale,
+            'seed': self.seed,
+            'repeat': self.repeat,
+            'warmup': self.warmup,
+            'environment': self._environment(),
+            'dataset': self._dataset_counts(),
+            'results': results,
+        }
+
+    # ------------------------------------------------------------------
+    # بيانات البيئة
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _git_commit() -> Optional[str]:
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5
+            ).stdout.strip() or None
+        except Exception:
+            return None
+
+    @staticmethod
+    def _environment() -> Dict[str, Any]:
+        from database.connection import db
+        env = {'python': platform.python_version(), 'platform': platform.platform()}
+        try:
+            with db.get_cursor() as cursor:
+                cursor.execute("SHOW server_version")
+                env['postgres'] = cursor.fetchone()['server_version']
+        except Exception as e:
+            logger.warning(f"تعذر جلب إصدار PostgreSQL: {e}")
+        return env
+
+    @staticmethod
+    def _dataset_counts() -> Dict[str, int]:
+        from database.connection import db
+        with db.get_cursor() as cursor:
+            counts = {}
+            for table in COUNTED_TABLES:
+                cursor.execute(f"SELECT COUNT(*) AS cnt FROM {table}")
+                counts[table] = cursor.fetchone()['cnt']
+            return counts
+
+
+# ----------------------------------------------------------------------
+# حفظ النتائج ومقارنتها
+# ----------------------------------------------------------------------
+def save_results(report: Dict[str, Any], path: str):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any],
+                    threshold: float = DEFAULT_THRESHOLD, metric: str = 'median_ms') -> Dict[str, Any]:
+    """
+    مقارنة نتيجتين حالة بحالة. الحالة تعتبر regression إذا زاد المقياس بأكثر من threshold
+    أو إذا فشلت في النتيجة الحالية بعد أن كانت ناجحة. الحالة الفاشلة لا تنشر زمناً،
+    فلا تُقارن بها ولا تُستخدم أساساً (still_failing / no_baseline).
+    """
+    rows = []
+    for name in sorted(set(baseline.get('results', {})) | set(current.get('results', {}))):
+        base = baseline.get('results', {}).get(name)
+        cur = current.get('results', {}).get(name)
+        row = {'name': name, 'baseline': base and base.get(metric), 'current': cur and cur.get(metric),
+               'change': None}
+        if base is None or cur is None:
+            row['status'] = 'missing'
+        elif not cur.get('ok'):
+            row['status'] = 'failed' if base.get('ok') else 'still_failing'
+        elif not base.get('ok') or base.get(metric) is None:
+            # الأساس فاشل (أو من نسخة نشرت زمن الفشل): لا يوجد زمن صالح للمقارنة
+            row['status'] = 'no_baseline'
+            row['baseline'] = None
+        elif base[metric] > 0:
+            row['change'] = round(cur[metric] / base[metric] - 1, 4)
+            if row['change'] > threshold:
+                row['status'] = 'regression'
+            elif row['change'] < -threshold:
+                row['status'] = 'improvement'
+            else:
+                row['status'] = 'ok'
+        else:
+            row['status'] = 'ok'
+        rows.append(row)
+
+    warnings = []
+    if baseline.get('scale') != current.get('scale') or baseline.get('dataset') != current.get('dataset'):
+        warnings.append("حجم البيانات مختلف بين النتيجتين - المقارنة غير دقيقة")
+    still_failing = [r['name'] for r in rows if r['status'] == 'still_failing']
+    if still_failing:
+        warnings.append(f"حالات ما زالت تفشل ولم تُقَس: {', '.join(still_failing)}")
+    return {
+        'metric': metric,
+        'threshold': threshold,
+        'baseline_commit': baseline.get('git_commit'),
+        'current_commit': current.get('git_commit'),
+        'warnings': warnings,
+        'rows': rows,
+        'regressions': [r['name'] for r in rows if r['status'] in ('regression', 'failed')],
+    }
+
+
+def format_comparison(comparison: Dict[str, Any]) -> str:
+    """جدول نصي مختصر لنتيجة المقارنة"""
+    lines = [f"المقارنة ({comparison['metric']}): {comparison['baseline_commit']} ← {comparison['current_commit']}"]
+    lines.extend(f"⚠️ {w}" for w in comparison['warnings'])
+    for row in comparison['rows']:
+        change = f"{row['change'] * 100:+.1f}%" if row['change'] is not None else '-'
+        lines.append(f"{row['status']:<13} {row['name']:<45} {row['baseline']!s:>10} → {row['current']!s:>10} {change}")
+    return '\n'.join(lines)
@@ -0,0 +1,351 @@
+# benchmarks/load_simulator.py
+"""
+محاكي ضغط أمناء الصندوق المتزامنين.
+
+يشغل N عاملاً (خيوط أو عمليات) ينفذ كل منهم مزيجاً واقعياً من العمليات خلال مدة محددة:
+فواتير (create_invoice و fast_process_invoice)، تحصيلات، تعديل تأشيرات وقراءة تقارير،
+مع تركيز جزء من الحركة على "زبائن ساخنين" كما في ذروة الأسبوع. بالتوازي يراقب خيط منفصل
+pg_locks / pg_stat_activity لرصد انتظار الأقفال. التقرير النهائي (JSON) يتضمن الإنتاجية
+وزمن الاستجابة p50/p95/p99 لكل عملية، الـ deadlocks، انتظار الأقفال، نفاد مجموعة الاتصالات
+وتكرار أرقام الفواتير.
+"""
+import logging
+import multiprocessing
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from benchmarks.harness import percentile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIX = {
+    'create_invoice': 30,
+    'fast_process_invoice': 20,
+    'record_collection': 25,
+    'visa_edit': 10,
+    'report_read': 15,
+}
+
+# تصنيف الأخطاء من نص رسالة PostgreSQL/psycopg2 (الوحدات تعيد الخطأ نصاً في {'error': ...})
+ERROR_KINDS = (
+    ('deadlock', 'deadlock detected'),
+    ('lock_timeout', 'lock timeout'),
+    ('serialization', 'could not serialize'),
+    ('pool_exhausted', 'pool exhausted'),
+    ('duplicate_key', 'duplicate key'),
+)
+
+
+def classify_error(message: str) -> str:
+    text = (message or '').lower()
+    for kind, needle in ERROR_KINDS:
+        if needle in text:
+            return kind
+    return 'other'
+
+
+def _worker(worker_id: int, config: Dict[str, Any]) -> List[tuple]:
+    """
+    حلقة عامل واحد حتى انتهاء المدة. يعيد عينات (operation, latency_ms, ok, error_kind, error).
+    تُنشأ المدراء داخل العامل حتى يعمل نفس الكود في وضع العمليات.
+    """
+    from modules.collection import CollectionManager
+    from modules.fast_operations import FastOperations
+    from modules.history_manager import HistoryManager
+    from modules.invoices import InvoiceManager
+    from modules.reports import ReportManager
+
+    rng = random.Random(config['seed'] * 1000 + worker_id)
+    invoice_manager = InvoiceManager()
+    collection_manager = CollectionManager()
+    history_manager = HistoryManager()
+    report_manager = ReportManager()
+
+    customers = config['customers']
+    hot = config['hot_customers']
+    user_id = config['user_id']
+    sector_id = config['sector_id']
+    operations = list(config['mix'])
+    weights = [config['mix'][op] for op in operations]
+
+    def pick_customer():
+        if hot and rng.random() < config['hot_ratio']:
+            return rng.choice(hot)
+        return rng.choice(customers)
+
+    def run_operation(op):
+        customer = pick_customer()
+        if op == 'create_invoice':
+            return invoice_manager.create_invoice({
+                'user_id': user_id,
+                'customer_id': customer['id'],
+                'sector_id': customer['sector_id'],
+                'new_reading': float(customer['last_counter_reading'] or 0) + rng.randint(10, 200),
+                'price_per_kilo': 7200,
+            })
+        if op == 'fast_process_invoice':
+            return FastOperations.fast_process_invoice(
+                customer['id'], kilowatt_amount=rng.randint(10, 200), price_per_kilo=7200, user_id=user_id)
+        if op == 'record_collection':
+            return collection_manager.record_collection(
+                user_id, customer['id'], rng.choice((5000, 10000, 25000, 50000)), notes='load test')
+        if op == 'visa_edit':
+            return history_manager.add_weekly_visa(
+                customer['id'], rng.choice((50, 100, 150)), notes='load test', user_id=user_id)
+        if op == 'report_read':
+            if rng.random() < 0.5:
+                return report_manager.get_visa_sheets_report(sector_id=sector_id)
+            return FastOperations.fast_search_customers('محمد', sector_id=sector_id, limit=50)
+        raise ValueError(f"عملية غير معروفة: {op}")
+
+    samples = []
+    deadline = time.monotonic() + config['duration']
+    think_time = config['think_time']
+    while time.monotonic() < deadline:
+        op = rng.choices(operations, weights)[0]
+        started = time.perf_counter()
+        try:
+            result = run_operation(op)
+            ok = not (isinstance(result, dict) and result.get('success') is False)
+            error = None if ok else str(result.get('error', ''))
+        except Exception as e:
+            ok, error = False, f"{type(e).__name__}: {e}"
+        latency = (time.perf_counter() - started) * 1000
+        samples.append((op, round(latency, 3), ok, None if ok else classify_error(error),
+                        None if ok else error[:200]))
+        if think_time:
+            time.sleep(rng.uniform(0, think_time))
+    return samples
+
+
+class LockMonitor:
+    """أخذ عينات دورية من pg_locks على اتصال مستقل (خارج مجموعة الاتصالات)"""
+
+    def __init__(self, interval: float = 0.2):
+        self.interval = interval
+        self.samples = 0
+        self.waiting_total = 0
+        self.waiting_max = 0
+        self.blocked_queries = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        from config.settings import DATABASE_CONFIG
+        self._conn = psycopg2.connect(**DATABASE_CONFIG)
+        self._conn.autocommit = True
+        self._thread = threading.Thread(target=self._run, name='LockMonitor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(5)
+        self._conn.close()
+
+    def _run(self):
+        with self._conn.cursor() as cursor:
+            while not self._stop.is_set():
+                try:
+                    cursor.execute("""
+                        SELECT a.pid, left(regexp_replace(a.query, '\\s+', ' ', 'g'), 120) AS query
+                        FROM pg_locks l
+                        JOIN pg_stat_activity a ON a.pid = l.pid
+                        WHERE NOT l.granted AND a.datname = current_database()
+                    """)
+                    rows = cursor.fetchall()
+                    self.samples += 1
+                    self.waiting_total += len(rows)
+                    self.waiting_max = max(self.waiting_max, len(rows))
+                    self.blocked_queries.update(q for _, q in rows)
+                except Exception as e:
+                    logger.warning(f"تعذر أخذ عينة من pg_locks: {e}")
+                self._stop.wait(self.interval)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'samples': self.samples,
+            'waiting_max': self.waiting_max,
+            'waiting_avg': round(self.waiting_total / self.samples, 3) if self.samples else 0,
+            'top_blocked_queries': [
+                {'query': q, 'samples': n} for q, n in self.blocked_queries.most_common(5)
+            ],
+        }
+
+
+class LoadSimulator:
+    """تشغيل الضغط وجمع التقرير"""
+
+    def __init__(self, workers: int = 8, duration: float = 60, mode: str = 'thread',
+                 mix: Optional[Dict[str, int]] = None, hot_customers: int = 20,
+                 hot_ratio: float = 0.3, think_time: float = 0.0, seed: int = 42):
+        if mode not in ('thread', 'process'):
+            raise ValueError("mode يجب أن يكون thread أو process")
+        self.workers = max(1, workers)
+        self.duration = duration
+        self.mode = mode
+        self.mix = dict(mix or DEFAULT_MIX)
+        self.hot_count = hot_customers
+        self.hot_ratio = hot_ratio
+        self.think_time = think_time
+        self.seed = seed
+
+    def _load_config(self) -> Dict[str, Any]:
+        from database.connection import db
+
+        with db.get_cursor() as cursor:
+            cursor.execute("""
+                SELECT id, sector_id, last_counter_reading
+                FROM customers
+                WHERE meter_type = 'زبون' AND is_active = TRUE
+                ORDER BY id
+            """)
+            customers = [dict(r) for r in cursor.fetchall()]
+            if not customers:
+                raise RuntimeError("لا يوجد زبائن في قاعدة القياس - شغّل generate أولاً")
+            cursor.execute("SELECT id FROM users WHERE username = 'bench_admin'")
+            user = cursor.fetchone()
+
+        for c in customers:
+            c['last_counter_reading'] = float(c['last_counter_reading'] or 0)
+        rng = random.Random(self.seed)
+        hot = rng.sample(customers, min(self.hot_count, len(customers)))
+        sector_counts = Counter(c['sector_id'] for c in customers)
+        return {
+            'customers': customers,
+            'hot_customers': hot,
+            'hot_ratio': self.hot_ratio,
+            'sector_id': sector_counts.most_common(1)[0][0],
+            'user_id': user['id'] if user else 1,
+            'mix': self.mix,
+            'duration': self.duration,
+            'think_time': self.think_time,
+            'seed': self.seed,
+        }
+
+    @staticmethod
+    def _db_stats(cursor) -> Dict[str, int]:
+        cursor.execute("""
+            SELECT deadlocks, xact_rollback, xact_commit
+            FROM pg_stat_database WHERE datname = current_database()
+        """)
+        return dict(cursor.fetchone())
+
+    @staticmethod
+    def _invoice_collisions(cursor, since: datetime) -> Dict[str, Any]:
+        """أرقام فواتير مكررة بين الفواتير المنشأة أثناء الضغط (إن لم يمنعها قيد UNIQUE)"""
+        cursor.execute("""
+            SELECT invoice_number, COUNT(*) AS cnt
+            FROM invoices
+            WHERE created_at >= %s
+            GROUP BY invoice_number
+            HAVING COUNT(*) > 1
+        """, (since,))
+        rows = cursor.fetchall()
+        return {'duplicated_numbers': len(rows), 'examples': [r[0] for r in rows[:5]]}
+
+    def run(self) -> Dict[str, Any]:
+        from config.settings import DATABASE_CONFIG
+        from database.connection import db
+
+        config = self._load_config()
+        logger.info(f"بدء الضغط: {self.workers} عامل ({self.mode}) لمدة {self.duration} ثانية")
+
+        stats_conn = psycopg2.connect(**DATABASE_CONFIG)
+        stats_conn.autocommit = True
+        monitor = LockMonitor()
+        try:
+            with stats_conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                before = self._db_stats(cursor)
+            started_at = datetime.now()
+            monitor.start()
+            started = time.perf_counter()
+
+            if self.mode == 'thread':
+                executor = ThreadPoolExecutor(max_workers=self.workers)
+            else:
+                # spawn: لا ترث العمليات اتصالات مجموعة الأب المفتوحة
+                executor = ProcessPoolExecutor(max_workers=self.workers,
+                                               mp_context=multiprocessing.get_context('spawn'))
+            with executor:
+                futures = [executor.submit(_worker, i, config) for i in range(self.workers)]
+                samples = [s for f in futures for s in f.result()]
+
+            wall = time.perf_counter() - started
+            monitor.stop()
+            with stats_conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                after = self._db_stats(cursor)
+            with stats_conn.cursor() as cursor:
+                collisions = self._invoice_collisions(cursor, started_at)
+        finally:
+            stats_conn.close()
+
+        return self._build_report(samples, wall, before, after, monitor.report(), collisions,
+                                  pool_size=db._connection_pool.lane('interactive').max_size)
+
+    def _build_report(self, samples, wall, before, after, locks, collisions, pool_size) -> Dict[str, Any]:
+        by_op = defaultdict(list)
+        errors = defaultdict(Counter)
+        examples = {}
+        for op, latency, ok, kind, error in samples:
+            by_op[op].append((latency, ok))
+            if not ok:
+                errors[op][kind] += 1
+                examples.setdefault(kind, error)
+
+        operations = {}
+        for op, rows in sorted(by_op.items()):
+            latencies = [latency for latency, _ in rows]
+            succeeded = sum(1 for _, ok in rows if ok)
+            operations[op] = {
+                'count': len(rows),
+                'succeeded': succeeded,
+                'failed': len(rows) - succeeded,
+                'throughput_per_sec': round(succeeded / wall, 2),
+                'p50_ms': round(percentile(latencies, 0.50), 3),
+                'p95_ms': round(percentile(latencies, 0.95), 3),
+                'p99_ms': round(percentile(latencies, 0.99), 3),
+                'max_ms': round(max(latencies), 3),
+                'errors': dict(errors[op]),
+            }
+
+        all_errors = sum((errors[op] for op in errors), Counter())
+        total_ok = sum(op['succeeded'] for op in operations.values())
+        all_latencies = [s[1] for s in samples] or [0]
+        return {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'workers': self.workers,
+            'mode': self.mode,
+            'pool_size': pool_size,
+            'duration_seconds': round(wall, 2),
+            'mix': self.mix,
+            'hot_customers': self.hot_count,
+            'hot_ratio': self.hot_ratio,
+            'total': {
+                'count': len(samples),
+                'succeeded': total_ok,
+                'throughput_per_sec': round(total_ok / wall, 2),
+                'p50_ms': round(percentile(all_latencies, 0.50), 3),
+                'p95_ms': round(percentile(all_latencies, 0.95), 3),
+                'p99_ms': round(percentile(all_latencies, 0.99), 3),
+            },
+            'operations': operations,
+            'errors': dict(all_errors),
+            'error_examples': examples,
+            'deadlocks': after['deadlocks'] - before['deadlocks'],
+            'rollbacks': after['xact_rollback'] - before['xact_rollback'],
+            'lock_waits': locks,
+            'invoice_number_collisions': {
+                'duplicate_key_errors': sum(errors[op]['duplicate_key'] for op in
+                                            ('create_invoice', 'fast_process_invoice')),
+                **collisions,
+            },
+        }
@@ -0,0 +1,388 @@
+# benchmarks/plan_checker.py
+"""
+فاحص تراجع خطط الاستعلامات لاستعلامات التقارير والزبائن.
+
+1. يشغل سيناريوهات ReportManager و CustomerManager بمعاملات تمثيلية على قاعدة القياس
+   ويلتقط كل استعلام قراءة تصدره (عبر تغليف db.get_cursor مؤقتاً).
+2. ينفذ EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) لكل استعلام داخل معاملة تُلغى دائماً.
+3. يحفظ بصمة الخطة (شكل العقد والجداول والفهارس) والتكلفة، ويعلّم:
+   Seq Scan على الجداول الكبيرة، أخطاء تقدير عدد الصفوف، وتراجع التكلفة مقارنة بخط أساس.
+4. يقترح فهارس لأعمدة الفلترة في عمليات Seq Scan، ويسرد فهارس Models.create_indexes
+   التي لم تستخدمها أي خطة.
+"""
+import hashlib
+import json
+import logging
+import re
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+LARGE_TABLE_ROWS = 10000      # Seq Scan على جدول أكبر من هذا يُعلَّم
+MISESTIMATE_FACTOR = 10       # نسبة الفرق بين الصفوف المقدرة والفعلية
+MISESTIMATE_MIN_ROWS = 100    # تجاهل الفروق على أعداد صغيرة
+COST_THRESHOLD = 0.5          # زيادة التكلفة بأكثر من 50% تعتبر تراجعاً
+
+READ_PREFIX = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+FILTER_COLUMN = re.compile(r'\(?(?:\w+\.)?(\w+)\)?(?:::\w+(?:\s\w+)*)?\s*(?:=|<>|<=|>=|<|>|~~\*?|IS\b|= ANY)')
+
+
+def _normalize_sql(query: str) -> str:
+    return ' '.join(query.split())
+
+
+def _sql_key(scenario: str, template: str) -> str:
+    digest = hashlib.sha1(_normalize_sql(template).encode('utf-8')).hexdigest()[:12]
+    return f"{scenario}:{digest}"
+
+
+class _RecordingCursor:
+    """تمرير كل شيء للمؤشر الحقيقي مع تسجيل استعلامات القراءة"""
+
+    def __init__(self, cursor, recorder):
+        self._cursor = cursor
+        self._recorder = recorder
+
+    def execute(self, query, params=None):
+        if isinstance(query, str) and READ_PREFIX.match(query):
+            try:
+                self._recorder.record(query, self._cursor.mogrify(query, params).decode('utf-8'))
+            except Exception as e:
+                logger.debug(f"تعذر تسجيل الاستعلام: {e}")
+        return self._cursor.execute(query, params)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class QueryRecorder:
+    """التقاط استعلامات القراءة التي تصدرها الوحدات أثناء سيناريو"""
+
+    def __init__(self):
+        self.queries: Dict[str, Dict[str, Any]] = {}
+        self.scenario = None
+
+    def record(self, template: str, sql: str):
+        key = _sql_key(self.scenario, template)
+        if key not in self.queries:
+            self.queries[key] = {'scenario': self.scenario, 'template': _normalize_sql(template), 'sql': sql}
+
+    @contextmanager
+    def capture(self, scenario: str):
+        from database.connection import db
+
+        self.scenario = scenario
+        original = db.get_cursor
+        recorder = self
+
+        @contextmanager
+        def recording_get_cursor(connection=None):
+            with original(connection) as cursor:
+                yield _RecordingCursor(cursor, recorder)
+
+        db.get_cursor = recording_get_cursor
+        try:
+            yield self
+        finally:
+            # حذف خاصية النسخة يعيد دالة الصنف الأصلية
+            del db.get_cursor
+            self.scenario = None
+
+
+def _walk(node: Dict[str, Any]):
+    yield node
+    for child in node.get('Plans', []):
+        yield from _walk(child)
+
+
+def _plan_shape(node: Dict[str, Any]):
+    return [node.get('Node Type'), node.get('Relation Name'), node.get('Index Name'),
+            [_plan_shape(child) for child in node.get('Plans', [])]]
+
+
+def _filter_columns(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return sorted({m.group(1) for m in FILTER_COLUMN.finditer(text)
+                   if not m.group(1).isdigit() and m.group(1).lower() not in ('true', 'false', 'null')})
+
+
+class PlanChecker:
+    """جمع الخطط وتحليلها ومقارنتها بخط أساس"""
+
+    def __init__(self, large_table_rows: int = LARGE_TABLE_ROWS,
+                 misestimate_factor: float = MISESTIMATE_FACTOR):
+        self.large_table_rows = large_table_rows
+        self.misestimate_factor = misestimate_factor
+        self.recorder = QueryRecorder()
+
+    # ------------------------------------------------------------------
+    # السيناريوهات
+    # ------------------------------------------------------------------
+    def _load_context(self) -> Dict[str, Any]:
+        from database.connection import db
+
+        with db.get_cursor() as cursor:
+            cursor.execute("""
+                SELECT sector_id, COUNT(*) AS cnt FROM customers
+                WHERE meter_type = 'زبون' AND is_active = TRUE
+                GROUP BY sector_id ORDER BY cnt DESC, sector_id LIMIT 1
+            """)
+            row = cursor.fetchone()
+            if not row:
+                raise RuntimeError("لا توجد بيانات في قاعدة القياس - شغّل generate أولاً")
+            sector_id = row['sector_id']
+            cursor.execute("""
+                SELECT id, parent_meter_id FROM customers
+                WHERE sector_id = %s AND meter_type = 'زبون' AND is_active = TRUE
+                ORDER BY id LIMIT 1
+            """, (sector_id,))
+            customer = cursor.fetchone()
+            cursor.execute("""
+                SELECT id FROM customers
+                WHERE sector_id = %s AND meter_type = 'علبة توزيع' ORDER BY id LIMIT 1
+            """, (sector_id,))
+            box = cursor.fetchone()
+            cursor.execute("SELECT id FROM users WHERE username = 'bench_admin'")
+            user = cursor.fetchone()
+
+        end = datetime.now().date()
+        return {
+            'sector_id': sector_id,
+            'customer_id': customer['id'],
+            'parent_id': customer['parent_meter_id'],
+            'box_id': box['id'] if box else None,
+            'user_id': user['id'] if user else 1,
+            'start_date': (end - timedelta(days=30)).strftime('%Y-%m-%d'),
+            'end_date': end.strftime('%Y-%m-%d'),
+        }
+
+    def scenarios(self, ctx: Dict[str, Any]) -> Dict[str, Callable[[], Any]]:
+        """السيناريوهات بمعاملات تمثيلية (مع الفلاتر الديناميكية وبدونها)"""
+        from modules.customers import CustomerManager
+        from modules.reports import ReportManager
+
+        reports = ReportManager()
+        customers = CustomerManager()
+        sector = ctx['sector_id']
+        return {
+            'reports.customer_balance': lambda: reports.get_customer_balance_report('negative'),
+            'reports.customers_by_sector': reports.get_customers_by_sector_report,
+            'reports.sales': lambda: reports.get_sales_report(ctx['start_date'], ctx['end_date']),
+            'reports.daily_sales': reports.get_daily_sales_summary,
+            'reports.invoice_detailed': lambda: reports.get_invoice_detailed_report(
+                ctx['start_date'], ctx['end_date'], sector_id=sector),
+            'reports.dashboard': reports.get_dashboard_statistics,
+            'reports.negative_balance': lambda: reports.get_negative_balance_lists_report(sector_id=sector),
+            'reports.negative_balance_filtered': lambda: reports.get_negative_balance_lists_report(
+                min_balance=-500000, max_balance=-1000, exclude_categories=['free', 'vip'], sector_id=sector),
+            'reports.cut_lists': lambda: reports.get_cut_lists_report(sector_id=sector),
+            'reports.cut_lists_box': lambda: reports.get_cut_lists_report(box_id=ctx['box_id'], max_balance=-1000),
+            'reports.visa_sheets': lambda: reports.get_visa_sheets_report(sector_id=sector),
+            'reports.free_customers': lambda: reports.get_free_customers_by_sector_report(sector_id=sector),
+            'reports.accountant_collections': lambda: reports.get_accountant_collections_report(
+                ctx['user_id'], f"{ctx['start_date']} 00:00:00", f"{ctx['end_date']} 23:59:59"),
+            'reports.cycle_inventory': lambda: reports.get_cycle_inventory_report(ctx['start_date'], ctx['end_date']),
+            'reports.vip_full': lambda: reports.get_vip_full_report(sector),
+            'reports.mobile_accountant': lambda: reports.get_mobile_accountant_full_report(sector),
+            'customers.get_customer': lambda: customers.get_customer(ctx['customer_id']),
+            'customers.search': lambda: customers.search_customers('محمد', sector),
+            'customers.list': lambda: customers.get_customers_list({'sector_id': sector}),
+            'customers.statistics': customers.get_customer_statistics,
+            'customers.balance_by_sector': customers.get_customer_balance_by_sector,
+            'customers.negative_advanced': lambda: customers.get_negative_balance_customers_advanced(
+                sector_id=sector),
+            'customers.hierarchy': lambda: customers.get_customer_hierarchy(sector),
+            'customers.meter_subtree': lambda: customers.get_meter_subtree(ctx['box_id']),
+            'customers.meter_ancestors': lambda: customers.get_meter_ancestors(ctx['customer_id']),
+            'customers.potential_children': lambda: customers.get_potential_children(ctx['parent_id']),
+            'customers.financial_logs': lambda: customers.get_financial_logs(ctx['customer_id']),
+        }
+
+    def collect(self, only: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        ctx = self._load_context()
+        for name, func in self.scenarios(ctx).items():
+            if only and not any(o in name for o in only):
+                continue
+            with self.recorder.capture(name):
+                try:
+                    func()
+                except Exception as e:
+                    logger.warning(f"فشل السيناريو {name}: {e}")
+        logger.info(f"تم التقاط {len(self.recorder.queries)} استعلام")
+        return self.recorder.queries
+
+    # ------------------------------------------------------------------
+    # الخطط
+    # ------------------------------------------------------------------
+    def _explain(self, cursor, sql: str) -> Dict[str, Any]:
+        """EXPLAIN ANALYZE داخل SAVEPOINT يُلغى دائماً (لا يبقى أي أثر حتى للاستعلامات المعدِّلة)"""
+        cursor.execute("SAVEPOINT plan_check")
+        try:
+            cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}")
+            row = cursor.fetchone()
+            plan = list(row.values())[0] if isinstance(row, dict) else row[0]
+            return plan[0] if isinstance(plan, list) else json.loads(plan)[0]
+        finally:
+            cursor.execute("ROLLBACK TO SAVEPOINT plan_check")
+
+    def _analyze(self, explained: Dict[str, Any], table_rows: Dict[str, float]) -> Dict[str, Any]:
+        root = explained['Plan']
+        seq_scans, misestimates, indexes_used = [], [], set()
+        for node in _walk(root):
+            relation = node.get('Relation Name')
+            if node.get('Index Name'):
+                indexes_used.add(node['Index Name'])
+            if node.get('Node Type') == 'Seq Scan' and table_rows.get(relation, 0) >= self.large_table_rows:
+                seq_scans.append({
+                    'relation': relation,
+                    'table_rows': int(table_rows[relation]),
+                    'filter': node.get('Filter'),
+                    'filter_columns': _filter_columns(node.get('Filter')),
+                })
+            loops = node.get('Actual Loops', 1) or 1
+            actual = node.get('Actual Rows', 0) * loops
+            estimated = node.get('Plan Rows', 0) * loops
+            worst = max(actual, estimated)
+            if worst >= MISESTIMATE_MIN_ROWS and worst / max(min(actual, estimated), 1) >= self.misestimate_factor:
+                misestimates.append({
+                    'node': node.get('Node Type'),
+                    'relation': relation,
+                    'estimated_rows': estimated,
+                    'actual_rows': actual,
+                })
+
+        shape = json.dumps(_plan_shape(root), ensure_ascii=False)
+        return {
+            'fingerprint': hashlib.sha1(shape.encode('utf-8')).hexdigest()[:16],
+            'total_cost': root.get('Total Cost'),
+            'plan_rows': root.get('Plan Rows'),
+            'actual_rows': root.get('Actual Rows'),
+            'execution_ms': explained.get('Execution Time'),
+            'planning_ms': explained.get('Planning Time'),
+            'shared_hit_blocks': root.get('Shared Hit Blocks'),
+            'shared_read_blocks': root.get('Shared Read Blocks'),
+            'seq_scans': seq_scans,
+            'misestimates': misestimates,
+            'indexes_used': sorted(indexes_used),
+        }
+
+    def check(self, only: Optional[List[str]] = None) -> Dict[str, Any]:
+        """جمع الاستعلامات، تحليل خططها وإرجاع تقرير JSON-ready مع مقترحات الفهارس"""
+        from database.connection import db
+
+        queries = self.collect(only)
+        results = {}
+        with db.get_cursor() as cursor:
+            cursor.execute("""
+                SELECT relname, reltuples FROM pg_class
+                WHERE relkind IN ('r', 'p') AND relnamespace = 'public'::regnamespace
+            """)
+            table_rows = {r['relname']: float(r['reltuples']) for r in cursor.fetchall()}
+            cursor.execute("""
+                SELECT tablename, indexname, indexdef FROM pg_indexes WHERE schemaname = 'public'
+            """)
+            indexes = [dict(r) for r in cursor.fetchall()]
+
+            for key, query in queries.items():
+                try:
+                    analysis = self._analyze(self._explain(cursor, query['sql']), table_rows)
+                except Exception as e:
+                    logger.warning(f"تعذر تحليل خطة {key}: {e}")
+                    analysis = {'error': str(e)}
+                results[key] = {'scenario': query['scenario'], 'sql': query['template'], **analysis}
+
+        return {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'large_table_rows': self.large_table_rows,
+            'queries': results,
+            'advice': self.advise(results, indexes),
+        }
+
+    # ------------------------------------------------------------------
+    # مستشار الفهارس
+    # ------------------------------------------------------------------
+    @staticmethod
+    def advise(results: Dict[str, Dict[str, Any]], indexes: List[Dict[str, Any]]) -> Dict[str, Any]:
+        leading = {}
+        for idx in indexes:
+            match = re.search(r'\(([^)]*)\)', idx['indexdef'])
+            first = match.group(1).split(',')[0].strip().strip('"') if match else ''
+            leading.setdefault(idx['tablename'], set()).add(first)
+
+        suggestions = {}
+        used = set()
+        for key, result in results.items():
+            used.update(result.get('indexes_used', []))
+            for scan in result.get('seq_scans', []):
+                for column in scan['filter_columns']:
+                    if column in leading.get(scan['relation'], set()):
+                        continue
+                    s = suggestions.setdefault((scan['relation'], column), {
+                        'relation': scan['relation'],
+                        'column': column,
+                        'statement': f"CREATE INDEX IF NOT EXISTS idx_{scan['relation']}_{column} "
+                                     f"ON {scan['relation']}({column});",
+                        'queries': [],
+                    })
+                    s['queries'].append(key)
+
+        unused = sorted(
+            idx['indexname'] for idx in indexes
+            if idx['indexname'].startswith('idx_') and idx['indexname'] not in used
+        )
+        return {'suggested_indexes': list(suggestions.values()), 'unused_indexes': unused}
+
+
+def compare_plans(baseline: Dict[str, Any], current: Dict[str, Any],
+                  cost_threshold: float = COST_THRESHOLD) -> Dict[str, Any]:
+    """مقارنة الخطط الحالية بخط الأساس: تغير شكل الخطة، Seq Scan جديد، تراجع التكلفة"""
+    base_queries = baseline.get('queries', {})
+    rows = []
+    for key, cur in sorted(current.get('queries', {}).items()):
+        base = base_queries.get(key)
+        issues = []
+        if base is None:
+            issues.append('new_query')
+        elif 'error' not in cur and 'error' not in base:
+            if cur['fingerprint'] != base['fingerprint']:
+                issues.append('plan_changed')
+            base_scans = {s['relation'] for s in base['seq_scans']}
+            new_scans = sorted({s['relation'] for s in cur['seq_scans']} - base_scans)
+            if new_scans:
+                issues.append(f"new_seq_scan:{','.join(new_scans)}")
+            if base['total_cost'] and cur['total_cost'] > base['total_cost'] * (1 + cost_threshold):
+                issues.append(f"cost_regression:{base['total_cost']:.0f}->{cur['total_cost']:.0f}")
+        elif 'error' in cur:
+            issues.append('error')
+        if issues:
+            rows.append({'key': key, 'scenario': cur['scenario'], 'issues': issues})
+
+    missing = sorted(set(base_queries) - set(current.get('queries', {})))
+    regressions = [r for r in rows if any(
+        i.startswith(('new_seq_scan', 'cost_regression')) or i == 'error' for i in r['issues'])]
+    return {'rows': rows, 'missing_queries': missing, 'regressions': [r['key'] for r in regressions]}
+
+
+def format_plan_report(report: Dict[str, Any], comparison: Optional[Dict[str, Any]] = None) -> str:
+    lines = []
+    for key, q in report['queries'].items():
+        if q.get('seq_scans') or q.get('misestimates'):
+            scans = ', '.join(f"{s['relation']}({s['table_rows']})" for s in q['seq_scans'])
+            lines.append(f"{key}: seq_scans=[{scans}] misestimates={len(q['misestimates'])} "
+                         f"cost={q['total_cost']} time={q['execution_ms']}ms")
+    for s in report['advice']['suggested_indexes']:
+        lines.append(f"💡 {s['statement']}  ({len(s['queries'])} استعلام)")
+    if report['advice']['unused_indexes']:
+        lines.append(f"فهارس غير مستخدمة في هذا الحمل: {', '.join(report['advice']['unused_indexes'])}")
+    if comparison:
+        for row in comparison['rows']:
+            lines.append(f"{row['key']}: {' '.join(row['issues'])}")
+        if comparison['missing_queries']:
+            lines.append(f"استعلامات اختفت منذ خط الأساس: {len(comparison['missing_queries'])}")
+    return '\n'.join(lines)
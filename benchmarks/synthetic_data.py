@@ -0,0 +1,415 @@
+# benchmarks/synthetic_data.py
+"""
+مولد بيانات اصطناعية حتمي لقياس الأداء.
+
+يبني في قاعدة بيانات مؤقتة: قطاعات، هرمية عدادات (مولدة ← علبة توزيع ← رئيسية ← زبون)،
+فواتير أسبوعية، سجل الزبائن (customer_history)، تأشيرات أسبوعية، وقراءات الوقود اليومية.
+نفس البذرة ونفس تاريخ النهاية تعطي نفس البيانات تماماً.
+"""
+import json
+import logging
+import math
+import random
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+from config.settings import DATABASE_CONFIG
+
+logger = logging.getLogger(__name__)
+
+SCALES = {'1k': 1000, '10k': 10000, '100k': 100000}
+DEFAULT_DB_NAME = 'electricity_billing_bench'
+
+# الجداول التي تُفرغ قبل التعبئة (CASCADE يشمل الجداول المرتبطة بالزبائن)
+RESET_TABLES = (
+    'customer_history', 'collection_logs', 'invoices', 'customers', 'sectors',
+    'daily_readings', 'fuel_transfers', 'fuel_purchases', 'fuel_tanks',
+    'generator_meters', 'sector_meters',
+)
+
+CUSTOMERS_PER_BOX = 150
+MAINS_PER_BOX = 3
+DIRECT_CUSTOMER_RATIO = 0.15   # نسبة الزبائن المرتبطين بالعلبة مباشرة
+PRICE_PER_KILO = 7200
+FINANCIAL_CATEGORIES = (('normal', 90), ('free', 4), ('vip', 4), ('free_vip', 2))
+
+FIRST_NAMES = ('أحمد', 'محمد', 'علي', 'حسن', 'خالد', 'عمر', 'يوسف', 'إبراهيم', 'سامر', 'فادي',
+               'مريم', 'فاطمة', 'زينب', 'هدى', 'رنا', 'سلمى', 'ليلى', 'نور', 'ريم', 'عبير')
+LAST_NAMES = ('الأحمد', 'الحسن', 'العلي', 'الخطيب', 'الشامي', 'الحلبي', 'النجار', 'الحداد',
+              'السعيد', 'الزين', 'المصري', 'العمر', 'الخليل', 'الصالح', 'الحمود', 'الجاسم')
+
+
+def parse_scale(scale) -> int:
+    """تحويل الحجم ('1k'/'10k'/'100k' أو رقم) إلى عدد الزبائن"""
+    if isinstance(scale, int):
+        return scale
+    if scale in SCALES:
+        return SCALES[scale]
+    return int(scale)
+
+
+def ensure_database(db_name: str = DEFAULT_DB_NAME, recreate: bool = False) -> bool:
+    """
+    إنشاء قاعدة بيانات القياس إن لم تكن موجودة (أو حذفها وإعادة إنشائها).
+    يرفض أي اسم لا يحتوي 'bench' لتجنب العمل على قاعدة الإنتاج بالخطأ.
+    """
+    if 'bench' not in db_name:
+        raise ValueError(f"اسم قاعدة بيانات القياس يجب أن يحتوي 'bench': {db_name}")
+
+    params = dict(DATABASE_CONFIG)
+    params['database'] = 'postgres'
+    conn = psycopg2.connect(**params)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            if recreate:
+                cursor.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(db_name)))
+            cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s", (db_name,))
+            if cursor.fetchone():
+                return False
+            cursor.execute(sql.SQL("CREATE DATABASE {} ENCODING 'UTF8' TEMPLATE template0").format(
+                sql.Identifier(db_name)))
+            logger.info(f"تم إنشاء قاعدة بيانات القياس: {db_name}")
+            return True
+    finally:
+        conn.close()
+
+
+def drop_database(db_name: str = DEFAULT_DB_NAME):
+    """حذف قاعدة بيانات القياس بعد الانتهاء"""
+    if 'bench' not in db_name:
+        raise ValueError(f"اسم قاعدة بيانات القياس يجب أن يحتوي 'bench': {db_name}")
+    from database.connection import db
+    db.close_all()
+
+    params = dict(DATABASE_CONFIG)
+    params['database'] = 'postgres'
+    conn = psycopg2.connect(**params)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(db_name)))
+    finally:
+        conn.close()
+
+
+class SyntheticDataGenerator:
+    """توليد بيانات اصطناعية حتمية بالحجم المطلوب"""
+
+    def __init__(self, scale='10k', seed: int = 42, weeks: int = 8,
+                 invoices_per_customer: int = 4, visas_per_customer: int = 2,
+                 end_date: Optional[date] = None, batch_size: int = 5000):
+        self.customer_count = parse_scale(scale)
+        self.scale = scale if isinstance(scale, str) else str(scale)
+        self.seed = seed
+        self.weeks = max(1, weeks)
+        self.invoices_per_customer = min(invoices_per_customer, self.weeks)
+        self.visas_per_customer = visas_per_customer
+        self.end_date = end_date or date.today()
+        self.start_date = self.end_date - timedelta(weeks=self.weeks)
+        self.batch_size = batch_size
+        self.rng = random.Random(seed)
+        self.sector_count = max(2, min(12, self.customer_count // 2500 + 2))
+
+    # ------------------------------------------------------------------
+    # الواجهة العامة
+    # ------------------------------------------------------------------
+    def generate(self) -> Dict:
+        """تفريغ الجداول ثم تعبئتها بالكامل، وإرجاع عدد الصفوف لكل جدول"""
+        from database.connection import db
+        from database.models import models
+
+        started = datetime.now()
+        counts = {}
+        try:
+            with db.get_cursor() as cursor:
+                self._reset(cursor)
+                self._ensure_partitions(cursor, models)
+                user_id = self._ensure_user(cursor)
+                sectors = self._insert_sectors(cursor)
+                customers = self._insert_hierarchy(cursor, sectors)
+                counts['sectors'] = len(sectors)
+                counts['meters'] = sum(len(s['meters']) for s in sectors)
+                counts['customers'] = len(customers)
+                counts['invoices'], counts['history'] = self._insert_invoices(cursor, customers, user_id)
+                counts['visas'] = self._insert_visas(cursor, customers, user_id)
+                counts['history'] += counts['visas']
+                counts['daily_readings'] = self._insert_fuel(cursor, sectors)
+
+            paths = models.rebuild_meter_paths()
+            if not paths.get('success'):
+                raise RuntimeError(paths.get('error'))
+
+            with db.get_cursor() as cursor:
+                cursor.execute("ANALYZE")
+
+            elapsed = (datetime.now() - started).total_seconds()
+            logger.info(f"تم توليد بيانات القياس ({self.customer_count} زبون) خلال {elapsed:.1f} ثانية")
+            return {'success': True, 'scale': self.scale, 'seed': self.seed,
+                    'counts': counts, 'elapsed_seconds': round(elapsed, 2)}
+        except Exception as e:
+            logger.error(f"خطأ في توليد بيانات القياس: {e}", exc_info=True)
+            return {'success': False, 'error': str(e)}
+
+    # ------------------------------------------------------------------
+    # التهيئة
+    # ------------------------------------------------------------------
+    def _reset(self, cursor):
+        cursor.execute(
+            sql.SQL("TRUNCATE {} RESTART IDENTITY CASCADE").format(
+                sql.SQL(', ').join(sql.Identifier(t) for t in RESET_TABLES))
+        )
+
+    def _ensure_partitions(self, cursor, models):
+        """أقسام شهرية تغطي فترة البيانات (وإلا تذهب كلها للقسم الافتراضي)"""
+        if models._is_history_partitioned(cursor):
+            models._create_history_partitions(
+                cursor, models._month_start(self.start_date), models._month_start(self.end_date)
+            )
+
+    def _ensure_user(self, cursor) -> int:
+        cursor.execute("""
+            INSERT INTO users (username, password_hash, full_name, role)
+            VALUES ('bench_admin', 'x', 'مستخدم القياس', 'admin')
+            ON CONFLICT (username) DO UPDATE SET full_name = EXCLUDED.full_name
+            RETURNING id
+        """)
+        return cursor.fetchone()['id']
+
+    # ------------------------------------------------------------------
+    # القطاعات والهرمية
+    # ------------------------------------------------------------------
+    def _insert_sectors(self, cursor) -> List[Dict]:
+        rows = [(f"قطاع قياس {i + 1}", f"BENCH{i + 1:02d}") for i in range(self.sector_count)]
+        result = execute_values(
+            cursor, "INSERT INTO sectors (name, code) VALUES %s RETURNING id, code", rows, fetch=True
+        )
+        return [{'id': r['id'], 'code': r['code'], 'meters': []} for r in result]
+
+    def _customer_row(self, sector_id, box, serial, parent_id, meter_type, name):
+        rng = self.rng
+        if meter_type == 'زبون':
+            category = rng.choices([c for c, _ in FINANCIAL_CATEGORIES],
+                                   [w for _, w in FINANCIAL_CATEGORIES])[0]
+            balance = round(rng.uniform(-150000, 40000), 2)
+            reading = round(rng.uniform(100, 20000), 2)
+            visa = round(rng.choice((0, 0, 50, 100, 150)), 2)
+            withdrawal = round(rng.uniform(0, 300), 2)
+        else:
+            category, balance, reading, visa, withdrawal = 'normal', 0, 0, 0, 0
+        phone = f"09{rng.randrange(10 ** 8):08d}"
+        return (sector_id, box, serial, parent_id, meter_type, name, phone,
+                balance, reading, visa, withdrawal, category, True)
+
+    def _insert_customers(self, cursor, rows) -> List[Dict]:
+        result = []
+        for start in range(0, len(rows), self.batch_size):
+            result.extend(execute_values(cursor, """
+                INSERT INTO customers
+                (sector_id, box_number, serial_number, parent_meter_id, meter_type, name, phone_number,
+                 current_balance, last_counter_reading, visa_balance, withdrawal_amount,
+                 financial_category, is_active)
+                VALUES %s
+                RETURNING id, sector_id, box_number, parent_meter_id, meter_type,
+                          current_balance, last_counter_reading, visa_balance, withdrawal_amount
+            """, rows[start:start + self.batch_size], page_size=self.batch_size, fetch=True))
+        return [dict(r) for r in result]
+
+    def _insert_hierarchy(self, cursor, sectors) -> List[Dict]:
+        """إدراج الهرمية مستوى بمستوى (كل مستوى يحتاج معرفات المستوى الأعلى)"""
+        rng = self.rng
+        per_sector = [self.customer_count // len(sectors)] * len(sectors)
+        per_sector[0] += self.customer_count - sum(per_sector)
+
+        generators = self._insert_customers(cursor, [
+            self._customer_row(s['id'], '0', '0', None, 'مولدة', f"مولدة {s['code']}")
+            for s in sectors
+        ])
+        execute_values(cursor, """
+            UPDATE sectors SET default_generator_id = v.generator_id
+            FROM (VALUES %s) AS v(sector_id, generator_id)
+            WHERE sectors.id = v.sector_id
+        """, [(g['sector_id'], g['id']) for g in generators])
+
+        box_rows, box_plan = [], []
+        for sector, generator, count in zip(sectors, generators, per_sector):
+            sector['meters'].append(generator['id'])
+            for b in range(max(1, math.ceil(count / CUSTOMERS_PER_BOX))):
+                box_rows.append(self._customer_row(
+                    sector['id'], str(b + 1), '0', generator['id'], 'علبة توزيع', f"علبة {sector['code']}-{b + 1}"))
+                box_plan.append(min(CUSTOMERS_PER_BOX, count - b * CUSTOMERS_PER_BOX))
+        boxes = self._insert_customers(cursor, box_rows)
+
+        main_rows = []
+        for box in boxes:
+            for m in range(MAINS_PER_BOX):
+                main_rows.append(self._customer_row(
+                    box['sector_id'], box['box_number'], f"R{m + 1}", box['id'], 'رئيسية',
+                    f"رئيسية {box['box_number']}-{m + 1}"))
+        mains = self._insert_customers(cursor, main_rows)
+
+        customer_rows = []
+        for index, (box, count) in enumerate(zip(boxes, box_plan)):
+            box_mains = mains[index * MAINS_PER_BOX:(index + 1) * MAINS_PER_BOX]
+            for serial in range(1, count + 1):
+                parent = box if rng.random() < DIRECT_CUSTOMER_RATIO else rng.choice(box_mains)
+                name = f"{rng.choice(FIRST_NAMES)} {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+                customer_rows.append(self._customer_row(
+                    box['sector_id'], box['box_number'], str(serial), parent['id'], 'زبون', name))
+        customers = self._insert_customers(cursor, customer_rows)
+
+        by_sector = {s['id']: s for s in sectors}
+        for meter in boxes + mains:
+            by_sector[meter['sector_id']]['meters'].append(meter['id'])
+        return customers
+
+    # ------------------------------------------------------------------
+    # الفواتير والسجل والتأشيرات
+    # ------------------------------------------------------------------
+    def _week_date(self, week: int) -> date:
+        return self.start_date + timedelta(weeks=week, days=self.rng.randrange(7))
+
+    def _insert_invoices(self, cursor, customers, user_id):
+        """فواتير أسبوعية لكل زبون مع سطر سجل لكل فاتورة (على دفعات)"""
+        rng = self.rng
+        invoice_count = history_count = 0
+        sequence = 0
+        for start in range(0, len(customers), self.batch_size // max(1, self.invoices_per_customer)):
+            chunk = customers[start:start + self.batch_size // max(1, self.invoices_per_customer)]
+            invoices, history = [], []
+            for c in chunk:
+                reading = float(c['last_counter_reading'])
+                balance = float(c['current_balance'])
+                weeks = sorted(rng.sample(range(self.weeks), self.invoices_per_customer))
+                # إعادة بناء القراءات والأرصدة للخلف حتى تنتهي عند القيم الحالية للزبون
+                kilowatts = [round(rng.uniform(20, 400), 2) for _ in weeks]
+                previous = reading - sum(kilowatts)
+                balance_before = balance - sum(k * PRICE_PER_KILO for k in kilowatts)
+                for week, kw in zip(weeks, kilowatts):
+                    sequence += 1
+                    pay_date = self._week_date(week)
+                    pay_time = time(rng.randrange(8, 18), rng.randrange(60))
+                    total = round(kw * PRICE_PER_KILO, 2)
+                    invoices.append((
+                        f"BN-{sequence:08d}", c['id'], c['sector_id'], user_id, pay_date, pay_time,
+                        kw, PRICE_PER_KILO, total, round(previous, 2), round(previous + kw, 2),
+                        round(balance_before + total, 2), 'active'
+                    ))
+                    history.append((
+                        c['id'], 'invoice_created', 'payment', round(balance_before, 2),
+                        round(balance_before + total, 2), total, round(balance_before, 2),
+                        round(balance_before + total, 2), f"فاتورة BN-{sequence:08d}", user_id,
+                        datetime.combine(pay_date, pay_time), float(c['withdrawal_amount']),
+                        float(c['visa_balance']), round(previous + kw, 2)
+                    ))
+                    previous += kw
+                    balance_before += total
+
+            execute_values(cursor, """
+                INSERT INTO invoices
+                (invoice_number, customer_id, sector_id, user_id, payment_date, payment_time,
+                 kilowatt_amount, price_per_kilo, total_amount, previous_reading, new_reading,
+                 current_balance, status)
+                VALUES %s
+            """, invoices, page_size=self.batch_size)
+            self._insert_history(cursor, history)
+            invoice_count += len(invoices)
+            history_count += len(history)
+        return invoice_count, history_count
+
+    def _insert_history(self, cursor, rows):
+        execute_values(cursor, """
+            INSERT INTO customer_history
+            (customer_id, action_type, transaction_type, old_value, new_value, amount,
+             current_balance_before, current_balance_after, notes, created_by, created_at,
+             snapshot_withdrawal_amount, snapshot_visa_balance, snapshot_last_counter_reading)
+            VALUES %s
+        """, rows, page_size=self.batch_size)
+
+    def _insert_visas(self, cursor, customers, user_id) -> int:
+        rng = self.rng
+        rows = []
+        count = 0
+        for c in customers:
+            visa = float(c['visa_balance'])
+            for _ in range(self.visas_per_customer):
+                amount = rng.choice((50, 100, 150))
+                created = datetime.combine(self._week_date(rng.randrange(self.weeks)), time(7, 0))
+                rows.append((
+                    c['id'], 'visa_update', 'weekly_visa', visa, visa + amount, amount,
+                    None, None, 'تأشيرة أسبوعية (بيانات قياس)', user_id, created,
+                    float(c['withdrawal_amount']), visa + amount, float(c['last_counter_reading'])
+                ))
+                visa += amount
+            if len(rows) >= self.batch_size:
+                self._insert_history(cursor, rows)
+                count += len(rows)
+                rows = []
+        if rows:
+            self._insert_history(cursor, rows)
+            count += len(rows)
+        return count
+
+    # ------------------------------------------------------------------
+    # الوقود والقراءات اليومية
+    # ------------------------------------------------------------------
+    def _insert_fuel(self, cursor, sectors) -> int:
+        rng = self.rng
+        tanks = [r['id'] for r in execute_values(
+            cursor, "INSERT INTO fuel_tanks (name, liters_per_cm) VALUES %s RETURNING id",
+            [('خزان قياس 1', 10.75), ('خزان قياس 2', 12.5)], fetch=True)]
+        generator_meters = [r['id'] for r in execute_values(
+            cursor, "INSERT INTO generator_meters (name, code) VALUES %s RETURNING id",
+            [(f"عداد مولدة {s['code']}", f"BG{s['code']}") for s in sectors], fetch=True)]
+        sector_meters = [r['id'] for r in execute_values(
+            cursor, "INSERT INTO sector_meters (name, code, sector_id) VALUES %s RETURNING id",
+            [(f"عداد قطاع {s['code']}", f"BS{s['code']}", s['id']) for s in sectors], fetch=True)]
+
+        purchases, transfers = [], []
+        for week in range(self.weeks):
+            day = self.start_date + timedelta(weeks=week)
+            purchases.append((day, round(rng.uniform(8000, 15000), 2), round(rng.uniform(9000, 11000), 2)))
+            for tank in tanks:
+                transfers.append((day, tank, round(rng.uniform(3000, 6000), 2)))
+        execute_values(cursor, """
+            INSERT INTO fuel_purchases (purchase_date, quantity_liters, price_per_liter) VALUES %s
+        """, purchases)
+        execute_values(cursor, """
+            INSERT INTO fuel_transfers (transfer_date, tank_id, quantity_liters) VALUES %s
+        """, transfers)
+
+        gen_totals = {m: rng.uniform(1e5, 5e5) for m in generator_meters}
+        sec_totals = {m: rng.uniform(1e5, 5e5) for m in sector_meters}
+        scale = self.customer_count / 1000.0
+        readings = []
+        for offset in range((self.end_date - self.start_date).days + 1):
+            day = self.start_date + timedelta(days=offset)
+            gen_delta = {m: rng.uniform(800, 1200) * scale / len(generator_meters) for m in generator_meters}
+            sec_delta = {m: gen_delta[g] * rng.uniform(0.85, 0.95) for m, g in zip(sector_meters, generator_meters)}
+            for m in gen_totals:
+                gen_totals[m] += gen_delta[m]
+            for m in sec_totals:
+                sec_totals[m] += sec_delta[m]
+            generator_output = sum(gen_delta.values())
+            sector_output = sum(sec_delta.values())
+            fuel = generator_output / rng.uniform(3.0, 3.6)
+            readings.append((
+                day,
+                json.dumps({str(m): round(v, 2) for m, v in gen_totals.items()}),
+                json.dumps({str(m): round(v, 2) for m, v in sec_totals.items()}),
+                json.dumps({str(t): round(rng.uniform(20, 180), 1) for t in tanks}),
+                round(generator_output, 2), round(sector_output, 2), round(fuel, 2),
+                round(generator_output / fuel, 4), round(sector_output / generator_output, 4)
+            ))
+        execute_values(cursor, """
+            INSERT INTO daily_readings
+            (reading_date, generator_readings, sector_readings, tank_readings,
+             generator_output, sector_output, total_fuel_burned,
+             generator_efficiency, sector_efficiency)
+            VALUES %s
+        """, readings)
+        return len(readings)
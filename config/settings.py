@@ -33,6 +33,18 @@ DATABASE_CONFIG = {
     'password': os.getenv('DB_PASSWORD', '521990')
 }
 
+# نسخة القراءة (read replica) للتقارير والتصدير - اختيارية.
+# dsn فارغ = كل القراءات على الخادم الأساسي. القيم غير المذكورة في dsn تؤخذ من DATABASE_CONFIG
+# مثال: DB_REPLICA_DSN="host=10.10.0.5 port=5433"
+DATABASE_REPLICA_CONFIG = {
+    'dsn': os.getenv('DB_REPLICA_DSN', ''),
+    'max_lag_seconds': 30,          # تأخر التطبيق (replay lag) المقبول قبل العودة للخادم الأساسي
+    'check_interval': 10,           # إعادة فحص التأخر كل (ثوانٍ)
+    'retry_after': 60,              # بعد فشل الاتصال بالنسخة أو تجاوز التأخر
+    'connect_timeout': 5,
+    'fallback_lane': 'reporting',   # مسار القراءات الثقيلة عند عدم توفر النسخة
+}
+
 # المفتاح السري للتشفير
 SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key-here-change-in-production')
 
@@ -125,6 +137,102 @@ BACKUP_CONFIG = {
         'sample_size': 10,
     },
     'parallel_backup': True,
+    # تنسيق pg_dump: 'custom' ملف واحد (استعادة متوازية بـ pg_restore -j)،
+    # 'directory' مجلد يدعم النسخ المتوازي أيضاً (pg_dump -j)
+    'dump_format': 'custom',
+    'parallel_jobs': 4,
+    'compression_level': 3,          # ضغط أخف = نسخ أسرع (0-9)
+    'io_buffer_size': 1024 * 1024,   # حجم القراءة عند حساب checksum والتشفير
+}
+
+# تقسيم جدول customer_history شهرياً وأرشفة الأقسام القديمة
+HISTORY_PARTITION_CONFIG = {
+    'months_ahead': 3,              # عدد الأشهر القادمة التي تُنشأ أقسامها مسبقاً
+    'archive_after_months': 24,     # الأقسام الأقدم من ذلك تُؤرشف
+    'auto_archive': False,          # تشغيل الأرشفة تلقائياً مع النسخ الاحتياطي المجدول
+    # الأرشفة تنقل الأقسام القديمة إلى tablespace على تخزين مضغوط (تبقى قابلة للاستعلام)
+    'archive_tablespace': None,     # اسم tablespace على قرص مضغوط (مطلوب للأرشفة)
+    # مجلد ملفات CSV المضغوطة لوضع التصدير والحذف (--export-and-drop فقط)
+    'archive_path': str(BACKUP_DIR / 'history_archive'),
+}
+
+# كاتب سجل النشاطات غير المتزامن (activity_logs)
+AUDIT_LOG_CONFIG = {
+    'batch_size': 100,              # عدد السجلات التي تُكتب دفعة واحدة
+    'flush_interval': 2.0,          # أقصى مدة (ثوانٍ) قبل كتابة الدفعة الحالية
+    'queue_max_size': 10000,        # عند الامتلاء تذهب السجلات لملف الانتظار مباشرة
+    'spool_file': str(LOG_DIR / 'audit_spool.jsonl'),  # ملف الانتظار عند تعذر الوصول لقاعدة البيانات
+    'reject_file': str(LOG_DIR / 'audit_rejected.jsonl'),  # سجلات رفضتها قاعدة البيانات (خطأ بيانات)
+}
+
+# دفتر التحصيل المحلي (SQLite) ومزامنته مع قاعدة البيانات المركزية
+COLLECTION_JOURNAL_CONFIG = {
+    'journal_path': str(DATA_DIR / 'collector_journal.sqlite3'),
+    'sync_batch_size': 200,         # عدد عمليات التحصيل في كل معاملة مزامنة
+    'keep_synced_days': 30,         # مدة الاحتفاظ بالعمليات المتزامنة في الدفتر المحلي
+}
+
+# تتبع الأداء (spans) للمدراء وشاشات الواجهة - يمكن تفعيله أثناء التشغيل من شاشة الإعدادات
+TRACING_CONFIG = {
+    'enabled': os.getenv('TRACING_ENABLED', '0') == '1',
+    'buffer_size': 200,             # عدد آخر التتبعات المحفوظة في الذاكرة
+    'max_spans_per_trace': 5000,    # بعده تُجمع أزمنة SQL دون إنشاء span لكل استعلام
+    'max_sql_length': 300,          # طول نص الاستعلام المحفوظ في الـ span
+    'export_dir': str(LOG_DIR / 'traces'),
+}
+
+# منفذ المهام الخلفية للواجهة (استعلامات الشاشات خارج حلقة أحداث Tk)
+UI_TASK_CONFIG = {
+    'workers': 4,                   # عدد خيوط العمل (كل مهمة تحجز اتصالاً واحداً طوال تنفيذها)
+    'poll_interval_ms': 50,         # فترة فحص طابور النتائج عبر after
+    'cancel_running_queries': True, # إلغاء الاستعلام الجاري على الخادم عند استبدال الطلب
+}
+
+# ذاكرة الجداول المرجعية (القطاعات، المستخدمون، تصنيفات المصروفات) المشتركة في العملية
+REFERENCE_DATA_CONFIG = {
+    'ttl_seconds': 600,             # إعادة التحميل بعدها لالتقاط تعديلات محطات العمل الأخرى (0 = بلا انتهاء)
+}
+
+# قناة التغييرات (LISTEN/NOTIFY) بين محطات العمل لإبطال الذاكرات وتحديث الشاشات فوراً
+CHANGE_FEED_CONFIG = {
+    'enabled': os.getenv('CHANGE_FEED_ENABLED', '1') == '1',
+    'channel': 'row_changes',
+    # الجداول المراقبة ← العمود المرسل مع كل إشعار كمفتاح (None = المعرف فقط)
+    'tables': {
+        'customers': 'sector_id',
+        'invoices': 'customer_id',
+        'role_permissions': 'role',
+        'user_permissions': 'user_id',
+        'daily_cash': 'cash_date',
+        'sectors': None,
+        'users': None,
+        'expense_categories': None,
+    },
+    'batch_window': 0.1,            # تجميع دفعات الإشعارات المتلاحقة (ثوانٍ) قبل التوزيع
+    'keepalive_interval': 30,       # فحص الاتصال عند عدم وصول إشعارات (ثوانٍ)
+    'reconnect_delay': 2,           # أول انتظار قبل إعادة الاتصال (يتضاعف حتى max_reconnect_delay)
+    'max_reconnect_delay': 60,
+    'ui_refresh_ms': 500,           # فترة فحص الشاشات المشتركة للتغييرات (تجميع التحديثات)
+}
+
+# ذاكرة سجلات الزبائن (LRU) لشاشة الجباية
+CUSTOMER_CACHE_CONFIG = {
+    'max_entries': 1000,            # عدد الزبائن المحتفظ بهم (الأقل استخداماً يُحذف أولاً)
+    'ttl_seconds': 30,              # مدة الصلاحية أثناء انقطاع قناة التغييرات فقط
+}
+
+# لقطات التقارير الأسبوعية المولدة مسبقاً (modules/report_snapshots.py)
+REPORT_SNAPSHOT_CONFIG = {
+    'enabled': os.getenv('REPORT_SNAPSHOTS_ENABLED', '1') == '1',
+    'weekday': 6,                   # يوم التوليد (الاثنين=0 ... الأحد=6) بعد إغلاق الدورة الأسبوعية
+    'hour': 4,                      # ساعة التوليد (خارج أوقات الذروة)
+    'catch_up_hours': 12,           # إن فات الموعد والبرنامج مغلق: التوليد عند التشغيل خلال هذه المدة فقط
+    'check_interval_minutes': 15,
+    'keep_versions': 8,             # عدد النسخ المحفوظة لكل تقرير
+    'max_attempts': 4,              # محاولات التقرير الفاشل لكل موعد قبل تركه حتى الموعد التالي
+    'retry_backoff_minutes': 30,    # مهلة إعادة المحاولة (تتضاعف بعد كل فشل)
+    'reports': None,                # None = كل التقارير في SNAPSHOT_REPORTS
+    'export_dir': 'exports',
 }
 
 # إعدادات الأداء
@@ -134,11 +242,28 @@ PERFORMANCE_SETTINGS = {
     'cache_customers': True,
     'parallel_backup': True,
     'fast_printing': True,
+    'report_section_workers': 4,    # أقصى أقسام التقارير المركبة المنفذة بالتوازي (ضمن الاتصالات الحرة في المسار)
 }
 
-# إعدادات الاتصال
+# إعدادات الاتصال (database/pool.py) - القيم العامة تُطبق على كل مسار ما لم يحدد المسار غيرها
 CONNECTION_POOL = {
-    'min_connections': 5,
-    'max_connections': 50,
-    'connection_timeout': 30,
+    'connection_timeout': 30,       # أقصى انتظار لاتصال متاح (ثوانٍ) قبل الخطأ
+    'max_lifetime': 1800,           # إعادة تدوير الاتصال بعد هذا العمر (ثوانٍ)
+    'validate_after_idle': 30,      # فحص SELECT 1 قبل تسليم اتصال خامل أكثر من ذلك
+    'probe_timeout_ms': 2000,       # مهلة SELECT 1 في الفحص (عند الحجز وفي خيط الصيانة)
+    'maintenance_interval': 30,     # دورة فحص الخامل وإكمال الحد الأدنى
+    'default_lane': 'interactive',
+    'lanes': {
+        # الجباية والشاشات: لا تنتظر خلف التقارير
+        'interactive': {'min_connections': 3, 'max_connections': 12, 'statement_timeout_ms': 60000},
+        # التقارير والتصدير
+        'reporting': {'min_connections': 1, 'max_connections': 6, 'statement_timeout_ms': 600000,
+                      'connection_timeout': 120},
+        # الترحيل وتهيئة الجداول والتقسيم: بلا مهلة استعلام
+        'maintenance': {'min_connections': 0, 'max_connections': 2, 'statement_timeout_ms': 0,
+                        'connection_timeout': 300},
+        # نسخة القراءة (يُنشأ فقط عند تحديد DATABASE_REPLICA_CONFIG['dsn'])
+        'replica': {'min_connections': 0, 'max_connections': 6, 'statement_timeout_ms': 600000,
+                    'connection_timeout': 120},
+    },
 }
\ No newline at end of file
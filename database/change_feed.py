@@ -0,0 +1,247 @@
+# database/change_feed.py
+"""
+قناة التغييرات بين محطات العمل عبر LISTEN/NOTIFY.
+
+- مشغّل (trigger) على كل جدول مراقب يرسل إشعاراً مختصراً بصيغة JSON:
+  {"t": الجدول, "op": "I"/"U"/"D", "id": المعرف, "k": قيمة العمود المفتاحي}
+- خيط استماع واحد لكل عملية باتصال مستقل (خارج المجموعة) يجمع الإشعارات
+  ويوزعها على المشتركين (ذاكرات وشاشات) مجمعة حسب الجدول.
+- عند كل اتصال (أو إعادة اتصال) يُرسل للمشتركين حدث RESET لكل جدول، لأن
+  التغييرات أثناء الانقطاع لم تصل.
+- change_feed.live صحيح طالما الاستماع قائم: يمكن للذاكرات الاستغناء عن مدة
+  الصلاحية والاعتماد على الإبطال الفوري، والعودة لها عند الانقطاع.
+
+دوال الاشتراك تُستدعى من خيط الاستماع: على الشاشات استخدام ui/live_refresh.py.
+"""
+import json
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import psycopg2
+import psycopg2.extensions
+
+from config.settings import CHANGE_FEED_CONFIG, DATABASE_CONFIG
+from database.connection import db
+
+logger = logging.getLogger(__name__)
+
+RESET = '*'
+TRIGGER_NAME = 'trg_change_feed'
+FUNCTION_NAME = 'notify_row_change'
+
+
+class ChangeFeed:
+    """مستمع LISTEN/NOTIFY وموزع التغييرات - Thread-safe"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        cfg = dict(CHANGE_FEED_CONFIG)
+        cfg.update(config or {})
+        self.enabled = bool(cfg.get('enabled', True))
+        self.channel = cfg.get('channel', 'row_changes')
+        self.tables: Dict[str, Optional[str]] = dict(cfg.get('tables', {}))
+        self.batch_window = float(cfg.get('batch_window', 0.1))
+        self.keepalive_interval = float(cfg.get('keepalive_interval', 30))
+        self.reconnect_delay = float(cfg.get('reconnect_delay', 2))
+        self.max_reconnect_delay = float(cfg.get('max_reconnect_delay', 60))
+        self.live = False
+        self._subscribers: Dict[str, List[Callable]] = defaultdict(list)
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._connection = None
+
+    # ------------------------------------------------------------------
+    # المشغّلات على الخادم
+    # ------------------------------------------------------------------
+    def install_triggers(self, cursor):
+        """إنشاء دالة الإشعار والمشغّلات الناقصة (لا يُعاد إنشاء الموجود لتجنب أقفال الجداول)"""
+        cursor.execute(f"""
+            CREATE OR REPLACE FUNCTION {FUNCTION_NAME}() RETURNS trigger AS $$
+            DECLARE
+                rec JSONB;
+            BEGIN
+                IF TG_OP = 'DELETE' THEN
+                    rec := to_jsonb(OLD);
+                ELSE
+                    rec := to_jsonb(NEW);
+                END IF;
+                PERFORM pg_notify(TG_ARGV[0], json_build_object(
+                    't', TG_TABLE_NAME,
+                    'op', left(TG_OP, 1),
+                    'id', rec->'id',
+                    'k', CASE WHEN TG_NARGS > 1 THEN rec->TG_ARGV[1] END
+                )::text);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        """)
+        cursor.execute("""
+            SELECT c.relname
+            FROM pg_trigger t
+            JOIN pg_class c ON c.oid = t.tgrelid
+            WHERE t.tgname = %s AND c.relname = ANY(%s)
+        """, (TRIGGER_NAME, list(self.tables)))
+        existing = {row['relname'] for row in cursor.fetchall()}
+
+        for table, key_column in self.tables.items():
+            if table in existing:
+                continue
+            cursor.execute("SELECT to_regclass(%s) AS oid", (table,))
+            if cursor.fetchone()['oid'] is None:
+                continue
+            args = f"'{self.channel}'" + (f", '{key_column}'" if key_column else '')
+            cursor.execute(f"""
+                CREATE TRIGGER {TRIGGER_NAME}
+                AFTER INSERT OR UPDATE OR DELETE ON {table}
+                FOR EACH ROW EXECUTE PROCEDURE {FUNCTION_NAME}({args})
+            """)
+            logger.info(f"تم إنشاء مشغّل قناة التغييرات على {table}")
+
+    def ensure_triggers(self) -> bool:
+        try:
+            with db.get_cursor() as cursor:
+                self.install_triggers(cursor)
+            return True
+        except Exception as e:
+            logger.error(f"تعذر تثبيت مشغّلات قناة التغييرات: {e}")
+            return False
+
+    # ------------------------------------------------------------------
+    # الاشتراك
+    # ------------------------------------------------------------------
+    def subscribe(self, tables: Iterable[str], callback: Callable[[str, List[Dict[str, Any]]], None]) -> Callable[[], None]:
+        """
+        الاشتراك في تغييرات جداول: callback(table, changes) من خيط الاستماع.
+        changes قائمة أحداث {'table', 'op', 'id', 'key'}؛ op == RESET تعني "كل شيء قد تغير".
+        يُرجع دالة لإلغاء الاشتراك.
+        """
+        if isinstance(tables, str):
+            tables = (tables,)
+        tables = tuple(tables)
+        with self._lock:
+            for table in tables:
+                self._subscribers[table].append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                for table in tables:
+                    callbacks = self._subscribers.get(table, [])
+                    if callback in callbacks:
+                        callbacks.remove(callback)
+        return unsubscribe
+
+    def _dispatch(self, changes: List[Dict[str, Any]]):
+        by_table: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        seen = set()
+        for change in changes:
+            marker = (change['table'], change['op'], change['id'], change['key'])
+            if marker in seen:
+                continue
+            seen.add(marker)
+            by_table[change['table']].append(change)
+
+        for table, table_changes in by_table.items():
+            with self._lock:
+                callbacks = list(self._subscribers.get(table, ()))
+            for callback in callbacks:
+                try:
+                    callback(table, table_changes)
+                except Exception as e:
+                    logger.error(f"خطأ في معالجة تغييرات {table}: {e}", exc_info=True)
+
+    def _reset_all(self):
+        self._dispatch([{'table': table, 'op': RESET, 'id': None, 'key': None} for table in self.tables])
+
+    # ------------------------------------------------------------------
+    # خيط الاستماع
+    # ------------------------------------------------------------------
+    def start(self):
+        if not self.enabled or (self._thread and self._thread.is_alive()):
+            return
+        self.ensure_triggers()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='change-feed', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        connection = self._connection
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.live = False
+
+    def _connect(self):
+        conn = psycopg2.connect(
+            application_name='billing-change-feed',
+            keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3,
+            **DATABASE_CONFIG
+        )
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {self.channel}")
+        return conn
+
+    def _run(self):
+        delay = self.reconnect_delay
+        while not self._stop.is_set():
+            try:
+                self._connection = self._connect()
+                self.live = True
+                delay = self.reconnect_delay
+                logger.info(f"قناة التغييرات متصلة ({self.channel})")
+                self._reset_all()
+                self._listen(self._connection)
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                logger.warning(f"انقطعت قناة التغييرات: {e} - إعادة المحاولة بعد {delay:.0f} ثانية")
+            finally:
+                self.live = False
+                if self._connection is not None:
+                    try:
+                        self._connection.close()
+                    except Exception:
+                        pass
+                    self._connection = None
+            self._stop.wait(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def _listen(self, conn):
+        while not self._stop.is_set():
+            ready, _, _ = select.select([conn], [], [], self.keepalive_interval)
+            if not ready:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                continue
+            conn.poll()
+            if self.batch_window and conn.notifies:
+                # تجميع الدفعة (استيراد، ترحيل...) في توزيع واحد
+                time.sleep(self.batch_window)
+                conn.poll()
+            changes = []
+            while conn.notifies:
+                changes.append(self._parse(conn.notifies.pop(0).payload))
+            changes = [c for c in changes if c is not None]
+            if changes:
+                self._dispatch(changes)
+
+    @staticmethod
+    def _parse(payload: str) -> Optional[Dict[str, Any]]:
+        try:
+            data = json.loads(payload)
+            return {'table': data['t'], 'op': data['op'], 'id': data.get('id'), 'key': data.get('k')}
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"إشعار غير مفهوم على قناة التغييرات: {payload[:200]}")
+            return None
+
+
+change_feed = ChangeFeed()
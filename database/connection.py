@@ -1,17 +1,66 @@
 # database/connection.py
+import functools
 import psycopg2
+import psycopg2.extensions
 from psycopg2 import pool
 from psycopg2.extras import RealDictCursor
 import logging
 from contextlib import contextmanager
+from contextvars import ContextVar
 import os
-from config.settings import DATABASE_CONFIG
+import time
+from config.settings import DATABASE_CONFIG, DATABASE_REPLICA_CONFIG, CONNECTION_POOL
+from database.pool import ConnectionPool
+from database.replica import ReplicaMonitor, REPLICA_LANE
+from utils.tracing import tracer
 
 logger = logging.getLogger(__name__)
 
+
+class _UnitOfWork:
+    """اتصال ومعاملة مشتركة بين كل استدعاءات get_cursor المتداخلة"""
+    __slots__ = ('connection', 'depth', 'lane', 'callbacks')
+
+    def __init__(self, connection, lane=None):
+        self.connection = connection
+        self.depth = 0
+        self.lane = lane
+        self.callbacks = []
+
+
+# وحدة العمل النشطة في السياق الحالي (خاصة بكل خيط/مهمة)
+_current_unit: ContextVar = ContextVar('db_unit_of_work', default=None)
+
+# مسار الاتصالات للعمل الجاري (None = المسار الافتراضي التفاعلي)
+_current_lane: ContextVar = ContextVar('db_pool_lane', default=None)
+
+
+class TracingCursor(RealDictCursor):
+    """RealDictCursor يسجل زمن كل استعلام في التتبع الحالي عند تفعيل التتبع"""
+
+    def execute(self, query, vars=None):
+        if not tracer.enabled:
+            return super().execute(query, vars)
+        started = time.perf_counter_ns()
+        try:
+            return super().execute(query, vars)
+        finally:
+            tracer.record_sql(query, started, time.perf_counter_ns())
+
+    def executemany(self, query, vars_list):
+        if not tracer.enabled:
+            return super().executemany(query, vars_list)
+        started = time.perf_counter_ns()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            tracer.record_sql(query, started, time.perf_counter_ns())
+
 class DatabaseConnection:
     _instance = None
     _connection_pool = None
+    _replica = None
+    _replica_fallback = None
     
     def __new__(cls):
         if cls._instance is None:
@@ -21,33 +70,172 @@ class DatabaseConnection:
     
     def _initialize_pool(self):
         try:
-            self._connection_pool = psycopg2.pool.ThreadedConnectionPool(
-                minconn=1,
-                maxconn=20,
-                **DATABASE_CONFIG
-            )
+            keepalives = dict(keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3)
+            lanes = dict(CONNECTION_POOL.get('lanes', {}))
+            replica_lane = lanes.pop(REPLICA_LANE, {})
+            self._connection_pool = ConnectionPool(dict(DATABASE_CONFIG, **keepalives),
+                                                   dict(CONNECTION_POOL, lanes=lanes))
+            self._replica_fallback = DATABASE_REPLICA_CONFIG.get('fallback_lane')
+            if DATABASE_REPLICA_CONFIG.get('dsn'):
+                self._replica = ReplicaMonitor(
+                    self._connection_pool.add_lane(REPLICA_LANE, self._replica_connect_kwargs(keepalives), replica_lane),
+                    DATABASE_REPLICA_CONFIG
+                )
+            self._connection_pool.warm()
             logger.info("تم إنشاء مجموعة اتصالات قاعدة البيانات بنجاح")
         except Exception as e:
             logger.error(f"فشل إنشاء مجموعة الاتصالات: {e}")
             raise
     
+    @staticmethod
+    def _replica_connect_kwargs(extra):
+        """معاملات الاتصال بنسخة القراءة: قيم DSN فوق قيم DATABASE_CONFIG"""
+        params = dict(DATABASE_CONFIG, **extra)
+        replica = psycopg2.extensions.parse_dsn(DATABASE_REPLICA_CONFIG['dsn'])
+        if 'dbname' in replica:
+            params.pop('database', None)
+        params.update(replica)
+        params.setdefault('connect_timeout', DATABASE_REPLICA_CONFIG.get('connect_timeout', 5))
+        return params
+
+    def _resolve_lane(self, lane):
+        """المسار الفعلي: 'replica' يتحول للمسار البديل إن لم تكن النسخة متاحة أو حديثة"""
+        lane = lane or _current_lane.get()
+        if lane == REPLICA_LANE and (self._replica is None or not self._replica.available()):
+            return self._replica_fallback
+        return lane
+
+    @contextmanager
+    def lane(self, name):
+        """
+        تشغيل ما بداخله على مسار اتصالات محدد ('reporting' للتقارير والتصدير،
+        'maintenance' للترحيل والصيانة، 'replica' للقراءات الثقيلة على نسخة القراءة
+        مع العودة للخادم الأساسي). داخل وحدة عمل قائمة يبقى اتصالها كما هو.
+        """
+        token = _current_lane.set(name)
+        try:
+            yield
+        finally:
+            _current_lane.reset(token)
+
     @contextmanager
-    def get_connection(self):
+    def get_connection(self, lane=None):
+        lane = self._resolve_lane(lane)
         conn = None
         try:
-            conn = self._connection_pool.getconn()
+            try:
+                conn = self._connection_pool.getconn(lane)
+            except Exception as e:
+                if lane != REPLICA_LANE:
+                    raise
+                self._replica.mark_failed(e)
+                lane = self._replica_fallback
+                conn = self._connection_pool.getconn(lane)
             yield conn
         except Exception as e:
             logger.error(f"خطأ في الحصول على الاتصال: {e}")
             raise
         finally:
             if conn:
-                self._connection_pool.putconn(conn)
+                # الاتصال المنقطع (conn.closed) أو العالق في معاملة يُغلق بدل إرجاعه
+                self._connection_pool.putconn(conn, lane)
+
+    def pool_stats(self):
+        """إحصائيات المسارات (الحجم، الخامل، المنتظرون، المهلات...)"""
+        stats = self._connection_pool.stats()
+        if self._replica is not None:
+            stats[REPLICA_LANE].update(self._replica.stats())
+        return stats
+
+    def free_connections(self, lane=None):
+        """عدد الاتصالات المتاحة فوراً في المسار (بعد تحويل 'replica' لبديله إن لزم)"""
+        return self._connection_pool.lane(self._resolve_lane(lane)).free()
+
+    def current_lane(self):
+        """مسار العمل الجاري (مسار وحدة العمل النشطة إن وجدت) - لتمريره لخيوط عمل فرعية"""
+        unit = _current_unit.get()
+        if unit is not None:
+            return unit.lane
+        return _current_lane.get()
+
+    def on_replica(self):
+        """
+        هل وحدة العمل الحالية تقرأ من نسخة القراءة؟ الذاكرات المشتركة لا تخزن
+        ما تقرؤه منها لأنه قد يسبق إبطالاً وصل من الخادم الأساسي.
+        """
+        unit = _current_unit.get()
+        return unit is not None and unit.lane == REPLICA_LANE
     
+    @contextmanager
+    def transaction(self):
+        """
+        وحدة عمل (unit of work): كل استدعاءات get_cursor داخلها تستخدم
+        الاتصال والمعاملة نفسها، ويتم commit مرة واحدة عند الخروج.
+        الاستدعاء المتداخل يُنشئ SAVEPOINT بدلاً من معاملة جديدة.
+        """
+        unit = _current_unit.get()
+        if unit is not None:
+            with self._savepoint(unit):
+                yield unit.connection
+            return
+
+        lane = self._resolve_lane(None)
+        with self.get_connection(lane) as conn:
+            unit = _UnitOfWork(conn, lane)
+            token = _current_unit.set(unit)
+            try:
+                yield conn
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"خطأ في تنفيذ المعاملة: {e}")
+                raise
+            finally:
+                _current_unit.reset(token)
+                for callback in unit.callbacks:
+                    try:
+                        callback()
+                    except Exception as e:
+                        logger.error(f"خطأ في دالة ما بعد المعاملة: {e}", exc_info=True)
+
+    def after_transaction(self, callback):
+        """
+        تشغيل callback بعد انتهاء وحدة العمل الحالية (commit أو rollback)، أو فوراً
+        خارج وحدة عمل. يُستخدم لإبطال الذاكرات المشتركة حتى لا يعيد قارئ آخر تعبئتها
+        من بيانات ما قبل الالتزام.
+        """
+        unit = _current_unit.get()
+        if unit is None:
+            callback()
+        else:
+            unit.callbacks.append(callback)
+
+    def in_transaction(self):
+        """هل يوجد وحدة عمل نشطة في السياق الحالي؟"""
+        return _current_unit.get() is not None
+
+    @contextmanager
+    def _savepoint(self, unit):
+        """نطاق متداخل داخل وحدة العمل: فشله يلغي تغييراته فقط"""
+        unit.depth += 1
+        name = f"uow_sp_{unit.depth}"
+        cursor = unit.connection.cursor()
+        try:
+            cursor.execute(f"SAVEPOINT {name}")
+            try:
+                yield
+            except BaseException:
+                cursor.execute(f"ROLLBACK TO SAVEPOINT {name}")
+                raise
+            cursor.execute(f"RELEASE SAVEPOINT {name}")
+        finally:
+            cursor.close()
+            unit.depth -= 1
+
     @contextmanager
     def get_cursor(self, connection=None):
         if connection:
-            cursor = connection.cursor(cursor_factory=RealDictCursor)
+            cursor = connection.cursor(cursor_factory=TracingCursor)
             try:
                 yield cursor
                 connection.commit()
@@ -58,15 +246,11 @@ class DatabaseConnection:
             finally:
                 cursor.close()
         else:
-            with self.get_connection() as conn:
-                cursor = conn.cursor(cursor_factory=RealDictCursor)
+            # أول get_cursor يفتح وحدة العمل، وما يتداخل داخله يشاركها عبر SAVEPOINT
+            with self.transaction() as conn:
+                cursor = conn.cursor(cursor_factory=TracingCursor)
                 try:
                     yield cursor
-                    conn.commit()
-                except Exception as e:
-                    conn.rollback()
-                    logger.error(f"خطأ في تنفيذ الاستعلام: {e}")
-                    raise
                 finally:
                     cursor.close()
     
@@ -76,4 +260,36 @@ class DatabaseConnection:
             logger.info("تم إغلاق جميع اتصالات قاعدة البيانات")
 
 # إنشاء كائن قاعدة البيانات العام
-db = DatabaseConnection()
\ No newline at end of file
+db = DatabaseConnection()
+
+
+def in_lane(name):
+    """مزخرف لتشغيل دالة على مسار اتصالات محدد"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with db.lane(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def lane_class(name):
+    """تشغيل كل الدوال العامة لصنف على مسار محدد (read_only_class لمدراء التقارير)"""
+    def decorator(cls):
+        for attr, raw in list(vars(cls).items()):
+            if attr.startswith('_'):
+                continue
+            if isinstance(raw, staticmethod):
+                setattr(cls, attr, staticmethod(in_lane(name)(raw.__func__)))
+            elif isinstance(raw, classmethod):
+                setattr(cls, attr, classmethod(in_lane(name)(raw.__func__)))
+            elif callable(raw) and not isinstance(raw, type):
+                setattr(cls, attr, in_lane(name)(raw))
+        return cls
+    return decorator
+
+
+# إعلان عمليات القراءة فقط: تُوجه لنسخة القراءة إن وُجدت وكانت حديثة
+read_only = in_lane(REPLICA_LANE)
+read_only_class = lane_class(REPLICA_LANE)
@@ -2,6 +2,7 @@
 import pandas as pd
 import logging
 from database.connection import db
+from database.reference_data import reference_data, SECTORS
 from tqdm import tqdm
 import os
 from datetime import datetime
@@ -45,6 +46,10 @@ class ExcelMigration:
                 else:
                     logger.warning(f"الملف غير موجود: {file_path}")
             
+            # بناء المسارات الهرمية المخزنة بعد ربط الآباء
+            from database.models import models
+            models.rebuild_meter_paths()
+            
             logger.info(f"اكتمل ترحيل البيانات بنجاح. إجمالي الزبائن: {total_customers}")
             return True
             
@@ -84,6 +89,7 @@ class ExcelMigration:
                     
                     result = cursor.fetchone()
                     logger.info(f"تم إدخال/تحديث القطاع: {arabic_name} (ID: {result['id']})")
+            reference_data.invalidate(SECTORS)
         except Exception as e:
             logger.error(f"خطأ في ترحيل القطاعات: {e}")
     
@@ -308,6 +314,11 @@ class ExcelMigration:
                     continue
             
             logger.info(f"تم ترحيل {invoice_count} فاتورة")
+
+            # فواتير الأرشيف قد تكون أقدم أو أحدث من الموجود: إعادة حساب مؤشر آخر فاتورة
+            from database.models import models
+            with db.get_cursor() as cursor:
+                models.refresh_last_invoice(cursor)
             return invoice_count
             
         except Exception as e:
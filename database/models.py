@@ -1,5 +1,5 @@
 # database/models.py
-from database.connection import db
+from database.connection import db, in_lane
 from datetime import datetime
 import logging
 import json
@@ -8,18 +8,21 @@ import json
 logger = logging.getLogger(__name__)
 
 class Models:
+    @in_lane('maintenance')
     def __init__(self):
         self.create_tables()
         self.update_profit_distribution_table()
         self.update_energy_tables()
         self.update_customers_table()
+        self.ensure_last_invoice_pointers()
         self.update_daily_expenses_table()   # <--- أضف هذا السطر هنا
         self.update_daily_cash_add_energy_profits()   # <--- أضف هذا السطر
         self.update_energy_meters_for_accounts()
         self.create_energy_account_tables()
         self.update_daily_cash_add_fuel_column()
         self.update_energy_meters_for_accounts()
-        self.create_energy_account_tables()                    
+        self.create_energy_account_tables()
+        self.create_report_snapshots_table()
 
     def update_invoices_table(self):
         """تحديث جدول الفواتير بإضافة الأعمدة المفقودة"""
@@ -219,6 +222,10 @@ class Models:
                 "CREATE INDEX IF NOT EXISTS idx_activity_logs_created_at ON activity_logs(created_at);",
                 "CREATE INDEX IF NOT EXISTS idx_invoices_user_id ON invoices(user_id);",
 
+                # آخر دفعة/تحصيل لكل زبون (CollectionManager.get_last_payments)
+                "CREATE INDEX IF NOT EXISTS idx_invoices_customer_paid ON invoices(customer_id, payment_date DESC, payment_time DESC) WHERE status = 'active';",
+                "CREATE INDEX IF NOT EXISTS idx_collection_logs_customer_date ON collection_logs(customer_id, collection_date DESC);",
+
                 # فهارس جداول الطاقة
                 "CREATE INDEX IF NOT EXISTS idx_energy_meters_name ON energy_meters(name);",
                 "CREATE INDEX IF NOT EXISTS idx_energy_daily_readings_date ON energy_daily_readings(reading_date);",
@@ -411,10 +418,10 @@ class Models:
             )
             """,
             
-            # جدول السجل التاريخي للزبائن - النسخة المحدثة
+            # جدول السجل التاريخي للزبائن - مقسّم شهرياً حسب created_at
             """
             CREATE TABLE IF NOT EXISTS customer_history (
-                id SERIAL PRIMARY KEY,
+                id SERIAL,
                 customer_id INTEGER REFERENCES customers(id) ON DELETE CASCADE,
                 
                 -- معلومات العملية
@@ -445,13 +452,15 @@ class Models:
                 -- معلومات النظام
                 created_by INTEGER REFERENCES users(id),
                 performed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
 
                 -- الأعمدة الجديدة للقطة
                 snapshot_withdrawal_amount DECIMAL(15, 2),
                 snapshot_visa_balance DECIMAL(15, 2),
-                snapshot_last_counter_reading DECIMAL(15, 2)
-            )
+                snapshot_last_counter_reading DECIMAL(15, 2),
+
+                PRIMARY KEY (id, created_at)
+            ) PARTITION BY RANGE (created_at)
             """,
             # جدول كتالوج الصلاحيات
             """
@@ -815,6 +824,10 @@ class Models:
                 
                 # إنشاء الفهارس
                 self.create_indexes(cursor)
+
+            # البيانات الأساسية قد تضيف قطاعات ومستخدمين وتصنيفات
+            from database.reference_data import reference_data
+            reference_data.invalidate()
                 
         except Exception as e:
             logger.error(f"خطأ في إنشاء الجداول: {e}")
@@ -828,31 +841,47 @@ class Models:
             self.update_users_table()
             # تحديث جدول الزبائن
             self.update_customers_table()
+            # فهرس المسار الهرمي للعدادات
+            self.ensure_meter_paths()
             self.update_daily_expenses_table()   # <--- أضف هنا أيضاً
             self.update_daily_cash_add_energy_profits()   # <--- أضف هنا
             self.update_profit_distribution_add_user_id()          # <-- أضف
             self.update_energy_profit_distribution_add_user_id()   # <-- أضف
             self.update_weekly_cash_inventory_table()   # <-- أضف هنا
+            self.update_collection_logs_table()
 
+            # أقسام الشهر الحالي والأشهر القادمة لجدول التاريخ
+            self.ensure_history_partitions()
             # إنشاء فهارس إضافية لجدول التاريخ بعد التحديث
             self.create_history_indexes()
             # تصحيح القيم النصية في الأعمدة الرقمية
             self.fix_customer_history_numeric_values()
 
     def create_history_indexes(self):
-        """إنشاء فهارس لجدول التاريخ"""
+        """إنشاء فهارس لجدول التاريخ (فهارس مركبة بدل الفهارس الأحادية المكررة)"""
         try:
             with db.get_cursor() as cursor:
+                # الفهارس القديمة أحادية العمود: يغطيها الفهرسان المركبان أو لا يستخدمها أي استعلام
+                obsolete_indexes = [
+                    "idx_customer_history_customer_id",
+                    "idx_customer_history_action_type",
+                    "idx_customer_history_transaction_type",
+                    "idx_customer_history_performed_at",
+                    "idx_customer_history_created_by",
+                    "idx_customer_history_invoice_number",
+                    "idx_customer_history_amount",
+                    "idx_customer_history_current_balance_after",
+                ]
+                for index_name in obsolete_indexes:
+                    cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
+
                 history_indexes = [
-                    "CREATE INDEX IF NOT EXISTS idx_customer_history_customer_id ON customer_history(customer_id);",
-                    "CREATE INDEX IF NOT EXISTS idx_customer_history_action_type ON customer_history(action_type);",
-                    "CREATE INDEX IF NOT EXISTS idx_customer_history_transaction_type ON customer_history(transaction_type);",
-                    "CREATE INDEX IF NOT EXISTS idx_customer_history_performed_at ON customer_history(performed_at DESC);",
+                    # سجل زبون معين مرتباً بالأحدث (HistoryManager، تلميح التأشيرة، المراقبة)
+                    "CREATE INDEX IF NOT EXISTS idx_customer_history_customer_created ON customer_history(customer_id, created_at DESC);",
+                    # مجاميع نوع عملية خلال فترة (تقارير التأشيرة)
+                    "CREATE INDEX IF NOT EXISTS idx_customer_history_type_created ON customer_history(transaction_type, created_at);",
+                    # سجل النشاط العام مرتباً بالأحدث
                     "CREATE INDEX IF NOT EXISTS idx_customer_history_created_at ON customer_history(created_at DESC);",
-                    "CREATE INDEX IF NOT EXISTS idx_customer_history_created_by ON customer_history(created_by);",
-                    "CREATE INDEX IF NOT EXISTS idx_customer_history_invoice_number ON customer_history(invoice_number);",
-                    "CREATE INDEX IF NOT EXISTS idx_customer_history_amount ON customer_history(amount);",
-                    "CREATE INDEX IF NOT EXISTS idx_customer_history_current_balance_after ON customer_history(current_balance_after);"
                 ]
                 
                 for index_sql in history_indexes:
@@ -863,6 +892,316 @@ class Models:
         except Exception as e:
             logger.error(f"خطأ في إنشاء فهارس التاريخ: {e}")
 
+    # ========== تقسيم جدول customer_history شهرياً ==========
+
+    @staticmethod
+    def _month_start(value):
+        return datetime(value.year, value.month, 1)
+
+    @staticmethod
+    def _add_months(month_start, months):
+        index = month_start.year * 12 + (month_start.month - 1) + months
+        return datetime(index // 12, index % 12 + 1, 1)
+
+    @staticmethod
+    def _history_partition_name(month_start):
+        return f"customer_history_y{month_start.year}m{month_start.month:02d}"
+
+    def _is_history_partitioned(self, cursor):
+        cursor.execute("SELECT relkind FROM pg_class WHERE relname = 'customer_history' AND relkind IN ('r', 'p')")
+        row = cursor.fetchone()
+        return bool(row) and row['relkind'] == 'p'
+
+    def _create_history_partitions(self, cursor, first_month, last_month):
+        """إنشاء الأقسام الشهرية الناقصة بين شهرين (شاملة)، مع نقل أي صفوف تخصها من القسم الافتراضي"""
+        cursor.execute("CREATE TABLE IF NOT EXISTS customer_history_default PARTITION OF customer_history DEFAULT")
+        cursor.execute("""
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = 'customer_history'
+        """)
+        existing = {row['relname'] for row in cursor.fetchall()}
+
+        created = []
+        month = first_month
+        while month <= last_month:
+            name = self._history_partition_name(month)
+            if name not in existing:
+                next_month = self._add_months(month, 1)
+                # إنشاء الجدول منفصلاً ثم إلحاقه: يسمح بنقل الصفوف من القسم الافتراضي أولاً
+                cursor.execute(f"CREATE TABLE {name} (LIKE customer_history INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+                cursor.execute(f"""
+                    WITH moved AS (
+                        DELETE FROM customer_history_default
+                        WHERE created_at >= %s AND created_at < %s
+                        RETURNING *
+                    )
+                    INSERT INTO {name} SELECT * FROM moved
+                """, (month, next_month))
+                cursor.execute(
+                    f"ALTER TABLE customer_history ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)",
+                    (month, next_month)
+                )
+                created.append(name)
+            month = self._add_months(month, 1)
+
+        if created:
+            logger.info(f"تم إنشاء أقسام customer_history: {', '.join(created)}")
+        return created
+
+    @in_lane('maintenance')
+    def ensure_history_partitions(self, months_ahead=None):
+        """التأكد من وجود أقسام الشهر الحالي والأشهر القادمة (يُستدعى عند بدء التشغيل ومن مهمة الأرشفة)"""
+        from config.settings import HISTORY_PARTITION_CONFIG
+        if months_ahead is None:
+            months_ahead = HISTORY_PARTITION_CONFIG.get('months_ahead', 3)
+        try:
+            with db.get_cursor() as cursor:
+                if not self._is_history_partitioned(cursor):
+                    logger.info("جدول customer_history غير مقسّم بعد (استخدم partition_customer_history للترحيل)")
+                    return []
+                current = self._month_start(datetime.now())
+                return self._create_history_partitions(cursor, current, self._add_months(current, months_ahead))
+        except Exception as e:
+            logger.error(f"خطأ في إنشاء أقسام customer_history: {e}")
+            return []
+
+    @in_lane('maintenance')
+    def partition_customer_history(self):
+        """
+        ترحيل جدول customer_history القائم (غير المقسّم) إلى جدول مقسّم شهرياً.
+        يتم في معاملة واحدة: إعادة تسمية الجدول القديم، إنشاء الجدول المقسّم وأقسامه،
+        نسخ البيانات ثم حذف الجدول القديم. عملية صيانة تُشغّل مرة واحدة خارج أوقات العمل.
+        """
+        from config.settings import HISTORY_PARTITION_CONFIG
+        try:
+            with db.get_cursor() as cursor:
+                if self._is_history_partitioned(cursor):
+                    logger.info("جدول customer_history مقسّم بالفعل")
+                    return {'success': True, 'migrated_rows': 0, 'already_partitioned': True}
+
+                # الفهارس والقيد الأساسي القديم تحمل نفس الأسماء التي سيستخدمها الجدول الجديد
+                cursor.execute("""
+                    SELECT indexname FROM pg_indexes
+                    WHERE tablename = 'customer_history' AND indexname LIKE 'idx_customer_history_%'
+                """)
+                for row in cursor.fetchall():
+                    cursor.execute(f"DROP INDEX IF EXISTS {row['indexname']}")
+
+                cursor.execute("ALTER TABLE customer_history RENAME TO customer_history_legacy")
+                cursor.execute("ALTER TABLE customer_history_legacy RENAME CONSTRAINT customer_history_pkey TO customer_history_legacy_pkey")
+                cursor.execute("""
+                    UPDATE customer_history_legacy
+                    SET created_at = COALESCE(performed_at, CURRENT_TIMESTAMP)
+                    WHERE created_at IS NULL
+                """)
+
+                cursor.execute("""
+                    CREATE TABLE customer_history (LIKE customer_history_legacy INCLUDING DEFAULTS)
+                    PARTITION BY RANGE (created_at)
+                """)
+                cursor.execute("ALTER TABLE customer_history ALTER COLUMN created_at SET NOT NULL")
+                cursor.execute("ALTER TABLE customer_history ALTER COLUMN created_at SET DEFAULT CURRENT_TIMESTAMP")
+                cursor.execute("ALTER TABLE customer_history ADD PRIMARY KEY (id, created_at)")
+                cursor.execute("""
+                    ALTER TABLE customer_history
+                    ADD FOREIGN KEY (customer_id) REFERENCES customers(id) ON DELETE CASCADE
+                """)
+                cursor.execute("ALTER TABLE customer_history ADD FOREIGN KEY (created_by) REFERENCES users(id)")
+                cursor.execute("ALTER SEQUENCE customer_history_id_seq OWNED BY customer_history.id")
+
+                cursor.execute("SELECT MIN(created_at) AS first_at FROM customer_history_legacy")
+                first_at = cursor.fetchone()['first_at'] or datetime.now()
+                current = self._month_start(datetime.now())
+                self._create_history_partitions(
+                    cursor,
+                    min(self._month_start(first_at), current),
+                    self._add_months(current, HISTORY_PARTITION_CONFIG.get('months_ahead', 3))
+                )
+
+                cursor.execute("INSERT INTO customer_history SELECT * FROM customer_history_legacy")
+                migrated_rows = cursor.rowcount
+                cursor.execute("DROP TABLE customer_history_legacy")
+
+            self.create_history_indexes()
+            logger.info(f"تم تقسيم جدول customer_history شهرياً ({migrated_rows} سجل)")
+            return {'success': True, 'migrated_rows': migrated_rows, 'already_partitioned': False}
+        except Exception as e:
+            logger.error(f"خطأ في تقسيم جدول customer_history: {e}")
+            return {'success': False, 'error': str(e)}
+
+    def get_history_partitions(self):
+        """قائمة أقسام customer_history مع حدودها وحجمها"""
+        with db.get_cursor() as cursor:
+            cursor.execute("""
+                SELECT
+                    c.relname AS name,
+                    pg_get_expr(c.relpartbound, c.oid) AS bounds,
+                    pg_total_relation_size(c.oid) AS size_bytes,
+                    COALESCE(t.spcname, 'pg_default') AS tablespace
+                FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                JOIN pg_class p ON p.oid = i.inhparent
+                LEFT JOIN pg_tablespace t ON t.oid = c.reltablespace
+                WHERE p.relname = 'customer_history'
+                ORDER BY c.relname
+            """)
+            return [dict(row) for row in cursor.fetchall()]
+
+    # ========== فهرس المسار الهرمي للعدادات (materialized path) ==========
+    # customers.meter_path يحوي معرفات العدادات من الجذر حتى العداد نفسه و
+    # meter_path_names أسماءها، فيصبح الاستعلام عن الشجرة فحصاً مفهرساً واحداً:
+    #   الفروع:   meter_path @> ARRAY[id]
+    #   الأسلاف:  id = ANY(meter_path)
+    #   الترتيب بعمق أول: ORDER BY meter_path (أو meter_path_names)
+
+    _METER_PATHS_SQL = """
+        WITH RECURSIVE up AS (
+            SELECT c.id AS start_id, c.parent_meter_id,
+                   ARRAY[c.id] AS ids, ARRAY[c.name]::VARCHAR[] AS names
+            FROM customers c
+            WHERE c.id = ANY(%s)
+            UNION ALL
+            SELECT up.start_id, p.parent_meter_id,
+                   array_prepend(p.id, up.ids), array_prepend(p.name::VARCHAR, up.names)
+            FROM up
+            JOIN customers p ON p.id = up.parent_meter_id
+            WHERE NOT p.id = ANY(up.ids)
+        ),
+        starts AS (
+            SELECT DISTINCT ON (start_id) start_id AS id, ids, names
+            FROM up
+            ORDER BY start_id, array_length(ids, 1) DESC
+        ),
+        down AS (
+            SELECT id, ids, names FROM starts
+            UNION ALL
+            SELECT c.id, array_append(d.ids, c.id), array_append(d.names, c.name::VARCHAR)
+            FROM down d
+            JOIN customers c ON c.parent_meter_id = d.id
+            WHERE NOT c.id = ANY(d.ids)
+        ),
+        paths AS (
+            SELECT DISTINCT ON (id) id, ids, names FROM down ORDER BY id
+        )
+    """
+
+    def refresh_meter_paths(self, cursor, customer_ids):
+        """
+        إعادة حساب المسار المخزن للعدادات المحددة وكل ما تحتها.
+        تُستدعى بعد أي تغيير في parent_meter_id أو في اسم عداد.
+        """
+        ids = [int(i) for i in customer_ids if i is not None]
+        if not ids:
+            return 0
+        cursor.execute(self._METER_PATHS_SQL + """
+            UPDATE customers c
+            SET meter_path = p.ids, meter_path_names = p.names
+            FROM paths p
+            WHERE c.id = p.id
+              AND (c.meter_path IS DISTINCT FROM p.ids OR c.meter_path_names IS DISTINCT FROM p.names)
+        """, (ids,))
+        return cursor.rowcount
+
+    @in_lane('maintenance')
+    def rebuild_meter_paths(self):
+        """إعادة بناء المسارات لكل العدادات (الجذور ثم أي عقد لم تُصل إليها كالحلقات)"""
+        try:
+            with db.get_cursor() as cursor:
+                cursor.execute("SELECT id FROM customers WHERE parent_meter_id IS NULL")
+                updated = self.refresh_meter_paths(cursor, [r['id'] for r in cursor.fetchall()])
+
+                cursor.execute("SELECT id FROM customers WHERE meter_path IS NULL")
+                orphans = [r['id'] for r in cursor.fetchall()]
+                updated += self.refresh_meter_paths(cursor, orphans)
+
+            logger.info(f"تمت إعادة بناء المسارات الهرمية: {updated} عداد محدث")
+            return {'success': True, 'updated': updated, 'unreachable': len(orphans)}
+        except Exception as e:
+            logger.error(f"خطأ في إعادة بناء المسارات الهرمية: {e}")
+            return {'success': False, 'error': str(e)}
+
+    def verify_meter_paths(self):
+        """مقارنة المسارات المخزنة بالمسارات المحسوبة من parent_meter_id"""
+        try:
+            with db.get_cursor() as cursor:
+                cursor.execute("SELECT array_agg(id) AS ids FROM customers")
+                all_ids = cursor.fetchone()['ids'] or []
+                cursor.execute(self._METER_PATHS_SQL + """
+                    SELECT c.id, c.name, c.meter_path, p.ids AS expected_path
+                    FROM customers c
+                    JOIN paths p ON p.id = c.id
+                    WHERE c.meter_path IS DISTINCT FROM p.ids
+                       OR c.meter_path_names IS DISTINCT FROM p.names
+                    ORDER BY c.id
+                """, (all_ids,))
+                mismatched = [dict(r) for r in cursor.fetchall()]
+            return {'success': True, 'checked': len(all_ids), 'mismatched': mismatched}
+        except Exception as e:
+            logger.error(f"خطأ في التحقق من المسارات الهرمية: {e}")
+            return {'success': False, 'error': str(e)}
+
+    def ensure_meter_paths(self):
+        """إنشاء فهارس المسار الهرمي وبناء المسارات الناقصة (مرة واحدة بعد الترقية)"""
+        try:
+            with db.get_cursor() as cursor:
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_customers_meter_path_gin ON customers USING GIN (meter_path)")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_customers_meter_path ON customers(meter_path)")
+                cursor.execute("SELECT EXISTS (SELECT 1 FROM customers WHERE meter_path IS NULL) AS missing")
+                missing = cursor.fetchone()['missing']
+            if missing:
+                self.rebuild_meter_paths()
+        except Exception as e:
+            logger.error(f"خطأ في تهيئة المسارات الهرمية: {e}")
+
+    _LAST_INVOICE_SQL = """
+        UPDATE customers c
+        SET last_invoice_id = li.id, last_invoice_number = li.invoice_number
+        FROM customers t
+        LEFT JOIN LATERAL (
+            SELECT i.id, i.invoice_number
+            FROM invoices i
+            WHERE i.customer_id = t.id
+            ORDER BY i.payment_date DESC, i.payment_time DESC
+            LIMIT 1
+        ) li ON TRUE
+        WHERE c.id = t.id
+          AND c.last_invoice_id IS DISTINCT FROM li.id
+    """
+
+    def refresh_last_invoice(self, cursor, customer_ids=None):
+        """
+        إعادة حساب مؤشر آخر فاتورة للزبائن المحددين (أو للجميع).
+        تُستدعى بعد حذف فواتير أو استيرادها دفعة واحدة؛ الإدراج العادي يحدّث المؤشر مباشرة.
+        """
+        if customer_ids is None:
+            cursor.execute(self._LAST_INVOICE_SQL)
+        else:
+            ids = [int(i) for i in customer_ids if i is not None]
+            if not ids:
+                return 0
+            cursor.execute(self._LAST_INVOICE_SQL + " AND t.id = ANY(%s)", (ids,))
+        return cursor.rowcount
+
+    def ensure_last_invoice_pointers(self):
+        """تعبئة مؤشر آخر فاتورة مرة واحدة بعد الترقية"""
+        try:
+            with db.get_cursor() as cursor:
+                cursor.execute("""
+                    SELECT EXISTS (
+                        SELECT 1 FROM customers c
+                        WHERE c.last_invoice_id IS NULL
+                          AND EXISTS (SELECT 1 FROM invoices i WHERE i.customer_id = c.id)
+                    ) AS missing
+                """)
+                if cursor.fetchone()['missing']:
+                    updated = self.refresh_last_invoice(cursor)
+                    logger.info(f"تمت تعبئة مؤشر آخر فاتورة لـ {updated} زبون")
+        except Exception as e:
+            logger.error(f"خطأ في تعبئة مؤشر آخر فاتورة: {e}")
+
     def seed_initial_data(self, cursor):
         """إضافة البيانات الأولية"""
         # إضافة القطاعات الأساسية
@@ -1588,6 +1927,12 @@ class Models:
                     ('previous_withdrawal', 'DECIMAL(15, 2) DEFAULT 0'),
                     ('withdrawal_updated_at', 'TIMESTAMP'),
                     ('assigned_collector_id', 'INTEGER REFERENCES users(id)'),
+                    # المسار الهرمي المخزن (من الجذر حتى العداد نفسه) - انظر refresh_meter_paths
+                    ('meter_path', 'INTEGER[]'),
+                    ('meter_path_names', 'VARCHAR[]'),
+                    # مؤشر آخر فاتورة (يُحدّث عند إدراج الفواتير) - انظر refresh_last_invoice
+                    ('last_invoice_id', 'INTEGER'),
+                    ('last_invoice_number', 'VARCHAR(50)'),
                 ]
                 
                 for column_name, column_type in new_columns:
@@ -1880,34 +2225,20 @@ class Models:
         try:
             week_end_date = week_start_date + timedelta(days=6)
             with db.get_cursor() as cursor:
-                # الحصول على الرصيد الافتتاحي لأول يوم في الأسبوع
-                cursor.execute("""
-                    SELECT opening_balance 
-                    FROM daily_cash 
-                    WHERE cash_date = %s
-                """, (week_start_date,))
-                first_day = cursor.fetchone()
-                total_opening = float(first_day['opening_balance']) if first_day else 0.0
-
-                # الحصول على الرصيد الختامي لآخر يوم في الأسبوع
-                cursor.execute("""
-                    SELECT closing_balance 
-                    FROM daily_cash 
-                    WHERE cash_date = %s
-                """, (week_end_date,))
-                last_day = cursor.fetchone()
-                total_closing = float(last_day['closing_balance']) if last_day else 0.0
-
-                # الحصول على مجاميع الأسبوع
+                # الرصيد الافتتاحي لأول يوم والختامي لآخر يوم ومجاميع الأسبوع في استعلام واحد
                 cursor.execute("""
                     SELECT 
+                        (SELECT opening_balance FROM daily_cash WHERE cash_date = %s) as first_opening,
+                        (SELECT closing_balance FROM daily_cash WHERE cash_date = %s) as last_closing,
                         COALESCE(SUM(total_collections), 0) as total_collections,
                         COALESCE(SUM(total_expenses), 0) as total_expenses,
                         COALESCE(SUM(total_profits), 0) as total_profits
                     FROM daily_cash
                     WHERE cash_date BETWEEN %s AND %s
-                """, (week_start_date, week_end_date))
+                """, (week_start_date, week_end_date, week_start_date, week_end_date))
                 totals = cursor.fetchone()
+                total_opening = float(totals['first_opening']) if totals['first_opening'] is not None else 0.0
+                total_closing = float(totals['last_closing']) if totals['last_closing'] is not None else 0.0
 
                 # تحديث أو إدراج الجرد الأسبوعي
                 cursor.execute("""
@@ -1936,6 +2267,149 @@ class Models:
             logger.error(f"خطأ في إعادة حساب الجرد الأسبوعي: {e}")
             return False
 
+    def recalculate_daily_cash_chain(self, from_date, dry_run=False):
+        """إعادة حساب سلسلة الصندوق اليومي من تاريخ التعديل فصاعداً بعملية واحدة
+        (مجموع تراكمي) مع تحديث الجرد الأسبوعي المتأثر ضمن نفس المعاملة.
+        عند dry_run=True تُعاد الفروقات فقط دون حفظ أي تغيير."""
+        try:
+            with db.get_cursor() as cursor:
+                cursor.execute("SAVEPOINT daily_cash_chain")
+
+                # 1. الأيام: مجاميع كل يوم ثم رصيد ختامي تراكمي لكل سلسلة أيام متتالية
+                # (الرصيد الافتتاحي = ختامي اليوم السابق مباشرة كما في recalculate_daily_cash)
+                cursor.execute("""
+                    WITH affected AS (
+                        SELECT id FROM daily_cash WHERE cash_date >= %(from_date)s
+                    ),
+                    sums AS (
+                        SELECT
+                            dc.id, dc.cash_date,
+                            dc.opening_balance AS old_opening,
+                            dc.closing_balance AS old_closing,
+                            COALESCE(col.total, 0) AS total_collections,
+                            COALESCE(ex.total, 0) AS total_expenses,
+                            COALESCE(pr.total, 0) AS total_profits,
+                            COALESCE(en.total, 0) AS total_energy_profits,
+                            dc.cash_date - (ROW_NUMBER() OVER (ORDER BY dc.cash_date))::int AS island
+                        FROM daily_cash dc
+                        LEFT JOIN (
+                            SELECT daily_cash_id, SUM(total_collected) AS total
+                            FROM daily_collections_detail
+                            WHERE daily_cash_id IN (SELECT id FROM affected)
+                            GROUP BY daily_cash_id
+                        ) col ON col.daily_cash_id = dc.id
+                        LEFT JOIN (
+                            SELECT daily_cash_id, SUM(amount) AS total
+                            FROM daily_expenses
+                            WHERE daily_cash_id IN (SELECT id FROM affected)
+                            GROUP BY daily_cash_id
+                        ) ex ON ex.daily_cash_id = dc.id
+                        LEFT JOIN (
+                            SELECT daily_cash_id, SUM(amount) AS total
+                            FROM profit_distribution
+                            WHERE daily_cash_id IN (SELECT id FROM affected)
+                            GROUP BY daily_cash_id
+                        ) pr ON pr.daily_cash_id = dc.id
+                        LEFT JOIN (
+                            SELECT daily_cash_id, SUM(amount) AS total
+                            FROM energy_profit_distribution
+                            WHERE daily_cash_id IN (SELECT id FROM affected)
+                            GROUP BY daily_cash_id
+                        ) en ON en.daily_cash_id = dc.id
+                        WHERE dc.id IN (SELECT id FROM affected)
+                    ),
+                    islands AS (
+                        SELECT s.*, MIN(s.cash_date) OVER (PARTITION BY s.island) AS island_start
+                        FROM sums s
+                    ),
+                    chain AS (
+                        SELECT
+                            i.*,
+                            COALESCE(p.closing_balance, 0) + SUM(
+                                i.total_collections - i.total_expenses
+                                - i.total_profits - i.total_energy_profits
+                            ) OVER (
+                                PARTITION BY i.island ORDER BY i.cash_date
+                                ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+                            ) AS new_closing
+                        FROM islands i
+                        LEFT JOIN daily_cash p ON p.cash_date = i.island_start - 1
+                    )
+                    UPDATE daily_cash dc SET
+                        opening_balance = c.new_closing - (c.total_collections - c.total_expenses
+                                                           - c.total_profits - c.total_energy_profits),
+                        total_collections = c.total_collections,
+                        total_expenses = c.total_expenses,
+                        total_profits = c.total_profits,
+                        total_energy_profits = c.total_energy_profits,
+                        closing_balance = c.new_closing,
+                        updated_at = CURRENT_TIMESTAMP,
+                        status = 'final'
+                    FROM chain c
+                    WHERE dc.id = c.id
+                    RETURNING dc.cash_date, c.old_opening, c.old_closing,
+                              dc.opening_balance AS new_opening, dc.closing_balance AS new_closing
+                """, {'from_date': from_date})
+                days = [dict(row) for row in cursor.fetchall()
+                        if row['old_opening'] != row['new_opening'] or row['old_closing'] != row['new_closing']]
+                days.sort(key=lambda r: r['cash_date'])
+
+                # 2. الجرد الأسبوعي: كل أسبوع ينتهي بعد تاريخ التعديل يُعاد حسابه من الأيام المحدثة
+                cursor.execute("""
+                    UPDATE weekly_cash_inventory w SET
+                        total_opening = COALESCE(f.opening_balance, 0),
+                        total_closing = COALESCE(l.closing_balance, 0),
+                        total_collections = t.total_collections,
+                        total_profits = t.total_profits,
+                        total_energy_profits = t.total_energy_profits,
+                        total_expenses = e.general,
+                        total_repair_expansion = e.repair_expansion,
+                        total_fuel = e.fuel,
+                        updated_at = CURRENT_TIMESTAMP
+                    FROM weekly_cash_inventory w0
+                    LEFT JOIN daily_cash f ON f.cash_date = w0.week_start
+                    LEFT JOIN daily_cash l ON l.cash_date = w0.week_end
+                    CROSS JOIN LATERAL (
+                        SELECT
+                            COALESCE(SUM(total_collections), 0) AS total_collections,
+                            COALESCE(SUM(total_profits), 0) AS total_profits,
+                            COALESCE(SUM(total_energy_profits), 0) AS total_energy_profits
+                        FROM daily_cash
+                        WHERE cash_date BETWEEN w0.week_start AND w0.week_end
+                    ) t
+                    CROSS JOIN LATERAL (
+                        SELECT
+                            COALESCE(SUM(de.amount) FILTER (WHERE ec.name NOT IN ('repair', 'expansion', 'fuel')), 0) AS general,
+                            COALESCE(SUM(de.amount) FILTER (WHERE ec.name IN ('repair', 'expansion')), 0) AS repair_expansion,
+                            COALESCE(SUM(de.amount) FILTER (WHERE ec.name = 'fuel'), 0) AS fuel
+                        FROM daily_expenses de
+                        JOIN daily_cash dc ON de.daily_cash_id = dc.id
+                        JOIN expense_categories ec ON de.category_id = ec.id
+                        WHERE dc.cash_date BETWEEN w0.week_start AND w0.week_end
+                    ) e
+                    WHERE w.id = w0.id AND w0.week_end >= %(from_date)s
+                    RETURNING w.id, w.week_start, w.week_end,
+                              w0.total_opening AS old_opening, w.total_opening AS new_opening,
+                              w0.total_closing AS old_closing, w.total_closing AS new_closing
+                """, {'from_date': from_date})
+                weeks = [dict(row) for row in cursor.fetchall()
+                         if row['old_opening'] != row['new_opening'] or row['old_closing'] != row['new_closing']]
+                weeks.sort(key=lambda r: r['week_start'])
+
+                if dry_run:
+                    cursor.execute("ROLLBACK TO SAVEPOINT daily_cash_chain")
+                else:
+                    cursor.execute("RELEASE SAVEPOINT daily_cash_chain")
+
+            logger.info(
+                f"{'معاينة' if dry_run else 'تم'} إعادة حساب سلسلة الصندوق من {from_date}: "
+                f"{len(days)} يوم و {len(weeks)} جرد أسبوعي متأثر"
+            )
+            return {'success': True, 'dry_run': dry_run, 'days': days, 'weeks': weeks}
+        except Exception as e:
+            logger.error(f"خطأ في إعادة حساب سلسلة الصندوق اليومي: {e}")
+            return {'success': False, 'error': str(e)}
+
 
     def update_daily_expenses_table(self):
         """تحديث جدول daily_expenses بإضافة عمود user_id وربطه بالمستخدمين"""
@@ -2033,6 +2507,25 @@ class Models:
             logger.error(f"❌ خطأ في تحديث جدول weekly_cash_inventory: {e}")
 
 
+    def update_collection_logs_table(self):
+        """إضافة client_uuid إلى collection_logs لجعل مزامنة دفتر المحصل غير مكررة"""
+        try:
+            with db.get_cursor() as cursor:
+                cursor.execute("""
+                    SELECT column_name FROM information_schema.columns
+                    WHERE table_name = 'collection_logs' AND column_name = 'client_uuid'
+                """)
+                if not cursor.fetchone():
+                    cursor.execute("ALTER TABLE collection_logs ADD COLUMN client_uuid UUID")
+                    logger.info("✅ تم إضافة العمود client_uuid إلى collection_logs")
+                cursor.execute("""
+                    CREATE UNIQUE INDEX IF NOT EXISTS idx_collection_logs_client_uuid
+                    ON collection_logs(client_uuid)
+                """)
+        except Exception as e:
+            logger.error(f"❌ خطأ في تحديث جدول collection_logs: {e}")
+
+
     # ========== تحديث جداول الطاقة لتلائم الحسابات المباشرة ==========
     def update_energy_meters_for_accounts(self):
         """إضافة conversion_rate و current_balance إلى energy_meters (إذا لم تكن موجودة)"""
@@ -2125,6 +2618,41 @@ class Models:
         except Exception as e:
             logger.error(f"❌ خطأ في إنشاء جداول الطاقة: {e}")
 
+    def create_report_snapshots_table(self):
+        """جدول لقطات التقارير الأسبوعية (modules/report_snapshots.py)"""
+        try:
+            with db.get_cursor() as cursor:
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS report_snapshots (
+                        id SERIAL PRIMARY KEY,
+                        report_key VARCHAR(50) NOT NULL,
+                        version INTEGER NOT NULL,
+                        watermark JSONB NOT NULL,
+                        payload BYTEA NOT NULL,
+                        xlsx BYTEA,
+                        xlsx_name VARCHAR(255),
+                        source VARCHAR(20) DEFAULT 'scheduled',
+                        duration_ms INTEGER,
+                        generated_by INTEGER REFERENCES users(id),
+                        generated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        UNIQUE (report_key, version)
+                    )
+                """)
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_report_snapshots_generated ON report_snapshots(generated_at)")
+                # محاولات التوليد الفاشلة لكل موعد أسبوعي (مهلة إعادة المحاولة والترك)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS report_snapshot_attempts (
+                        report_key VARCHAR(50) NOT NULL,
+                        slot TIMESTAMP NOT NULL,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        last_error TEXT,
+                        last_attempt_at TIMESTAMP NOT NULL DEFAULT LOCALTIMESTAMP,
+                        PRIMARY KEY (report_key, slot)
+                    )
+                """)
+        except Exception as e:
+            logger.error(f"❌ خطأ في إنشاء جدول لقطات التقارير: {e}")
+
     def update_daily_cash_add_fuel_column(self):
         """إضافة عمود total_fuel إلى daily_cash إن لم يكن موجوداً"""
         try:
@@ -0,0 +1,317 @@
+# database/pool.py
+"""
+مجموعة اتصالات متكيفة مقسمة إلى مسارات (lanes).
+
+- كل مسار (تفاعلي، تقارير، صيانة) له حد أدنى يُفتح مسبقاً وحد أعلى ومهلة
+  statement_timeout خاصة به، فلا ينتظر مسار الجباية خلف تقرير طويل.
+- الحجز ينتظر (Condition) حتى يتوفر اتصال أو تنتهي مهلة الحجز بدلاً من الخطأ الفوري.
+- الاتصال الخامل أكثر من validate_after_idle يُفحص بـ SELECT 1 قبل تسليمه، والاتصال
+  الأقدم من max_lifetime يُعاد تدويره؛ والاتصال المعاد في حالة معاملة مجهولة يُغلق.
+- خيط صيانة دوري يفحص الخامل واحداً تلو الآخر (بمهلة probe_timeout_ms) ويعيد الحد
+  الأدنى بعد انقطاع الشبكة؛ لا يحجز إلا الاتصال الذي يفحصه.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2 import pool
+
+logger = logging.getLogger(__name__)
+
+_IDLE = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+
+class PoolTimeout(pool.PoolError):
+    """انتهت مهلة انتظار اتصال متاح في المسار"""
+
+
+class PoolLane:
+    """مسار اتصالات واحد - Thread-safe"""
+
+    def __init__(self, name: str, connect_kwargs: Dict[str, Any], config: Dict[str, Any]):
+        self.name = name
+        self.min_size = int(config.get('min_connections', 1))
+        self.max_size = max(self.min_size, int(config.get('max_connections', 10)))
+        self.checkout_timeout = float(config.get('connection_timeout', 30))
+        self.max_lifetime = float(config.get('max_lifetime', 1800))
+        self.validate_after_idle = float(config.get('validate_after_idle', 30))
+        self.probe_timeout_ms = int(config.get('probe_timeout_ms', 2000))
+        self.statement_timeout_ms = int(config.get('statement_timeout_ms', 0))
+
+        self._connect_kwargs = dict(connect_kwargs)
+        self._connect_kwargs.setdefault('application_name', f'billing-{name}')
+        if self.statement_timeout_ms:
+            self._connect_kwargs['options'] = f"-c statement_timeout={self.statement_timeout_ms}"
+
+        self._idle: deque = deque()              # الأحدث استخداماً في النهاية
+        self._meta: Dict[int, list] = {}         # id(conn) -> [وقت الإنشاء, آخر استخدام]
+        self._size = 0                           # كل الاتصالات المفتوحة (خاملة ومحجوزة)
+        self._waiting = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self.stats_counters = {'checkouts': 0, 'waits': 0, 'timeouts': 0, 'recycled': 0, 'broken': 0}
+
+    # ------------------------------------------------------------------
+    # فتح وإغلاق الاتصالات
+    # ------------------------------------------------------------------
+    def _open(self):
+        conn = psycopg2.connect(**self._connect_kwargs)
+        now = time.monotonic()
+        self._meta[id(conn)] = [now, now]
+        return conn
+
+    def _close(self, conn):
+        self._meta.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _discard(self, conn, counter: str):
+        self._close(conn)
+        with self._cond:
+            self._size -= 1
+            self.stats_counters[counter] += 1
+            self._cond.notify()
+
+    def warm(self):
+        """فتح الاتصالات حتى الحد الأدنى"""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._open()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                raise
+            with self._cond:
+                self._idle.append(conn)
+                self._cond.notify()
+
+    # ------------------------------------------------------------------
+    # الحجز والإرجاع
+    # ------------------------------------------------------------------
+    def getconn(self, timeout: Optional[float] = None):
+        deadline = time.monotonic() + (self.checkout_timeout if timeout is None else timeout)
+        while True:
+            conn = None
+            with self._cond:
+                if self._closed:
+                    raise pool.PoolError(f"مسار الاتصالات {self.name} مغلق")
+                waited = False
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats_counters['timeouts'] += 1
+                        raise PoolTimeout(
+                            f"لا يوجد اتصال متاح في مسار {self.name} خلال "
+                            f"{self.checkout_timeout:.0f} ثانية ({self._size} اتصال محجوز)")
+                    if not waited:
+                        self.stats_counters['waits'] += 1
+                        waited = True
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                if self._idle:
+                    conn = self._idle.pop()
+                else:
+                    self._size += 1
+                self.stats_counters['checkouts'] += 1
+
+            if conn is None:
+                try:
+                    return self._open()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+
+            if self._healthy(conn):
+                self._meta[id(conn)][1] = time.monotonic()
+                return conn
+            # اتصال تالف أو قديم: نغلقه ونحاول مجدداً
+
+    def _healthy(self, conn) -> bool:
+        meta = self._meta.get(id(conn))
+        now = time.monotonic()
+        if conn.closed or meta is None:
+            self._discard(conn, 'broken')
+            return False
+        if self.max_lifetime and now - meta[0] > self.max_lifetime:
+            self._discard(conn, 'recycled')
+            return False
+        if self.validate_after_idle and now - meta[1] > self.validate_after_idle:
+            try:
+                with conn.cursor() as cursor:
+                    # فحص قصير: اتصال معلق لا يحجز الطالب أو خيط الصيانة بمهلة المسار الكاملة
+                    if self.probe_timeout_ms:
+                        cursor.execute("SET LOCAL statement_timeout = %s", (self.probe_timeout_ms,))
+                    cursor.execute("SELECT 1")
+                conn.rollback()
+            except Exception as e:
+                logger.warning(f"اتصال خامل تالف في مسار {self.name}: {e}")
+                self._discard(conn, 'broken')
+                return False
+        return True
+
+    def putconn(self, conn, close: bool = False):
+        if not close and not conn.closed:
+            try:
+                if conn.get_transaction_status() != _IDLE:
+                    conn.rollback()
+                close = conn.get_transaction_status() != _IDLE
+            except Exception:
+                close = True
+        if close or conn.closed:
+            self._discard(conn, 'broken')
+            return
+        meta = self._meta.get(id(conn))
+        if meta is not None:
+            meta[1] = time.monotonic()
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                self._close(conn)
+                return
+            self._idle.append(conn)
+            self._cond.notify()
+
+    # ------------------------------------------------------------------
+    # الصيانة
+    # ------------------------------------------------------------------
+    def _needs_check(self, conn, now: float) -> bool:
+        meta = self._meta.get(id(conn))
+        if conn.closed or meta is None:
+            return True
+        if self.max_lifetime and now - meta[0] > self.max_lifetime:
+            return True
+        return bool(self.validate_after_idle) and now - meta[1] > self.validate_after_idle
+
+    def maintain(self):
+        """
+        فحص الاتصالات الخاملة وإعادة تدوير القديمة ثم إكمال الحد الأدنى.
+
+        يُحجز اتصال واحد في كل مرة من بداية الطابور (الأقدم استخداماً) ويعود فور نجاح
+        فحصه، فلا يبقى المسار بلا اتصالات خاملة أثناء الفحص. يتوقف عند أول اتصال حديث.
+        """
+        with self._cond:
+            remaining = len(self._idle)
+        while remaining > 0:
+            remaining -= 1
+            with self._cond:
+                if self._closed or not self._idle or not self._needs_check(self._idle[0], time.monotonic()):
+                    break
+                conn = self._idle.popleft()
+            if not self._healthy(conn):
+                continue
+            # فُحص للتو: يلحق بالأحدث استخداماً حتى لا يُعاد فحصه في الدورة نفسها
+            self._meta[id(conn)][1] = time.monotonic()
+            with self._cond:
+                if self._closed:
+                    self._size -= 1
+                    self._close(conn)
+                    return
+                self._idle.append(conn)
+                self._cond.notify()
+        try:
+            self.warm()
+        except Exception as e:
+            logger.warning(f"تعذر إكمال الحد الأدنى لمسار {self.name}: {e}")
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            self._close(conn)
+
+    def free(self) -> int:
+        """عدد الاتصالات التي يمكن حجزها الآن دون انتظار (تقدير لحظي)"""
+        with self._cond:
+            return max(0, len(self._idle) + self.max_size - self._size - self._waiting)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'lane': self.name,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'waiting': self._waiting,
+                'max': self.max_size,
+                **self.stats_counters,
+            }
+
+
+class ConnectionPool:
+    """مجموعة المسارات مع خيط الصيانة"""
+
+    def __init__(self, connect_kwargs: Dict[str, Any], config: Dict[str, Any]):
+        self.default_lane = config.get('default_lane', 'interactive')
+        self._shared = {k: v for k, v in config.items() if k not in ('lanes', 'default_lane', 'maintenance_interval')}
+        self.lanes: Dict[str, PoolLane] = {}
+        for name, lane_config in config.get('lanes', {self.default_lane: {}}).items():
+            self.add_lane(name, connect_kwargs, lane_config)
+        if self.default_lane not in self.lanes:
+            raise ValueError(f"المسار الافتراضي {self.default_lane} غير معرف")
+
+        self.maintenance_interval = float(config.get('maintenance_interval', 30))
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_lane(self, name: str, connect_kwargs: Dict[str, Any], lane_config: Dict[str, Any]) -> PoolLane:
+        """إضافة مسار (قبل warm) - يمكن أن يتصل بخادم آخر مثل نسخة القراءة"""
+        lane = PoolLane(name, connect_kwargs, {**self._shared, **lane_config})
+        self.lanes[name] = lane
+        return lane
+
+    def lane(self, name: Optional[str]) -> PoolLane:
+        return self.lanes.get(name or self.default_lane) or self.lanes[self.default_lane]
+
+    def warm(self):
+        """فتح الحد الأدنى لكل المسارات (المسار الافتراضي أولاً: خطؤه يوقف التشغيل)"""
+        self.lanes[self.default_lane].warm()
+        for name, lane in self.lanes.items():
+            if name != self.default_lane:
+                try:
+                    lane.warm()
+                except Exception as e:
+                    logger.warning(f"تعذر تجهيز مسار {name}: {e}")
+        if self.maintenance_interval and self._thread is None:
+            self._thread = threading.Thread(target=self._maintenance_loop, name='db-pool-maintenance', daemon=True)
+            self._thread.start()
+
+    def _maintenance_loop(self):
+        while not self._stop.wait(self.maintenance_interval):
+            for lane in self.lanes.values():
+                try:
+                    lane.maintain()
+                except Exception as e:
+                    logger.error(f"خطأ في صيانة مسار {lane.name}: {e}")
+
+    def getconn(self, lane: Optional[str] = None, timeout: Optional[float] = None):
+        return self.lane(lane).getconn(timeout)
+
+    def putconn(self, conn, lane: Optional[str] = None, close: bool = False):
+        self.lane(lane).putconn(conn, close)
+
+    def closeall(self):
+        self._stop.set()
+        for lane in self.lanes.values():
+            lane.closeall()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: lane.stats() for name, lane in self.lanes.items()}
@@ -0,0 +1,114 @@
+# database/prepared.py
+"""
+سجل العبارات المجهزة على الخادم (PREPARE / EXECUTE) لمسار الفاتورة الساخن.
+
+- العبارة تُسجل مرة واحدة عند تحميل الوحدة باسم ونص SQL بمعاملات $1..$n:
+      CUSTOMER_FOR_INVOICE = statements.register('fast_customer_for_invoice', "... WHERE c.id = $1")
+- عند أول تنفيذ على اتصال من المجموعة تُجهز (PREPARE) ثم تُنفذ بالاسم، فيتجاوز
+  الخادم التحليل والتخطيط في الاستدعاءات التالية على هذا الاتصال.
+- العبارات المجهزة تُتتبع لكل اتصال (مرجع ضعيف)، فالاتصال الجديد بعد انقطاع أو
+  إعادة تدوير يُجهز من جديد تلقائياً. PREPARE لا يتأثر بالتراجع عن المعاملة.
+- لكل عبارة إحصائيات زمن خاصة بها (statements.stats()).
+- تغيير أعمدة نتيجة العبارة (مثل SELECT *) يكسر الخطة المخزنة: يجب ذكر الأعمدة صراحة.
+"""
+import logging
+import re
+import threading
+import time
+import weakref
+from typing import Any, Dict, Sequence
+
+logger = logging.getLogger(__name__)
+
+_PARAM = re.compile(r'\$(\d+)')
+_NAME = re.compile(r'^[a-z_][a-z0-9_]*$')
+
+
+class PreparedStatement:
+    """عبارة مسجلة مع إحصائيات تنفيذها"""
+
+    __slots__ = ('name', 'sql', 'param_count', 'calls', 'prepares', 'total_ms', 'max_ms')
+
+    def __init__(self, name: str, sql: str):
+        self.name = name
+        self.sql = sql
+        self.param_count = max((int(n) for n in _PARAM.findall(sql)), default=0)
+        self.calls = 0
+        self.prepares = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'calls': self.calls,
+            'prepares': self.prepares,
+            'total_ms': round(self.total_ms, 2),
+            'avg_ms': round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            'max_ms': round(self.max_ms, 2),
+        }
+
+
+class StatementRegistry:
+    """سجل العبارات المجهزة وحالة تجهيزها على كل اتصال - Thread-safe"""
+
+    def __init__(self):
+        self._statements: Dict[str, PreparedStatement] = {}
+        self._prepared: 'weakref.WeakKeyDictionary' = weakref.WeakKeyDictionary()  # اتصال -> أسماء مجهزة
+        self._lock = threading.Lock()
+
+    def register(self, name: str, sql: str) -> str:
+        """تسجيل عبارة وإرجاع اسمها (التسجيل المكرر بالنص نفسه مسموح)"""
+        if not _NAME.match(name):
+            raise ValueError(f"اسم عبارة غير صالح: {name}")
+        sql = sql.strip()
+        with self._lock:
+            existing = self._statements.get(name)
+            if existing is not None:
+                if existing.sql != sql:
+                    raise ValueError(f"العبارة {name} مسجلة مسبقاً بنص مختلف")
+                return name
+            self._statements[name] = PreparedStatement(name, sql)
+        return name
+
+    def execute(self, cursor, name: str, params: Sequence[Any] = ()):
+        """تنفيذ عبارة مسجلة بالاسم على اتصال المؤشر (مع تجهيزها عند أول استخدام عليه)"""
+        statement = self._statements[name]
+        if len(params) != statement.param_count:
+            raise ValueError(f"العبارة {name} تتوقع {statement.param_count} معامل، وصل {len(params)}")
+
+        connection = cursor.connection
+        with self._lock:
+            prepared = self._prepared.get(connection)
+            if prepared is None:
+                prepared = self._prepared[connection] = set()
+
+        start = time.perf_counter()
+        if name not in prepared:
+            cursor.execute(f"PREPARE {name} AS {statement.sql}")
+            prepared.add(name)
+            statement.prepares += 1
+        if params:
+            cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", tuple(params))
+        else:
+            cursor.execute(f"EXECUTE {name}")
+        elapsed = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            statement.calls += 1
+            statement.total_ms += elapsed
+            if elapsed > statement.max_ms:
+                statement.max_ms = elapsed
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """إحصائيات كل عبارة: عدد الاستدعاءات والتجهيزات والزمن"""
+        with self._lock:
+            return {name: statement.stats() for name, statement in self._statements.items()}
+
+    def reset_stats(self):
+        with self._lock:
+            for statement in self._statements.values():
+                statement.calls = statement.prepares = 0
+                statement.total_ms = statement.max_ms = 0.0
+
+
+statements = StatementRegistry()
@@ -0,0 +1,172 @@
+# database/reference_data.py
+"""
+ذاكرة مشتركة لبيانات الجداول المرجعية الصغيرة (القطاعات، المستخدمون، تصنيفات المصروفات، أنواع العدادات).
+
+- كل جدول يُحمّل مرة واحدة عند أول طلب ويُحفظ على مستوى العملية مع خرائط بحث
+  (المعرف ← السجل، الاسم ← المعرف)، فلا تدفع الشاشات والحوارات رحلة لقاعدة البيانات.
+- المدراء الذين يكتبون في هذه الجداول يستدعون reference_data.invalidate(<الجدول>)
+  بعد الكتابة، وتعديلات محطات العمل الأخرى تصل عبر قناة التغييرات (change_feed).
+  مدة الصلاحية (ttl_seconds) تُطبق فقط أثناء انقطاع القناة.
+- السجلات المرجعة نسخ، فتعديلها لا يفسد الذاكرة.
+"""
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from config.settings import REFERENCE_DATA_CONFIG
+from database.change_feed import change_feed
+from database.connection import db
+
+logger = logging.getLogger(__name__)
+
+SECTORS = 'sectors'
+USERS = 'users'
+EXPENSE_CATEGORIES = 'expense_categories'
+
+# أنواع العدادات ثابتة في النظام (لا يوجد جدول لها)
+METER_TYPES = ('مولدة', 'علبة توزيع', 'رئيسية', 'زبون')
+
+
+class ReferenceTable:
+    """لقطة محمّلة من جدول مرجعي مع خرائط البحث"""
+
+    def __init__(self, rows: List[Dict[str, Any]], name_field: str):
+        self.rows = rows
+        self.by_id: Dict[int, Dict[str, Any]] = {row['id']: row for row in rows}
+        self.id_by_name: Dict[str, int] = {row[name_field]: row['id'] for row in rows if row.get(name_field)}
+        self.loaded_at = time.monotonic()
+
+
+class ReferenceDataCache:
+    """ذاكرة الجداول المرجعية - Thread-safe"""
+
+    # الاستعلام وحقل الاسم لكل جدول
+    QUERIES = {
+        SECTORS: ("""
+            SELECT id, name, code, description, is_active, default_generator_id
+            FROM sectors
+            ORDER BY name
+        """, 'name'),
+        USERS: ("""
+            SELECT id, username, full_name, role, email, is_active
+            FROM users
+            ORDER BY full_name
+        """, 'username'),
+        EXPENSE_CATEGORIES: ("""
+            SELECT id, name, arabic_name, is_active
+            FROM expense_categories
+            ORDER BY id
+        """, 'name'),
+    }
+
+    def __init__(self, ttl_seconds: Optional[float] = None):
+        if ttl_seconds is None:
+            ttl_seconds = REFERENCE_DATA_CONFIG.get('ttl_seconds', 600)
+        self.ttl = ttl_seconds
+        self._tables: Dict[str, ReferenceTable] = {}
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        change_feed.subscribe(tuple(self.QUERIES), lambda table, changes: self.invalidate(table))
+
+    # ------------------------------------------------------------------
+    # التحميل والإبطال
+    # ------------------------------------------------------------------
+    def _is_fresh(self, cached: Optional[ReferenceTable]) -> bool:
+        if cached is None:
+            return False
+        return change_feed.live or not self.ttl or time.monotonic() - cached.loaded_at < self.ttl
+
+    def _table(self, table: str) -> ReferenceTable:
+        cached = self._tables.get(table)
+        if self._is_fresh(cached):
+            return cached
+        with self._lock:
+            cached = self._tables.get(table)
+            if self._is_fresh(cached):
+                return cached
+            generation = self._generations.get(table, 0)
+            query, name_field = self.QUERIES[table]
+            with db.lane(None), db.get_cursor() as cursor:
+                cursor.execute(query)
+                rows = [dict(row) for row in cursor.fetchall()]
+                cacheable = not db.on_replica()
+            loaded = ReferenceTable(rows, name_field)
+            # إبطال وصل أثناء التحميل، أو قراءة من نسخة القراءة: نُرجع النتيجة دون تخزينها
+            if cacheable and generation == self._generations.get(table, 0):
+                self._tables[table] = loaded
+            logger.debug(f"تم تحميل الجدول المرجعي {table} ({len(rows)} سجل)")
+            return loaded
+
+    def invalidate(self, table: Optional[str] = None):
+        """إبطال جدول محدد (أو كل الجداول) ليُعاد تحميله عند الطلب التالي"""
+        # بدون القفل: قد يُستدعى من خيط قناة التغييرات أثناء تحميل جارٍ
+        for name in ([table] if table else list(self.QUERIES)):
+            self._generations[name] = self._generations.get(name, 0) + 1
+            self._tables.pop(name, None)
+
+    @staticmethod
+    def _copy(row: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        return dict(row) if row is not None else None
+
+    def _rows(self, table: str, active_only: bool) -> List[Dict[str, Any]]:
+        return [dict(row) for row in self._table(table).rows
+                if not active_only or row.get('is_active', True)]
+
+    # ------------------------------------------------------------------
+    # القطاعات
+    # ------------------------------------------------------------------
+    def sectors(self, active_only: bool = True) -> List[Dict[str, Any]]:
+        """القطاعات مرتبة بالاسم"""
+        return self._rows(SECTORS, active_only)
+
+    def sector(self, sector_id: int) -> Optional[Dict[str, Any]]:
+        return self._copy(self._table(SECTORS).by_id.get(sector_id))
+
+    def sector_id(self, name: str) -> Optional[int]:
+        return self._table(SECTORS).id_by_name.get(name)
+
+    def sector_name(self, sector_id: Optional[int], default: str = '') -> str:
+        row = self._table(SECTORS).by_id.get(sector_id) if sector_id else None
+        return row['name'] if row else default
+
+    def sectors_by_id(self, active_only: bool = False) -> Dict[int, Dict[str, Any]]:
+        return {row['id']: row for row in self.sectors(active_only)}
+
+    def sector_ids_by_name(self, active_only: bool = False) -> Dict[str, int]:
+        return {row['name']: row['id'] for row in self.sectors(active_only)}
+
+    # ------------------------------------------------------------------
+    # المستخدمون
+    # ------------------------------------------------------------------
+    def users(self, active_only: bool = True, role: Optional[str] = None) -> List[Dict[str, Any]]:
+        """المستخدمون مرتبون بالاسم الكامل"""
+        return [row for row in self._rows(USERS, active_only) if role is None or row['role'] == role]
+
+    def user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        return self._copy(self._table(USERS).by_id.get(user_id))
+
+    def user_id(self, username: str) -> Optional[int]:
+        return self._table(USERS).id_by_name.get(username)
+
+    def user_display_name(self, user_id: Optional[int], default: str = '') -> str:
+        row = self._table(USERS).by_id.get(user_id) if user_id else None
+        if not row:
+            return default
+        return row['full_name'] or row['username']
+
+    # ------------------------------------------------------------------
+    # تصنيفات المصروفات وأنواع العدادات
+    # ------------------------------------------------------------------
+    def expense_categories(self, active_only: bool = True) -> List[Dict[str, Any]]:
+        return self._rows(EXPENSE_CATEGORIES, active_only)
+
+    def expense_category_id(self, name: str) -> Optional[int]:
+        return self._table(EXPENSE_CATEGORIES).id_by_name.get(name)
+
+    @staticmethod
+    def meter_types() -> List[str]:
+        return list(METER_TYPES)
+
+
+reference_data = ReferenceDataCache()
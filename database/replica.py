@@ -0,0 +1,122 @@
+# database/replica.py
+"""
+توجيه القراءات الثقيلة إلى نسخة قراءة (streaming replica) مع مراقبة تأخرها.
+
+- القراءات المعلنة للقراءة فقط (db.lane('replica') أو @read_only / @read_only_class)
+  تذهب لمسار 'replica' في مجموعة الاتصالات طالما النسخة متاحة وتأخرها ضمن الحد.
+- التأخر يُقاس على النسخة نفسها: صفر إن كان كل ما استُلم من WAL مطبقاً ومستقبل
+  WAL يبث (pg_stat_wal_receiver.status = 'streaming') ووصلته رسالة من الخادم
+  الأساسي خلال max_lag_seconds، وإلا now() - pg_last_xact_replay_timestamp().
+  فالنسخة التي انقطع بثها لا تُعد حديثة لمجرد أنها طبقت كل ما استلمته.
+  (قراءة أعمدة pg_stat_wal_receiver تتطلب دور pg_read_all_stats؛ بدونه يُعتمد
+  زمن آخر معاملة مطبقة.) خادم ليس في وضع الاستعادة (مثل نسخة منطقية أو خادم
+  محلي ثانٍ للاختبار) يُعد بلا تأخر.
+- النتيجة تُحفظ check_interval ثانية، وبعد الفشل أو تجاوز التأخر لا يُعاد الفحص
+  قبل retry_after، فلا يدفع كل تقرير مهلة الاتصال بنسخة متوقفة.
+"""
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from database.pool import PoolLane
+
+logger = logging.getLogger(__name__)
+
+REPLICA_LANE = 'replica'
+
+
+class ReplicaMonitor:
+    """حالة نسخة القراءة (متاحة/متأخرة/متوقفة) - Thread-safe"""
+
+    LAG_QUERY = """
+        SELECT
+            pg_is_in_recovery() AS standby,
+            CASE
+                WHEN NOT pg_is_in_recovery() THEN 0
+                WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+                     AND EXISTS (
+                         SELECT 1
+                         FROM pg_stat_wal_receiver
+                         WHERE status = 'streaming'
+                           AND last_msg_receipt_time > now() - make_interval(secs => %s)
+                     ) THEN 0
+                ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+            END AS lag
+    """
+
+    def __init__(self, lane: PoolLane, config: Dict[str, Any]):
+        self.lane = lane
+        self.max_lag = float(config.get('max_lag_seconds', 30))
+        self.check_interval = float(config.get('check_interval', 10))
+        self.retry_after = float(config.get('retry_after', 60))
+        self.check_timeout = float(config.get('connect_timeout', 5))
+        self.lag: Optional[float] = None
+        self.standby: Optional[bool] = None
+        self.last_error: Optional[str] = None
+        self._available = False
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """هل يمكن توجيه القراءات للنسخة الآن؟"""
+        if time.monotonic() < self._next_check:
+            return self._available
+        with self._lock:
+            if time.monotonic() < self._next_check:
+                return self._available
+            self._set_state(self._check())
+        return self._available
+
+    def mark_failed(self, error: Exception):
+        """فشل حجز اتصال أو استعلام على النسخة: العودة للخادم الأساسي حتى retry_after"""
+        with self._lock:
+            self.last_error = str(error)
+            self._set_state(False)
+
+    def _set_state(self, available: bool):
+        if available != self._available:
+            if available:
+                logger.info(f"نسخة القراءة متاحة (التأخر {self.lag or 0:.1f} ثانية)")
+            else:
+                logger.warning(f"توجيه القراءات للخادم الأساسي: نسخة القراءة غير متاحة ({self.last_error})")
+        self._available = available
+        self._next_check = time.monotonic() + (self.check_interval if available else self.retry_after)
+
+    def _check(self) -> bool:
+        try:
+            conn = self.lane.getconn(self.check_timeout)
+        except Exception as e:
+            self.last_error = str(e)
+            return False
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(self.LAG_QUERY, (self.max_lag,))
+                standby, lag = cursor.fetchone()
+            conn.rollback()
+        except Exception as e:
+            self.lane.putconn(conn, close=True)
+            self.last_error = str(e)
+            return False
+        self.lane.putconn(conn)
+
+        self.standby = standby
+        self.lag = float(lag) if lag is not None else None
+        if self.lag is None:
+            # نسخة لم تطبق أي معاملة بعد بدء تشغيلها: لا يمكن معرفة حداثتها
+            self.last_error = "تأخر غير معروف"
+            return False
+        if self.lag > self.max_lag:
+            self.last_error = f"التأخر {self.lag:.0f} ثانية أكبر من {self.max_lag:.0f}"
+            return False
+        self.last_error = None
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'available': self._available,
+            'standby': self.standby,
+            'lag_seconds': self.lag,
+            'max_lag_seconds': self.max_lag,
+            'last_error': self.last_error,
+        }
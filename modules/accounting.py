@@ -3,9 +3,46 @@
 import logging
 from datetime import datetime
 from database.connection import db
+from database.prepared import statements
+from utils.tracing import traced_class
 
 logger = logging.getLogger(__name__)
 
+# عبارات مسار الفاتورة المجهزة (database/prepared.py)
+CUSTOMER_FOR_INVOICE = statements.register('acct_customer_for_invoice', """
+    SELECT id, name, current_balance, last_counter_reading
+    FROM customers
+    WHERE id = $1 AND is_active = TRUE
+    FOR UPDATE
+""")
+
+UPDATE_CUSTOMER_READING = statements.register('acct_update_customer_reading', """
+    UPDATE customers
+    SET current_balance = $1,
+        last_counter_reading = $2,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = $3
+""")
+
+# مشتركة مع FastOperations: تحديث مؤشر آخر فاتورة مع لقطة الزبون بعد التحديث
+SET_LAST_INVOICE = statements.register('inv_set_last_invoice', """
+    UPDATE customers
+    SET last_invoice_id = $1, last_invoice_number = $2
+    WHERE id = $3
+    RETURNING withdrawal_amount, visa_balance, last_counter_reading
+""")
+
+INSERT_INVOICE_HISTORY = statements.register('inv_insert_history', """
+    INSERT INTO customer_history
+    (customer_id, action_type, transaction_type,
+    old_value, new_value, amount,
+    current_balance_before, current_balance_after,
+    notes, created_by, created_at,
+    snapshot_withdrawal_amount, snapshot_visa_balance, snapshot_last_counter_reading)
+    VALUES ($1, 'invoice_created', 'payment', $2, $3, $4, $5, $6, $7, $8, CURRENT_TIMESTAMP, $9, $10, $11)
+""")
+
+@traced_class
 class AccountingEngine:
     """
     محرك المحاسبة الرئيسي
@@ -50,12 +87,8 @@ class AccountingEngine:
         """تنفيذ عملية محاسبة كاملة للفاتورة"""
         try:
             with db.get_cursor() as cursor:
-                # 1. جلب بيانات الزبون
-                cursor.execute("""
-                    SELECT id, name, current_balance, last_counter_reading
-                    FROM customers
-                    WHERE id = %s AND is_active = TRUE
-                """, (customer_id,))
+                # 1. جلب بيانات الزبون مع قفل السطر حتى نهاية المعاملة
+                statements.execute(cursor, CUSTOMER_FOR_INVOICE, (customer_id,))
                 customer = cursor.fetchone()
                 if not customer:
                     return {'success': False, 'error': 'الزبون غير موجود'}
@@ -75,14 +108,7 @@ class AccountingEngine:
                 new_balance = current_balance + kilowatt_amount + free_kilowatt
                 
                 # 3. تحديث بيانات الزبون
-                cursor.execute("""
-                    UPDATE customers
-                    SET
-                        current_balance = %s,
-                        last_counter_reading = %s,
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE id = %s
-                """, (
+                statements.execute(cursor, UPDATE_CUSTOMER_READING, (
                     new_balance,
                     new_reading,
                     customer_id
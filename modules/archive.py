@@ -6,6 +6,8 @@ import logging
 import os
 import shutil
 import json
+import gzip
+import re
 import subprocess
 from datetime import datetime
 from pathlib import Path
@@ -13,13 +15,16 @@ from typing import Dict, List, Optional
 import threading
 import time
 
-from config.settings import BACKUP_CONFIG, DATABASE_CONFIG
+from config.settings import BACKUP_CONFIG, DATABASE_CONFIG, HISTORY_PARTITION_CONFIG
+from database.connection import in_lane
 from modules.backup_engine import PostgresBackupEngine
+from utils.tracing import traced_class
 
 
 logger = logging.getLogger(__name__)
 
 
+@traced_class
 class ArchiveManager:
     """مدير عمليات الأرشيف والنسخ الاحتياطي (نسخة متقدمة)"""
 
@@ -101,6 +106,10 @@ class ArchiveManager:
                         logger.error(f"❌ فشل النسخ الاحتياطي التلقائي: {result.get('error')}")
                 except Exception as e:
                     logger.exception(f"❌ خطأ أثناء النسخ الاحتياطي التلقائي: {e}")
+                if HISTORY_PARTITION_CONFIG.get('auto_archive', False):
+                    result = self.archive_history_partitions()
+                    if not result.get('success'):
+                        logger.error(f"❌ فشل أرشفة أقسام السجل التاريخي: {result.get('error')}")
                 # الانتظار للمدة المحددة (بالثواني)
                 time.sleep(interval_hours * 3600)
 
@@ -109,6 +118,62 @@ class ArchiveManager:
         thread.start()
         logger.info(f"🕒 تم بدء جدولة النسخ الاحتياطي التلقائي كل {interval_hours} ساعة")
 
+    @in_lane('maintenance')
+    def archive_history_partitions(self, older_than_months: int = None, export_and_drop: bool = False) -> Dict:
+        """
+        أرشفة أقسام customer_history الأقدم من المدة المحددة:
+        - افتراضياً: نقل القسم إلى archive_tablespace على تخزين مضغوط (يبقى قابلاً للاستعلام).
+        - export_and_drop=True (اختيار صريح فقط): تصدير القسم إلى ملف CSV مضغوط ثم فصله
+          وحذفه من قاعدة البيانات، فيختفي من السجل التاريخي والتقارير.
+        كما تضمن إنشاء أقسام الأشهر القادمة.
+        """
+        from database.connection import db
+        from database.models import models
+
+        mode = 'export' if export_and_drop else 'tablespace'
+        months = older_than_months or HISTORY_PARTITION_CONFIG.get('archive_after_months', 24)
+        tablespace = HISTORY_PARTITION_CONFIG.get('archive_tablespace')
+        if mode == 'tablespace' and not tablespace:
+            return {'success': False,
+                    'error': 'لم يتم تحديد archive_tablespace في HISTORY_PARTITION_CONFIG: '
+                             'أنشئ tablespace على قرص مضغوط وحدد اسمه، أو استخدم --export-and-drop صراحةً'}
+
+        archive_dir = Path(HISTORY_PARTITION_CONFIG.get('archive_path', os.path.join(self.backup_dir, 'history_archive')))
+        if mode == 'export':
+            archive_dir.mkdir(parents=True, exist_ok=True)
+        cutoff = models._add_months(models._month_start(datetime.now()), -months)
+
+        try:
+            models.ensure_history_partitions()
+            archived = []
+            for partition in models.get_history_partitions():
+                name = partition['name']
+                match = re.match(r'customer_history_y(\d{4})m(\d{2})$', name)
+                if not match or datetime(int(match.group(1)), int(match.group(2)), 1) >= cutoff:
+                    continue
+
+                if mode == 'tablespace':
+                    if partition['tablespace'] == tablespace:
+                        continue
+                    with db.get_cursor() as cursor:
+                        cursor.execute(f"ALTER TABLE {name} SET TABLESPACE {tablespace}")
+                    archived.append({'partition': name, 'tablespace': tablespace})
+                else:
+                    archive_file = archive_dir / f"{name}.csv.gz"
+                    with db.get_cursor() as cursor:
+                        with gzip.open(archive_file, 'wb') as f:
+                            cursor.copy_expert(f"COPY {name} TO STDOUT WITH CSV HEADER", f)
+                        cursor.execute(f"ALTER TABLE customer_history DETACH PARTITION {name}")
+                        cursor.execute(f"DROP TABLE {name}")
+                    archived.append({'partition': name, 'file': str(archive_file)})
+
+                logger.info(f"تمت أرشفة القسم {name} ({mode})")
+
+            return {'success': True, 'archived': archived}
+        except Exception as e:
+            logger.error(f"خطأ في أرشفة أقسام السجل التاريخي: {e}")
+            return {'success': False, 'error': str(e)}
+
     def _close_db_connections(self):
         """إغلاق جميع اتصالات قاعدة البيانات الحالية."""
         try:
@@ -122,11 +187,18 @@ class ArchiveManager:
         """
         استعادة نسخة احتياطية - مع إغلاق جميع الاتصالات وإعادة تشغيلها بعد الاستعادة
         """
+        decrypted_dir = None
         try:
             backup_file = Path(backup_path)
 
             # فك التشفير إذا لزم الأمر
-            if backup_file.suffix == '.gpg':
+            if backup_file.is_dir():
+                if any(backup_file.glob('*.gpg')):
+                    decrypted = self._decrypt_directory(backup_file)
+                    if not decrypted:
+                        return {'success': False, 'error': 'فشل فك التشفير'}
+                    backup_file = decrypted_dir = decrypted
+            elif backup_file.suffix == '.gpg':
                 decrypted = self._decrypt_file(backup_file)
                 if not decrypted:
                     return {'success': False, 'error': 'فشل فك التشفير'}
@@ -164,6 +236,8 @@ class ArchiveManager:
                 '-p', str(DATABASE_CONFIG['port']),
                 '--clean',
                 '--if-exists',
+                # استعادة متوازية (مدعومة لتنسيقي custom و directory)
+                '-j', str(BACKUP_CONFIG.get('parallel_jobs', os.cpu_count() or 1)),
                 str(backup_file)
             ]
 
@@ -203,6 +277,10 @@ class ArchiveManager:
         except Exception as e:
             logger.error(f"استثناء عام في restore_backup: {e}")
             return {'success': False, 'error': str(e)}
+        finally:
+            # النسخة المفكوكة غير مشفرة: لا تبقى على القرص بعد الاستعادة
+            if decrypted_dir is not None:
+                shutil.rmtree(decrypted_dir, ignore_errors=True)
 
     def _decrypt_file(self, encrypted_path: Path) -> Optional[Path]:
         """فك تشفير ملف GPG (يتطلب المفتاح الخاص)."""
@@ -221,6 +299,36 @@ class ArchiveManager:
             logger.error(f"خطأ في فك التشفير: {e}")
             return None
 
+    def _decrypt_directory(self, encrypted_dir: Path) -> Optional[Path]:
+        """فك تشفير نسخة بتنسيق directory (كل ملف مشفر على حدة) إلى مجلد مجاور."""
+        try:
+            import gnupg
+            from concurrent.futures import ThreadPoolExecutor
+            gpg = gnupg.GPG()
+            decrypted_dir = encrypted_dir.with_name(encrypted_dir.name + '.restore')
+            decrypted_dir.mkdir(exist_ok=True)
+
+            def decrypt(path: Path) -> bool:
+                target = decrypted_dir / (path.stem if path.suffix == '.gpg' else path.name)
+                if path.suffix != '.gpg':
+                    shutil.copy2(path, target)
+                    return True
+                with open(path, 'rb') as f:
+                    status = gpg.decrypt_file(f, output=str(target))
+                if not status.ok:
+                    logger.error(f"فشل فك تشفير {path.name}: {status.stderr}")
+                return status.ok
+
+            files = [p for p in encrypted_dir.iterdir() if p.is_file()]
+            with ThreadPoolExecutor(max_workers=BACKUP_CONFIG.get('parallel_jobs', os.cpu_count() or 1)) as executor:
+                results = list(executor.map(decrypt, files))
+            if not all(results):
+                return None
+            return decrypted_dir
+        except Exception as e:
+            logger.error(f"خطأ في فك تشفير المجلد: {e}")
+            return None
+
     def export_database_tables(self, backup_folder):
         """تصدير جداول قاعدة البيانات"""
         tables = ['customers', 'invoices', 'users', 'sectors', 'activity_logs']
@@ -15,6 +15,7 @@ import re
 import tempfile
 import datetime
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Any
 from datetime import datetime, timedelta
@@ -115,6 +116,10 @@ class PostgresBackupEngine:
             return 0
 
     def perform_full_backup(self, backup_label: str = None) -> Dict[str, Any]:
+        # التنسيق directory يسمح بـ pg_dump -j (نسخ متوازي) ويقصر مدة الاحتفاظ بلقطة قاعدة البيانات
+        if self.backup_config.get('dump_format', 'custom') == 'directory':
+            return self.perform_parallel_backup(backup_label)
+
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         label = backup_label or f"full_backup_{timestamp}"
         backup_file = self.local_backup_dir / f"{label}.dump"
@@ -130,7 +135,7 @@ class PostgresBackupEngine:
             cmd = [
                 'pg_dump',
                 '-Fc',                     # تنسيق custom
-                '-Z', '9',                  # أقصى ضغط
+                '-Z', str(self._compression_level()),
                 '-f', str(backup_file),     # ملف الإخراج
                 '-d', self.db_config['database'],
                 '-U', self.db_config['user'],
@@ -139,21 +144,18 @@ class PostgresBackupEngine:
             ]
             subprocess.run(cmd, env=self.pg_env, check=True, capture_output=True)
 
-            # 3. حساب checksum
-            checksum = self._calculate_checksum(backup_file)
-
-            # 4. تشفير إذا لزم الأمر
+            # 3. التشفير (إن وجد) وحساب checksum في قراءة واحدة
+            backup_file, checksum = self._finalize_file(backup_file)
             if self.encryption_enabled:
-                encrypted_path = self._encrypt_file(backup_file)
-                backup_file.unlink()  # حذف الملف غير المشفر
-                backup_file = encrypted_path
                 label = backup_file.stem
 
-            # 5. حفظ الميتاداتا
+            # 4. حفظ الميتاداتا
             metadata = {
                 'backup_label': label,
                 'timestamp': timestamp,
                 'type': 'full_dump',
+                'format': 'custom',
+                'backup_path': str(backup_file),
                 'database_size': db_size,
                 'checksum': checksum,
                 'encrypted': self.encryption_enabled,
@@ -176,6 +178,91 @@ class PostgresBackupEngine:
             logger.error(f"خطأ غير متوقع: {e}")
             return {'success': False, 'error': str(e)}
 
+    def perform_parallel_backup(self, backup_label: str = None) -> Dict[str, Any]:
+        """
+        نسخ كامل بتنسيق directory مع pg_dump -j.
+        كل ملف في المجلد يُشفَّر ويُحسب له checksum بشكل متوازٍ وفي قراءة واحدة،
+        وتُحفظ قيم checksum لكل ملف في الميتاداتا.
+        """
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        label = backup_label or f"full_backup_{timestamp}"
+        backup_dir = self.local_backup_dir / f"{label}.dir"
+        metadata_file = self.local_backup_dir / f"{label}.json"
+        jobs = self._parallel_jobs()
+
+        try:
+            logger.info(f"بدء النسخ الاحتياطي المتوازي ({jobs} عمليات) باستخدام pg_dump -Fd: {label}")
+            db_size = self._get_database_size()
+
+            started = time.time()
+            cmd = [
+                'pg_dump',
+                '-Fd',                      # تنسيق directory (مطلوب لـ -j)
+                '-j', str(jobs),
+                '-Z', str(self._compression_level()),
+                '-f', str(backup_dir),
+                '-d', self.db_config['database'],
+                '-U', self.db_config['user'],
+                '-h', self.db_config['host'],
+                '-p', str(self.db_config['port'])
+            ]
+            subprocess.run(cmd, env=self.pg_env, check=True, capture_output=True)
+            dump_seconds = time.time() - started
+
+            # التشفير + checksum لكل ملف بالتوازي (hashlib و gpg يحرران GIL)
+            files = sorted(p for p in backup_dir.iterdir() if p.is_file())
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                finalized = list(executor.map(self._finalize_file, files))
+            file_checksums = {path.name: checksum for path, checksum in finalized}
+
+            metadata = {
+                'backup_label': label,
+                'timestamp': timestamp,
+                'type': 'full_dump',
+                'format': 'directory',
+                'backup_path': str(backup_dir),
+                'parallel_jobs': jobs,
+                'compression_level': self._compression_level(),
+                'dump_seconds': round(dump_seconds, 2),
+                'database_size': db_size,
+                'checksum': self._manifest_checksum(file_checksums),
+                'files': file_checksums,
+                'encrypted': self.encryption_enabled,
+                'pg_version': self._get_pg_version()
+            }
+            with open(metadata_file, 'w') as f:
+                json.dump(metadata, f, indent=2, default=str)
+
+            logger.info(f"تم إنشاء النسخة الاحتياطية المتوازية: {backup_dir} ({len(files)} ملف)")
+            return {
+                'success': True,
+                'backup_path': str(backup_dir),
+                'metadata': metadata
+            }
+
+        except subprocess.CalledProcessError as e:
+            logger.error(f"فشل النسخ الاحتياطي المتوازي: {e.stderr}")
+            shutil.rmtree(backup_dir, ignore_errors=True)
+            return {'success': False, 'error': e.stderr}
+        except Exception as e:
+            logger.error(f"خطأ غير متوقع في النسخ المتوازي: {e}")
+            shutil.rmtree(backup_dir, ignore_errors=True)
+            return {'success': False, 'error': str(e)}
+
+    def _parallel_jobs(self) -> int:
+        return max(1, int(self.backup_config.get('parallel_jobs', os.cpu_count() or 1)))
+
+    def _compression_level(self) -> int:
+        return int(self.backup_config.get('compression_level', 9))
+
+    def _buffer_size(self) -> int:
+        return int(self.backup_config.get('io_buffer_size', 1024 * 1024))
+
+    @staticmethod
+    def _manifest_checksum(file_checksums: Dict[str, str]) -> str:
+        """checksum إجمالي للنسخة مشتق من checksum كل ملف (بترتيب ثابت)."""
+        manifest = ''.join(f"{name}:{checksum}\n" for name, checksum in sorted(file_checksums.items()))
+        return hashlib.sha256(manifest.encode('utf-8')).hexdigest()
 
     def _get_pg_version(self) -> str:
         """الحصول على إصدار PostgreSQL."""
@@ -188,25 +275,42 @@ class PostgresBackupEngine:
     def _calculate_checksum(self, file_path: Path) -> str:
         """حساب SHA256 للملف."""
         sha256 = hashlib.sha256()
-        with open(file_path, 'rb') as f:
-            for block in iter(lambda: f.read(4096), b''):
+        buffer_size = self._buffer_size()
+        with open(file_path, 'rb', buffering=0) as f:
+            for block in iter(lambda: f.read(buffer_size), b''):
                 sha256.update(block)
         return sha256.hexdigest()
 
-    def _encrypt_file(self, file_path: Path) -> Path:
-        encrypted_path = file_path.with_suffix(file_path.suffix + '.gpg')
+    def _finalize_file(self, file_path: Path) -> Tuple[Path, str]:
+        """
+        تجهيز ملف النسخة للتخزين في قراءة واحدة:
+        بدون تشفير يُحسب checksum فقط، ومع التشفير يُمرَّر الملف إلى gpg ويُحسب
+        checksum للناتج المشفر أثناء كتابته (وهو ما يتحقق منه verify_backup لاحقاً).
+        """
+        if not self.encryption_enabled:
+            return file_path, self._calculate_checksum(file_path)
+
+        encrypted_path = file_path.with_name(file_path.name + '.gpg')
         recipient = self.backup_config['encryption']['recipient']
-        with open(file_path, 'rb') as f:
-            status = self.gpg.encrypt_file(
-                f,
-                recipients=[recipient],
-                output=str(encrypted_path),
-                always_trust=True
-            )
-        if not status.ok:
-            raise RuntimeError(f"فشل التشفير: {status.stderr}")
-        return encrypted_path
+        cmd = [self.gpg.gpgbinary, '--batch', '--yes', '--trust-model', 'always']
+        if self.gpg.gnupghome:
+            cmd += ['--homedir', self.gpg.gnupghome]
+        cmd += ['--encrypt', '--recipient', recipient, '--output', '-', str(file_path)]
 
+        sha256 = hashlib.sha256()
+        buffer_size = self._buffer_size()
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as proc, \
+                open(encrypted_path, 'wb') as out:
+            for block in iter(lambda: proc.stdout.read(buffer_size), b''):
+                sha256.update(block)
+                out.write(block)
+            stderr = proc.stderr.read()
+        if proc.returncode != 0:
+            encrypted_path.unlink(missing_ok=True)
+            raise RuntimeError(f"فشل التشفير: {stderr.decode(errors='replace')}")
+
+        file_path.unlink()  # حذف الملف غير المشفر
+        return encrypted_path, sha256.hexdigest()
 
     def archive_wal(self) -> bool:
         """
@@ -240,8 +344,11 @@ class PostgresBackupEngine:
             logger.error(f"ملف النسخة غير موجود: {backup_path}")
             return False
 
-        # التحقق من checksum
-        if metadata.get('checksum'):
+        # نسخ directory: التحقق من checksum كل ملف بالتوازي
+        if metadata.get('files'):
+            if not self._verify_directory_checksums(backup_path, metadata['files']):
+                return False
+        elif metadata.get('checksum'):
             current_checksum = self._calculate_checksum(backup_path)
             if current_checksum != metadata['checksum']:
                 logger.error(f"checksum mismatch: expected {metadata['checksum']}, got {current_checksum}")
@@ -256,6 +363,24 @@ class PostgresBackupEngine:
         logger.info(f"تم التحقق من النسخة {backup_path.name} بنجاح.")
         return True
 
+    def _verify_directory_checksums(self, backup_dir: Path, file_checksums: Dict[str, str]) -> bool:
+        """التحقق من checksum كل ملف في نسخة directory."""
+        def check(item):
+            name, expected = item
+            path = backup_dir / name
+            if not path.exists():
+                return name, 'missing'
+            return name, self._calculate_checksum(path) == expected
+
+        with ThreadPoolExecutor(max_workers=self._parallel_jobs()) as executor:
+            results = list(executor.map(check, file_checksums.items()))
+
+        failed = [name for name, ok in results if ok is not True]
+        if failed:
+            logger.error(f"checksum mismatch في {len(failed)} ملف: {', '.join(failed[:10])}")
+            return False
+        return True
+
     def _test_restore_sample(self, backup_path: Path, sample_size: int) -> bool:
         """
         اختبار استرجاع عينة عشوائية من البيانات.
@@ -280,7 +405,10 @@ class PostgresBackupEngine:
                 if remote.startswith(('\\\\', '//')):  # UNC path
                     # استخدام robocopy على Windows أو rsync على Linux
                     if os.name == 'nt':
-                        cmd = ['robocopy', str(backup_path.parent), remote, backup_path.name, '/COPY:DAT']
+                        if backup_path.is_dir():
+                            cmd = ['robocopy', str(backup_path), os.path.join(remote, backup_path.name), '/E', '/COPY:DAT']
+                        else:
+                            cmd = ['robocopy', str(backup_path.parent), remote, backup_path.name, '/COPY:DAT']
                         subprocess.run(cmd, check=True)
                     else:
                         # استخدام rsync
@@ -289,10 +417,17 @@ class PostgresBackupEngine:
                     # رفع إلى S3
                     s3 = boto3.client('s3')
                     bucket, key = remote[5:].split('/', 1)
-                    s3.upload_file(str(backup_path), bucket, f"{key}/{backup_path.name}")
+                    if backup_path.is_dir():
+                        for part in backup_path.iterdir():
+                            s3.upload_file(str(part), bucket, f"{key}/{backup_path.name}/{part.name}")
+                    else:
+                        s3.upload_file(str(backup_path), bucket, f"{key}/{backup_path.name}")
                 else:
                     # افتراض أنه مسار محلي أو UNC عادي
-                    shutil.copy2(str(backup_path), remote)
+                    if backup_path.is_dir():
+                        shutil.copytree(str(backup_path), os.path.join(remote, backup_path.name), dirs_exist_ok=True)
+                    else:
+                        shutil.copy2(str(backup_path), remote)
                 logger.info(f"تم نسخ {backup_path.name} إلى {remote}")
             except Exception as e:
                 logger.error(f"فشل النسخ إلى {remote}: {e}")
@@ -310,15 +445,22 @@ class PostgresBackupEngine:
         # تجميع جميع ملفات النسخ مع الميتاداتا
         backups = []
         for meta_file in self.local_backup_dir.glob('*.json'):
-            backup_file = meta_file.with_suffix('')  # بدون .json، قد يكون له امتدادات أخرى
-            if not backup_file.exists():
-                # قد يكون هناك امتداد .gpg
-                backup_file = meta_file.with_suffix('.backup.gpg')
-                if not backup_file.exists():
-                    continue
             try:
                 with open(meta_file) as f:
                     metadata = json.load(f)
+            except Exception as e:
+                logger.error(f"خطأ في قراءة الميتاداتا {meta_file}: {e}")
+                continue
+            if metadata.get('backup_path'):
+                backup_file = Path(metadata['backup_path'])
+            else:
+                backup_file = meta_file.with_suffix('')  # بدون .json، قد يكون له امتدادات أخرى
+                if not backup_file.exists():
+                    # قد يكون هناك امتداد .gpg
+                    backup_file = meta_file.with_suffix('.backup.gpg')
+            if not backup_file.exists():
+                continue
+            try:
                 timestamp_str = metadata.get('timestamp')
                 if timestamp_str:
                     backup_time = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
@@ -344,7 +486,10 @@ class PostgresBackupEngine:
 
         for backup in to_delete:
             try:
-                backup['path'].unlink()
+                if backup['path'].is_dir():
+                    shutil.rmtree(backup['path'])
+                else:
+                    backup['path'].unlink()
                 backup['meta'].unlink()
                 logger.info(f"تم حذف النسخة القديمة: {backup['path'].name}")
             except Exception as e:
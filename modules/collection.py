@@ -3,9 +3,13 @@ import logging
 from datetime import datetime
 from database.connection import db
 from typing import Dict, List, Optional
+from psycopg2.extras import execute_values
+from modules.customer_cache import customer_cache
+from utils.tracing import traced_class
 
 logger = logging.getLogger(__name__)
 
+@traced_class
 class CollectionManager:
     """مدير عمليات التحصيل الميداني"""
 
@@ -55,58 +59,194 @@ class CollectionManager:
                 ))
 
                 logger.info(f"تم تسجيل تحصيل {collected_amount} للزبون {customer_id} بواسطة المحصل {collector_id}")
-                return {'success': True, 'log_id': log_id, 'new_balance': new_balance}
+
+            customer_cache.invalidate([customer_id])
+            return {'success': True, 'log_id': log_id, 'new_balance': new_balance}
         except Exception as e:
             logger.error(f"خطأ في تسجيل التحصيل: {e}")
             return {'success': False, 'error': str(e)}
 
 
+    def apply_collection_batch(self, entries: List[Dict]) -> Dict:
+        """
+        تطبيق دفعة من عمليات التحصيل القادمة من دفتر المحصل المحلي في معاملة واحدة.
+        كل عملية تحمل uuid مولداً عند المحصل، فإعادة الإرسال لا تكرر التحصيل.
+        يعيد: applied {uuid: log_id}، duplicates [uuid] (سبق تطبيقها)، conflicts {uuid: السبب}.
+        """
+        applied, duplicates, conflicts = {}, [], {}
+        if not entries:
+            return {'success': True, 'applied': applied, 'duplicates': duplicates, 'conflicts': conflicts}
+
+        try:
+            with db.get_cursor() as cursor:
+                # قفل كل زبائن الدفعة مرة واحدة (يمنع تطبيق نفس الدفعة من جهازين بالتوازي)
+                customer_ids = sorted({int(e['customer_id']) for e in entries})
+                cursor.execute("""
+                    SELECT id, current_balance, is_active
+                    FROM customers
+                    WHERE id = ANY(%s)
+                    ORDER BY id
+                    FOR UPDATE
+                """, (customer_ids,))
+                balances = {row['id']: row for row in cursor.fetchall()}
+
+                cursor.execute("""
+                    SELECT client_uuid::text AS uuid
+                    FROM collection_logs
+                    WHERE client_uuid = ANY(%s::uuid[])
+                """, ([e['uuid'] for e in entries],))
+                already = {row['uuid'] for row in cursor.fetchall()}
+
+                # حساب الأرصدة المتتالية بترتيب وقت التحصيل
+                logs, history = [], []
+                new_balances = {}
+                seen = set()
+                for entry in sorted(entries, key=lambda e: str(e['collected_at'])):
+                    uuid = entry['uuid']
+                    if uuid in already or uuid in seen:
+                        duplicates.append(uuid)
+                        continue
+                    seen.add(uuid)
+
+                    customer = balances.get(int(entry['customer_id']))
+                    amount = float(entry['collected_amount'] or 0)
+                    if not customer:
+                        conflicts[uuid] = 'الزبون غير موجود'
+                        continue
+                    if not customer['is_active']:
+                        conflicts[uuid] = 'الزبون غير نشط'
+                        continue
+                    if amount <= 0:
+                        conflicts[uuid] = 'مبلغ غير صالح'
+                        continue
+
+                    customer_id = customer['id']
+                    old_balance = new_balances.get(customer_id, float(customer['current_balance'] or 0))
+                    new_balance = old_balance + amount   # إضافة المبلغ المحصل (يقلل الدين)
+                    new_balances[customer_id] = new_balance
+                    notes = entry.get('notes') or ''
+
+                    logs.append((
+                        entry['collector_id'], customer_id, amount, old_balance, notes,
+                        entry.get('lat'), entry.get('lon'), entry['collected_at'], uuid
+                    ))
+                    history.append((
+                        customer_id, 'collection', 'mobile_collection',
+                        old_balance, new_balance, amount,
+                        old_balance, new_balance,
+                        f'تحصيل ميداني: {amount} ك.و - {notes}',
+                        entry['collector_id'], entry['collected_at']
+                    ))
+
+                if logs:
+                    rows = execute_values(cursor, """
+                        INSERT INTO collection_logs
+                        (collector_id, customer_id, collected_amount, expected_amount, notes,
+                         location_lat, location_lon, collection_date, client_uuid)
+                        VALUES %s
+                        RETURNING id, client_uuid::text AS uuid
+                    """, logs, template='(%s, %s, %s, %s, %s, %s, %s, %s::timestamp, %s::uuid)',
+                        page_size=len(logs), fetch=True)
+                    applied = {row['uuid']: row['id'] for row in rows}
+
+                    execute_values(cursor, """
+                        UPDATE customers c
+                        SET current_balance = v.balance, updated_at = CURRENT_TIMESTAMP
+                        FROM (VALUES %s) AS v(id, balance)
+                        WHERE c.id = v.id
+                    """, list(new_balances.items()), template='(%s::int, %s::numeric)',
+                        page_size=len(new_balances))
+
+                    execute_values(cursor, """
+                        INSERT INTO customer_history
+                        (customer_id, action_type, transaction_type, old_value, new_value, amount,
+                        current_balance_before, current_balance_after, notes, created_by, created_at)
+                        VALUES %s
+                    """, history, template='(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s::timestamp)',
+                        page_size=len(history))
+
+            if applied:
+                customer_cache.invalidate(new_balances)
+            logger.info(f"مزامنة التحصيل: {len(applied)} مطبقة، {len(duplicates)} مكررة، {len(conflicts)} متعارضة")
+            return {'success': True, 'applied': applied, 'duplicates': duplicates, 'conflicts': conflicts}
+        except Exception as e:
+            logger.error(f"خطأ في تطبيق دفعة التحصيل: {e}")
+            return {'success': False, 'error': str(e)}
+
     def get_last_payment(self, customer_id: int) -> Optional[Dict]:
         """الحصول على آخر دفعة لزبون (من الفواتير أو التحصيلات)"""
+        return self.get_last_payments([customer_id]).get(customer_id)
+
+    def get_last_payments(self, customer_ids: List[int]) -> Dict[int, Dict]:
+        """
+        آخر دفعة لعدة زبائن باستعلام واحد (الأحدث بين آخر فاتورة وآخر تحصيل).
+        يعيد {customer_id: {'payment_datetime', 'amount', 'source'}} للزبائن الذين لديهم دفعات.
+        """
+        ids = [int(cid) for cid in customer_ids if cid is not None]
+        if not ids:
+            return {}
         try:
             with db.get_cursor() as cursor:
-                # آخر فاتورة (payment_date + payment_time)
                 cursor.execute("""
-                    SELECT 
-                        (payment_date + payment_time) as payment_datetime,
-                        total_amount as amount,
-                        'invoice' as source
-                    FROM invoices
-                    WHERE customer_id = %s AND status = 'active'
-                    ORDER BY payment_date DESC, payment_time DESC
-                    LIMIT 1
-                """, (customer_id,))
-                invoice = cursor.fetchone()
-
-                # آخر تحصيل
+                    SELECT c.customer_id, last.payment_datetime, last.amount, last.source
+                    FROM unnest(%s::int[]) AS c(customer_id)
+                    CROSS JOIN LATERAL (
+                        SELECT p.*
+                        FROM (
+                            (SELECT
+                                (payment_date + payment_time) as payment_datetime,
+                                total_amount as amount,
+                                'invoice' as source
+                             FROM invoices
+                             WHERE customer_id = c.customer_id AND status = 'active'
+                             ORDER BY payment_date DESC, payment_time DESC
+                             LIMIT 1)
+                            UNION ALL
+                            (SELECT
+                                collection_date as payment_datetime,
+                                collected_amount as amount,
+                                'collection' as source
+                             FROM collection_logs
+                             WHERE customer_id = c.customer_id
+                             ORDER BY collection_date DESC
+                             LIMIT 1)
+                        ) p
+                        -- عند تساوي الوقت يُفضّل التحصيل (كما في السابق)
+                        ORDER BY p.payment_datetime DESC NULLS LAST, p.source = 'collection' DESC
+                        LIMIT 1
+                    ) last
+                """, (list(set(ids)),))
+
+                return {
+                    row['customer_id']: {
+                        'payment_datetime': row['payment_datetime'],
+                        'amount': row['amount'],
+                        'source': row['source']
+                    }
+                    for row in cursor.fetchall()
+                }
+        except Exception as e:
+            logger.error(f"خطأ في جلب آخر الدفعات: {e}")
+            return {}
+
+    def get_last_collections(self, customer_ids: List[int], collector_id: int) -> Dict[int, Dict]:
+        """آخر تحصيل لعدة زبائن من قبل محصل معين باستعلام واحد"""
+        ids = [int(cid) for cid in customer_ids if cid is not None]
+        if not ids:
+            return {}
+        try:
+            with db.get_cursor() as cursor:
                 cursor.execute("""
-                    SELECT 
-                        collection_date as payment_datetime,
-                        collected_amount as amount,
-                        'collection' as source
+                    SELECT DISTINCT ON (customer_id)
+                        customer_id, collection_date, collected_amount
                     FROM collection_logs
-                    WHERE customer_id = %s
-                    ORDER BY collection_date DESC
-                    LIMIT 1
-                """, (customer_id,))
-                collection = cursor.fetchone()
-
-                # اختيار الأحدث
-                last = None
-                if invoice and collection:
-                    if invoice['payment_datetime'] > collection['payment_datetime']:
-                        last = invoice
-                    else:
-                        last = collection
-                elif invoice:
-                    last = invoice
-                elif collection:
-                    last = collection
-
-                return last
+                    WHERE customer_id = ANY(%s) AND collector_id = %s
+                    ORDER BY customer_id, collection_date DESC
+                """, (list(set(ids)), collector_id))
+                return {row['customer_id']: row for row in cursor.fetchall()}
         except Exception as e:
-            logger.error(f"خطأ في جلب آخر دفعة: {e}")
-            return None
+            logger.error(f"خطأ في جلب آخر التحصيلات: {e}")
+            return {}
 
 
     def get_collector_performance(self, collector_id: int, start_date: str, end_date: str) -> Dict:
@@ -0,0 +1,272 @@
+# modules/collection_journal.py
+"""
+دفتر التحصيل المحلي للمحصل (SQLite) ومحرك مزامنته مع قاعدة البيانات المركزية.
+
+يُسجل كل تحصيل فوراً في ملف SQLite محلي مع uuid يولد عند المحصل، ثم
+يرسل CollectionSync العمليات المعلقة على دفعات (كل دفعة في معاملة واحدة
+عبر CollectionManager.apply_collection_batch) ويجلب لقطة مختصرة لزبائن
+المحصل للبحث دون اتصال.
+"""
+import logging
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from config.settings import COLLECTION_JOURNAL_CONFIG
+from database.connection import db
+from modules.collection import CollectionManager
+from utils.tracing import traced_class
+
+logger = logging.getLogger(__name__)
+
+# حالات العمليات في الدفتر
+PENDING = 'pending'
+SYNCED = 'synced'
+CONFLICT = 'conflict'
+
+SNAPSHOT_COLUMNS = (
+    'id', 'name', 'box_number', 'serial_number', 'sector_name', 'current_balance',
+    'visa_balance', 'withdrawal_amount', 'last_counter_reading'
+)
+
+
+class CollectionJournal:
+    """دفتر التحصيل المحلي - Thread-safe (اتصال SQLite لكل عملية)"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or COLLECTION_JOURNAL_CONFIG['journal_path']
+        self._lock = threading.Lock()
+        self._create_schema()
+
+    @contextmanager
+    def _connect(self):
+        with self._lock:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+
+    def _create_schema(self):
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS collections (
+                    uuid TEXT PRIMARY KEY,
+                    collector_id INTEGER NOT NULL,
+                    customer_id INTEGER NOT NULL,
+                    collected_amount REAL NOT NULL,
+                    notes TEXT,
+                    lat REAL,
+                    lon REAL,
+                    collected_at TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    error TEXT,
+                    server_log_id INTEGER,
+                    synced_at TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_collections_status
+                    ON collections(status, collected_at);
+
+                CREATE TABLE IF NOT EXISTS customers_snapshot (
+                    collector_id INTEGER NOT NULL,
+                    id INTEGER NOT NULL,
+                    name TEXT,
+                    box_number TEXT,
+                    serial_number TEXT,
+                    sector_name TEXT,
+                    current_balance REAL,
+                    visa_balance REAL,
+                    withdrawal_amount REAL,
+                    last_counter_reading REAL,
+                    snapshot_at TEXT NOT NULL,
+                    PRIMARY KEY (collector_id, id)
+                );
+            """)
+
+    # ------------------------------------------------------------------
+    # التسجيل المحلي
+    # ------------------------------------------------------------------
+    def record(self, collector_id: int, customer_id: int, collected_amount: float,
+               notes: str = '', lat: Optional[float] = None, lon: Optional[float] = None) -> Dict:
+        """تسجيل تحصيل في الدفتر المحلي فوراً (بدون أي اتصال بالخادم)"""
+        try:
+            amount = float(collected_amount)
+            if amount <= 0:
+                return {'success': False, 'error': 'المبلغ يجب أن يكون أكبر من صفر'}
+
+            entry_uuid = str(uuid.uuid4())
+            with self._connect() as conn:
+                conn.execute("""
+                    INSERT INTO collections
+                    (uuid, collector_id, customer_id, collected_amount, notes, lat, lon, collected_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, (entry_uuid, collector_id, customer_id, amount, notes, lat, lon,
+                      datetime.now().isoformat(sep=' ')))
+            return {'success': True, 'uuid': entry_uuid}
+        except Exception as e:
+            logger.error(f"خطأ في تسجيل التحصيل في الدفتر المحلي: {e}")
+            return {'success': False, 'error': str(e)}
+
+    def get_pending(self, limit: int = None) -> List[Dict]:
+        """العمليات غير المتزامنة بترتيب وقت التحصيل"""
+        query = "SELECT * FROM collections WHERE status = ? ORDER BY collected_at"
+        params = [PENDING]
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute(query, params)]
+
+    def pending_count(self) -> int:
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM collections WHERE status = ?", (PENDING,)
+            ).fetchone()[0]
+
+    def get_conflicts(self) -> List[Dict]:
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute(
+                "SELECT * FROM collections WHERE status = ? ORDER BY collected_at", (CONFLICT,)
+            )]
+
+    def mark_results(self, applied: Dict[str, int], duplicates: List[str],
+                     conflicts: Dict[str, str]):
+        """تحديث حالة العمليات بعد رد الخادم"""
+        now = datetime.now().isoformat(sep=' ')
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE collections SET status = ?, server_log_id = ?, synced_at = ?, error = NULL WHERE uuid = ?",
+                [(SYNCED, log_id, now, entry_uuid) for entry_uuid, log_id in applied.items()]
+                + [(SYNCED, None, now, entry_uuid) for entry_uuid in duplicates]
+            )
+            conn.executemany(
+                "UPDATE collections SET status = ?, error = ? WHERE uuid = ?",
+                [(CONFLICT, reason, entry_uuid) for entry_uuid, reason in conflicts.items()]
+            )
+
+    def purge_synced(self, older_than_days: int = None):
+        """حذف العمليات المتزامنة القديمة من الدفتر"""
+        days = older_than_days if older_than_days is not None else COLLECTION_JOURNAL_CONFIG['keep_synced_days']
+        cutoff = (datetime.now() - timedelta(days=days)).isoformat(sep=' ')
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM collections WHERE status = ? AND synced_at < ?", (SYNCED, cutoff)
+            )
+
+    # ------------------------------------------------------------------
+    # لقطة الزبائن للبحث دون اتصال
+    # ------------------------------------------------------------------
+    def save_snapshot(self, collector_id: int, customers: List[Dict]):
+        """استبدال لقطة زبائن المحصل"""
+        now = datetime.now().isoformat(sep=' ')
+        rows = [
+            (collector_id,) + tuple(
+                float(c[col]) if col in ('current_balance', 'visa_balance',
+                                         'withdrawal_amount', 'last_counter_reading') and c.get(col) is not None
+                else c.get(col)
+                for col in SNAPSHOT_COLUMNS
+            ) + (now,)
+            for c in customers
+        ]
+        with self._connect() as conn:
+            conn.execute("DELETE FROM customers_snapshot WHERE collector_id = ?", (collector_id,))
+            conn.executemany(f"""
+                INSERT INTO customers_snapshot (collector_id, {', '.join(SNAPSHOT_COLUMNS)}, snapshot_at)
+                VALUES ({', '.join('?' * (len(SNAPSHOT_COLUMNS) + 2))})
+            """, rows)
+
+    def get_customers(self, collector_id: int) -> List[Dict]:
+        """زبائن المحصل من اللقطة مع إضافة التحصيلات المعلقة إلى الرصيد"""
+        with self._connect() as conn:
+            rows = conn.execute("""
+                SELECT s.id, s.name, s.box_number, s.serial_number, s.sector_name,
+                       s.visa_balance, s.withdrawal_amount, s.last_counter_reading, s.snapshot_at,
+                       COALESCE(s.current_balance, 0) + COALESCE(p.pending_amount, 0) AS current_balance,
+                       COALESCE(p.pending_amount, 0) AS pending_amount
+                FROM customers_snapshot s
+                LEFT JOIN (
+                    SELECT customer_id, SUM(collected_amount) AS pending_amount
+                    FROM collections
+                    WHERE status = 'pending'
+                    GROUP BY customer_id
+                ) p ON p.customer_id = s.id
+                WHERE s.collector_id = ?
+                ORDER BY s.name
+            """, (collector_id,))
+            return [dict(row) for row in rows]
+
+
+@traced_class
+class CollectionSync:
+    """مزامنة دفتر التحصيل المحلي مع قاعدة البيانات المركزية"""
+
+    def __init__(self, journal: CollectionJournal = None, batch_size: int = None):
+        self.journal = journal or CollectionJournal()
+        self.batch_size = batch_size or COLLECTION_JOURNAL_CONFIG['sync_batch_size']
+        self.collection_manager = CollectionManager()
+        self._sync_lock = threading.Lock()
+
+    def push(self) -> Dict:
+        """إرسال كل العمليات المعلقة على دفعات (كل دفعة في معاملة واحدة)"""
+        report = {'success': True, 'applied': 0, 'duplicates': 0, 'conflicts': {}, 'batches': 0}
+        while True:
+            batch = self.journal.get_pending(self.batch_size)
+            if not batch:
+                break
+
+            result = self.collection_manager.apply_collection_batch(batch)
+            if not result['success']:
+                report.update(success=False, error=result.get('error'))
+                break
+
+            self.journal.mark_results(result['applied'], result['duplicates'], result['conflicts'])
+            report['batches'] += 1
+            report['applied'] += len(result['applied'])
+            report['duplicates'] += len(result['duplicates'])
+            report['conflicts'].update(result['conflicts'])
+
+            if len(batch) < self.batch_size:
+                break
+        return report
+
+    def pull_snapshot(self, collector_id: int) -> Dict:
+        """جلب لقطة مختصرة لزبائن المحصل وحفظها محلياً"""
+        try:
+            with db.get_cursor() as cursor:
+                cursor.execute("""
+                    SELECT c.id, c.name, c.box_number, c.serial_number, s.name as sector_name,
+                           c.current_balance, c.visa_balance, c.withdrawal_amount, c.last_counter_reading
+                    FROM customers c
+                    LEFT JOIN sectors s ON c.sector_id = s.id
+                    WHERE c.assigned_collector_id = %s AND c.is_active = TRUE
+                    ORDER BY c.name
+                """, (collector_id,))
+                customers = [dict(row) for row in cursor.fetchall()]
+            self.journal.save_snapshot(collector_id, customers)
+            return {'success': True, 'count': len(customers)}
+        except Exception as e:
+            logger.warning(f"تعذر جلب لقطة زبائن المحصل {collector_id}: {e}")
+            return {'success': False, 'error': str(e)}
+
+    def sync(self, collector_id: int = None) -> Dict:
+        """دورة مزامنة كاملة: إرسال المعلق ثم تحديث اللقطة"""
+        with self._sync_lock:
+            report = self.push()
+            if report['success'] and collector_id:
+                snapshot = self.pull_snapshot(collector_id)
+                report['snapshot'] = snapshot
+            if report['success']:
+                self.journal.purge_synced()
+            report['pending'] = self.journal.pending_count()
+            if report['conflicts']:
+                logger.warning(f"عمليات تحصيل متعارضة أثناء المزامنة: {report['conflicts']}")
+            return report
@@ -5,11 +5,14 @@ modules/collection_monitor.py
 
 from datetime import datetime, date, timedelta
 from typing import Optional, Dict, Any, List
-from database.connection import db
+from database.connection import db, read_only_class
 import logging
+from utils.tracing import traced_class
 
 logger = logging.getLogger(__name__)
 
+@traced_class
+@read_only_class
 class CollectionMonitor:
     """
     محلل متابعة الدفعات وتصنيف المتأخرين حسب الأسابيع مع تحليل السحب.
@@ -0,0 +1,120 @@
+# modules/customer_cache.py
+"""
+ذاكرة LRU لسجلات الزبائن المفتوحة على شاشة الجباية.
+
+- السجل: c.* (ومنه مؤشر آخر فاتورة last_invoice_id/last_invoice_number المحدث عند
+  إدراج الفواتير) مع اسم القطاع وبيانات العداد الأب؛ يُحمّل باستعلام واحد بالمفتاح.
+- الإبطال بمعرف الزبون: صراحةً من المدراء بعد الكتابة، ولكل كتابة من أي محطة عبر
+  قناة التغييرات (customers بالمعرف، invoices بمعرف الزبون). تعديل عداد يبطل أيضاً
+  سجلات أبنائه المخزنة لأنها تحمل اسمه.
+- الإبطال داخل وحدة عمل يُنفذ بعد انتهائها (db.after_transaction)، فلا يعيد قارئ
+  متزامن تعبئة السجل من بيانات ما قبل الالتزام.
+- أثناء انقطاع القناة تُطبق مدة صلاحية قصيرة (ttl_seconds).
+- التحميل دائماً من الخادم الأساسي، وما يُقرأ داخل وحدة عمل على نسخة القراءة لا يُخزن.
+- السجلات المرجعة نسخ.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+from config.settings import CUSTOMER_CACHE_CONFIG
+from database.change_feed import change_feed, RESET
+from database.connection import db
+
+logger = logging.getLogger(__name__)
+
+
+class CustomerCache:
+    """ذاكرة LRU لسجلات الزبائن - Thread-safe"""
+
+    QUERY = """
+        SELECT
+            c.*,
+            s.name as sector_name,
+            s.code as sector_code,
+            p.name as parent_name,
+            p.box_number as parent_box_number,
+            p.meter_type as parent_meter_type,
+            p.serial_number as parent_serial_number
+        FROM customers c
+        LEFT JOIN sectors s ON c.sector_id = s.id
+        LEFT JOIN customers p ON c.parent_meter_id = p.id
+        WHERE c.id = %s
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        self.max_entries = int(max_entries or CUSTOMER_CACHE_CONFIG.get('max_entries', 1000))
+        self.ttl = ttl_seconds if ttl_seconds is not None else CUSTOMER_CACHE_CONFIG.get('ttl_seconds', 30)
+        self._entries: 'OrderedDict[int, tuple]' = OrderedDict()   # id -> (loaded_at, record)
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        change_feed.subscribe(('customers', 'invoices', 'sectors'), self._on_changes)
+
+    # ------------------------------------------------------------------
+    # القراءة
+    # ------------------------------------------------------------------
+    def get(self, customer_id: int) -> Optional[Dict[str, Any]]:
+        """سجل الزبون (نسخة) أو None إن لم يوجد"""
+        with self._lock:
+            entry = self._entries.get(customer_id)
+            if entry is not None and (change_feed.live or time.monotonic() - entry[0] < self.ttl):
+                self._entries.move_to_end(customer_id)
+                self.hits += 1
+                return dict(entry[1])
+            generation = self._generation
+            self.misses += 1
+
+        # التحميل من الخادم الأساسي؛ داخل وحدة عمل على نسخة القراءة لا نخزن النتيجة
+        with db.lane(None), db.get_cursor() as cursor:
+            cursor.execute(self.QUERY, (customer_id,))
+            row = cursor.fetchone()
+            cacheable = not db.on_replica()
+        if not row:
+            return None
+        record = dict(row)
+
+        with self._lock:
+            # إبطال وصل أثناء التحميل: لا نخزن نتيجة قد تكون قديمة
+            if cacheable and generation == self._generation:
+                self._entries[customer_id] = (time.monotonic(), record)
+                self._entries.move_to_end(customer_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return dict(record)
+
+    # ------------------------------------------------------------------
+    # الإبطال
+    # ------------------------------------------------------------------
+    def invalidate(self, customer_ids: Optional[Iterable[int]] = None):
+        """إبطال زبائن محددين (مع أبنائهم المخزنين) أو الذاكرة كلها - بعد انتهاء وحدة العمل الجارية"""
+        ids = None if customer_ids is None else {int(i) for i in customer_ids if i is not None}
+        db.after_transaction(lambda: self._invalidate(ids))
+
+    def _invalidate(self, ids: Optional[set]):
+        with self._lock:
+            self._generation += 1
+            if ids is None:
+                self._entries.clear()
+                return
+            for cid, (_, record) in list(self._entries.items()):
+                if cid in ids or record.get('parent_meter_id') in ids:
+                    del self._entries[cid]
+
+    def _on_changes(self, table, changes):
+        if table == 'sectors' or any(c['op'] == RESET for c in changes):
+            self.invalidate()
+        elif table == 'customers':
+            self.invalidate(c['id'] for c in changes)
+        else:
+            # invoices: المفتاح معرف الزبون
+            self.invalidate(c['key'] for c in changes)
+
+    def stats(self) -> Dict[str, int]:
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+customer_cache = CustomerCache()
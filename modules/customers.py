@@ -1,10 +1,15 @@
 # modules/customers.py
 from database.connection import db
+from database.reference_data import reference_data
+from modules.customer_cache import customer_cache
+from psycopg2.extras import execute_values
 import logging
 from typing import List, Dict, Optional
+from utils.tracing import traced_class
 
 logger = logging.getLogger(__name__)
 
+@traced_class
 class CustomerManager:
     def get_cut_lists_by_box(self, min_balance: float = 0, max_balance: float = -1000, exclude_categories: list = None) -> dict:
         """
@@ -196,6 +201,10 @@ class CustomerManager:
                 
                 # تسجيل العملية في السجل التاريخي
                 if result:
+                    # المسار الهرمي المخزن للعداد الجديد
+                    from database.models import models
+                    models.refresh_meter_paths(cursor, [result['id']])
+
                     # إعداد قيم اللقطة
                     snapshot_withdrawal = customer_data.get('withdrawal_amount', 0)
                     snapshot_visa = customer_data.get('visa_balance', 0)
@@ -287,53 +296,37 @@ class CustomerManager:
     def get_customer(self, customer_id: int) -> Optional[Dict]:
         """الحصول على بيانات زبون مع العلاقات الهرمية"""
         try:
-            with db.get_cursor() as cursor:
-                cursor.execute("""
-                    SELECT 
-                        c.*,
-                        s.name as sector_name,
-                        s.code as sector_code,
-                        p.name as parent_name,
-                        p.box_number as parent_box_number,
-                        p.meter_type as parent_meter_type,
-                        p.serial_number as parent_serial_number
-                    FROM customers c
-                    LEFT JOIN sectors s ON c.sector_id = s.id
-                    LEFT JOIN customers p ON c.parent_meter_id = p.id
-                    WHERE c.id = %s
-                """, (customer_id,))
+            # السجل الأساسي من ذاكرة الزبائن، والأبناء يُجلبون دائماً من القاعدة
+            customer_dict = customer_cache.get(customer_id)
+            if not customer_dict:
+                return None
 
-                customer = cursor.fetchone()
-                if not customer:
-                    return None
+            # --- بناء parent_display بنفس منطق بقية الدوال ---
+            parent_meter = customer_dict.get('parent_name', '') or ''
+            parent_box = customer_dict.get('parent_box_number', '') or ''
+            parent_type = customer_dict.get('parent_meter_type', '') or ''
 
-                customer_dict = dict(customer)
-
-                # --- بناء parent_display بنفس منطق بقية الدوال ---
-                parent_meter = customer_dict.get('parent_name', '') or ''
-                parent_box = customer_dict.get('parent_box_number', '') or ''
-                parent_type = customer_dict.get('parent_meter_type', '') or ''
-
-                if parent_box and parent_type and parent_meter:
-                    parent_display = f"{parent_box} ({parent_type}) - {parent_meter}"
-                elif parent_box and parent_meter:
-                    parent_display = f"{parent_box} - {parent_meter}"
-                elif parent_meter and parent_type:
-                    parent_display = f"{parent_meter} ({parent_type})"
-                elif parent_meter:
-                    parent_display = parent_meter
-                elif parent_box and parent_type:
-                    parent_display = f"{parent_box} ({parent_type})"
-                elif parent_box:
-                    parent_display = parent_box
-                else:
-                    parent_display = ''
+            if parent_box and parent_type and parent_meter:
+                parent_display = f"{parent_box} ({parent_type}) - {parent_meter}"
+            elif parent_box and parent_meter:
+                parent_display = f"{parent_box} - {parent_meter}"
+            elif parent_meter and parent_type:
+                parent_display = f"{parent_meter} ({parent_type})"
+            elif parent_meter:
+                parent_display = parent_meter
+            elif parent_box and parent_type:
+                parent_display = f"{parent_box} ({parent_type})"
+            elif parent_box:
+                parent_display = parent_box
+            else:
+                parent_display = ''
 
-                customer_dict['parent_display'] = parent_display
-                # --- نهاية بناء parent_display ---
+            customer_dict['parent_display'] = parent_display
+            # --- نهاية بناء parent_display ---
 
-                # جلب الأبناء إذا كان هناك أبناء
-                if customer_dict.get('meter_type') in ['مولدة', 'علبة توزيع', 'رئيسية']:
+            # جلب الأبناء إذا كان هناك أبناء
+            if customer_dict.get('meter_type') in ['مولدة', 'علبة توزيع', 'رئيسية']:
+                with db.get_cursor() as cursor:
                     cursor.execute("""
                         SELECT id, name, box_number, meter_type, current_balance, serial_number
                         FROM customers 
@@ -345,7 +338,7 @@ class CustomerManager:
                     customer_dict['children'] = [dict(child) for child in children]
                     customer_dict['children_count'] = len(children)
 
-                return customer_dict
+            return customer_dict
 
         except Exception as e:
             logger.error(f"خطأ في جلب بيانات الزبون: {e}")
@@ -537,6 +530,12 @@ class CustomerManager:
                 if not updated_customer:
                     return {'success': False, 'error': 'فشل تحديث الزبون'}
                 
+                # تغيير الأب أو الاسم يغير المسار المخزن للعداد وكل ما تحته
+                if (updated_customer['parent_meter_id'] != old_data['parent_meter_id']
+                        or updated_customer['name'] != old_data['name']):
+                    from database.models import models
+                    models.refresh_meter_paths(cursor, [customer_id])
+                
                 # === جلب الرصيد بعد التحديث ===
                 cursor.execute("SELECT current_balance FROM customers WHERE id = %s", (customer_id,))
                 current_balance_after = float(cursor.fetchone()['current_balance'] or 0)
@@ -608,6 +607,7 @@ class CustomerManager:
                         elif parent_box:
                             parent_display = parent_box
                 
+                customer_cache.invalidate([customer_id])
                 logger.info(f"تم تحديث الزبون: {updated_customer['name']} - نوع: {updated_customer.get('meter_type')}")
                 return {
                     'success': True,
@@ -868,6 +868,7 @@ class CustomerManager:
                         snapshot_reading
                     ))
                     
+                    customer_cache.invalidate([customer_id])
                     logger.info(f"تم حذف الزبون: {customer_name} - نوع: {meter_type}")
                     return {
                         'success': True,
@@ -1064,6 +1065,7 @@ class CustomerManager:
                 cursor.execute("DELETE FROM customers RETURNING id, name, meter_type")
                 deleted_customers = cursor.fetchall()
                 
+                customer_cache.invalidate()
                 logger.info(f"تم حذف {len(deleted_customers)} زبون")
                 
                 return {
@@ -1085,8 +1087,7 @@ class CustomerManager:
         try:
             with db.get_cursor() as cursor:
                 # الحصول على اسم القطاع
-                cursor.execute("SELECT name FROM sectors WHERE id = %s", (sector_id,))
-                sector = cursor.fetchone()
+                sector = reference_data.sector(sector_id)
                 
                 if not sector:
                     return {'success': False, 'error': 'القطاع غير موجود'}
@@ -1141,6 +1142,7 @@ class CustomerManager:
                 
                 deleted_customers = cursor.fetchall()
                 
+                customer_cache.invalidate()
                 logger.info(f"تم حذف {len(deleted_customers)} زبون من قطاع {sector['name']}")
                 
                 return {
@@ -1303,6 +1305,7 @@ class CustomerManager:
                     f"تحديث التصنيف المالي للزبون {customer_id}: {old_category} -> {new_category}"
                 ))
                 
+                customer_cache.invalidate([customer_id])
                 logger.info(f"تم تحديث التصنيف المالي للزبون {customer_id} إلى {new_category}")
                 return {
                     'success': True,
@@ -1371,6 +1374,7 @@ class CustomerManager:
                     1  # النظام
                 ))
                 
+                customer_cache.invalidate([customer_id])
                 return {
                     'success': True,
                     'free_remaining': new_remaining,
@@ -1531,81 +1535,44 @@ class CustomerManager:
         """
         try:
             with db.get_cursor() as cursor:
-                # استعلام عودي لبناء الشجرة والمسار
+                # الشجرة من المسار الهرمي المخزن (meter_path / meter_path_names):
+                # كل عقد المسار نشطة، والجذر بلا أب ومن القطاع المطلوب
                 query = """
-                    WITH RECURSIVE customer_tree AS (
-                        -- 1. العقد الجذرية (بدون أب)
-                        SELECT 
-                            c.id,
-                            c.name,
-                            c.meter_type,
-                            c.financial_category,
-                            c.visa_balance,
-                            c.current_balance,
-                            c.withdrawal_amount,
-                            c.box_number,
-                            c.serial_number,
-                            c.phone_number,
-                            c.parent_meter_id,
-                            c.sector_id,
-                            c.is_active,
-                            s.name as sector_name,
-                            0 AS level,
-                            ARRAY[c.name]::VARCHAR[] AS path_names,
-                            ARRAY[c.meter_type]::VARCHAR[] AS path_types
-                        FROM customers c
-                        LEFT JOIN sectors s ON c.sector_id = s.id
-                        WHERE c.parent_meter_id IS NULL
-                        AND c.is_active = TRUE
-                        AND (c.sector_id = %s OR %s IS NULL)
-                        
-                        UNION ALL
-                        
-                        -- 2. الأبناء
-                        SELECT 
-                            c.id,
-                            c.name,
-                            c.meter_type,
-                            c.financial_category,
-                            c.visa_balance,
-                            c.current_balance,
-                            c.withdrawal_amount,
-                            c.box_number,
-                            c.serial_number,
-                            c.phone_number,
-                            c.parent_meter_id,
-                            c.sector_id,
-                            c.is_active,
-                            s.name as sector_name,
-                            ct.level + 1,
-                            ct.path_names || c.name,
-                            ct.path_types || c.meter_type
-                        FROM customers c
-                        INNER JOIN customer_tree ct ON c.parent_meter_id = ct.id
-                        LEFT JOIN sectors s ON c.sector_id = s.id
-                        WHERE c.is_active = TRUE
-                    )
                     SELECT 
-                        id,
-                        name,
-                        meter_type,
-                        financial_category,
-                        visa_balance,
-                        current_balance,
-                        withdrawal_amount,
-                        box_number,
-                        serial_number,
-                        phone_number,
-                        parent_meter_id,
-                        sector_id,
-                        sector_name,
-                        is_active,
-                        level,
-                        path_names,
-                        path_types,
-                        array_to_string(path_names, ' ← ') as path_display
-                    FROM customer_tree
-                    ORDER BY path_names  -- ترتيب عمق أول (نفس ترتيب Excel)
+                        c.id,
+                        c.name,
+                        c.meter_type,
+                        c.financial_category,
+                        c.visa_balance,
+                        c.current_balance,
+                        c.withdrawal_amount,
+                        c.box_number,
+                        c.serial_number,
+                        c.phone_number,
+                        c.parent_meter_id,
+                        c.sector_id,
+                        s.name as sector_name,
+                        c.is_active,
+                        array_length(c.meter_path, 1) - 1 AS level,
+                        c.meter_path_names AS path_names,
+                        ARRAY(
+                            SELECT a.meter_type
+                            FROM unnest(c.meter_path) WITH ORDINALITY u(id, ord)
+                            JOIN customers a ON a.id = u.id
+                            ORDER BY u.ord
+                        )::VARCHAR[] AS path_types,
+                        array_to_string(c.meter_path_names, ' ← ') as path_display
+                    FROM customers c
+                    JOIN customers r ON r.id = c.meter_path[1]
+                    LEFT JOIN sectors s ON c.sector_id = s.id
+                    WHERE c.is_active = TRUE
+                    AND r.parent_meter_id IS NULL
+                    AND (r.sector_id = %s OR %s IS NULL)
+                    AND NOT EXISTS (
+                        SELECT 1 FROM customers a
+                        WHERE a.id = ANY(c.meter_path) AND a.is_active IS NOT TRUE
+                    )
+                    ORDER BY c.meter_path_names  -- ترتيب عمق أول (نفس ترتيب Excel)
                 """
                 cursor.execute(query, (sector_id, sector_id))
                 rows = cursor.fetchall()
@@ -1615,6 +1582,43 @@ class CustomerManager:
             return []
 
 
+    def get_meter_subtree(self, customer_id: int, include_self: bool = True) -> List[Dict]:
+        """كل العدادات تحت عداد معين بترتيب عمق أول (فحص مفهرس على meter_path)"""
+        try:
+            with db.get_cursor() as cursor:
+                cursor.execute("""
+                    SELECT c.id, c.name, c.meter_type, c.parent_meter_id, c.sector_id,
+                           c.withdrawal_amount, c.visa_balance, c.current_balance, c.is_active,
+                           array_length(c.meter_path, 1) - 1 AS level,
+                           c.meter_path, c.meter_path_names
+                    FROM customers c
+                    WHERE c.meter_path @> ARRAY[%s]::INTEGER[]
+                    AND (%s OR c.id <> %s)
+                    ORDER BY c.meter_path
+                """, (customer_id, include_self, customer_id))
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"خطأ في جلب فروع العداد {customer_id}: {e}")
+            return []
+
+    def get_meter_ancestors(self, customer_id: int) -> List[Dict]:
+        """أسلاف عداد من الجذر حتى الأب المباشر"""
+        try:
+            with db.get_cursor() as cursor:
+                cursor.execute("""
+                    SELECT a.id, a.name, a.meter_type, a.sector_id, u.ord - 1 AS level
+                    FROM customers c
+                    CROSS JOIN LATERAL unnest(c.meter_path) WITH ORDINALITY u(id, ord)
+                    JOIN customers a ON a.id = u.id
+                    WHERE c.id = %s AND a.id <> c.id
+                    ORDER BY u.ord
+                """, (customer_id,))
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"خطأ في جلب أسلاف العداد {customer_id}: {e}")
+            return []
+
+
     def get_customer_balance_by_sector(self) -> Dict:
         """
         حساب لنا وعلينا لكل قطاع بدقة عالية:
@@ -1858,96 +1862,185 @@ class CustomerManager:
                 if not parent:
                     return {'success': False, 'error': 'الوالد غير موجود'}
                 
-                # تحديد أنواع الأبناء المسموح بها (للتحقق)
-                allowed_child_types = []
-                if parent['meter_type'] == 'مولدة':
-                    allowed_child_types = ['علبة توزيع', 'رئيسية', 'زبون']
-                elif parent['meter_type'] == 'علبة توزيع':
-                    allowed_child_types = ['رئيسية', 'زبون']
-                elif parent['meter_type'] == 'رئيسية':
-                    allowed_child_types = ['زبون']
-                else:
-                    return {'success': False, 'error': 'هذا النوع لا يمكن أن يكون أباً'}
-                
-                # 1. تحديث الأبناء المحددين (جدد أو قدامى)
+                # الأبناء المطلوبون: موجودون ونشطون ومن نفس القطاع
+                valid_ids = []
                 if child_ids:
-                    # التحقق من أن جميع child_ids موجودة ومن نفس القطاع ومن الأنواع المسموحة
                     cursor.execute("""
-                        SELECT id, meter_type FROM customers 
+                        SELECT id FROM customers 
                         WHERE id = ANY(%s) AND sector_id = %s AND is_active = TRUE
                     """, (child_ids, parent['sector_id']))
-                    valid_children = cursor.fetchall()
-                    valid_ids = [c['id'] for c in valid_children]
-                    
-                    # التحقق من الأنواع
-                    for child in valid_children:
-                        if child['meter_type'] not in allowed_child_types:
-                            return {
-                                'success': False,
-                                'error': f'الزبون {child["id"]} من نوع {child["meter_type"]} غير مسموح به لهذا الوالد'
-                            }
-                    
-                    # تعيين parent_meter_id للقائمة
-                    cursor.execute("""
-                        UPDATE customers 
-                        SET parent_meter_id = %s, updated_at = CURRENT_TIMESTAMP
-                        WHERE id = ANY(%s)
-                    """, (parent_id, valid_ids))
-                    
-                    # تسجيل العملية لكل ابن
-                    for child_id in valid_ids:
-                        cursor.execute("""
-                            INSERT INTO customer_history 
-                            (customer_id, action_type, transaction_type, 
-                            details, notes, created_by, created_at)
-                            VALUES (%s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
-                        """, (
-                            child_id,
-                            'child_update',
-                            'parent_change',
-                            f'تم تعيين العداد {parent_id} كوالد',
-                            f'تحديد كابن للوالد {parent_id}',
-                            user_id
-                        ))
+                    valid_ids = [c['id'] for c in cursor.fetchall()]
                 
-                # 2. إزالة الأبناء السابقين الذين لم يعدوا في القائمة
+                # الأبناء الحاليون الذين لم يعودوا في القائمة
                 cursor.execute("""
-                    UPDATE customers 
-                    SET parent_meter_id = NULL, updated_at = CURRENT_TIMESTAMP
+                    SELECT id FROM customers
                     WHERE parent_meter_id = %s AND id != ALL(%s)
-                """, (parent_id, child_ids if child_ids else [-1]))
+                """, (parent_id, valid_ids or [-1]))
+                detached_ids = [c['id'] for c in cursor.fetchall()]
                 
-                # تسجيل العملية للأبناء الذين تمت إزالتهم
-                cursor.execute("""
-                    SELECT id FROM customers 
-                    WHERE parent_meter_id IS NULL AND updated_at = CURRENT_TIMESTAMP
-                """)
-                removed = cursor.fetchall()
-                for child in removed:
-                    cursor.execute("""
-                        INSERT INTO customer_history 
-                        (customer_id, action_type, transaction_type, 
-                        details, notes, created_by, created_at)
-                        VALUES (%s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
-                    """, (
-                        child['id'],
-                        'child_update',
-                        'parent_removed',
-                        f'تم إزالة العلاقة مع الوالد {parent_id}',
-                        'إزالة من الأبناء',
-                        user_id
-                    ))
+                moves = {child_id: parent_id for child_id in valid_ids}
+                moves.update({child_id: None for child_id in detached_ids})
                 
-                logger.info(f"تم تحديث أبناء الوالد {parent_id}: {len(child_ids)} ابن جديد، {len(removed)} تمت إزالتهم")
+                # نفس المعاملة: move_meters يشارك الاتصال عبر وحدة العمل
+                result = self.move_meters(moves, user_id)
+                if not result['success']:
+                    return result
+                
+                added = sum(1 for m in result['moved'] if m['new_parent_id'] == parent_id)
+                removed = sum(1 for m in result['moved'] if m['new_parent_id'] is None)
+                logger.info(f"تم تحديث أبناء الوالد {parent_id}: {len(valid_ids)} ابن، {added} منقول إليه، {removed} تمت إزالتهم")
                 return {
                     'success': True,
-                    'message': f"تم تحديث الأبناء بنجاح: {len(child_ids)} ابن تمت إضافتهم/تأكيدهم، {len(removed)} تمت إزالتهم"
+                    'moved': result['moved'],
+                    'unchanged': result['unchanged'],
+                    'message': f"تم تحديث الأبناء بنجاح: {len(valid_ids)} ابن تمت إضافتهم/تأكيدهم، {removed} تمت إزالتهم"
                 }
                 
         except Exception as e:
             logger.error(f"خطأ في تحديث الأبناء: {e}")
             return {'success': False, 'error': str(e)}
 
+    def move_meters(self, moves: Dict[int, Optional[int]], user_id: int) -> Dict:
+        """
+        نقل مجموعة عدادات بين الآباء في معاملة واحدة.
+        moves: {معرف العداد: معرف الأب الجديد أو None للفصل}
+        - التحقق من الأنواع لكل نقل ومن عدم إنشاء حلقة (استعلام عودي واحد يشمل كل التغييرات معاً)
+        - تحديث parent_meter_id بعبارة واحدة وتسجيل كل السجلات التاريخية بإدراج متعدد الصفوف
+        يعيد: moved [{id, name, old_parent_id, new_parent_id}] و unchanged [ids]
+        """
+        moves = {int(child): (int(parent) if parent is not None else None) for child, parent in moves.items()}
+        if not moves:
+            return {'success': True, 'moved': [], 'unchanged': [], 'message': 'لا توجد تغييرات'}
+
+        try:
+            with db.get_cursor() as cursor:
+                child_ids = list(moves.keys())
+                parent_ids = sorted({p for p in moves.values() if p is not None})
+
+                # قفل العدادات المعنية (الأبناء والآباء الجدد) بترتيب ثابت
+                cursor.execute("""
+                    SELECT id, name, meter_type, parent_meter_id, is_active
+                    FROM customers
+                    WHERE id = ANY(%s)
+                    ORDER BY id
+                    FOR UPDATE
+                """, (sorted(set(child_ids) | set(parent_ids)),))
+                meters = {row['id']: row for row in cursor.fetchall()}
+
+                # 1. التحقق من الوجود والأنواع
+                errors = []
+                for child_id, parent_id in moves.items():
+                    child = meters.get(child_id)
+                    if not child:
+                        errors.append(f'العداد {child_id} غير موجود')
+                        continue
+                    if parent_id is None:
+                        continue
+                    if parent_id == child_id:
+                        errors.append(f'لا يمكن جعل العداد {child["name"]} أباً لنفسه')
+                        continue
+                    parent = meters.get(parent_id)
+                    if not parent or not parent['is_active']:
+                        errors.append(f'الأب {parent_id} غير موجود أو غير نشط')
+                        continue
+                    if not self._validate_meter_hierarchy(parent['meter_type'], child['meter_type']):
+                        errors.append(
+                            f'الزبون {child_id} من نوع {child["meter_type"]} غير مسموح به تحت {parent["meter_type"]} ({parent["name"]})'
+                        )
+                if errors:
+                    return {'success': False, 'error': '\n'.join(errors), 'errors': errors}
+
+                # 2. التحقق من الحلقات على الشجرة بعد تطبيق كل النقلات معاً:
+                # الصعود من الأب الجديد لكل عداد، فإن وصلنا إلى العداد نفسه فهناك حلقة
+                cursor.execute("""
+                    WITH RECURSIVE m(id, parent) AS (
+                        SELECT * FROM unnest(%s::int[], %s::int[])
+                    ),
+                    walk AS (
+                        SELECT m.id AS start_id, m.parent AS node, ARRAY[m.id] AS seen
+                        FROM m
+                        WHERE m.parent IS NOT NULL
+                        UNION ALL
+                        SELECT w.start_id,
+                               CASE WHEN mm.id IS NOT NULL THEN mm.parent ELSE c.parent_meter_id END,
+                               w.seen || w.node
+                        FROM walk w
+                        JOIN customers c ON c.id = w.node
+                        LEFT JOIN m mm ON mm.id = w.node
+                        WHERE w.node <> w.start_id
+                          AND NOT w.node = ANY(w.seen)
+                    )
+                    SELECT DISTINCT start_id FROM walk WHERE node = start_id
+                """, (child_ids, [moves[c] for c in child_ids]))
+                cycles = [row['start_id'] for row in cursor.fetchall()]
+                if cycles:
+                    names = ', '.join(str(meters[c]['name']) for c in cycles)
+                    return {
+                        'success': False,
+                        'error': f'النقل ينشئ حلقة في الشجرة للعدادات: {names}',
+                        'cycles': cycles
+                    }
+
+                # 3. التطبيق
+                changed = [c for c in child_ids if meters[c]['parent_meter_id'] != moves[c]]
+                unchanged = [c for c in child_ids if c not in changed]
+                if not changed:
+                    return {'success': True, 'moved': [], 'unchanged': unchanged, 'message': 'لا توجد تغييرات'}
+
+                cursor.execute("""
+                    UPDATE customers c
+                    SET parent_meter_id = m.parent, updated_at = CURRENT_TIMESTAMP
+                    FROM unnest(%s::int[], %s::int[]) AS m(id, parent)
+                    WHERE c.id = m.id
+                """, (changed, [moves[c] for c in changed]))
+
+                from database.models import models
+                models.refresh_meter_paths(cursor, changed)
+
+                history = []
+                moved = []
+                for child_id in changed:
+                    old_parent, new_parent = meters[child_id]['parent_meter_id'], moves[child_id]
+                    moved.append({
+                        'id': child_id,
+                        'name': meters[child_id]['name'],
+                        'old_parent_id': old_parent,
+                        'new_parent_id': new_parent
+                    })
+                    if new_parent is not None:
+                        history.append((
+                            child_id, 'child_update', 'parent_change',
+                            f'تم تعيين العداد {new_parent} كوالد',
+                            f'تحديد كابن للوالد {new_parent}' + (f' (بدلاً من {old_parent})' if old_parent else ''),
+                            user_id
+                        ))
+                    else:
+                        history.append((
+                            child_id, 'child_update', 'parent_removed',
+                            f'تم إزالة العلاقة مع الوالد {old_parent}',
+                            'إزالة من الأبناء',
+                            user_id
+                        ))
+
+                execute_values(cursor, """
+                    INSERT INTO customer_history
+                    (customer_id, action_type, transaction_type, details, notes, created_by, created_at)
+                    VALUES %s
+                """, history, template='(%s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)', page_size=len(history))
+
+                customer_cache.invalidate([m['id'] for m in moved])
+                logger.info(f"تم نقل {len(moved)} عداد بين الآباء ({len(unchanged)} بدون تغيير)")
+                return {
+                    'success': True,
+                    'moved': moved,
+                    'unchanged': unchanged,
+                    'message': f'تم نقل {len(moved)} عداد'
+                }
+
+        except Exception as e:
+            logger.error(f"خطأ في نقل العدادات: {e}")
+            return {'success': False, 'error': str(e)}
+
     def assign_collector(self, customer_id: int, collector_id: int) -> Dict:
         """تعيين محصل جوال لزبون معين"""
         try:
@@ -1969,6 +2062,7 @@ class CustomerManager:
                 """, (collector_id, customer_id))
 
                 if cursor.fetchone():
+                    customer_cache.invalidate([customer_id])
                     logger.info(f"تم تعيين محصل {collector_id} للزبون {customer_id}")
                     return {'success': True, 'message': 'تم التعيين بنجاح'}
                 else:
@@ -5,9 +5,12 @@ from datetime import date, timedelta
 from typing import Dict, List, Optional
 from database.connection import db
 from database.models import models
+from database.reference_data import reference_data, EXPENSE_CATEGORIES
+from utils.tracing import traced_class
 
 logger = logging.getLogger(__name__)
 
+@traced_class
 class DailyCashManager:
 
     def __init__(self):
@@ -19,12 +22,16 @@ class DailyCashManager:
             ('office', 'مصاريف مكتب وإدارية'), ('repair', 'إصلاح'), ('expansion', 'توسعة'),
             ('energy', 'طاقة'), ('fuel', 'مازوت')
         ]
+        inserted = 0
         with db.get_cursor() as cursor:
             for code, name in categories:
                 cursor.execute("""
                     INSERT INTO expense_categories (name, arabic_name)
                     VALUES (%s, %s) ON CONFLICT (name) DO NOTHING
                 """, (code, name))
+                inserted += cursor.rowcount
+        if inserted:
+            reference_data.invalidate(EXPENSE_CATEGORIES)
 
     # ---------- دوال مساعدة ----------
     @staticmethod
@@ -118,7 +125,7 @@ class DailyCashManager:
                     VALUES (%s, %s, %s, %s, %s)
                 """, (daily_id, det['collector_id'], det['collector_name'], det['total'], det['collection_count']))
 
-        models.recalculate_daily_cash(cash_date)
+        models.recalculate_daily_cash_chain(cash_date)
 
         with db.get_cursor() as cursor:
             cursor.execute("SELECT id, closing_balance FROM daily_cash WHERE cash_date = %s", (cash_date,))
@@ -138,9 +145,8 @@ class DailyCashManager:
                 effective_user_id = 1  # احتياطي
 
         with db.get_cursor() as cursor:
-            cursor.execute("SELECT id FROM expense_categories WHERE name = %s", (category_name,))
-            cat = cursor.fetchone()
-            if not cat:
+            category_id = reference_data.expense_category_id(category_name)
+            if category_id is None:
                 return {'success': False, 'error': f'التصنيف {category_name} غير موجود'}
 
             cursor.execute("SELECT cash_date FROM daily_cash WHERE id = %s", (daily_cash_id,))
@@ -152,10 +158,10 @@ class DailyCashManager:
             cursor.execute("""
                 INSERT INTO daily_expenses (daily_cash_id, category_id, amount, note, user_id)
                 VALUES (%s, %s, %s, %s, %s) RETURNING id
-            """, (daily_cash_id, cat['id'], amount, note, effective_user_id))
+            """, (daily_cash_id, category_id, amount, note, effective_user_id))
             expense_id = cursor.fetchone()['id']
 
-        models.recalculate_daily_cash(cash_date)
+        models.recalculate_daily_cash_chain(cash_date)
         return {'success': True, 'expense_id': expense_id}
 
     # ---------- توزيع الأرباح ----------
@@ -179,7 +185,7 @@ class DailyCashManager:
             """, (daily_cash_id, owner_id, amount, profit_type, note, effective_user_id))
             profit_id = cursor.fetchone()['id']
 
-        models.recalculate_daily_cash(cash_date)
+        models.recalculate_daily_cash_chain(cash_date)
         return {'success': True, 'profit_id': profit_id}
 
     def add_energy_profit_distribution(self, daily_cash_id: int, meter_id: int, amount: float,
@@ -220,7 +226,7 @@ class DailyCashManager:
             return {'success': False, 'error': res['error']}
 
         # 3. إعادة حساب الصندوق اليومي (بعد تغيير الرصيد)
-        models.recalculate_daily_cash(cash_date)
+        models.recalculate_daily_cash_chain(cash_date)
         return {'success': True, 'profit_id': profit_id, 'meter_name': meter['name']}
 
     # ---------- ملخص المحاسبين ----------
@@ -400,7 +406,7 @@ class DailyCashManager:
                 WHERE id = %s
             """, (amount, note, user_id, expense_id))
         
-        models.recalculate_daily_cash(cash_date)
+        models.recalculate_daily_cash_chain(cash_date)
         return {'success': True}
 
     def delete_expense(self, expense_id: int, user_id: int) -> Dict:
@@ -419,7 +425,7 @@ class DailyCashManager:
 
             cursor.execute("DELETE FROM daily_expenses WHERE id = %s", (expense_id,))
 
-        models.recalculate_daily_cash(cash_date)
+        models.recalculate_daily_cash_chain(cash_date)
         return {'success': True}
 
     def update_profit(self, profit_id: int, amount: float, note: str, user_id: int) -> Dict:
@@ -439,7 +445,7 @@ class DailyCashManager:
                 SET amount = %s, note = %s, user_id = %s
                 WHERE id = %s
             """, (amount, note, user_id, profit_id))
-        models.recalculate_daily_cash(cash_date)
+        models.recalculate_daily_cash_chain(cash_date)
         return {'success': True}
 
     def update_energy_profit(self, profit_id: int, amount: float, note: str, user_id: int) -> Dict:
@@ -482,7 +488,7 @@ class DailyCashManager:
                 note=note or f"توزيع أرباح طاقة (معدل) - {cash_date}"
             )
 
-        models.recalculate_daily_cash(cash_date)
+        models.recalculate_daily_cash_chain(cash_date)
         return {'success': True}
 
     def delete_profit(self, profit_id: int, user_id: int) -> Dict:
@@ -501,7 +507,7 @@ class DailyCashManager:
 
             cursor.execute("DELETE FROM profit_distribution WHERE id = %s", (profit_id,))
 
-        models.recalculate_daily_cash(cash_date)
+        models.recalculate_daily_cash_chain(cash_date)
         return {'success': True}
 
     def delete_energy_profit(self, profit_id: int, user_id: int) -> Dict:
@@ -530,9 +536,14 @@ class DailyCashManager:
         from modules.fuel_management import FuelManagement
         FuelManagement.recalculate_meter_balance(meter_id)
 
-        models.recalculate_daily_cash(cash_date)
+        models.recalculate_daily_cash_chain(cash_date)
         return {'success': True}
 
+    def recalculate_from(self, from_date: date, dry_run: bool = False) -> Dict:
+        """إعادة حساب الصندوق من تاريخ معين وحتى آخر يوم (مع الجرد الأسبوعي).
+        dry_run=True يعيد قائمة الأيام والأسابيع التي ستتغير دون حفظ."""
+        return models.recalculate_daily_cash_chain(from_date, dry_run=dry_run)
+
     def get_daily_cash_report(self, cash_date: date) -> Dict:
         with db.get_cursor() as cursor:
             cursor.execute("""
@@ -588,56 +599,35 @@ class DailyCashManager:
     # ---------- الجرد الأسبوعي ----------
     def generate_weekly_inventory(self, start_date: date, end_date: date, user_id: int) -> Dict:
         with db.get_cursor() as cursor:
-            cursor.execute("SELECT opening_balance FROM daily_cash WHERE cash_date = %s", (start_date,))
-            first_day = cursor.fetchone()
-            total_opening = float(first_day['opening_balance']) if first_day else 0.0
-
-            cursor.execute("SELECT closing_balance FROM daily_cash WHERE cash_date = %s", (end_date,))
-            last_day = cursor.fetchone()
-            total_closing = float(last_day['closing_balance']) if last_day else 0.0
-
             cursor.execute("""
                 SELECT
+                    (SELECT opening_balance FROM daily_cash WHERE cash_date = %s) as first_opening,
+                    (SELECT closing_balance FROM daily_cash WHERE cash_date = %s) as last_closing,
                     COALESCE(SUM(total_collections), 0) as total_collections,
                     COALESCE(SUM(total_profits), 0) as total_profits,
                     COALESCE(SUM(total_energy_profits), 0) as total_energy_profits
                 FROM daily_cash
                 WHERE cash_date BETWEEN %s AND %s
-            """, (start_date, end_date))
+            """, (start_date, end_date, start_date, end_date))
             totals = cursor.fetchone()
+            total_opening = float(totals['first_opening']) if totals['first_opening'] is not None else 0.0
+            total_closing = float(totals['last_closing']) if totals['last_closing'] is not None else 0.0
 
+            # تصنيفات المصاريف الثلاثة في استعلام واحد
             cursor.execute("""
-                SELECT COALESCE(SUM(de.amount), 0) AS val
-                FROM daily_expenses de
-                JOIN daily_cash dc ON de.daily_cash_id = dc.id
-                JOIN expense_categories ec ON de.category_id = ec.id
-                WHERE dc.cash_date BETWEEN %s AND %s
-                AND ec.name NOT IN ('repair', 'expansion', 'fuel')
-            """, (start_date, end_date))
-            row = cursor.fetchone()
-            total_expenses_general = float(row['val']) if row else 0.0
-
-            cursor.execute("""
-                SELECT COALESCE(SUM(de.amount), 0) AS val
-                FROM daily_expenses de
-                JOIN daily_cash dc ON de.daily_cash_id = dc.id
-                JOIN expense_categories ec ON de.category_id = ec.id
-                WHERE dc.cash_date BETWEEN %s AND %s
-                AND ec.name IN ('repair', 'expansion')
-            """, (start_date, end_date))
-            row = cursor.fetchone()
-            total_repair_expansion = float(row['val']) if row else 0.0
-
-            cursor.execute("""
-                SELECT COALESCE(SUM(de.amount), 0) AS val
+                SELECT
+                    COALESCE(SUM(de.amount) FILTER (WHERE ec.name NOT IN ('repair', 'expansion', 'fuel')), 0) AS general,
+                    COALESCE(SUM(de.amount) FILTER (WHERE ec.name IN ('repair', 'expansion')), 0) AS repair_expansion,
+                    COALESCE(SUM(de.amount) FILTER (WHERE ec.name = 'fuel'), 0) AS fuel
                 FROM daily_expenses de
                 JOIN daily_cash dc ON de.daily_cash_id = dc.id
                 JOIN expense_categories ec ON de.category_id = ec.id
                 WHERE dc.cash_date BETWEEN %s AND %s
-                AND ec.name = 'fuel'
             """, (start_date, end_date))
             row = cursor.fetchone()
-            total_fuel = float(row['val']) if row else 0.0
+            total_expenses_general = float(row['general']) if row else 0.0
+            total_repair_expansion = float(row['repair_expansion']) if row else 0.0
+            total_fuel = float(row['fuel']) if row else 0.0
 
             cursor.execute("""
                 INSERT INTO weekly_cash_inventory (
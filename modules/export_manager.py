@@ -7,7 +7,8 @@ from datetime import datetime
 from typing import Dict, Any, Callable, List, Optional, Union
 
 import pandas as pd
-from database.connection import db
+from database.connection import db, read_only_class
+from utils.tracing import traced_class
 
 logger = logging.getLogger(__name__)
 
@@ -60,6 +61,8 @@ def safe_str(value: Any) -> str:
     return str(value).strip()
 
 
+@traced_class
+@read_only_class
 class ExportManager:
     """
     مدير التصدير المتقدم.
@@ -5,12 +5,85 @@
 """
 import logging
 from datetime import datetime
-from database.connection import db
+from database.connection import db, read_only
 import pandas as pd
 from typing import List, Dict, Any
+from utils.tracing import traced_class
+from database.prepared import statements
+from modules.accounting import SET_LAST_INVOICE, INSERT_INVOICE_HISTORY
+from modules.customer_cache import customer_cache
 
 logger = logging.getLogger(__name__)
 
+# عبارات مجهزة (database/prepared.py)
+_SEARCH_SQL = """
+    SELECT
+        c.id, c.name, c.box_number, c.serial_number,
+        c.current_balance, c.last_counter_reading,
+        c.visa_balance, c.withdrawal_amount,
+        s.name as sector_name,
+        CONCAT(c.box_number, ' - ', c.name) as display_text
+    FROM customers c
+    LEFT JOIN sectors s ON c.sector_id = s.id
+    WHERE c.is_active = TRUE
+"""
+
+
+def _search_statement(has_term: bool, has_sector: bool) -> str:
+    """عبارة بحث لكل تركيبة من الشروط (بدلاً من عبارة عامة بشروط OR تفسد الخطة)"""
+    sql, n = _SEARCH_SQL, 0
+    if has_term:
+        n += 1
+        # بحث في الاسم أو العلبة أو المسلسل
+        sql += f" AND (c.name ILIKE ${n} OR c.box_number ILIKE ${n} OR c.serial_number ILIKE ${n})"
+    if has_sector:
+        n += 1
+        sql += f" AND c.sector_id = ${n}"
+    sql += f" ORDER BY c.name LIMIT ${n + 1}"
+    return statements.register(f"fast_search_{int(has_term)}{int(has_sector)}", sql)
+
+
+SEARCH_STATEMENTS = {(t, s): _search_statement(t, s) for t in (False, True) for s in (False, True)}
+
+CUSTOMER_FOR_INVOICE = statements.register('fast_customer_for_invoice', """
+    SELECT
+        c.current_balance,
+        c.last_counter_reading,
+        c.sector_id,
+        c.visa_balance,
+        c.name,
+        s.name as sector_name
+    FROM customers c
+    INNER JOIN sectors s ON c.sector_id = s.id
+    WHERE c.id = $1 AND c.is_active = TRUE
+    FOR UPDATE
+""")
+
+UPDATE_CUSTOMER_READING = statements.register('fast_update_customer_reading', """
+    UPDATE customers
+    SET current_balance = $1,
+        last_counter_reading = $2,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = $3
+""")
+
+INSERT_INVOICE = statements.register('fast_insert_invoice', """
+    INSERT INTO invoices (
+        customer_id, sector_id, user_id, invoice_number,
+        payment_date, payment_time, kilowatt_amount, free_kilowatt,
+        price_per_kilo, discount, total_amount,
+        previous_reading, new_reading, visa_application, customer_withdrawal,
+        current_balance, created_at
+    ) VALUES (
+        $1, $2, $3, $4,
+        CURRENT_DATE, CURRENT_TIME, $5, $6,
+        $7, $8, $9, $10, $11, $12, $13,
+        $14, CURRENT_TIMESTAMP
+    )
+    RETURNING id
+""")
+
+@traced_class
 class FastOperations:
     """عمليات سريعة للاستخدام اليومي"""
     
@@ -18,41 +91,15 @@ class FastOperations:
     def fast_search_customers(search_term: str = "", sector_id: int = None, limit: int = 50) -> List[Dict]:
         """بحث سريع بالزبائن (مشابه للبحث في Excel)"""
         try:
+            params = []
+            if search_term:
+                params.append(f"%{search_term}%")
+            if sector_id:
+                params.append(sector_id)
+            params.append(limit)
+
             with db.get_cursor() as cursor:
-                query = """
-                    SELECT 
-                        c.id, c.name, c.box_number, c.serial_number,
-                        c.current_balance, c.last_counter_reading,
-                        c.visa_balance, c.withdrawal_amount,
-                        s.name as sector_name,
-                        CONCAT(c.box_number, ' - ', c.name) as display_text
-                    FROM customers c
-                    LEFT JOIN sectors s ON c.sector_id = s.id
-                    WHERE c.is_active = TRUE
-                """
-                
-                params = []
-                
-                if search_term:
-                    # بحث في الاسم أو العلبة أو المسلسل
-                    query += """
-                        AND (
-                            c.name ILIKE %s 
-                            OR c.box_number ILIKE %s 
-                            OR c.serial_number ILIKE %s
-                        )
-                    """
-                    search_pattern = f"%{search_term}%"
-                    params.extend([search_pattern, search_pattern, search_pattern])
-                
-                if sector_id:
-                    query += " AND c.sector_id = %s"
-                    params.append(sector_id)
-                
-                query += " ORDER BY c.name LIMIT %s"
-                params.append(limit)
-                
-                cursor.execute(query, params)
+                statements.execute(cursor, SEARCH_STATEMENTS[(bool(search_term), bool(sector_id))], params)
                 results = cursor.fetchall()
                 
                 # تحويل إلى قائمة من القواميس
@@ -64,31 +111,13 @@ class FastOperations:
         
     @staticmethod
     def fast_get_customer_details(customer_id: int) -> Dict:
-        """جلب بيانات زبون سريعاً مع التصنيف المالي"""
+        """جلب بيانات زبون سريعاً مع التصنيف المالي (من ذاكرة الزبائن، وآخر فاتورة من المؤشر المخزن)"""
         try:
-            with db.get_cursor() as cursor:
-                cursor.execute("""
-                    SELECT
-                        c.*, s.name as sector_name,
-                        s.code as sector_code,
-                        c.financial_category,
-                        c.free_reason, c.free_amount, c.free_remaining, c.free_expiry_date,
-                        c.vip_reason, c.vip_no_cut_days, c.vip_expiry_date, c.vip_grace_period,
-                        c.notes,
-                        (
-                            SELECT invoice_number
-                            FROM invoices
-                            WHERE customer_id = c.id
-                            ORDER BY payment_date DESC, payment_time DESC
-                            LIMIT 1
-                        ) as last_invoice
-                    FROM customers c
-                    LEFT JOIN sectors s ON c.sector_id = s.id
-                    WHERE c.id = %s
-                """, (customer_id,))
-                
-                result = cursor.fetchone()
-                return dict(result) if result else {}
+            customer = customer_cache.get(customer_id)
+            if not customer:
+                return {}
+            customer['last_invoice'] = customer.get('last_invoice_number')
+            return customer
                 
         except Exception as e:
             logger.error(f"خطأ في جلب بيانات الزبون: {e}")
@@ -108,19 +137,7 @@ class FastOperations:
 
             with db.get_cursor() as cursor:
                 # جلب بيانات الزبون مع FOR UPDATE
-                cursor.execute("""
-                    SELECT
-                        c.current_balance,
-                        c.last_counter_reading,
-                        c.sector_id,
-                        c.visa_balance,          
-                        c.name,
-                        s.name as sector_name
-                    FROM customers c
-                    INNER JOIN sectors s ON c.sector_id = s.id
-                    WHERE c.id = %s AND c.is_active = TRUE
-                    FOR UPDATE
-                """, (customer_id,))
+                statements.execute(cursor, CUSTOMER_FOR_INVOICE, (customer_id,))
 
                 customer = cursor.fetchone()
                 if not customer:
@@ -138,31 +155,11 @@ class FastOperations:
                 invoice_number = f"INV-{datetime.now().strftime('%Y%m%d%H%M%S')}-{customer_id}"
 
                 # تحديث بيانات الزبون
-                cursor.execute("""
-                    UPDATE customers
-                    SET current_balance = %s,
-                        last_counter_reading = %s,
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE id = %s
-                    RETURNING *
-                """, (float(new_balance), float(new_reading), customer_id))
+                statements.execute(cursor, UPDATE_CUSTOMER_READING,
+                                   (float(new_balance), float(new_reading), customer_id))
 
                 # إدخال الفاتورة
-                cursor.execute("""
-                    INSERT INTO invoices (
-                        customer_id, sector_id, user_id, invoice_number,
-                        payment_date, payment_time, kilowatt_amount, free_kilowatt,
-                        price_per_kilo, discount, total_amount,
-                        previous_reading, new_reading, visa_application, customer_withdrawal,
-                        current_balance, created_at
-                    ) VALUES (
-                        %s, %s, %s, %s,
-                        CURRENT_DATE, CURRENT_TIME, %s, %s,
-                        %s, %s, %s, %s, %s, %s, %s,
-                        %s, CURRENT_TIMESTAMP
-                    )
-                    RETURNING id
-                """, (
+                statements.execute(cursor, INSERT_INVOICE, (
                     customer_id, customer['sector_id'], user_id, invoice_number,
                     float(kilowatt_amount), float(free_kilowatt), float(price_per_kilo),
                     float(discount), float(total_amount),
@@ -174,26 +171,16 @@ class FastOperations:
 
                 invoice_id = cursor.fetchone()['id']
 
-                # جلب اللقطة الحالية للزبون (بعد التحديث)
-                cursor.execute("SELECT withdrawal_amount, visa_balance, last_counter_reading FROM customers WHERE id = %s", (customer_id,))
+                # تحديث مؤشر آخر فاتورة وجلب اللقطة الحالية للزبون (بعد التحديث)
+                statements.execute(cursor, SET_LAST_INVOICE, (invoice_id, invoice_number, customer_id))
                 snapshot = cursor.fetchone()
                 snapshot_withdrawal = snapshot['withdrawal_amount'] if snapshot else 0
                 snapshot_visa = snapshot['visa_balance'] if snapshot else 0
                 snapshot_reading = snapshot['last_counter_reading'] if snapshot else 0
 
                 # ✅ تسجيل الحدث في customer_history مع اللقطة
-                cursor.execute("""
-                    INSERT INTO customer_history 
-                    (customer_id, action_type, transaction_type, 
-                    old_value, new_value, amount,
-                    current_balance_before, current_balance_after,
-                    notes, created_by, created_at,
-                    snapshot_withdrawal_amount, snapshot_visa_balance, snapshot_last_counter_reading)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP, %s, %s, %s)
-                """, (
+                statements.execute(cursor, INSERT_INVOICE_HISTORY, (
                     customer_id,
-                    'invoice_created',            # action_type
-                    'payment',                     # transaction_type
                     current_balance,                # old_value (الرصيد قبل)
                     new_balance,                     # new_value (الرصيد بعد)
                     total_amount,                     # amount
@@ -212,6 +199,7 @@ class FastOperations:
                     VALUES (%s, 'fast_invoice', %s)
                 """, (user_id, f"فاتورة سريعة #{invoice_number} للزبون {customer['name']}"))
 
+                customer_cache.invalidate([customer_id])
                 return {
                     "success": True,
                     "invoice_id": invoice_id,
@@ -245,6 +233,7 @@ class FastOperations:
             return ""
     
     @staticmethod
+    @read_only
     def backup_to_excel_parallel() -> bool:
         """نسخ احتياطي موازي إلى Excel (مثل النظام القديم)"""
         try:
@@ -1,10 +1,13 @@
 # modules/financial_reports.py
 import logging
 from typing import Dict, List
-from database.connection import db
+from database.connection import db, read_only_class
+from utils.tracing import traced_class
 
 logger = logging.getLogger(__name__)
 
+@traced_class
+@read_only_class
 class FinancialReports:
     """تقارير التصنيفات المالية"""
     
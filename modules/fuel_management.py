@@ -4,9 +4,12 @@ import logging
 from datetime import datetime, date, timedelta
 from typing import Dict, List, Any, Optional
 from database.connection import db
+from database.reference_data import reference_data, EXPENSE_CATEGORIES
+from utils.tracing import traced_class
 
 logger = logging.getLogger(__name__)
 
+@traced_class
 class FuelManagement:
     """إدارة عدادات المولدة والقطاعات والخزانات والطاقة والقراءات اليومية والجرد الأسبوعي"""
 
@@ -339,13 +342,15 @@ class FuelManagement:
                 daily_cash_id = row['id']
 
                 # 3. تصنيف "مازوت"
-                cursor.execute("SELECT id FROM expense_categories WHERE name = 'fuel'")
-                cat = cursor.fetchone()
-                if not cat:
-                    cursor.execute("INSERT INTO expense_categories (name, arabic_name) VALUES ('fuel', 'مازوت') RETURNING id")
+                category_id = reference_data.expense_category_id('fuel')
+                if category_id is None:
+                    cursor.execute("""
+                        INSERT INTO expense_categories (name, arabic_name) VALUES ('fuel', 'مازوت')
+                        ON CONFLICT (name) DO UPDATE SET arabic_name = EXCLUDED.arabic_name
+                        RETURNING id
+                    """)
                     category_id = cursor.fetchone()['id']
-                else:
-                    category_id = cat['id']
+                    reference_data.invalidate(EXPENSE_CATEGORIES)
 
                 # 4. إدراج المصروف
                 cursor.execute("""
@@ -357,7 +362,7 @@ class FuelManagement:
 
             # 5. إعادة حساب الصندوق
             from database.models import models
-            models.recalculate_daily_cash(purchase_date)
+            models.recalculate_daily_cash_chain(purchase_date)
 
             return {'success': True, 'id': purchase_id}
         except Exception as e:
@@ -401,9 +406,8 @@ class FuelManagement:
                     """, (new_total, f"شراء مازوت: {data['quantity_liters']} لتر بسعر {data['price_per_liter']} ل.س", daily['id']))
 
             from database.models import models
-            models.recalculate_daily_cash(new_date)
-            if old_date != new_date:
-                models.recalculate_daily_cash(old_date)
+            # سلسلة واحدة من أقدم التاريخين تغطي اليومين وكل ما بعدهما
+            models.recalculate_daily_cash_chain(min(old_date, new_date))
 
             return {'success': True}
         except Exception as e:
@@ -429,7 +433,7 @@ class FuelManagement:
                 cursor.execute("DELETE FROM fuel_purchases WHERE id=%s", (purchase_id,))
 
             from database.models import models
-            models.recalculate_daily_cash(purchase_date)
+            models.recalculate_daily_cash_chain(purchase_date)
             return {'success': True}
         except Exception as e:
             logger.error(f"خطأ في حذف شراء: {e}")
@@ -1,11 +1,25 @@
 # modules/history_manager.py
 import logging
+import threading
+from collections import OrderedDict
 from datetime import datetime
 from database.connection import db
+from modules.customer_cache import customer_cache
 from typing import Dict, List, Optional
+from utils.tracing import traced_class
 
 logger = logging.getLogger(__name__)
 
+
+class _HistoryWriteFailed(Exception):
+    """فشل تسجيل العملية التاريخية: يُرفع داخل get_cursor لتتراجع وحدة العمل عن تعديل الزبون"""
+
+    def __init__(self, result: Dict):
+        super().__init__(result.get('error'))
+        self.result = result
+
+
+@traced_class
 class HistoryManager:
     """مدير سجل العمليات التاريخية للزبائن"""
 
@@ -28,6 +42,14 @@ class HistoryManager:
         'sector_delete': 'حذف قطاعي'
     }
 
+    # أنواع العمليات التي تعدّل رصيد التأشيرة ('تحديث تأشيرة' يكتبها محرر التأشيرات)
+    VISA_TRANSACTION_TYPES = ('weekly_visa', 'visa_update', 'visa_adjustment', 'تحديث تأشيرة')
+
+    # كاش LRU مشترك لسجل تأشيرات كل زبون: customer_id -> (limit, قائمة السجلات)
+    _VISA_CACHE_SIZE = 256
+    _visa_cache = OrderedDict()
+    _visa_cache_lock = threading.Lock()
+
     def _safe_format_number(self, value, default=0.0):
         """تنسيق الأرقام بشكل آمن"""
         if value is None:
@@ -158,10 +180,9 @@ class HistoryManager:
                 )
 
                 if not history_result['success']:
-                    cursor.execute("ROLLBACK")
-                    return history_result
+                    raise _HistoryWriteFailed(history_result)
 
-                return {
+                result = {
                     'success': True,
                     'customer_id': customer_id,
                     'old_visa': old_visa,
@@ -173,6 +194,13 @@ class HistoryManager:
                     'message': f'تم إضافة تأشيرة أسبوعية: {visa_amount:,.0f}'
                 }
 
+            # بعد الحفظ: سجل التأشيرات المخزن وسجل الزبون لم يعودا صالحين
+            self.invalidate_visa_cache(customer_id)
+            customer_cache.invalidate([customer_id])
+            return result
+
+        except _HistoryWriteFailed as e:
+            return e.result
         except Exception as e:
             logger.error(f"خطأ في إضافة التأشيرة الأسبوعية: {e}")
             return {'success': False, 'error': str(e)}
@@ -232,10 +260,9 @@ class HistoryManager:
                 )
 
                 if not history_result['success']:
-                    cursor.execute("ROLLBACK")
-                    return history_result
+                    raise _HistoryWriteFailed(history_result)
 
-                return {
+                result = {
                     'success': True,
                     'customer_id': customer_id,
                     'old_withdrawal': old_withdrawal,
@@ -247,6 +274,11 @@ class HistoryManager:
                     'message': f'تم إضافة سحب نقدي: {withdrawal_amount:,.0f}'
                 }
 
+            customer_cache.invalidate([customer_id])
+            return result
+
+        except _HistoryWriteFailed as e:
+            return e.result
         except Exception as e:
             logger.error(f"خطأ في إضافة السحب النقدي: {e}")
             return {'success': False, 'error': str(e)}
@@ -305,10 +337,9 @@ class HistoryManager:
                 )
 
                 if not history_result['success']:
-                    cursor.execute("ROLLBACK")
-                    return history_result
+                    raise _HistoryWriteFailed(history_result)
 
-                return {
+                result = {
                     'success': True,
                     'customer_id': customer_id,
                     'old_reading': old_reading,
@@ -319,6 +350,11 @@ class HistoryManager:
                     'message': f'تم تحديث قراءة العداد: {old_reading:,.0f} → {new_reading:,.0f}'
                 }
 
+            customer_cache.invalidate([customer_id])
+            return result
+
+        except _HistoryWriteFailed as e:
+            return e.result
         except Exception as e:
             logger.error(f"خطأ في تحديث قراءة العداد: {e}")
             return {'success': False, 'error': str(e)}
@@ -375,10 +411,9 @@ class HistoryManager:
                 )
 
                 if not history_result['success']:
-                    cursor.execute("ROLLBACK")
-                    return history_result
+                    raise _HistoryWriteFailed(history_result)
 
-                return {
+                result = {
                     'success': True,
                     'customer_id': customer_id,
                     'old_balance': old_balance,
@@ -390,10 +425,62 @@ class HistoryManager:
                     'message': f'تم استيراد تأشيرة: {visa_amount:,.0f}'
                 }
 
+            # بعد الحفظ: سجل التأشيرات المخزن وسجل الزبون لم يعودا صالحين
+            self.invalidate_visa_cache(customer_id)
+            customer_cache.invalidate([customer_id])
+            return result
+
+        except _HistoryWriteFailed as e:
+            return e.result
         except Exception as e:
             logger.error(f"خطأ في معالجة تأشيرة مستوردة: {e}")
             return {'success': False, 'error': str(e)}
 
+    def get_visa_events(self, customer_id: int, limit: int = 100) -> List[Dict]:
+        """
+        سجل تعديلات التأشيرة لزبون (الأحدث أولاً)، مصفى في قاعدة البيانات حسب
+        VISA_TRANSACTION_TYPES ومخزن في كاش LRU حتى أول كتابة تأشيرة لنفس الزبون.
+        """
+        if not customer_id:
+            return []
+
+        with self._visa_cache_lock:
+            cached = self._visa_cache.get(customer_id)
+            if cached is not None and cached[0] >= limit:
+                self._visa_cache.move_to_end(customer_id)
+                return cached[1][:limit]
+
+        try:
+            with db.get_cursor() as cursor:
+                cursor.execute('''
+                    SELECT created_at, old_value, new_value, amount, notes, transaction_type
+                    FROM customer_history
+                    WHERE customer_id = %s
+                      AND transaction_type = ANY(%s)
+                    ORDER BY created_at DESC
+                    LIMIT %s
+                ''', (customer_id, list(self.VISA_TRANSACTION_TYPES), limit))
+                events = [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"خطأ في جلب سجل التأشيرات للزبون {customer_id}: {e}")
+            return []
+
+        with self._visa_cache_lock:
+            self._visa_cache[customer_id] = (limit, events)
+            self._visa_cache.move_to_end(customer_id)
+            while len(self._visa_cache) > self._VISA_CACHE_SIZE:
+                self._visa_cache.popitem(last=False)
+        return events
+
+    @classmethod
+    def invalidate_visa_cache(cls, customer_id: Optional[int] = None):
+        """حذف سجل تأشيرات زبون من الكاش (أو تفريغ الكاش كاملاً عند عدم تحديد زبون)"""
+        with cls._visa_cache_lock:
+            if customer_id is None:
+                cls._visa_cache.clear()
+            else:
+                cls._visa_cache.pop(customer_id, None)
+
     def get_customer_history(self,
                               customer_id: int,
                               limit: int = 100,
@@ -3,10 +3,36 @@ import logging
 from datetime import datetime
 from typing import List, Dict, Optional
 from database.connection import db
-from modules.accounting import AccountingEngine
+from database.models import models
+from database.prepared import statements
+from modules.accounting import (AccountingEngine, CUSTOMER_FOR_INVOICE, SET_LAST_INVOICE,
+                               INSERT_INVOICE_HISTORY)
+from modules.customer_cache import customer_cache
+from utils.tracing import traced_class
 
 logger = logging.getLogger(__name__)
 
+INSERT_INVOICE = statements.register('inv_insert_invoice', """
+    INSERT INTO invoices (
+        invoice_number, customer_id, sector_id, user_id,
+        payment_date, payment_time,
+        kilowatt_amount, free_kilowatt, price_per_kilo,
+        discount, total_amount,
+        previous_reading, new_reading,
+        visa_application, customer_withdrawal,
+        book_number, receipt_number,
+        current_balance, status
+    )
+    VALUES ($1, $2, $3, $4, $5, $6,
+            $7, $8, $9, $10, $11,
+            $12, $13,
+            $14, $15,
+            $16, $17,
+            $18, $19)
+    RETURNING id, invoice_number
+""")
+
+@traced_class
 class InvoiceManager:
     """مدير عمليات الفواتير"""
 
@@ -21,105 +47,103 @@ class InvoiceManager:
             if user_id is None:
                 return {'success': False, 'error': 'يجب تحديد معرف المستخدم (user_id) لإنشاء الفاتورة'}
 
-            engine = AccountingEngine(
-                kilowatt_price=invoice_data.get('price_per_kilo', 0)
-            )
-
-            # 1️⃣ تنفيذ المحاسبة باستخدام new_reading (كما كانت تعمل سابقًا)
-            result = engine.process_invoice(
-                customer_id=invoice_data['customer_id'],
-                new_reading=invoice_data.get('new_reading', 0),  # استخدم new_reading
-                visa_amount=invoice_data.get('visa_application', 0),
-                discount=invoice_data.get('discount', 0),
-                accountant_id=user_id
-            )
-
-            if not result.get('success'):
-                return result
-
-            with db.get_cursor() as cursor:
-                invoice_number = self.generate_invoice_number()
-
-                cursor.execute("""
-                    INSERT INTO invoices (
-                        invoice_number, customer_id, sector_id, user_id,
-                        payment_date, payment_time,
-                        kilowatt_amount, free_kilowatt, price_per_kilo,
-                        discount, total_amount,
-                        previous_reading, new_reading,
-                        visa_application, customer_withdrawal,
-                        book_number, receipt_number,
-                        current_balance, status
-                    )
-                    VALUES (%s, %s, %s, %s, %s, %s,
-                            %s, %s, %s, %s, %s,
-                            %s, %s,
-                            %s, %s,
-                            %s, %s,
-                            %s, %s)
-                    RETURNING id, invoice_number
-                """, (
-                    invoice_number,
-                    invoice_data['customer_id'],
-                    invoice_data.get('sector_id'),
-                    user_id,
-                    datetime.now().date(),
-                    datetime.now().time(),
-                    result['consumption'],          # ✅ kilowatt_amount = consumption
-                    invoice_data.get('free_kilowatt', 0),
-                    result['kilowatt_price'],
-                    result['discount'],
-                    result['total_amount'],
-                    result['previous_reading'],
-                    result['new_reading'],
-                    invoice_data.get('visa_application', 0),
-                    invoice_data.get('customer_withdrawal', ''),
-                    invoice_data.get('book_number', ''),
-                    invoice_data.get('receipt_number', ''),
-                    result['new_balance'],
-                    'active'
-                ))
+            # المحاسبة وحفظ الفاتورة والسجل في معاملة واحدة على اتصال واحد
+            with db.transaction():
+                engine = AccountingEngine(
+                    kilowatt_price=invoice_data.get('price_per_kilo', 0)
+                )
+
+                # 1️⃣ كمية الدفع: مباشرة، أو من القراءة الجديدة ناقص قراءة الزبون الحالية والمجاني
+                free_kilowatt = float(invoice_data.get('free_kilowatt') or 0)
+                kilowatt_amount = invoice_data.get('kilowatt_amount')
+                if kilowatt_amount is None:
+                    with db.get_cursor() as cursor:
+                        # القفل نفسه الذي تأخذه المحاسبة: القراءة لا تتغير حتى نهاية المعاملة
+                        statements.execute(cursor, CUSTOMER_FOR_INVOICE, (invoice_data['customer_id'],))
+                        customer = cursor.fetchone()
+                    if not customer:
+                        return {'success': False, 'error': 'الزبون غير موجود'}
+                    try:
+                        consumption = engine.calculate_consumption(
+                            float(customer['last_counter_reading'] or 0),
+                            float(invoice_data.get('new_reading') or 0)
+                        )
+                    except ValueError as e:
+                        return {'success': False, 'error': str(e)}
+                    kilowatt_amount = consumption - free_kilowatt
+                    if kilowatt_amount < 0:
+                        return {'success': False, 'error': 'الكمية المجانية أكبر من الاستهلاك'}
+
+                # 2️⃣ تنفيذ المحاسبة
+                result = engine.process_invoice(
+                    customer_id=invoice_data['customer_id'],
+                    kilowatt_amount=float(kilowatt_amount),
+                    free_kilowatt=free_kilowatt,
+                    visa_amount=invoice_data.get('visa_application', 0),
+                    discount=invoice_data.get('discount', 0),
+                    accountant_id=user_id
+                )
+
+                if not result.get('success'):
+                    return result
+
+                with db.get_cursor() as cursor:
+                    invoice_number = self.generate_invoice_number()
+
+                    statements.execute(cursor, INSERT_INVOICE, (
+                        invoice_number,
+                        invoice_data['customer_id'],
+                        invoice_data.get('sector_id'),
+                        user_id,
+                        datetime.now().date(),
+                        datetime.now().time(),
+                        result['consumption'],          # ✅ kilowatt_amount = consumption
+                        invoice_data.get('free_kilowatt', 0),
+                        result['kilowatt_price'],
+                        result['discount'],
+                        result['total_amount'],
+                        result['previous_reading'],
+                        result['new_reading'],
+                        invoice_data.get('visa_application', 0),
+                        invoice_data.get('customer_withdrawal', ''),
+                        invoice_data.get('book_number', ''),
+                        invoice_data.get('receipt_number', ''),
+                        result['new_balance'],
+                        'active'
+                    ))
 
-                invoice = cursor.fetchone()
+                    invoice = cursor.fetchone()
 
-                # جلب اللقطة الحالية للزبون
-                cursor.execute("SELECT withdrawal_amount, visa_balance, last_counter_reading FROM customers WHERE id = %s", (invoice_data['customer_id'],))
-                snapshot = cursor.fetchone()
-                snapshot_withdrawal = snapshot['withdrawal_amount'] if snapshot else 0
-                snapshot_visa = snapshot['visa_balance'] if snapshot else 0
-                snapshot_reading = snapshot['last_counter_reading'] if snapshot else 0
+                    # تحديث مؤشر آخر فاتورة وجلب اللقطة الحالية للزبون في استعلام واحد
+                    statements.execute(cursor, SET_LAST_INVOICE,
+                                       (invoice['id'], invoice['invoice_number'], invoice_data['customer_id']))
+                    snapshot = cursor.fetchone()
+                    snapshot_withdrawal = snapshot['withdrawal_amount'] if snapshot else 0
+                    snapshot_visa = snapshot['visa_balance'] if snapshot else 0
+                    snapshot_reading = snapshot['last_counter_reading'] if snapshot else 0
 
-                # ✅ تسجيل الحدث في customer_history مع اللقطة
-                cursor.execute("""
-                    INSERT INTO customer_history 
-                    (customer_id, action_type, transaction_type, 
-                    old_value, new_value, amount,
-                    current_balance_before, current_balance_after,
-                    notes, created_by, created_at,
-                    snapshot_withdrawal_amount, snapshot_visa_balance, snapshot_last_counter_reading)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP, %s, %s, %s)
-                """, (
-                    invoice_data['customer_id'],
-                    'invoice_created',                    # action_type
-                    'payment',                             # transaction_type
-                    result.get('previous_balance', 0),     # old_value (الرصيد قبل)
-                    result['new_balance'],                  # new_value (الرصيد بعد)
-                    result['total_amount'],                  # amount
-                    result.get('previous_balance', 0),      # current_balance_before
-                    result['new_balance'],                   # current_balance_after
-                    f"إنشاء فاتورة {invoice['invoice_number']} بمبلغ {result['total_amount']}",
-                    user_id,                                 # created_by
-                    snapshot_withdrawal,
-                    snapshot_visa,
-                    snapshot_reading
-                ))
+                    # ✅ تسجيل الحدث في customer_history مع اللقطة
+                    statements.execute(cursor, INSERT_INVOICE_HISTORY, (
+                        invoice_data['customer_id'],
+                        result.get('previous_balance', 0),     # old_value (الرصيد قبل)
+                        result['new_balance'],                  # new_value (الرصيد بعد)
+                        result['total_amount'],                  # amount
+                        result.get('previous_balance', 0),      # current_balance_before
+                        result['new_balance'],                   # current_balance_after
+                        f"إنشاء فاتورة {invoice['invoice_number']} بمبلغ {result['total_amount']}",
+                        user_id,                                 # created_by
+                        snapshot_withdrawal,
+                        snapshot_visa,
+                        snapshot_reading
+                    ))
 
-            return {
-                'success': True,
-                'invoice_id': invoice['id'],
-                'invoice_number': invoice['invoice_number'],
-                **result
-            }
+                customer_cache.invalidate([invoice_data['customer_id']])
+                return {
+                    'success': True,
+                    'invoice_id': invoice['id'],
+                    'invoice_number': invoice['invoice_number'],
+                    **result
+                }
 
         except Exception as e:
             logger.error(f"خطأ في إنشاء الفاتورة: {e}")
@@ -274,7 +298,7 @@ class InvoiceManager:
                 UPDATE invoices 
                 SET {', '.join(set_clauses)}, updated_at = CURRENT_TIMESTAMP 
                 WHERE id = %s 
-                RETURNING id, invoice_number, current_balance, new_reading
+                RETURNING id, invoice_number, current_balance, new_reading, customer_id
             """
 
             with db.get_cursor() as cursor:
@@ -284,6 +308,10 @@ class InvoiceManager:
                 if not updated:
                     return {'success': False, 'error': 'الفاتورة غير موجودة'}
 
+                # رقم الفاتورة أو تاريخها قد تغير: مؤشر آخر فاتورة للزبون
+                models.refresh_last_invoice(cursor, [updated['customer_id']])
+                customer_cache.invalidate([updated['customer_id']])
+
                 # 2. التحقق مما إذا كان الرصيد أو القراءة قد تغيرا
                 new_balance = updated['current_balance']
                 new_reading = updated['new_reading']
@@ -465,6 +493,8 @@ class InvoiceManager:
                 if invoice['status'] == 'cancelled':
                     cursor.execute("DELETE FROM invoices WHERE id = %s RETURNING invoice_number", (invoice_id,))
                     result = cursor.fetchone()
+                    models.refresh_last_invoice(cursor, [invoice['customer_id']])
+                    customer_cache.invalidate([invoice['customer_id']])
                     return {
                         'success': True,
                         'message': f"تم حذف الفاتورة الملغاة {result['invoice_number']}"
@@ -536,6 +566,8 @@ class InvoiceManager:
                 # 6. حذف الفاتورة
                 cursor.execute("DELETE FROM invoices WHERE id = %s RETURNING invoice_number", (invoice_id,))
                 result = cursor.fetchone()
+                models.refresh_last_invoice(cursor, [invoice['customer_id']])
+                customer_cache.invalidate([invoice['customer_id']])
 
                 return {
                     'success': True,
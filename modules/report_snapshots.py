@@ -0,0 +1,405 @@
+# modules/report_snapshots.py
+"""
+لقطات التقارير الأسبوعية المولدة مسبقاً.
+
+- مجدول في خيط خلفي يولد التقارير الثقيلة (قوائم القطع والكسر، أوراق التأشيرات،
+  جرد الدورة، VIP، المحاسبة الجوالة) في موعد أسبوعي خارج أوقات الذروة، ومرة عند
+  التشغيل إن فات الموعد دون توليد.
+- كل لقطة نسخة مرقمة في جدول report_snapshots: التقرير مسلسلاً (JSON مضغوط)
+  وملف Excel المولد، مع علامة البيانات (watermark) التي بُني منها.
+- العلامة ملخص رخيص للجداول التي تقرأ منها التقارير (أكبر معرف، العدد، آخر تعديل):
+  اختلافها عن العلامة الحالية يعني أن البيانات تغيرت منذ اللقطة. علامة اللقطة تُقرأ
+  على اتصال بيانات التقرير نفسه (نسخة القراءة إن كانت متاحة) فلا تدّعي بيانات لم
+  تقرأها، والعلامة الحالية من الخادم الأساسي؛ تأخر النسخة يظهر لقطةً قديمة لا العكس.
+- الموعد الأسبوعي يُحسب بساعة الخادم (LOCALTIMESTAMP) مثل generated_at، فلا يؤثر
+  فرق المنطقة الزمنية أو الساعة بين المحطات.
+- عدة محطات قد تشغل المجدول: قفل استشاري (advisory lock) يضمن أن محطة واحدة تولد،
+  وقفل معاملة لكل تقرير يسلسل حساب رقم النسخة عند إعادة التوليد اليدوية المتزامنة.
+  القفل على اتصال مخصص خارج مجموعة الاتصالات فلا يحجز أحد اتصالي مسار الصيانة.
+- التوليد الفاشل يُسجل لكل موعد في report_snapshot_attempts: يُعاد بمهلة متضاعفة
+  ثم يُترك حتى الموعد التالي بعد max_attempts بدل إعادته في كل دورة فحص.
+"""
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg2
+
+from config.settings import DATABASE_CONFIG, REPORT_SNAPSHOT_CONFIG
+from database.connection import db
+
+logger = logging.getLogger(__name__)
+
+# التقارير المولدة مسبقاً: دالة التوليد ودالة التصدير في ReportManager، ونوعها في ReportUI
+SNAPSHOT_REPORTS = {
+    'cut_lists': {
+        'title': '✂️ قوائم القطع',
+        'report_type': 'cut_lists_advanced',
+        'fetch': 'get_cut_lists_report',
+        'export': 'export_cut_lists_report_to_excel',
+    },
+    'negative_balance': {
+        'title': '📉 قوائم الكسر',
+        'report_type': 'negative_balance_advanced',
+        'fetch': 'get_negative_balance_lists_report',
+        'export': 'export_negative_balance_report_to_excel',
+    },
+    'visa_sheets': {
+        'title': '🖨️ أوراق التأشيرات',
+        'report_type': 'visa_report',
+        'fetch': 'get_visa_sheets_report',
+        'export': 'export_visa_report_to_excel',
+    },
+    'cycle_inventory': {
+        'title': '📋 جرد الدورة',
+        'report_type': 'cycle_inventory',
+        'fetch': 'get_cycle_inventory_report',
+        'export': 'export_cycle_inventory_to_excel',
+    },
+    'vip_full': {
+        'title': '👑 تقرير VIP شامل',
+        'report_type': 'vip_full',
+        'fetch': 'get_vip_full_report',
+        'export': 'export_vip_report_to_excel',
+    },
+    'mobile_accountant': {
+        'title': '📱 تقرير محاسبة جوالة شامل',
+        'report_type': 'mobile_accountant_full',
+        'fetch': 'get_mobile_accountant_full_report',
+        'export': 'export_mobile_accountant_report_to_excel',
+    },
+}
+
+# مفتاح القفل الاستشاري لتوليد اللقطات المجدول
+_SCHEDULER_LOCK_KEY = 7_405_010
+# مفتاح قفل المعاملة لحفظ نسخة (مع hashtext(report_key) كمفتاح ثانٍ)
+_VERSION_LOCK_KEY = 7_405_011
+
+# آخر موعد أسبوعي مضى بساعة الخادم (ISODOW - 1 = weekday في بايثون) وعمره بالثواني
+SLOT_QUERY = """
+    SELECT slot, EXTRACT(EPOCH FROM LOCALTIMESTAMP - slot) AS age_seconds
+    FROM (
+        SELECT CASE WHEN s > LOCALTIMESTAMP THEN s - INTERVAL '7 days' ELSE s END AS slot
+        FROM (
+            SELECT date_trunc('day', LOCALTIMESTAMP)
+                   - make_interval(days => (EXTRACT(ISODOW FROM LOCALTIMESTAMP)::int - 1 - %s + 7) %% 7)
+                   + make_interval(hours => %s) AS s
+        ) t
+    ) slot
+"""
+
+WATERMARK_QUERY = """
+    SELECT
+        (SELECT COALESCE(MAX(id), 0) FROM invoices) AS invoices_max_id,
+        (SELECT COUNT(*) FROM invoices) AS invoices_count,
+        (SELECT MAX(updated_at) FROM customers) AS customers_updated_at,
+        (SELECT COUNT(*) FROM customers) AS customers_count,
+        (SELECT COALESCE(MAX(id), 0) FROM customer_history) AS history_max_id,
+        (SELECT COALESCE(MAX(id), 0) FROM sectors) AS sectors_max_id,
+        (SELECT COUNT(*) FROM sectors WHERE is_active = TRUE) AS sectors_active
+"""
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat(sep=' ') if isinstance(value, datetime) else value.isoformat()
+    if isinstance(value, (set, tuple)):
+        return list(value)
+    return str(value)
+
+
+def _normalize(value) -> Any:
+    """نفس الشكل بعد التخزين (للمقارنة بين العلامات)"""
+    return json.loads(json.dumps(value, default=_json_default))
+
+
+def _report_error(report) -> Optional[str]:
+    if not isinstance(report, dict):
+        return "نتيجة تقرير غير صالحة"
+    if report.get('success') is False or report.get('error'):
+        return str(report.get('error') or 'فشل توليد التقرير')
+    return None
+
+
+class ReportSnapshotManager:
+    """تخزين لقطات التقارير وقراءتها ومقارنة علاماتها"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        cfg = dict(REPORT_SNAPSHOT_CONFIG)
+        cfg.update(config or {})
+        self.keep_versions = int(cfg.get('keep_versions', 8))
+        self.export_dir = cfg.get('export_dir', 'exports')
+
+    # ------------------------------------------------------------------
+    # علامة البيانات
+    # ------------------------------------------------------------------
+    def current_watermark(self) -> Dict[str, Any]:
+        """علامة البيانات الحالية من الخادم الأساسي"""
+        with db.lane(None), db.get_cursor() as cursor:
+            cursor.execute(WATERMARK_QUERY)
+            return _normalize(dict(cursor.fetchone()))
+
+    def is_stale(self, snapshot: Dict[str, Any], watermark: Optional[Dict[str, Any]] = None) -> bool:
+        """هل تغيرت البيانات منذ بناء اللقطة؟"""
+        if watermark is None:
+            watermark = self.current_watermark()
+        return snapshot.get('watermark') != watermark
+
+    # ------------------------------------------------------------------
+    # التوليد
+    # ------------------------------------------------------------------
+    def generate(self, report_key: str, user_id: int = None, source: str = 'manual') -> Dict[str, Any]:
+        """توليد التقرير وتصديره وحفظه كنسخة جديدة"""
+        spec = SNAPSHOT_REPORTS.get(report_key)
+        if spec is None:
+            return {'success': False, 'error': f"تقرير غير معروف: {report_key}"}
+        xlsx_path = None
+        try:
+            from modules.reports import ReportManager
+            manager = ReportManager()
+            started = time.perf_counter()
+
+            # العلامة قبل القراءة وعلى الاتصال نفسه (وحدة عمل واحدة): تغيير أثناء التوليد
+            # أو لم يصل النسخة بعد يظهر لاحقاً كبيانات أحدث من اللقطة
+            with db.lane('replica'), db.transaction():
+                with db.get_cursor() as cursor:
+                    cursor.execute(WATERMARK_QUERY)
+                    watermark = _normalize(dict(cursor.fetchone()))
+                report = getattr(manager, spec['fetch'])()
+            error = _report_error(report)
+            if error:
+                return {'success': False, 'error': error}
+
+            filename = f"snapshot_{report_key}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+            exported, xlsx_path = getattr(manager, spec['export'])(report, filename)
+            xlsx = None
+            if exported:
+                with open(xlsx_path, 'rb') as f:
+                    xlsx = f.read()
+            else:
+                logger.warning(f"تعذر تصدير لقطة {report_key} إلى Excel: {xlsx_path}")
+                xlsx_path = None
+
+            payload = gzip.compress(json.dumps(report, default=_json_default, ensure_ascii=False).encode('utf-8'))
+            duration_ms = int((time.perf_counter() - started) * 1000)
+
+            with db.lane(None), db.get_cursor() as cursor:
+                # إعادة توليد متزامنة من محطتين: رقم النسخة يُحسب بعد حصول الأولى على القفل وحفظها
+                cursor.execute("SELECT pg_advisory_xact_lock(%s, hashtext(%s))",
+                               (_VERSION_LOCK_KEY, report_key))
+                cursor.execute("""
+                    INSERT INTO report_snapshots
+                    (report_key, version, watermark, payload, xlsx, xlsx_name, source, duration_ms, generated_by)
+                    VALUES (%s,
+                            (SELECT COALESCE(MAX(version), 0) + 1 FROM report_snapshots WHERE report_key = %s),
+                            %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING id, version, generated_at
+                """, (
+                    report_key, report_key, json.dumps(watermark), payload, xlsx,
+                    filename if xlsx else None, source, duration_ms, user_id
+                ))
+                row = cursor.fetchone()
+                self._prune(cursor, report_key)
+
+            logger.info(f"تم حفظ لقطة {report_key} نسخة {row['version']} "
+                        f"({len(payload) // 1024} KB، {duration_ms} ms)")
+            return {'success': True, 'id': row['id'], 'version': row['version'],
+                    'generated_at': row['generated_at'], 'duration_ms': duration_ms}
+        except Exception as e:
+            logger.error(f"خطأ في توليد لقطة {report_key}: {e}", exc_info=True)
+            return {'success': False, 'error': str(e)}
+        finally:
+            # الملف المؤقت محفوظ في قاعدة البيانات
+            if xlsx_path and os.path.exists(xlsx_path):
+                try:
+                    os.remove(xlsx_path)
+                except OSError:
+                    pass
+
+    def _prune(self, cursor, report_key: str):
+        if self.keep_versions <= 0:
+            return
+        cursor.execute("""
+            DELETE FROM report_snapshots
+            WHERE report_key = %s
+            AND version <= (SELECT MAX(version) FROM report_snapshots WHERE report_key = %s) - %s
+        """, (report_key, report_key, self.keep_versions))
+
+    # ------------------------------------------------------------------
+    # القراءة
+    # ------------------------------------------------------------------
+    def list_latest(self) -> List[Dict[str, Any]]:
+        """آخر نسخة لكل تقرير (بدون المحتوى)"""
+        with db.get_cursor() as cursor:
+            cursor.execute("""
+                SELECT DISTINCT ON (report_key)
+                    id, report_key, version, watermark, source, duration_ms,
+                    generated_at, generated_by, xlsx_name, length(payload) AS payload_size
+                FROM report_snapshots
+                ORDER BY report_key, version DESC
+            """)
+            return [dict(row) for row in cursor.fetchall()]
+
+    def load(self, snapshot_id: int) -> Optional[Dict[str, Any]]:
+        """اللقطة مع التقرير المفكوك"""
+        with db.get_cursor() as cursor:
+            cursor.execute("""
+                SELECT id, report_key, version, watermark, payload, generated_at, xlsx_name
+                FROM report_snapshots
+                WHERE id = %s
+            """, (snapshot_id,))
+            row = cursor.fetchone()
+        if not row:
+            return None
+        snapshot = dict(row)
+        snapshot['report'] = json.loads(gzip.decompress(bytes(snapshot.pop('payload'))).decode('utf-8'))
+        return snapshot
+
+    def save_xlsx(self, snapshot_id: int) -> Optional[str]:
+        """كتابة ملف Excel المحفوظ للقطة في مجلد التصدير وإرجاع مساره"""
+        with db.get_cursor() as cursor:
+            cursor.execute("SELECT xlsx, xlsx_name FROM report_snapshots WHERE id = %s", (snapshot_id,))
+            row = cursor.fetchone()
+        if not row or row['xlsx'] is None:
+            return None
+        os.makedirs(self.export_dir, exist_ok=True)
+        filepath = os.path.join(self.export_dir, row['xlsx_name'])
+        with open(filepath, 'wb') as f:
+            f.write(bytes(row['xlsx']))
+        return filepath
+
+
+class ReportScheduler:
+    """توليد اللقطات أسبوعياً في خيط خلفي (daemon)"""
+
+    def __init__(self, snapshots: ReportSnapshotManager = None, config: Optional[Dict[str, Any]] = None):
+        cfg = dict(REPORT_SNAPSHOT_CONFIG)
+        cfg.update(config or {})
+        self.snapshots = snapshots or ReportSnapshotManager(cfg)
+        self.enabled = bool(cfg.get('enabled', True))
+        self.weekday = int(cfg.get('weekday', 6))
+        self.hour = int(cfg.get('hour', 4))
+        self.check_interval = float(cfg.get('check_interval_minutes', 15)) * 60
+        self.catch_up_window = float(cfg.get('catch_up_hours', 12)) * 3600
+        self.reports = list(cfg.get('reports') or SNAPSHOT_REPORTS)
+        self.max_attempts = int(cfg.get('max_attempts', 4))
+        self.retry_backoff_minutes = int(cfg.get('retry_backoff_minutes', 30))
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def last_slot(self) -> Tuple[datetime, float]:
+        """آخر موعد أسبوعي مضى بساعة الخادم (كـ generated_at) وعمره بالثواني"""
+        with db.get_cursor() as cursor:
+            cursor.execute(SLOT_QUERY, (self.weekday, self.hour))
+            row = cursor.fetchone()
+        return row['slot'], float(row['age_seconds'])
+
+    def due_reports(self, slot: datetime) -> List[str]:
+        """التقارير التي لم تُولد لها نسخة منذ الموعد (عدا الفاشلة في مهلة إعادة المحاولة أو المتروكة)"""
+        with db.get_cursor() as cursor:
+            cursor.execute("""
+                SELECT report_key FROM report_snapshots
+                WHERE generated_at >= %s
+                GROUP BY report_key
+                UNION
+                SELECT report_key FROM report_snapshot_attempts
+                WHERE slot = %s
+                AND (attempts >= %s
+                     OR last_attempt_at + make_interval(mins => %s * (1 << LEAST(attempts - 1, 10)))
+                        > LOCALTIMESTAMP)
+            """, (slot, slot, self.max_attempts, self.retry_backoff_minutes))
+            done = {row['report_key'] for row in cursor.fetchall()}
+        return [key for key in self.reports if key not in done]
+
+    def record_failure(self, report_key: str, slot: datetime, error: str):
+        """تسجيل محاولة فاشلة للموعد (ومسح محاولات المواعيد السابقة)"""
+        try:
+            with db.get_cursor() as cursor:
+                cursor.execute("DELETE FROM report_snapshot_attempts WHERE slot < %s", (slot,))
+                cursor.execute("""
+                    INSERT INTO report_snapshot_attempts (report_key, slot, attempts, last_error, last_attempt_at)
+                    VALUES (%s, %s, 1, %s, LOCALTIMESTAMP)
+                    ON CONFLICT (report_key, slot) DO UPDATE SET
+                        attempts = report_snapshot_attempts.attempts + 1,
+                        last_error = EXCLUDED.last_error,
+                        last_attempt_at = EXCLUDED.last_attempt_at
+                    RETURNING attempts
+                """, (report_key, slot, error))
+                attempts = cursor.fetchone()['attempts']
+            if attempts >= self.max_attempts:
+                logger.error(f"توقف توليد لقطة {report_key} حتى الموعد التالي بعد {attempts} محاولات: {error}")
+        except Exception as e:
+            logger.error(f"تعذر تسجيل فشل لقطة {report_key}: {e}")
+
+    @staticmethod
+    def _lock_connection():
+        # اتصال مخصص للقفل الاستشاري خارج مجموعة الاتصالات (مسار الصيانة اتصالان فقط)
+        conn = psycopg2.connect(
+            application_name='billing-report-scheduler',
+            keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3,
+            **DATABASE_CONFIG
+        )
+        conn.autocommit = True
+        return conn
+
+    def run_due(self) -> Dict[str, Any]:
+        """توليد التقارير المستحقة (محطة واحدة فقط عبر القفل الاستشاري)"""
+        slot, age = self.last_slot()
+        # موعد فات بأكثر من نافذة التعويض (البرنامج كان مغلقاً): ننتظر الموعد التالي
+        if age > self.catch_up_window:
+            return {}
+        if not self.due_reports(slot):
+            return {}
+        results = {}
+        # قفل على مستوى الجلسة طوال التوليد؛ يُحرر تلقائياً إن انقطع الاتصال أو أُغلق
+        conn = self._lock_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_try_advisory_lock(%s)", (_SCHEDULER_LOCK_KEY,))
+                locked = cursor.fetchone()[0]
+            if not locked:
+                logger.info("توليد اللقطات جارٍ على محطة أخرى")
+                return {}
+            # قد تكون محطة أخرى أنهت بعضها قبل حصولنا على القفل
+            for report_key in self.due_reports(slot):
+                if self._stop.is_set():
+                    break
+                results[report_key] = self.snapshots.generate(report_key, source='scheduled')
+                if not results[report_key].get('success'):
+                    self.record_failure(report_key, slot, results[report_key].get('error') or '')
+        finally:
+            conn.close()
+        failed = [key for key, result in results.items() if not result.get('success')]
+        logger.info(f"انتهى توليد اللقطات الأسبوعية: {len(results) - len(failed)} نجح، فشل: {failed or 'لا شيء'}")
+        return results
+
+    def start(self):
+        if not self.enabled or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='report-scheduler', daemon=True)
+        self._thread.start()
+        logger.info(f"🕒 تم بدء جدولة لقطات التقارير (اليوم {self.weekday} الساعة {self.hour}:00)")
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_due()
+            except Exception as e:
+                logger.error(f"خطأ في مجدول لقطات التقارير: {e}", exc_info=True)
+            self._stop.wait(self.check_interval)
+
+
+report_snapshots = ReportSnapshotManager()
+report_scheduler = ReportScheduler(report_snapshots)
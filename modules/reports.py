@@ -2,14 +2,18 @@
 import logging
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional, Tuple
-from database.connection import db
+from database.connection import db, read_only_class
+from database.reference_data import reference_data
 import pandas as pd
 import os
+from utils.tracing import traced_class
 
 logger = logging.getLogger(__name__)
 
 
 
+@traced_class
+@read_only_class
 class ReportManager:
     """مدير عمليات التقارير والإحصائيات المحسّن"""
 
@@ -849,61 +853,46 @@ class ReportManager:
         """
         try:
             with db.get_cursor() as cursor:
-                # استعلام عودي لبناء الشجرة مع تحويل الأنواع لضمان التوافق
+                # الشجرة من المسار الهرمي المخزن (customers.meter_path) بدل الاستعلام العودي:
+                # الجذر من الأنواع المسموح بها، وكل عقد المسار نشطة ومن أنواع الأبناء المسموحة
                 query = """
-                    WITH RECURSIVE meter_tree AS (
-                        -- 1. العقد الجذرية: عدادات بدون أب (من الأنواع المسموح بها)
-                        SELECT 
-                            id,
-                            name,
-                            meter_type,
-                            financial_category,
-                            visa_balance,
-                            box_number,
-                            serial_number,
-                            parent_meter_id,
-                            sector_id,
-                            0 AS level,
-                            ARRAY[id] AS path,
-                            ARRAY[name]::VARCHAR[] AS path_names,
-                            ARRAY[meter_type]::VARCHAR[] AS path_types
-                        FROM customers
-                        WHERE is_active = TRUE
-                        AND parent_meter_id IS NULL
-                        AND meter_type IN ('مولدة', 'علبة توزيع', 'رئيسية')
-                        AND (sector_id = %s OR %s IS NULL)
-                        
-                        UNION ALL
-                        
-                        -- 2. الأبناء المباشرون (عدادات فرعية أو زبائن)
-                        SELECT 
-                            c.id,
-                            c.name,
-                            c.meter_type,
-                            c.financial_category,
-                            c.visa_balance,
-                            c.box_number,
-                            c.serial_number,
-                            c.parent_meter_id,
-                            c.sector_id,
-                            mt.level + 1,
-                            mt.path || c.id,
-                            (mt.path_names || c.name)::VARCHAR[],
-                            (mt.path_types || c.meter_type)::VARCHAR[]
-                        FROM customers c
-                        INNER JOIN meter_tree mt ON c.parent_meter_id = mt.id
-                        WHERE c.is_active = TRUE
-                        AND c.meter_type IN ('علبة توزيع', 'رئيسية', 'زبون')
-                    )
-                    -- جلب جميع العقد مع اسم القطاع
                     SELECT 
-                        mt.*,
+                        mt.id,
+                        mt.name,
+                        mt.meter_type,
+                        mt.financial_category,
+                        mt.visa_balance,
+                        mt.box_number,
+                        mt.serial_number,
+                        mt.parent_meter_id,
+                        mt.sector_id,
+                        array_length(mt.meter_path, 1) - 1 AS level,
+                        mt.meter_path AS path,
+                        mt.meter_path_names AS path_names,
+                        ARRAY(
+                            SELECT a.meter_type
+                            FROM unnest(mt.meter_path) WITH ORDINALITY u(id, ord)
+                            JOIN customers a ON a.id = u.id
+                            ORDER BY u.ord
+                        )::VARCHAR[] AS path_types,
                         s.name as sector_name
-                    FROM meter_tree mt
+                    FROM customers mt
+                    JOIN customers r ON r.id = mt.meter_path[1]
                     LEFT JOIN sectors s ON mt.sector_id = s.id
+                    WHERE mt.is_active = TRUE
+                    AND r.parent_meter_id IS NULL
+                    AND r.meter_type IN ('مولدة', 'علبة توزيع', 'رئيسية')
+                    AND (r.sector_id = %s OR %s IS NULL)
+                    AND NOT EXISTS (
+                        SELECT 1
+                        FROM unnest(mt.meter_path) WITH ORDINALITY u(id, ord)
+                        JOIN customers a ON a.id = u.id
+                        WHERE a.is_active IS NOT TRUE
+                           OR (u.ord > 1 AND COALESCE(a.meter_type IN ('علبة توزيع', 'رئيسية', 'زبون'), FALSE) = FALSE)
+                    )
                     ORDER BY 
                         COALESCE(s.name, 'بدون قطاع'), 
-                        mt.path
+                        mt.meter_path
                 """
                 params = [sector_id, sector_id]  # لشرط IS NULL
                 cursor.execute(query, params)
@@ -1043,9 +1032,7 @@ class ReportManager:
 
     def get_available_sectors(self) -> List[Dict]:
         try:
-            with db.get_cursor() as cursor:
-                cursor.execute("SELECT id, name, code FROM sectors WHERE is_active = TRUE ORDER BY name")
-                return [dict(row) for row in cursor.fetchall()]
+            return [{'id': s['id'], 'name': s['name'], 'code': s['code']} for s in reference_data.sectors()]
         except Exception as e:
             logger.error(f"خطأ في جلب القطاعات: {e}")
             return []
@@ -1066,17 +1053,12 @@ class ReportManager:
                 query += " ORDER BY meter_type, name"
                 cursor.execute(query, params)
                 boxes = cursor.fetchall()
-                result = []
-                for box in boxes:
-                    box_dict = dict(box)
-                    if box_dict['sector_id']:
-                        cursor.execute("SELECT name FROM sectors WHERE id = %s", (box_dict['sector_id'],))
-                        sector = cursor.fetchone()
-                        box_dict['sector_name'] = sector['name'] if sector else ''
-                    else:
-                        box_dict['sector_name'] = ''
-                    result.append(box_dict)
-                return result
+            result = []
+            for box in boxes:
+                box_dict = dict(box)
+                box_dict['sector_name'] = reference_data.sector_name(box_dict['sector_id'])
+                result.append(box_dict)
+            return result
         except Exception as e:
             logger.error(f"خطأ في جلب العلب: {e}")
             return []
@@ -1085,7 +1067,7 @@ class ReportManager:
         return ['normal', 'free', 'vip', 'free_vip', 'mobile_accountant']
 
     def get_meter_types(self) -> List[str]:
-        return ['مولدة', 'علبة توزيع', 'رئيسية', 'زبون']
+        return reference_data.meter_types()
 
     # ============== دوال التصدير (بدون عمود الرصيد الجديد) ==============
 
@@ -1860,14 +1842,8 @@ class ReportManager:
     def get_accountants_list(self) -> List[Dict[str, Any]]:
         """جلب قائمة المحاسبين (المستخدمين النشطين)"""
         try:
-            with db.get_cursor() as cursor:
-                cursor.execute("""
-                    SELECT id, full_name, username
-                    FROM users
-                    WHERE is_active = TRUE
-                    ORDER BY full_name
-                """)
-                return [dict(row) for row in cursor.fetchall()]
+            return [{'id': u['id'], 'full_name': u['full_name'], 'username': u['username']}
+                    for u in reference_data.users()]
         except Exception as e:
             logger.error(f"خطأ في جلب قائمة المحاسبين: {e}")
             return []
@@ -2105,146 +2081,217 @@ class ReportManager:
         }
 
         try:
-            # ====== 1. لنا وعلينا ======
-            try:
-                if include_visa_effect:
-                    before = self._get_we_vs_them_with_visa_adjustment(start_date, end_date, after=False)
-                    after = self._get_we_vs_them_with_visa_adjustment(start_date, end_date, after=True)
-                    result['sections']['we_vs_them'] = {
-                        'title': 'لنا وعلينا (قبل وبعد التأشيرات)',
-                        'before': before,
-                        'after': after,
-                    }
-                else:
-                    from modules.customers import CustomerManager
-                    cm = CustomerManager()
-                    balance_stats = cm.get_customer_balance_by_sector()
-                    result['sections']['we_vs_them'] = {
-                        'title': 'لنا وعلينا حسب القطاع',
-                        'sectors': balance_stats.get('sectors', []),
-                        'totals': {
-                            'total_lana_amount': balance_stats.get('total_lana_amount', 0),
-                            'total_alayna_amount': balance_stats.get('total_alayna_amount', 0),
-                            'total_lana_count': balance_stats.get('total_lana_count', 0),
-                            'total_alayna_count': balance_stats.get('total_alayna_count', 0),
-                        }
-                    }
-            except Exception as e:
-                logger.error(f"فشل جلب بيانات لنا وعلينا: {e}")
-                result['sections']['we_vs_them'] = {'sectors': [], 'totals': {}}
-
-            # ====== 2. هدر العلب ======
-            try:
-                waste_query = """
-                    SELECT
-                        s.id as sector_id,
-                        s.name as sector_name,
-                        COALESCE(SUM(CASE WHEN c.meter_type = 'زبون' THEN c.withdrawal_amount ELSE 0 END), 0) as customers_withdrawal,
-                        COALESCE(SUM(CASE WHEN c.meter_type = 'رئيسية' THEN c.withdrawal_amount ELSE 0 END), 0) as main_meters_withdrawal
-                    FROM sectors s
-                    LEFT JOIN customers c ON s.id = c.sector_id AND c.is_active = TRUE
-                    WHERE s.is_active = TRUE
-                    GROUP BY s.id, s.name
-                    ORDER BY s.name
-                """
-                with db.get_cursor() as cursor:
-                    cursor.execute(waste_query)
-                    rows = cursor.fetchall()
-                    waste_by_sector = []
-                    total_customers_withdrawal = 0
-                    total_main_withdrawal = 0
-
-                    for row in rows:
-                        cust_w = float(row['customers_withdrawal'] or 0)
-                        main_w = float(row['main_meters_withdrawal'] or 0)
-                        waste = main_w - cust_w
-                        waste_pct = (waste / main_w * 100) if main_w > 0 else 0
-
-                        waste_by_sector.append({
-                            'sector_id': row['sector_id'],
-                            'sector_name': row['sector_name'],
-                            'customers_withdrawal': cust_w,
-                            'main_meters_withdrawal': main_w,
-                            'waste': waste,
-                            'waste_percentage': waste_pct,
-                        })
-
-                        total_customers_withdrawal += cust_w
-                        total_main_withdrawal += main_w
+            # الأقسام مستقلة: تُنفذ بالتوازي كل منها على اتصال منفصل
+            sections = {
+                'waste': self._cycle_waste_section,
+                'free_balances': self._cycle_free_balances_section,
+                'invoices': lambda: self._cycle_invoices_section(start_date, end_date),
+            }
+            if include_visa_effect:
+                sections['we_vs_them_before'] = lambda: self._get_we_vs_them_with_visa_adjustment(start_date, end_date, after=False)
+                sections['we_vs_them_after'] = lambda: self._get_we_vs_them_with_visa_adjustment(start_date, end_date, after=True)
+            else:
+                sections['we_vs_them'] = self._cycle_we_vs_them_section
 
-                    result['sections']['waste'] = {
-                        'title': 'هدر العلب (الفرق بين سحب الرئيسيات والزبائن)',
-                        'sectors': waste_by_sector,
-                        'totals': {
-                            'total_customers_withdrawal': total_customers_withdrawal,
-                            'total_main_withdrawal': total_main_withdrawal,
-                            'total_waste': total_main_withdrawal - total_customers_withdrawal,
-                        }
-                    }
-            except Exception as e:
-                logger.error(f"فشل جلب بيانات الهدر: {e}")
-                result['sections']['waste'] = {'sectors': [], 'totals': {}}
+            values, timings, errors = self._run_sections(sections)
 
-            # ====== 3. أرصدة المجاني ======
-            try:
-                free_query = """
-                    SELECT
-                        COUNT(*) as free_customers_count,
-                        COALESCE(SUM(current_balance), 0) as total_free_remaining,
-                        COALESCE(SUM(withdrawal_amount), 0) as total_free_withdrawal
-                    FROM customers
-                    WHERE financial_category IN ('free', 'free_vip')
-                    AND is_active = TRUE
-                """
-                with db.get_cursor() as cursor:
-                    cursor.execute(free_query)
-                    free_row = cursor.fetchone()
-                    result['sections']['free_balances'] = {
-                        'title': 'أرصدة الزبائن المجانيين',
-                        'count': free_row['free_customers_count'] if free_row else 0,
-                        'total_free_remaining': float(free_row['total_free_remaining']) if free_row else 0,
-                        'total_free_withdrawal': float(free_row['total_free_withdrawal']) if free_row else 0,
+            if include_visa_effect:
+                failed = [errors.pop(name) for name in ('we_vs_them_before', 'we_vs_them_after') if name in errors]
+                if failed:
+                    errors['we_vs_them'] = failed[0]
+                else:
+                    values['we_vs_them'] = {
+                        'title': 'لنا وعلينا (قبل وبعد التأشيرات)',
+                        'before': values['we_vs_them_before'],
+                        'after': values['we_vs_them_after'],
                     }
-            except Exception as e:
-                logger.error(f"فشل جلب أرصدة المجاني: {e}")
-                result['sections']['free_balances'] = {'count': 0, 'total_free_remaining': 0, 'total_free_withdrawal': 0}
 
-            # ====== 4. إحصائيات الفواتير ======
-            try:
-                invoice_query = """
-                    SELECT
-                        COUNT(*) as invoice_count,
-                        COALESCE(SUM(kilowatt_amount), 0) as total_kilowatts,
-                        COALESCE(SUM(free_kilowatt), 0) as total_free_kilowatts,
-                        COALESCE(SUM(discount), 0) as total_discount,
-                        COALESCE(SUM(total_amount), 0) as total_amount
-                    FROM invoices
-                    WHERE payment_date BETWEEN %s AND %s
-                    AND status = 'active'
-                """
-                with db.get_cursor() as cursor:
-                    cursor.execute(invoice_query, (start_date, end_date))
-                    inv_row = cursor.fetchone()
-                    result['sections']['invoices'] = {
-                        'title': f'الكيليات المقطوعة من {start_date} إلى {end_date}',
-                        'start_date': start_date,
-                        'end_date': end_date,
-                        'invoice_count': inv_row['invoice_count'] if inv_row else 0,
-                        'total_kilowatts': float(inv_row['total_kilowatts']) if inv_row else 0,
-                        'total_free_kilowatts': float(inv_row['total_free_kilowatts']) if inv_row else 0,
-                        'total_discount': float(inv_row['total_discount']) if inv_row else 0,
-                        'total_amount': float(inv_row['total_amount']) if inv_row else 0,
-                    }
-            except Exception as e:
-                logger.error(f"فشل جلب إحصائيات الفواتير: {e}")
-                result['sections']['invoices'] = {}
+            # الأقسام الفاشلة تُعرض فارغة كما كانت، مع ذكرها في failed_sections
+            fallbacks = {
+                'we_vs_them': {'sectors': [], 'totals': {}},
+                'waste': {'sectors': [], 'totals': {}},
+                'free_balances': {'count': 0, 'total_free_remaining': 0, 'total_free_withdrawal': 0},
+                'invoices': {},
+            }
+            for name, fallback in fallbacks.items():
+                result['sections'][name] = values[name] if name not in errors else fallback
 
+            for name, error in errors.items():
+                logger.error(f"فشل قسم {name} في تقرير جرد الدورة: {error}")
+            result['section_timings_ms'] = timings
+            result['failed_sections'] = {name: str(error) for name, error in errors.items()}
             return result
 
         except Exception as e:
             logger.error(f"خطأ عام في تقرير جرد الدورة: {e}", exc_info=True)
             return {'error': str(e)}
 
+    def _run_sections(self, sections: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, float], Dict[str, Exception]]:
+        """
+        تنفيذ أقسام تقرير مستقلة بالتوازي: الخيط المستدعي ينفذ الأقسام على اتصاله
+        (وحدة العمل الحالية)، وخيوط مساعدة بقدر الاتصالات الحرة في المسار فقط تسحب
+        من الأقسام نفسها، فلا ينتظر التقرير اتصالات يحجزها تقرير آخر. بلا اتصالات
+        حرة تُنفذ الأقسام بالتتابع.
+        يُرجع (النتائج، الأزمنة بالملي ثانية، الأخطاء) - فشل قسم لا يوقف بقية الأقسام.
+        """
+        import threading
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        from config.settings import PERFORMANCE_SETTINGS
+
+        # الخيوط المساعدة لا ترث وحدة العمل الحالية (كل قسم يفتح وحدته)، بل مسارها فقط
+        lane = db.current_lane()
+        pending = iter(list(sections.items()))
+        lock = threading.Lock()
+        results = {}
+
+        def drain():
+            while True:
+                with lock:
+                    name, fn = next(pending, (None, None))
+                if name is None:
+                    return
+                started = time.perf_counter()
+                try:
+                    with db.lane(lane):
+                        results[name] = (fn(), None, (time.perf_counter() - started) * 1000)
+                except Exception as e:
+                    results[name] = (None, e, (time.perf_counter() - started) * 1000)
+
+        workers = PERFORMANCE_SETTINGS.get('report_section_workers', 4)
+        helpers = max(0, min(len(sections) - 1, workers - 1, db.free_connections(lane)))
+        if helpers:
+            with ThreadPoolExecutor(max_workers=helpers, thread_name_prefix='report-section') as executor:
+                for _ in range(helpers):
+                    executor.submit(drain)
+                drain()
+        else:
+            drain()
+
+        values, timings, errors = {}, {}, {}
+        for name in sections:
+            value, error, elapsed = results[name]
+            timings[name] = round(elapsed, 1)
+            if error is not None:
+                errors[name] = error
+            else:
+                values[name] = value
+        logger.debug(f"أزمنة الأقسام (ms): {timings}")
+        return values, timings, errors
+
+    def _cycle_we_vs_them_section(self) -> Dict[str, Any]:
+        """لنا وعلينا حسب القطاع (الرصيد الحالي)"""
+        from modules.customers import CustomerManager
+        balance_stats = CustomerManager().get_customer_balance_by_sector()
+        return {
+            'title': 'لنا وعلينا حسب القطاع',
+            'sectors': balance_stats.get('sectors', []),
+            'totals': {
+                'total_lana_amount': balance_stats.get('total_lana_amount', 0),
+                'total_alayna_amount': balance_stats.get('total_alayna_amount', 0),
+                'total_lana_count': balance_stats.get('total_lana_count', 0),
+                'total_alayna_count': balance_stats.get('total_alayna_count', 0),
+            }
+        }
+
+    def _cycle_waste_section(self) -> Dict[str, Any]:
+        """هدر العلب: الفرق بين سحب الرئيسيات وسحب الزبائن لكل قطاع"""
+        waste_query = """
+            SELECT
+                s.id as sector_id,
+                s.name as sector_name,
+                COALESCE(SUM(CASE WHEN c.meter_type = 'زبون' THEN c.withdrawal_amount ELSE 0 END), 0) as customers_withdrawal,
+                COALESCE(SUM(CASE WHEN c.meter_type = 'رئيسية' THEN c.withdrawal_amount ELSE 0 END), 0) as main_meters_withdrawal
+            FROM sectors s
+            LEFT JOIN customers c ON s.id = c.sector_id AND c.is_active = TRUE
+            WHERE s.is_active = TRUE
+            GROUP BY s.id, s.name
+            ORDER BY s.name
+        """
+        with db.get_cursor() as cursor:
+            cursor.execute(waste_query)
+            rows = cursor.fetchall()
+
+        waste_by_sector = []
+        total_customers_withdrawal = 0
+        total_main_withdrawal = 0
+
+        for row in rows:
+            cust_w = float(row['customers_withdrawal'] or 0)
+            main_w = float(row['main_meters_withdrawal'] or 0)
+            waste = main_w - cust_w
+            waste_pct = (waste / main_w * 100) if main_w > 0 else 0
+
+            waste_by_sector.append({
+                'sector_id': row['sector_id'],
+                'sector_name': row['sector_name'],
+                'customers_withdrawal': cust_w,
+                'main_meters_withdrawal': main_w,
+                'waste': waste,
+                'waste_percentage': waste_pct,
+            })
+
+            total_customers_withdrawal += cust_w
+            total_main_withdrawal += main_w
+
+        return {
+            'title': 'هدر العلب (الفرق بين سحب الرئيسيات والزبائن)',
+            'sectors': waste_by_sector,
+            'totals': {
+                'total_customers_withdrawal': total_customers_withdrawal,
+                'total_main_withdrawal': total_main_withdrawal,
+                'total_waste': total_main_withdrawal - total_customers_withdrawal,
+            }
+        }
+
+    def _cycle_free_balances_section(self) -> Dict[str, Any]:
+        """أرصدة الزبائن المجانيين"""
+        free_query = """
+            SELECT
+                COUNT(*) as free_customers_count,
+                COALESCE(SUM(current_balance), 0) as total_free_remaining,
+                COALESCE(SUM(withdrawal_amount), 0) as total_free_withdrawal
+            FROM customers
+            WHERE financial_category IN ('free', 'free_vip')
+            AND is_active = TRUE
+        """
+        with db.get_cursor() as cursor:
+            cursor.execute(free_query)
+            free_row = cursor.fetchone()
+        return {
+            'title': 'أرصدة الزبائن المجانيين',
+            'count': free_row['free_customers_count'] if free_row else 0,
+            'total_free_remaining': float(free_row['total_free_remaining']) if free_row else 0,
+            'total_free_withdrawal': float(free_row['total_free_withdrawal']) if free_row else 0,
+        }
+
+    def _cycle_invoices_section(self, start_date: str, end_date: str) -> Dict[str, Any]:
+        """إحصائيات الفواتير (الكيليات المقطوعة) خلال الفترة"""
+        invoice_query = """
+            SELECT
+                COUNT(*) as invoice_count,
+                COALESCE(SUM(kilowatt_amount), 0) as total_kilowatts,
+                COALESCE(SUM(free_kilowatt), 0) as total_free_kilowatts,
+                COALESCE(SUM(discount), 0) as total_discount,
+                COALESCE(SUM(total_amount), 0) as total_amount
+            FROM invoices
+            WHERE payment_date BETWEEN %s AND %s
+            AND status = 'active'
+        """
+        with db.get_cursor() as cursor:
+            cursor.execute(invoice_query, (start_date, end_date))
+            inv_row = cursor.fetchone()
+        return {
+            'title': f'الكيليات المقطوعة من {start_date} إلى {end_date}',
+            'start_date': start_date,
+            'end_date': end_date,
+            'invoice_count': inv_row['invoice_count'] if inv_row else 0,
+            'total_kilowatts': float(inv_row['total_kilowatts']) if inv_row else 0,
+            'total_free_kilowatts': float(inv_row['total_free_kilowatts']) if inv_row else 0,
+            'total_discount': float(inv_row['total_discount']) if inv_row else 0,
+            'total_amount': float(inv_row['total_amount']) if inv_row else 0,
+        }
+
 
     def export_cycle_inventory_to_excel(self, report_data: Dict[str, Any], filename: str = None) -> Tuple[bool, str]:
         """
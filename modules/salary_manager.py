@@ -5,9 +5,11 @@ from datetime import date, datetime
 from typing import Dict, List, Optional, Union
 from database.connection import db
 from modules.daily_cash import DailyCashManager   # استيراد مدير الصندوق اليومي
+from utils.tracing import traced_class
 
 logger = logging.getLogger(__name__)
 
+@traced_class
 class SalaryManager:
     """مدير رواتب الموظفين وسلفهم مع التسجيل التلقائي في دفتر اليومية"""
 
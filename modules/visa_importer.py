@@ -4,25 +4,27 @@ from tkinter import ttk, messagebox, filedialog, simpledialog
 import logging
 from typing import Dict, List, Optional, Tuple, Any
 from database.connection import db
+from database.reference_data import reference_data
 import re
 from datetime import datetime, timedelta
+from utils.tracing import traced_class
+from ui.virtual_grid import VirtualGrid
 
 logger = logging.getLogger(__name__)
 
 class ExcelLikeTable(tk.Frame):
-    """جدول يشبه Excel للتعديل المباشر مع تحسينات كبيرة"""
-    
+    """جدول يشبه Excel للتعديل المباشر فوق VirtualGrid (لا يُنشأ في الشجرة إلا الصفوف الظاهرة)"""
+
+    RECENT_HOURS = 96   # الصفوف المعدلة خلال هذه المدة تُلوَّن كمعدلة حديثاً
+
     def __init__(self, parent, columns: List[str], data: List[Dict]):
         super().__init__(parent)
         self.columns = columns
-        self.data = data
-        self.data = data          # البيانات المعروضة حالياً
-        self.all_data = data.copy()  # نسخة احتياطية من جميع البيانات
-
-        self.original_data = data.copy()
-        self.cells = {}  # لحفظ مراجع الصفوف
+        self.all_data = data          # جميع الصفوف - التعديلات تُكتب فيها مباشرة
+        self.data = data              # الصفوف المعروضة حالياً (بعد البحث)
+        self.original_values: Dict[int, Dict[str, Any]] = {}  # رقم الصف -> القيم قبل أول تعديل
         self.entry = None  # حقل التعديل العائم
-        self.current_cell = None  # الخلية الحالية (item, column)
+        self.current_cell = None  # الخلية الحالية (رقم الصف, '#n')
         self.last_edit_value = None  # آخر قيمة قبل التعديل
         self.tooltip = None
         self.tooltip_text = None
@@ -31,140 +33,50 @@ class ExcelLikeTable(tk.Frame):
         self.setup_ui()
         
     def setup_ui(self):
-        """إعداد واجهة الجدول مع تحسينات"""
-        # إطار التمرير
-        container = ttk.Frame(self)
-        container.pack(fill=tk.BOTH, expand=True)
-        
-        # شريط التمرير العمودي
-        y_scrollbar = ttk.Scrollbar(container, orient=tk.VERTICAL)
-        y_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        
-        # شريط التمرير الأفقي
-        x_scrollbar = ttk.Scrollbar(container, orient=tk.HORIZONTAL)
-        x_scrollbar.pack(side=tk.BOTTOM, fill=tk.X)
-        
-        # إنشاء الجدول
-        self.tree = ttk.Treeview(
-            container,
-            columns=self.columns,
-            show='headings',
-            yscrollcommand=y_scrollbar.set,
-            xscrollcommand=x_scrollbar.set,
-            height=25,
-            selectmode='browse'
-        )
+        """إعداد واجهة الجدول"""
+        self.view_grid = VirtualGrid(self, self.columns, height=25, stripe_tags=('evenbox', 'oddbox'))
+        self.view_grid.pack(fill=tk.BOTH, expand=True)
+        self.tree = self.view_grid.tree
         
         # تكوين الأعمدة
         for col in self.columns:
             self.tree.heading(col, text=col)
             self.tree.column(col, width=120, minwidth=80)
         
-        # إضافة البيانات مع الحفاظ على الترتيب الصحيح
-        self.populate_data()
-        
-        # ربط أحداث لوحة المفاتيح والفأرة
-        self.bind_events()
-        
-        self.tree.pack(fill=tk.BOTH, expand=True)
-        y_scrollbar.config(command=self.tree.yview)
-        x_scrollbar.config(command=self.tree.xview)
-        
-        # تلوين الصفوف بالتناوب
-        #self.tree.tag_configure('evenbox', background='#e8f5e9')  # أخضر فاتح
-        #self.tree.tag_configure('oddbox', background='#f1f8e9')   # أخضر أفتح
-        self.tree.tag_configure('selected', background='#e3f2fd')
-        self.tree.tag_configure('search_result', background='#fff9c4')
-        self.tree.tag_configure('modified', background='#ffeaa7')
-        self.tree.tag_configure('separator', background='#e0e0e0')
-        self.tree.tag_configure('recently_modified', background='#b3e5fc')   # <-- أضف هذا
-        self.tree.tag_configure('test', background='red')
-        self.apply_row_colors()
-
-        # في setup_ui، بعد تعريف التاغات
         self.tree.tag_configure('evenbox', background='#e8f5e9')  # أخضر فاتح
         self.tree.tag_configure('oddbox', background='#f1f8e9')   # أخضر أفتح
-        self.tree.tag_configure('selected', background='#e3f2fd')
         self.tree.tag_configure('search_result', background='#fff9c4')
         self.tree.tag_configure('modified', background='#FFA07A')      # سمون فاتح
-        self.tree.tag_configure('separator', background='#e0e0e0')
-        self.tree.tag_configure('recently_modified', background='#FFB6C1')  # وردي فاتح        
+        self.tree.tag_configure('recently_modified', background='#FFB6C1')  # وردي فاتح
+        
+        # إضافة البيانات
+        self.populate_data()
+        
+        # ربط أحداث لوحة المفاتيح والفأرة
+        self.bind_events()
         
         # التركيز على الجدول
         self.tree.focus_set()
         
     def populate_data(self):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        self.cells = {}
-        item_id_counter = 0
-        now = datetime.now()  # استخدم التوقيت المحلي
-        twenty_four_hours_ago = now - timedelta(hours=96)
-
-        for idx, row in enumerate(self.data):
-            values = [row.get(col, '') for col in self.columns]
-            item_id = self.tree.insert('', tk.END, values=values, tags=(f'row_{item_id_counter}',))
-
-            # الحصول على updated_at من الصف مباشرة
+        """تحميل الصفوف في مخزن الأعمدة مع وسم المعدلة حديثاً"""
+        threshold = datetime.now() - timedelta(hours=self.RECENT_HOURS)
+        tags = []
+        for row in self.all_data:
             updated_at = row.get('updated_at')
             if updated_at and isinstance(updated_at, str):
                 try:
                     updated_at = datetime.fromisoformat(updated_at.replace('Z', '+00:00'))
-                except:
+                except ValueError:
                     updated_at = None
+            is_recent = isinstance(updated_at, datetime) and updated_at > threshold
+            tags.append(('recently_modified',) if is_recent else ())
 
-            is_recent = False
-            if updated_at and isinstance(updated_at, datetime):
-                if updated_at > twenty_four_hours_ago:
-                    is_recent = True
-
-            # طباعة للتصحيح (يمكن إزالتها لاحقاً)
-            print(f"الصف {idx}: updated_at = {updated_at}, is_recent = {is_recent}")
-
-            self.cells[item_id] = {
-                'row_data': row,
-                'original_row': row.copy(),
-                'data_index': idx,
-                'box': row.get('علبة', ''),
-                'serial': row.get('مسلسل', ''),
-                'updated_at': updated_at,
-                'is_recent': is_recent,
-                'is_modified': False
-            }
-            item_id_counter += 1
-
-        self.apply_row_colors()
-            
+        self.view_grid.set_rows(([row.get(col, '') for col in self.columns] for row in self.all_data), tags)
 
     def apply_row_colors(self):
-        for idx, item in enumerate(self.tree.get_children()):
-            if 'separator' in self.tree.item(item, 'tags'):
-                continue
-            current_tags = list(self.tree.item(item, 'tags'))
-            # إزالة جميع التاجات التي نريد إعادة تعيينها
-            for tag in ['evenbox', 'oddbox', 'search_result', 'modified', 'recently_modified']:
-                if tag in current_tags:
-                    current_tags.remove(tag)
-
-            # تحديد حالة الصف
-            is_recent = item in self.cells and self.cells[item].get('is_recent', False)
-            is_modified = item in self.cells and self.cells[item].get('is_modified', False)
-
-            # إضافة التاجات حسب الأولوية: recently_modified > modified > تناوب عادي
-            if is_recent:
-                current_tags.append('recently_modified')
-            elif is_modified:
-                current_tags.append('modified')
-            else:
-                # تلوين متناوب عادي
-                if idx % 2 == 0:
-                    current_tags.append('evenbox')
-                else:
-                    current_tags.append('oddbox')
-
-            self.tree.item(item, tags=tuple(current_tags))
-            
+        """إعادة رسم الصفوف الظاهرة (التلوين المتناوب يُحسب عند الرسم)"""
+        self.view_grid.refresh()
                 
     def bind_events(self):
         """ربط أحداث لوحة المفاتيح والفأرة"""
@@ -186,15 +98,7 @@ class ExcelLikeTable(tk.Frame):
         self.tree.bind('<Tab>', self.on_tab_key)
         self.tree.bind('<Shift-Tab>', self.on_shift_tab)
         
-        # أحداث التركيز
-        self.tree.bind('<FocusIn>', lambda e: self.tree.selection_set(self.tree.focus()))
-        # إزالة إخفاء الـ Entry عند فقدان التركيز للشجرة (هذا يسبب اختفاء الحقل فور إنشائه)
-        # السابق:
-        # self.tree.bind('<FocusOut>', lambda e: self.hide_entry())
-
-        # الجديد: لا تفعل شيئًا عند فقدان تركيز الشجرة
-        # (نترك حفظ/إخفاء الحقل لربط حقل الإدخال نفسه عبر entry.bind('<FocusOut>', ...))
-
+        # حفظ/إخفاء حقل التعديل يتم عبر entry.bind('<FocusOut>', ...) وليس عند فقدان تركيز الشجرة
         
         # تحديد مباشر عند الكتابة
         self.tree.bind('<KeyPress>', self.on_direct_edit)
@@ -206,31 +110,27 @@ class ExcelLikeTable(tk.Frame):
         """عند النقر على خلية"""
         region = self.tree.identify_region(event.x, event.y)
         if region == 'cell':
-            item = self.tree.identify_row(event.y)
+            row = self.view_grid.row_at(event.y)
             column = self.tree.identify_column(event.x)
-            if item and item not in ['', None]:
-                # تحديث تلوين الصف المحدد
-                self.update_selection(item)
-                self.current_cell = (item, column)
-                # بدء التعديل مباشرة إذا بدأ المستخدم بالكتابة
+            if row is not None:
+                self.update_selection(row)
+                self.current_cell = (row, column)
                 self.tree.focus_set()
     
-    def update_selection(self, item):
-        """تحديث تلوين الصف المحدد"""
-        # إعادة تعيين جميع الصفوف
-        for i in self.tree.get_children():
-            if i == item:
-                continue
-            current_tags = list(self.tree.item(i, 'tags'))
-            if 'selected' in current_tags:
-                current_tags.remove('selected')
-                self.tree.item(i, tags=tuple(current_tags))
-        
-        # تلوين الصف المحدد
-        current_tags = list(self.tree.item(item, 'tags'))
-        if 'selected' not in current_tags:
-            current_tags.append('selected')
-            self.tree.item(item, tags=tuple(current_tags))
+    def update_selection(self, row):
+        """تحديد الصف والتمرير إليه"""
+        self.view_grid.select(row)
+
+    def select_row(self, row):
+        """تحديد صف من خارج الجدول (نتائج البحث) مع الاحتفاظ بالعمود الحالي"""
+        column = self.current_cell[1] if self.current_cell else '#1'
+        self.update_selection(row)
+        self.current_cell = (row, column)
+
+    def mark_search_results(self, rows):
+        """تلوين نتائج البحث"""
+        for row in rows:
+            self.view_grid.set_tags(row, ('search_result',))
     
     def on_cell_double_click(self, event):
         """بدء التعديل عند النقر المزدوج"""
@@ -240,43 +140,29 @@ class ExcelLikeTable(tk.Frame):
     def start_edit_cell(self, event=None, direct_edit=False, char=None):
         """بدء تعديل الخلية الحالية"""
         if not self.current_cell:
-            item = self.tree.focus()
-            if not item:
-                # محاولة الحصول على أول عنصر
-                children = self.tree.get_children()
-                if children:
-                    for child in children:
-                        # تخطي الفواصل
-                        if 'separator' not in self.tree.item(child, 'tags'):
-                            item = child
-                            break
-            
-            column = '#1'
-            if item:
-                self.current_cell = (item, column)
-            else:
+            row = self.view_grid.selected_row
+            if row is None and self.view_grid.view:
+                row = self.view_grid.view[0]
+            if row is None:
                 return 'break'
+            self.current_cell = (row, '#1')
         
-        item, column = self.current_cell
-        if not item or not column:
+        row, column = self.current_cell
+        if row is None or not column:
             return 'break'
         
-        # تخطي الفواصل
-        if 'separator' in self.tree.item(item, 'tags'):
-            return 'break'
-        
-        # الحصول على إحداثيات الخلية
-        bbox = self.tree.bbox(item, column)
+        # الحصول على إحداثيات الخلية (بعد التمرير إليها إن لم تكن ظاهرة)
+        self.view_grid.see(row)
+        bbox = self.view_grid.cell_bbox(row, column)
         if not bbox:
             return 'break'
         
         # الحصول على قيمة الخلية الحالية
         col_index = int(column.replace('#', '')) - 1
-        current_values = self.tree.item(item, 'values')
-        if col_index >= len(current_values):
+        if col_index >= len(self.columns):
             return 'break'
         
-        current_value = current_values[col_index]
+        current_value = self.view_grid.get_value(row, col_index)
         self.last_edit_value = current_value
         
         # إخفاء أي حقل تعديل سابق
@@ -303,105 +189,78 @@ class ExcelLikeTable(tk.Frame):
         self.entry.focus_set()
         
         # ربط الأحداث
-        self.entry.bind('<Return>', lambda e: self.save_edit_and_move_down(item, column))
-        self.entry.bind('<Escape>', lambda e: self.cancel_edit(item, column))
-        self.entry.bind('<Tab>', lambda e: self.save_edit_and_move_right(item, column))
-        self.entry.bind('<Shift-Tab>', lambda e: self.save_edit_and_move_left(item, column))
-        self.entry.bind('<Up>', lambda e: self.save_edit_and_move_up(item, column))
-        self.entry.bind('<Down>', lambda e: self.save_edit_and_move_down(item, column))
-        self.entry.bind('<Left>', lambda e: self.save_edit_and_move_left(item, column))
-        self.entry.bind('<Right>', lambda e: self.save_edit_and_move_right(item, column))
+        self.entry.bind('<Return>', lambda e: self.save_edit_and_move_down(row, column))
+        self.entry.bind('<Escape>', lambda e: self.cancel_edit(row, column))
+        self.entry.bind('<Tab>', lambda e: self.save_edit_and_move_right(row, column))
+        self.entry.bind('<Shift-Tab>', lambda e: self.save_edit_and_move_left(row, column))
+        self.entry.bind('<Up>', lambda e: self.save_edit_and_move_up(row, column))
+        self.entry.bind('<Down>', lambda e: self.save_edit_and_move_down(row, column))
+        self.entry.bind('<Left>', lambda e: self.save_edit_and_move_left(row, column))
+        self.entry.bind('<Right>', lambda e: self.save_edit_and_move_right(row, column))
         
         # حفظ عند فقدان التركيز
-        self.entry.bind('<FocusOut>', lambda e: self.save_edit(item, column))
+        self.entry.bind('<FocusOut>', lambda e: self.save_edit(row, column))
         
         return 'break'
+
+    def set_cell(self, row, col_index, value):
+        """تعديل خلية: في الصف نفسه وفي مخزن الجدول، مع حفظ القيمة الأصلية عند أول تعديل"""
+        col_name = self.columns[col_index]
+        row_data = self.all_data[row]
+        self.original_values.setdefault(row, {}).setdefault(col_name, row_data.get(col_name, ''))
+        row_data[col_name] = value
+        self.view_grid.set_value(row, col_index, value)
+        self.mark_row_as_modified(row)
     
-    def save_edit(self, item, column, event=None):
+    def save_edit(self, row, column, event=None):
         """حفظ التعديل وإخفاء حقل الإدخال"""
         if not self.entry:
             return
         
-        # الحصول على القيمة الجديدة
         new_value = self.entry.get()
-        
-        # الحصول على الفهرس
         col_index = int(column.replace('#', '')) - 1
-        
-        # تحديث القيمة في الجدول
-        values = list(self.tree.item(item, 'values'))
-        old_value = values[col_index]
-        values[col_index] = new_value
-        self.tree.item(item, values=values)
-        
-        # تحديث البيانات في cells
-        if item in self.cells:
-            col_name = self.columns[col_index]
-            self.cells[item]['row_data'][col_name] = new_value
-        
-        # تلوين الصف المعدل
-        self.mark_row_as_modified(item)
-        self.apply_row_colors()
+        if str(new_value) != str(self.view_grid.get_value(row, col_index)):
+            self.set_cell(row, col_index, new_value)
         
         # إخفاء حقل التعديل
         self.hide_entry()
         
         # إعادة التركيز على الجدول
         self.tree.focus_set()
-        self.tree.selection_set(item)
+        self.update_selection(row)
         
         return 'break'
         
-    def mark_row_as_modified(self, item):
-        """تحديد الصف كمعدل وتحديث is_recent إذا لزم الأمر"""
-        if item in self.cells:
-            current_tags = list(self.tree.item(item, 'tags'))
-            if 'modified' not in current_tags:
-                current_tags.append('modified')
-                self.tree.item(item, tags=tuple(current_tags))
-            
-            # تحديث is_modified في الخلايا
-            self.cells[item]['is_modified'] = True
-            # تحديث is_recent (أي تعديل جديد يعتبر حديثاً)
-            self.cells[item]['is_recent'] = True
-            self.cells[item]['updated_at'] = datetime.now()   # نضع الوقت الحالي افتراضياً
+    def mark_row_as_modified(self, row):
+        """تلوين الصف المعدل (أي تعديل جديد يعتبر حديثاً)"""
+        self.view_grid.set_tags(row, ('recently_modified',))
     
-    def save_edit_and_move_down(self, item, column):
+    def save_edit_and_move_down(self, row, column):
         """حفظ التعديل والانتقال للأسفل"""
-        self.save_edit(item, column)
+        self.save_edit(row, column)
         self.move_down(None)
         return 'break'
     
-    def save_edit_and_move_up(self, item, column):
+    def save_edit_and_move_up(self, row, column):
         """حفظ التعديل والانتقال للأعلى"""
-        self.save_edit(item, column)
+        self.save_edit(row, column)
         self.move_up(None)
         return 'break'
     
-    def save_edit_and_move_right(self, item, column):
+    def save_edit_and_move_right(self, row, column):
         """حفظ التعديل والانتقال لليمين"""
-        self.save_edit(item, column)
+        self.save_edit(row, column)
         self.move_right(None)
         return 'break'
     
-    def save_edit_and_move_left(self, item, column):
+    def save_edit_and_move_left(self, row, column):
         """حفظ التعديل والانتقال لليسار"""
-        self.save_edit(item, column)
+        self.save_edit(row, column)
         self.move_left(None)
         return 'break'
     
-    def cancel_edit(self, item, column):
-        """إلغاء التعديل"""
-        if self.entry and self.last_edit_value:
-            col_index = int(column.replace('#', '')) - 1
-            values = list(self.tree.item(item, 'values'))
-            values[col_index] = self.last_edit_value
-            self.tree.item(item, values=values)
-            
-            if item in self.cells:
-                col_name = self.columns[col_index]
-                self.cells[item]['row_data'][col_name] = self.last_edit_value
-        
+    def cancel_edit(self, row, column):
+        """إلغاء التعديل (القيمة لم تُكتب بعد في الجدول)"""
         self.hide_entry()
         self.tree.focus_set()
         return 'break'
@@ -409,25 +268,17 @@ class ExcelLikeTable(tk.Frame):
     def hide_entry(self):
         """إخفاء حقل التعديل"""
         if self.entry:
-            self.entry.destroy()
+            entry = self.entry
             self.entry = None
             self.last_edit_value = None
+            entry.destroy()
     
     def clear_cell(self, event):
         """مسح محتوى الخلية"""
         if self.current_cell:
-            item, column = self.current_cell
+            row, column = self.current_cell
             col_index = int(column.replace('#', '')) - 1
-            
-            values = list(self.tree.item(item, 'values'))
-            values[col_index] = ''
-            self.tree.item(item, values=values)
-            
-            if item in self.cells:
-                col_name = self.columns[col_index]
-                self.cells[item]['row_data'][col_name] = ''
-            
-            self.mark_row_as_modified(item)
+            self.set_cell(row, col_index, '')
         
         return 'break'
     
@@ -465,308 +316,164 @@ class ExcelLikeTable(tk.Frame):
         """معالجة مفتاح Enter"""
         if self.entry:
             # إذا كان هناك حقل تعديل، حفظ والانتقال للأسفل
-            item, column = self.current_cell
-            self.save_edit_and_move_down(item, column)
+            row, column = self.current_cell
+            self.save_edit_and_move_down(row, column)
         else:
             # إذا لم يكن هناك حقل تعديل، بدء التعديل
             self.start_edit_cell()
         
         return 'break'
+
+    def _move_row(self, delta, column=None, wrap=False):
+        row = self.view_grid.move_selection(delta, wrap=wrap)
+        if row is not None:
+            if column is None:
+                column = self.current_cell[1] if self.current_cell else '#1'
+            self.current_cell = (row, column)
+        return row
     
     def move_up(self, event):
         """الانتقال للخلية الأعلى"""
         self.hide_entry()
-        current = self.tree.focus()
-        if current:
-            prev = self.tree.prev(current)
-            if prev:
-                # تخطي الفواصل
-                while prev and 'separator' in self.tree.item(prev, 'tags'):
-                    prev = self.tree.prev(prev)
-                
-                if prev:
-                    self.tree.selection_set(prev)
-                    self.tree.focus(prev)
-                    self.tree.see(prev)
-                    self.update_selection(prev)
-                    # تحديث الخلية الحالية
-                    column = self.current_cell[1] if self.current_cell else '#1'
-                    self.current_cell = (prev, column)
+        self._move_row(-1)
         return 'break'
     
     def move_down(self, event):
-        """الانتقال للخلية الأسفل"""
+        """الانتقال للخلية الأسفل (مع الالتفاف لأول صف)"""
         self.hide_entry()
-        current = self.tree.focus()
-        if current:
-            next_item = self.tree.next(current)
-            
-            # تخطي الفواصل
-            while next_item and 'separator' in self.tree.item(next_item, 'tags'):
-                next_item = self.tree.next(next_item)
-            
-            if not next_item:
-                children = self.tree.get_children()
-                for child in children:
-                    if 'separator' not in self.tree.item(child, 'tags'):
-                        next_item = child
-                        break
-            
-            if next_item:
-                self.tree.selection_set(next_item)
-                self.tree.focus(next_item)
-                self.tree.see(next_item)
-                self.update_selection(next_item)
-                # تحديث الخلية الحالية
-                column = self.current_cell[1] if self.current_cell else '#1'
-                self.current_cell = (next_item, column)
+        self._move_row(1, wrap=True)
         return 'break'
     
     def move_left(self, event):
         """الانتقال لليسار"""
         self.hide_entry()
         if self.current_cell:
-            item, column = self.current_cell
+            row, column = self.current_cell
             col_index = int(column.replace('#', '')) - 1
             if col_index > 0:
-                new_column = f'#{col_index}'
-                self.current_cell = (item, new_column)
+                self.current_cell = (row, f'#{col_index}')
         return 'break'
     
     def move_right(self, event):
         """الانتقال لليمين"""
         self.hide_entry()
         if self.current_cell:
-            item, column = self.current_cell
+            row, column = self.current_cell
             col_index = int(column.replace('#', '')) - 1
             if col_index < len(self.columns) - 1:
-                new_column = f'#{col_index + 2}'
-                self.current_cell = (item, new_column)
+                self.current_cell = (row, f'#{col_index + 2}')
         return 'break'
     
     def on_tab_key(self, event):
         """الانتقال للخلية التالية عند Tab"""
         self.hide_entry()
-        current = self.tree.focus()
-        if current:
-            # الحصول على الخلية التالية (يمين)
-            if self.current_cell:
-                item, column = self.current_cell
-                col_index = int(column.replace('#', '')) - 1
-                
-                if col_index < len(self.columns) - 1:
-                    # الانتقال لليمين في نفس الصف
-                    new_column = f'#{col_index + 2}'
-                    self.current_cell = (item, new_column)
-                else:
-                    # الانتقال للصف التالي، العمود الأول
-                    next_item = self.tree.next(current)
-                    
-                    # تخطي الفواصل
-                    while next_item and 'separator' in self.tree.item(next_item, 'tags'):
-                        next_item = self.tree.next(next_item)
-                    
-                    if not next_item:
-                        children = self.tree.get_children()
-                        for child in children:
-                            if 'separator' not in self.tree.item(child, 'tags'):
-                                next_item = child
-                                break
-                    
-                    if next_item:
-                        self.tree.selection_set(next_item)
-                        self.tree.focus(next_item)
-                        self.tree.see(next_item)
-                        self.update_selection(next_item)
-                        self.current_cell = (next_item, '#1')
-        
+        if self.current_cell:
+            row, column = self.current_cell
+            col_index = int(column.replace('#', '')) - 1
+            if col_index < len(self.columns) - 1:
+                # الانتقال لليمين في نفس الصف
+                self.current_cell = (row, f'#{col_index + 2}')
+            else:
+                # الانتقال للصف التالي، العمود الأول
+                self._move_row(1, column='#1', wrap=True)
         return 'break'
     
     def on_shift_tab(self, event):
         """الانتقال للخلية السابقة عند Shift+Tab"""
         self.hide_entry()
-        current = self.tree.focus()
-        if current:
-            # الحصول على الخلية السابقة (يسار)
-            if self.current_cell:
-                item, column = self.current_cell
-                col_index = int(column.replace('#', '')) - 1
-                
-                if col_index > 0:
-                    # الانتقال لليسار في نفس الصف
-                    new_column = f'#{col_index}'
-                    self.current_cell = (item, new_column)
-                else:
-                    # الانتقال للصف السابق، العمود الأخير
-                    prev = self.tree.prev(current)
-                    
-                    # تخطي الفواصل
-                    while prev and 'separator' in self.tree.item(prev, 'tags'):
-                        prev = self.tree.prev(prev)
-                    
-                    if prev:
-                        self.tree.selection_set(prev)
-                        self.tree.focus(prev)
-                        self.tree.see(prev)
-                        self.update_selection(prev)
-                        self.current_cell = (prev, f'#{len(self.columns)}')
-        
+        if self.current_cell:
+            row, column = self.current_cell
+            col_index = int(column.replace('#', '')) - 1
+            if col_index > 0:
+                # الانتقال لليسار في نفس الصف
+                self.current_cell = (row, f'#{col_index}')
+            elif self.view_grid.position(row):
+                # الانتقال للصف السابق، العمود الأخير
+                self._move_row(-1, column=f'#{len(self.columns)}')
         return 'break'
         
     def search_in_table(self, search_text: str, search_column: str = "الكل"):
-        """بحث في الجدول مع إخفاء الصفوف غير المطابقة"""
-        # إعادة تعيين تلوين البحث السابق (ولكننا الآن نخفي الصفوف)
-        # نعيد إظهار جميع الصفوف أولاً إذا كان هناك بحث سابق
-        all_items = self.tree.get_children()
-        for item in all_items:
-            if 'separator' in self.tree.item(item, 'tags'):
-                continue
-            # إذا كان العنصر مخفياً (detached) نعيده
-            # لكن tree.get_children لا تعيد العناصر المخفية. لذا نحتاج لتتبع المخفيين.
-            # بدلاً من ذلك، سنقوم بإعادة بناء الجدول عند البحث الفارغ.
-            pass
-        
-        # لتسهيل الأمر، سنقوم بتخزين قائمة بجميع العناصر (حتى المخفية) في self.all_items
-        # ولكن ليس لدينا. لذا سنستخدم طريقة detach وإعادة الإظهار عبر populate_data.
-            
-    
+        """بحث في الجدول مع إخفاء الصفوف غير المطابقة (فلترة العرض دون إعادة بناء الجدول)"""
+        self.hide_entry()
+        self.current_cell = None
         if not search_text:
             # إعادة عرض جميع البيانات
-            self.data = self.all_data.copy()
-            self.populate_data()
+            self.view_grid.set_view(None)
+            self.data = self.all_data
             return []
         
-        search_text = search_text.lower()
-        filtered_data = []
-        
-        for row in self.all_data:
-            found = False
-            if search_column == "الكل":
-                for col in self.columns:
-                    if search_text in str(row.get(col, '')).lower():
-                        found = True
-                        break
-            else:
-                if search_column in self.columns:
-                    if search_text in str(row.get(search_column, '')).lower():
-                        found = True
-            
-            if found:
-                filtered_data.append(row)
-        
-        # عرض البيانات المفلترة
-        self.data = filtered_data
-        self.populate_data()
-        
-        # تحديث التلوين للنتائج (اختياري، لأن populate_data يعيد التلوين)
-        # يمكن إضافة تاغ search_result للصفوف في populate_data إذا أردنا تلوينها.
-        
-        return filtered_data
-        
-        # تلوين النتائج (الصفوف التي لا تزال ظاهرة)
-        for item in results:
-            current_tags = list(self.tree.item(item, 'tags'))
-            if 'search_result' not in current_tags:
-                current_tags.append('search_result')
-                self.tree.item(item, tags=tuple(current_tags))
-        
-        # إعادة تطبيق الألوان على الصفوف الظاهرة
-        self.apply_row_colors()
-        
-        # إذا كانت هناك نتائج، التمرير للنتيجة الأولى
-        if results:
-            self.tree.see(results[0])
-            self.tree.selection_set(results[0])
-            self.update_selection(results[0])
+        if search_column == "الكل":
+            rows = self.view_grid.find(search_text)
+        elif search_column in self.columns:
+            rows = self.view_grid.find(search_text, [search_column])
+        else:
+            rows = []
         
-        return results
+        self.view_grid.set_view(rows)
+        self.data = [self.all_data[row] for row in rows]
+        return self.data
         
     def get_modified_data(self):
-        """الحصول على البيانات المعدلة فقط"""
+        """الحصول على البيانات المعدلة فقط (من كل الصفوف وليس الظاهرة فقط)"""
         modified_rows = []
         
-        for item in self.tree.get_children():
-            # تخطي الفواصل
-            if 'separator' in self.tree.item(item, 'tags'):
-                continue
+        for row in sorted(self.original_values):
+            row_data = self.all_data[row]
+            original_row = {**row_data, **self.original_values[row]}
             
-            if item in self.cells:
-                current_values = self.tree.item(item, 'values')
-                original_row = self.cells[item]['original_row']
-                row_data = self.cells[item]['row_data']
-                
-                # التحقق من وجود تعديلات
-                is_modified = False
-                for col_idx, col_name in enumerate(self.columns):
-                    current_val = str(current_values[col_idx]).strip()
-                    original_val = str(original_row.get(col_name, '')).strip()
-                    
-                    if current_val != original_val:
-                        is_modified = True
-                        break
-                
-                if is_modified:
-                    # إضافة البيانات المعدلة
-                    modified_row = {
-                        'id': original_row.get('id'),
-                        'علبة': row_data.get('علبة', ''),
-                        'مسلسل': row_data.get('مسلسل', ''),
-                        'التأشيرة_الحالية_أصلية': original_row.get('التأشيرة الحالية', ''),
-                        'التأشيرة_الجديدة': row_data.get('التأشيرة الجديدة', ''),
-                        'previous_withdrawal': original_row.get('previous_withdrawal', 0),      # السحب القديم الأصلي
-                        'withdrawal_updated_at': original_row.get('withdrawal_updated_at'),    # وقت آخر تحديث للسحب
-                        'row_data': row_data,
-                        'original_data': original_row.copy()
-                    }
-                    modified_rows.append(modified_row)
+            # التحقق من وجود تعديلات
+            is_modified = any(
+                str(row_data.get(col_name, '')).strip() != str(original_row.get(col_name, '')).strip()
+                for col_name in self.columns
+            )
+            
+            if is_modified:
+                modified_rows.append({
+                    'id': original_row.get('id'),
+                    'علبة': row_data.get('علبة', ''),
+                    'مسلسل': row_data.get('مسلسل', ''),
+                    'التأشيرة_الحالية_أصلية': original_row.get('التأشيرة الحالية', ''),
+                    'التأشيرة_الجديدة': row_data.get('التأشيرة الجديدة', ''),
+                    'previous_withdrawal': original_row.get('previous_withdrawal', 0),      # السحب القديم الأصلي
+                    'withdrawal_updated_at': original_row.get('withdrawal_updated_at'),    # وقت آخر تحديث للسحب
+                    'row_data': row_data,
+                    'original_data': original_row
+                })
         
         return modified_rows
     
     def get_all_data(self):
-        """الحصول على جميع البيانات"""
-        all_data = []
-        for item in self.tree.get_children():
-            if 'separator' in self.tree.item(item, 'tags'):
-                continue
-            
-            if item in self.cells:
-                all_data.append(self.cells[item]['row_data'])
-        
-        return all_data
-
-    # ... داخل ExcelLikeTable ...
+        """الحصول على جميع البيانات الظاهرة"""
+        return [self.all_data[row] for row in self.view_grid.view]
 
     def on_mouse_motion(self, event):
         """تتبع حركة الماوس لعرض التلميحات"""
         region = self.tree.identify_region(event.x, event.y)
         if region == 'cell':
-            item = self.tree.identify_row(event.y)
+            row = self.view_grid.row_at(event.y)
             column = self.tree.identify_column(event.x)
-            if item and column:
-                if (item, column) != (self.current_hover_item, self.current_hover_column):
-                    self.current_hover_item = item
+            if row is not None and column:
+                if (row, column) != (self.current_hover_item, self.current_hover_column):
+                    self.current_hover_item = row
                     self.current_hover_column = column
-                    self.show_tooltip(event, item, column)
+                    self.show_tooltip(event, row, column)
         else:
             self.hide_tooltip()
 
     def on_mouse_leave(self, event):
         self.hide_tooltip()
 
-    def show_tooltip(self, event, item, column):
+    def show_tooltip(self, event, row, column):
         """عرض تلميح يحتوي على معلومات الخلية"""
         self.hide_tooltip()
         
-        if item not in self.cells:
-            return
-        
         col_index = int(column.replace('#', '')) - 1
         col_name = self.columns[col_index] if col_index < len(self.columns) else None
         if not col_name:
             return
         
-        row_data = self.cells[item]['row_data']
-        original_row = self.cells[item]['original_row']
+        row_data = self.all_data[row]
+        original_row = {**row_data, **self.original_values.get(row, {})}
         
         lines = []
         
@@ -820,6 +527,7 @@ class ExcelLikeTable(tk.Frame):
 
 
 
+@traced_class(prefix='load_')
 class VisaEditor:
     """محرر التأشيرات داخل البرنامج مع تحسينات كبيرة"""
     
@@ -1104,33 +812,24 @@ class VisaEditor:
     def load_sectors(self):
         """تحميل قائمة القطاعات"""
         try:
-            with db.get_cursor() as cursor:
-                cursor.execute("""
-                    SELECT id, name, code 
-                    FROM sectors 
-                    WHERE is_active = TRUE 
-                    ORDER BY name
-                """)
-                sectors = cursor.fetchall()
-                
-                sector_names = []
-                self.sectors_map = {}
-                
-                for sector in sectors:
-                    display_name = f"{sector['name']} ({sector['code'] or 'بدون رمز'})"
-                    sector_names.append(display_name)
-                    self.sectors_map[display_name] = {
-                        'id': sector['id'],
-                        'name': sector['name'],
-                        'code': sector['code']
-                    }
-                
-                self.sector_combo['values'] = sector_names
-                
-                if sector_names:
-                    self.sector_combo.current(0)
-                    self.on_sector_selected()
-                
+            sector_names = []
+            self.sectors_map = {}
+            
+            for sector in reference_data.sectors():
+                display_name = f"{sector['name']} ({sector['code'] or 'بدون رمز'})"
+                sector_names.append(display_name)
+                self.sectors_map[display_name] = {
+                    'id': sector['id'],
+                    'name': sector['name'],
+                    'code': sector['code']
+                }
+            
+            self.sector_combo['values'] = sector_names
+            
+            if sector_names:
+                self.sector_combo.current(0)
+                self.on_sector_selected()
+            
         except Exception as e:
             logger.error(f"خطأ في تحميل القطاعات: {e}")
             messagebox.showerror("خطأ", f"فشل تحميل القطاعات: {e}")
@@ -1219,57 +918,47 @@ class VisaEditor:
             
             # تطبيق البحث
             if hasattr(self, 'table'):
-                # البحث في البيانات
-                items = self.table.tree.get_children()
-                results = []
-                
-                for item in items:
-                    if 'separator' in self.table.tree.item(item, 'tags'):
-                        continue
-                    
-                    values = self.table.tree.item(item, 'values')
-                    if not values:
-                        continue
-                    
-                    match = False
-                    
-                    # البحث في كل الأعمدة
-                    for idx, cell_value in enumerate(values):
-                        cell_str = str(cell_value).replace(',', '')
-                        
-                        if search_type_val == "exact":
-                            match = cell_str == value
-                        elif search_type_val == "contains":
-                            match = value in cell_str
-                        elif search_type_val == "greater":
-                            try:
-                                if cell_str.replace('.', '').isdigit():
-                                    match = float(cell_str) > float(value)
-                            except:
-                                pass
-                        elif search_type_val == "smaller":
-                            try:
-                                if cell_str.replace('.', '').isdigit():
-                                    match = float(cell_str) < float(value)
-                            except:
-                                pass
+                grid = self.table.view_grid
+                if search_type_val == "exact":
+                    # مطابقة تامة عبر فهرس كل عمود بدل المرور على كل الخلايا
+                    matches = set()
+                    for col in self.table.columns:
+                        matches.update(grid.lookup(col, value))
+                    results = [row for row in grid.view if row in matches]
+                else:
+                    results = []
+                    for row in grid.view:
+                        match = False
                         
-                        if match:
-                            results.append(item)
-                            break
+                        # البحث في كل الأعمدة
+                        for cell_value in grid.get_row(row):
+                            cell_str = str(cell_value).replace(',', '')
+                            
+                            if search_type_val == "contains":
+                                match = value in cell_str
+                            elif search_type_val == "greater":
+                                try:
+                                    if cell_str.replace('.', '').isdigit():
+                                        match = float(cell_str) > float(value)
+                                except:
+                                    pass
+                            elif search_type_val == "smaller":
+                                try:
+                                    if cell_str.replace('.', '').isdigit():
+                                        match = float(cell_str) < float(value)
+                                except:
+                                    pass
+                            
+                            if match:
+                                results.append(row)
+                                break
                 
                 # تلوين النتائج
                 if results:
-                    for item in results:
-                        current_tags = list(self.table.tree.item(item, 'tags'))
-                        if 'search_result' not in current_tags:
-                            current_tags.append('search_result')
-                            self.table.tree.item(item, tags=tuple(current_tags))
+                    self.table.mark_search_results(results)
                     
                     # التمرير للنتيجة الأولى
-                    self.table.tree.see(results[0])
-                    self.table.tree.selection_set(results[0])
-                    self.table.update_selection(results[0])
+                    self.table.select_row(results[0])
                     
                     messagebox.showinfo("نتيجة البحث", 
                                       f"تم العثور على {len(results)} نتيجة")
@@ -1289,53 +978,18 @@ class VisaEditor:
     def find_next(self):
         """البحث عن التالي"""
         if hasattr(self, 'table') and self.search_var.get():
-            items = self.table.tree.get_children()
-            # تصفية العناصر الفارغة والفاصلة
-            valid_items = []
-            for item in items:
-                if 'separator' in self.table.tree.item(item, 'tags'):
-                    continue
-                values = self.table.tree.item(item, 'values')
-                if values and any(str(v).strip() != '' for v in values):
-                    valid_items.append(item)
-            
-            if not valid_items:
-                return
-            
-            selected = self.table.tree.selection()
-            
-            if selected and selected[0] in valid_items:
-                current_idx = valid_items.index(selected[0])
-                next_idx = (current_idx + 1) % len(valid_items)
-            else:
-                next_idx = 0
-            
-            # البحث عن المطابقة التالية
-            search_text = self.search_var.get().lower()
             search_column = self.search_column_var.get()
+            if search_column == "الكل":
+                columns = None
+            elif search_column in self.table.columns:
+                columns = [search_column]
+            else:
+                return
             
-            for i in range(len(valid_items)):
-                idx = (next_idx + i) % len(valid_items)
-                item = valid_items[idx]
-                values = self.table.tree.item(item, 'values')
-                
-                found = False
-                if search_column == "الكل":
-                    for value in values:
-                        if search_text in str(value).lower():
-                            found = True
-                            break
-                else:
-                    if search_column in self.table.columns:
-                        col_idx = self.table.columns.index(search_column)
-                        if search_text in str(values[col_idx]).lower():
-                            found = True
-                
-                if found:
-                    self.table.tree.see(item)
-                    self.table.tree.selection_set(item)
-                    self.table.update_selection(item)
-                    break
+            # البحث عن المطابقة التالية بعد الصف المحدد
+            row = self.table.view_grid.find_next(self.search_var.get(), columns)
+            if row is not None:
+                self.table.select_row(row)
                     
     # في VisaEditor.load_customers()
     def load_customers(self):
@@ -1353,41 +1007,28 @@ class VisaEditor:
         try:
             # استعلام مباشر لجلب البيانات مع previous_withdrawal و withdrawal_updated_at
             with db.get_cursor() as cursor:
+                # الترتيب الهرمي من المسار المخزن (meter_path) بدون استعلام عودي
                 query = """
-                    WITH RECURSIVE meter_tree AS (
-                        SELECT 
-                            id, name, meter_type, financial_category, visa_balance,
-                            box_number, serial_number, parent_meter_id, sector_id,
-                            current_balance, withdrawal_amount, updated_at,
-                            previous_withdrawal, withdrawal_updated_at,  -- الأعمدة الجديدة
-                            0 AS level,
-                            ARRAY[id] AS path,
-                            ARRAY[name]::VARCHAR[] AS path_names
-                        FROM customers
-                        WHERE is_active = TRUE
-                        AND parent_meter_id IS NULL
-                        AND (sector_id = %s OR %s IS NULL)
-                        
-                        UNION ALL
-                        
-                        SELECT 
-                            c.id, c.name, c.meter_type, c.financial_category, c.visa_balance,
-                            c.box_number, c.serial_number, c.parent_meter_id, c.sector_id,
-                            c.current_balance, c.withdrawal_amount, c.updated_at,
-                            c.previous_withdrawal, c.withdrawal_updated_at,
-                            mt.level + 1,
-                            mt.path || c.id,
-                            mt.path_names || c.name
-                        FROM customers c
-                        INNER JOIN meter_tree mt ON c.parent_meter_id = mt.id
-                        WHERE c.is_active = TRUE
-                    )
                     SELECT 
-                        mt.*,
+                        mt.id, mt.name, mt.meter_type, mt.financial_category, mt.visa_balance,
+                        mt.box_number, mt.serial_number, mt.parent_meter_id, mt.sector_id,
+                        mt.current_balance, mt.withdrawal_amount, mt.updated_at,
+                        mt.previous_withdrawal, mt.withdrawal_updated_at,
+                        array_length(mt.meter_path, 1) - 1 AS level,
+                        mt.meter_path AS path,
+                        mt.meter_path_names AS path_names,
                         s.name as sector_name
-                    FROM meter_tree mt
+                    FROM customers mt
+                    JOIN customers r ON r.id = mt.meter_path[1]
                     LEFT JOIN sectors s ON mt.sector_id = s.id
-                    ORDER BY mt.path
+                    WHERE mt.is_active = TRUE
+                    AND r.parent_meter_id IS NULL
+                    AND (r.sector_id = %s OR %s IS NULL)
+                    AND NOT EXISTS (
+                        SELECT 1 FROM customers a
+                        WHERE a.id = ANY(mt.meter_path) AND a.is_active IS NOT TRUE
+                    )
+                    ORDER BY mt.meter_path
                 """
                 cursor.execute(query, (self.sector_id, self.sector_id))
                 all_nodes = cursor.fetchall()
@@ -1688,6 +1329,7 @@ class VisaEditor:
 
         try:
             total_updated = 0
+            updated_ids = []
             skipped_decreases = 0
             failed_updates = []
 
@@ -1771,11 +1413,19 @@ class VisaEditor:
                         ))
 
                         total_updated += 1
+                        updated_ids.append(customer_id)
 
                     except Exception as e:
                         customer_info = f"{mod_row.get('علبة', '')}/{mod_row.get('مسلسل', '')}"
                         failed_updates.append(f"{customer_info}: {str(e)}")
 
+                # سجلات التأشيرة المخزنة مؤقتاً (تلميح شاشة المحاسبة) لم تعد صالحة
+                if total_updated > 0:
+                    from modules.history_manager import HistoryManager
+                    from modules.customer_cache import customer_cache
+                    HistoryManager.invalidate_visa_cache()
+                    customer_cache.invalidate(updated_ids)
+
                 # عرض النتيجة
                 if total_updated > 0 or skipped_decreases > 0:
                     msg_parts = []
@@ -1821,6 +1471,279 @@ class VisaEditor:
         
     
 
+@traced_class
+class VisaImporter:
+    """
+    استيراد ملف تأشيرات Excel دفعة واحدة:
+    قراءة الملف بـ pandas، مطابقة المعرفات مع فهرس الزبائن في الذاكرة،
+    التحقق من كل الأسطر مرة واحدة، ثم تطبيق كل التحديثات وسجلات
+    customer_history في معاملة واحدة، مع تقرير لكل سطر.
+    """
+
+    ID_COLUMNS = ('id', 'رقم الزبون', 'customer_id')
+    BOX_COLUMN = 'علبة'
+    SERIAL_COLUMN = 'مسلسل'
+    DEFAULT_AMOUNT_COLUMN = 'تنزيل تأشيرة'
+
+    STATUS_LABELS = {
+        'ok': 'تم',
+        'empty': 'فارغ - تم التخطي',
+        'invalid_amount': 'مبلغ غير صالح',
+        'missing_identifier': 'معرف فارغ',
+        'not_found': 'الزبون غير موجود',
+        'ambiguous': 'رقم العلبة مكرر - حدد المسلسل أو القطاع',
+        'duplicate': 'الزبون مكرر في الملف',
+    }
+
+    _ARABIC_DIGITS = str.maketrans('٠١٢٣٤٥٦٧٨٩٫٬', '0123456789.,')
+
+    def __init__(self, user_id: int = None, sector_id: int = None):
+        self.user_id = user_id
+        self.sector_id = sector_id
+
+    @staticmethod
+    def _normalize_key(series):
+        """توحيد المعرفات النصية (إزالة المسافات و .0 الناتجة عن Excel)"""
+        return (series.fillna('').astype(str).str.strip()
+                .str.replace(r'\.0+$', '', regex=True))
+
+    @classmethod
+    def _parse_amounts(cls, series):
+        """نسخة متجهة من VisaEditor.parse_number (NaN للقيم غير الصالحة)"""
+        import pandas as pd
+
+        s = series.fillna('').astype(str).str.translate(cls._ARABIC_DIGITS)
+        s = s.str.replace(r'[^\d.,\-]', '', regex=True)
+        has_comma = s.str.contains(',', regex=False)
+        has_dot = s.str.contains('.', regex=False)
+        decimal_comma = has_comma & ~has_dot & s.str.match(r'^-?\d+,\d{1,2}$')
+        s = s.where(~decimal_comma, s.str.replace(',', '.', regex=False))
+        s = s.str.replace(',', '', regex=False)
+        trailing_minus = s.str.endswith('-') & ~s.str.startswith('-')
+        s = s.where(~trailing_minus, '-' + s.str[:-1])
+        return pd.to_numeric(s, errors='coerce')
+
+    def _load_index(self, sector_id):
+        """فهرس الزبائن النشطين (للقطاع المحدد أو للكل) في DataFrame"""
+        import pandas as pd
+
+        query = """
+            SELECT id, box_number, serial_number, name
+            FROM customers
+            WHERE is_active = TRUE
+        """
+        params = ()
+        if sector_id:
+            query += " AND sector_id = %s"
+            params = (sector_id,)
+
+        with db.get_cursor() as cursor:
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+
+        index = pd.DataFrame(rows, columns=['id', 'box_number', 'serial_number', 'name'])
+        index['box_key'] = self._normalize_key(index['box_number'])
+        index['serial_key'] = self._normalize_key(index['serial_number'])
+        return index
+
+    def import_from_excel(self, file_path: str, identifier_column: str = None,
+                          amount_column: str = None, sector_id: int = None,
+                          dry_run: bool = False) -> Dict[str, Any]:
+        """
+        استيراد التأشيرات من ملف Excel.
+        identifier_column: عمود المعرف ('id' أو 'علبة'؛ يُستخدم 'مسلسل' تلقائياً إن وُجد)
+        dry_run: التحقق وإعداد التقرير دون أي تعديل على قاعدة البيانات
+        """
+        import os
+        import pandas as pd
+        from psycopg2.extras import execute_values
+
+        try:
+            df = pd.read_excel(file_path, dtype=str)
+            df.columns = [str(c).strip() for c in df.columns]
+
+            identifier_column = (identifier_column or self.BOX_COLUMN).strip()
+            amount_column = (amount_column or self.DEFAULT_AMOUNT_COLUMN).strip()
+            for column in (identifier_column, amount_column):
+                if column not in df.columns:
+                    return {'success': False,
+                            'message': f'العمود "{column}" غير موجود في الملف'}
+
+            sector_id = sector_id or self.sector_id
+            index = self._load_index(sector_id)
+
+            rows = pd.DataFrame({
+                'row': df.index + 2,  # رقم السطر كما يظهر في Excel (بعد سطر العناوين)
+                'identifier': self._normalize_key(df[identifier_column]),
+                'raw_amount': df[amount_column].fillna('').astype(str).str.strip(),
+            })
+            rows['amount'] = self._parse_amounts(rows['raw_amount'])
+
+            # 1. المطابقة مع الفهرس
+            if identifier_column in self.ID_COLUMNS:
+                ids = pd.to_numeric(rows['identifier'], errors='coerce')
+                known = set(index['id'])
+                rows['customer_id'] = ids.where(ids.isin(known))
+                rows['ambiguous'] = False
+            else:
+                keys = ['box_key']
+                rows['box_key'] = rows['identifier']
+                if self.SERIAL_COLUMN in df.columns and identifier_column != self.SERIAL_COLUMN:
+                    rows['serial_key'] = self._normalize_key(df[self.SERIAL_COLUMN])
+                    keys.append('serial_key')
+                elif identifier_column == self.SERIAL_COLUMN:
+                    rows = rows.drop(columns='box_key')
+                    rows['serial_key'] = rows['identifier']
+                    keys = ['serial_key']
+
+                duplicated = index.duplicated(keys, keep=False)
+                ambiguous_keys = index.loc[duplicated, keys].drop_duplicates()
+                unique_index = index.loc[~duplicated, keys + ['id']]
+
+                rows = rows.merge(unique_index, how='left', on=keys)
+                rows = rows.rename(columns={'id': 'customer_id'})
+                ambiguous_keys['ambiguous'] = True
+                rows = rows.merge(ambiguous_keys, how='left', on=keys)
+                rows['ambiguous'] = rows['ambiguous'].fillna(False).astype(bool)
+
+            # 2. التحقق من كل الأسطر دفعة واحدة (الأولوية للحالة الأولى المطابقة)
+            empty_amount = rows['raw_amount'] == ''
+            conditions = [
+                (rows['identifier'] == '') & empty_amount,
+                rows['identifier'] == '',
+                empty_amount | (rows['amount'] == 0),
+                rows['amount'].isna(),
+                rows['ambiguous'],
+                rows['customer_id'].isna(),
+            ]
+            statuses = ['empty', 'missing_identifier', 'empty', 'invalid_amount',
+                        'ambiguous', 'not_found']
+            rows['status'] = 'ok'
+            for condition, status in reversed(list(zip(conditions, statuses))):
+                rows.loc[condition, 'status'] = status
+
+            # الزبون نفسه أكثر من مرة: يُعتمد أول سطر صالح فقط
+            ok_ids = rows.loc[rows['status'] == 'ok', 'customer_id']
+            repeated = ok_ids.duplicated(keep='first')
+            rows.loc[repeated[repeated].index, 'status'] = 'duplicate'
+            ok = rows['status'] == 'ok'
+
+            valid = rows.loc[ok, ['row', 'customer_id', 'amount']].copy()
+            valid['customer_id'] = valid['customer_id'].astype(int)
+            source = os.path.basename(file_path)
+
+            # 3. التطبيق في معاملة واحدة: تحديث الأرصدة + سجل التاريخ بعبارة واحدة
+            applied = {}
+            if not valid.empty and not dry_run:
+                values = [
+                    (int(r.customer_id), float(r.amount),
+                     f"استيراد تأشيرة من ملف Excel: {r.amount:,.0f} | {source}",
+                     self.user_id)
+                    for r in valid.itertuples(index=False)
+                ]
+                with db.get_cursor() as cursor:
+                    returned = execute_values(cursor, """
+                        WITH v (customer_id, amount, notes, created_by) AS (VALUES %s),
+                        upd AS (
+                            UPDATE customers c
+                            SET current_balance = COALESCE(c.current_balance, 0) + v.amount,
+                                visa_balance = COALESCE(c.visa_balance, 0) + v.amount,
+                                updated_at = CURRENT_TIMESTAMP
+                            FROM v
+                            WHERE c.id = v.customer_id
+                            RETURNING c.id, v.amount, v.notes, v.created_by,
+                                      c.visa_balance - v.amount AS old_visa,
+                                      c.visa_balance AS new_visa,
+                                      c.current_balance AS new_balance,
+                                      c.withdrawal_amount, c.last_counter_reading
+                        )
+                        INSERT INTO customer_history
+                        (customer_id, transaction_type, old_value, new_value,
+                         amount, current_balance_after, notes, created_by,
+                         snapshot_withdrawal_amount, snapshot_visa_balance, snapshot_last_counter_reading)
+                        SELECT id, 'weekly_visa', old_visa, new_visa,
+                               amount, new_balance, notes, created_by,
+                               COALESCE(withdrawal_amount, 0), new_visa, COALESCE(last_counter_reading, 0)
+                        FROM upd
+                        RETURNING customer_id, old_value, new_value, current_balance_after
+                    """, values,
+                        template='(%s::int, %s::numeric, %s, %s::int)',
+                        page_size=len(values),
+                        fetch=True)
+                    applied = {r['customer_id']: r for r in returned}
+
+                if applied:
+                    from modules.history_manager import HistoryManager
+                    from modules.customer_cache import customer_cache
+                    HistoryManager.invalidate_visa_cache()
+                    customer_cache.invalidate(applied)
+
+            # 4. التقرير لكل سطر
+            names = dict(zip(index['id'], index['name']))
+            details = []
+            for r in rows.itertuples(index=False):
+                customer_id = int(r.customer_id) if r.customer_id == r.customer_id else None
+                entry = {
+                    'row': int(r.row),
+                    'identifier': r.identifier,
+                    'customer_id': customer_id,
+                    'customer_name': names.get(customer_id),
+                    'amount': None if r.amount != r.amount else float(r.amount),
+                    'status': r.status,
+                }
+                if r.status == 'ok' and customer_id in applied:
+                    entry['old_visa'] = float(applied[customer_id]['old_value'] or 0)
+                    entry['new_visa'] = float(applied[customer_id]['new_value'] or 0)
+                    entry['new_balance'] = float(applied[customer_id]['current_balance_after'] or 0)
+                details.append(entry)
+
+            imported = len(valid) if dry_run else len(applied)
+            total_amount = float(valid['amount'].sum()) if imported else 0.0
+            errors = [d for d in details if d['status'] not in ('ok', 'empty')]
+            message = (f"{'(تجربة) ' if dry_run else ''}تم استيراد {imported} تأشيرة "
+                       f"بإجمالي {total_amount:,.0f}، أسطر مرفوضة: {len(errors)}")
+
+            logger.info(f"استيراد التأشيرات من {source}: {message}")
+            return {
+                'success': True,
+                'dry_run': dry_run,
+                'message': message,
+                'imported_count': imported,
+                'error_count': len(errors),
+                'total_amount': total_amount,
+                'rows': details,
+                'report': self._build_report(source, message, details)
+            }
+
+        except Exception as e:
+            logger.error(f"خطأ في استيراد ملف التأشيرات: {e}", exc_info=True)
+            return {'success': False, 'message': str(e), 'error': str(e)}
+
+    def _build_report(self, source: str, message: str, details: List[Dict]) -> str:
+        """تقرير نصي: الملخص ثم الأسطر المرفوضة ثم الأسطر المستوردة"""
+        lines = [f"ملف التأشيرات: {source}", message, "=" * 60]
+
+        rejected = [d for d in details if d['status'] not in ('ok', 'empty')]
+        if rejected:
+            lines.append("الأسطر المرفوضة:")
+            for d in rejected:
+                amount = '' if d['amount'] is None else f"{d['amount']:,.0f}"
+                lines.append(f"  سطر {d['row']}: {d['identifier'] or '-'} {amount} - "
+                             f"{self.STATUS_LABELS[d['status']]}")
+            lines.append("-" * 60)
+
+        lines.append("الأسطر المستوردة:")
+        for d in details:
+            if d['status'] != 'ok':
+                continue
+            line = f"  سطر {d['row']}: {d['customer_name'] or d['customer_id']} +{d['amount']:,.0f}"
+            if 'new_visa' in d:
+                line += f" (التأشيرة {d['old_visa']:,.0f} ← {d['new_visa']:,.0f})"
+            lines.append(line)
+
+        return '\n'.join(lines)
+
+
 def open_visa_editor(parent, user_id: int):
     """فتح محرر التأشيرات"""
     editor = VisaEditor(parent, user_id)
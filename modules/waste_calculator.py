@@ -6,9 +6,13 @@ import math
 from collections import defaultdict, Counter
 import statistics
 import numpy as np
+from utils.tracing import traced_class
+from database.connection import read_only_class
 
 logger = logging.getLogger(__name__)
 
+@traced_class
+@read_only_class
 class HierarchicalWasteCalculator:
     """حاسبة هدر هرمية متعددة المستويات لشبكة الكهرباء - الإصدار المصحح"""
     
@@ -111,12 +115,11 @@ class HierarchicalWasteCalculator:
             return {'success': False, 'error': str(e)}
     
     def _analyze_meter_hierarchy(self, meter_id: int, level: int = 0, path: List = None) -> Dict:
-        """تحليل هرمي متكرر للعداد وكل ما تحته"""
+        """تحليل هرمي للعداد وكل ما تحته (الشجرة الفرعية تُجلب باستعلام واحد عبر meter_path)"""
         try:
             from database.connection import db
             
             with db.get_cursor() as cursor:
-                # جلب بيانات العداد
                 cursor.execute("""
                     SELECT c.id, c.name, c.meter_type, c.withdrawal_amount,
                            c.sector_id, s.name as sector_name,
@@ -124,85 +127,83 @@ class HierarchicalWasteCalculator:
                            c.parent_meter_id, c.current_balance
                     FROM customers c
                     LEFT JOIN sectors s ON c.sector_id = s.id
-                    WHERE c.id = %s AND c.is_active = TRUE
-                """, (meter_id,))
-                
-                meter = cursor.fetchone()
-                if not meter:
-                    return {}
-                
-                current_path = (path or []) + [meter['name']]
-                
-                # جلب الأبناء المباشرين
-                cursor.execute("""
-                    SELECT c.id, c.name, c.meter_type, c.withdrawal_amount,
-                           c.sector_id, s.name as sector_name,
-                           c.box_number, c.serial_number,
-                           c.parent_meter_id, c.current_balance
-                    FROM customers c
-                    LEFT JOIN sectors s ON c.sector_id = s.id
-                    WHERE c.parent_meter_id = %s 
+                    WHERE c.meter_path @> ARRAY[%s]::INTEGER[]
                     AND c.is_active = TRUE
                     ORDER BY c.meter_type, c.withdrawal_amount DESC
                 """, (meter_id,))
-                
-                children = cursor.fetchall()
-                
-                # تحليل كل ابن بشكل متكرر
-                children_analysis = []
-                total_children_withdrawal = 0
-                
-                for child in children:
-                    child_analysis = self._analyze_meter_hierarchy(child['id'], level + 1, current_path)
-                    if child_analysis:  # فقط إذا كان التحليل ناجحاً
-                        children_analysis.append(child_analysis)
-                        total_children_withdrawal += child_analysis.get('meter', {}).get('withdrawal_amount', 0)
-                
-                # حساب الهدر لهذا المستوى - تصحيح الحساب
-                meter_withdrawal = float(meter.get('withdrawal_amount') or 0)
-                waste_amount = meter_withdrawal - total_children_withdrawal
-                
-                # إذا كان الهدر سالباً، فهناك مشكلة في القياس
-                if waste_amount < 0:
-                    waste_amount = abs(waste_amount)  # استخدام القيمة المطلقة
-                    waste_type = "مشكلة: سحب الأبناء أكبر من سحب الأب"
-                else:
-                    waste_type = "هدر طبيعي"
-                
-                waste_percentage = (waste_amount / meter_withdrawal * 100) if meter_withdrawal > 0 else 0
-                efficiency = (total_children_withdrawal / meter_withdrawal * 100) if meter_withdrawal > 0 else 0
-                
-                return {
-                    'meter': {
-                        'id': meter['id'],
-                        'name': meter['name'],
-                        'meter_type': meter.get('meter_type', ''),
-                        'type_arabic': self._get_meter_type_arabic(meter.get('meter_type', '')),
-                        'withdrawal_amount': meter_withdrawal,
-                        'sector_name': meter.get('sector_name', ''),
-                        'box_number': meter.get('box_number', ''),
-                        'serial_number': meter.get('serial_number', ''),
-                        'current_balance': float(meter.get('current_balance') or 0),
-                        'hierarchy_level': level,
-                        'hierarchy_path': ' → '.join(current_path)
-                    },
-                    'children': children_analysis,
-                    'children_count': len(children_analysis),
-                    'total_children_withdrawal': total_children_withdrawal,
-                    'waste_amount': waste_amount,
-                    'waste_percentage': waste_percentage,
-                    'efficiency': min(efficiency, 100),  # لا تتجاوز 100%
-                    'waste_type': waste_type,
-                    'direct_customers': [c for c in children if c.get('meter_type') == 'زبون'],
-                    'direct_distribution_boxes': [c for c in children if c.get('meter_type') == 'علبة توزيع'],
-                    'direct_main_meters': [c for c in children if c.get('meter_type') == 'رئيسية'],
-                    'calculation': f"{meter_withdrawal} - {total_children_withdrawal} = {waste_amount}"
-                }
-                
+                rows = cursor.fetchall()
         except Exception as e:
             logger.error(f"خطأ في التحليل الهرمي للعداد {meter_id}: {e}")
             return {}
+        
+        nodes = {row['id']: row for row in rows}
+        if meter_id not in nodes:
+            return {}
+        
+        # الأبناء المباشرون لكل عداد (بنفس ترتيب الاستعلام: النوع ثم السحب تنازلياً)
+        children_map = defaultdict(list)
+        for row in rows:
+            if row['id'] != meter_id and row['parent_meter_id'] in nodes:
+                children_map[row['parent_meter_id']].append(row)
+        
+        return self._build_meter_analysis(nodes[meter_id], children_map, level, path)
     
+    def _build_meter_analysis(self, meter: Dict, children_map: Dict, level: int = 0, path: List = None) -> Dict:
+        """بناء تحليل العداد وأبنائه من الشجرة المحملة في الذاكرة"""
+        current_path = (path or []) + [meter['name']]
+        children = children_map.get(meter['id'], [])
+        
+        # تحليل كل ابن بشكل متكرر
+        children_analysis = []
+        total_children_withdrawal = 0
+        
+        for child in children:
+            child_analysis = self._build_meter_analysis(child, children_map, level + 1, current_path)
+            if child_analysis:  # فقط إذا كان التحليل ناجحاً
+                children_analysis.append(child_analysis)
+                total_children_withdrawal += child_analysis.get('meter', {}).get('withdrawal_amount', 0)
+        
+        # حساب الهدر لهذا المستوى - تصحيح الحساب
+        meter_withdrawal = float(meter.get('withdrawal_amount') or 0)
+        waste_amount = meter_withdrawal - total_children_withdrawal
+        
+        # إذا كان الهدر سالباً، فهناك مشكلة في القياس
+        if waste_amount < 0:
+            waste_amount = abs(waste_amount)  # استخدام القيمة المطلقة
+            waste_type = "مشكلة: سحب الأبناء أكبر من سحب الأب"
+        else:
+            waste_type = "هدر طبيعي"
+        
+        waste_percentage = (waste_amount / meter_withdrawal * 100) if meter_withdrawal > 0 else 0
+        efficiency = (total_children_withdrawal / meter_withdrawal * 100) if meter_withdrawal > 0 else 0
+        
+        return {
+            'meter': {
+                'id': meter['id'],
+                'name': meter['name'],
+                'meter_type': meter.get('meter_type', ''),
+                'type_arabic': self._get_meter_type_arabic(meter.get('meter_type', '')),
+                'withdrawal_amount': meter_withdrawal,
+                'sector_name': meter.get('sector_name', ''),
+                'box_number': meter.get('box_number', ''),
+                'serial_number': meter.get('serial_number', ''),
+                'current_balance': float(meter.get('current_balance') or 0),
+                'hierarchy_level': level,
+                'hierarchy_path': ' → '.join(current_path)
+            },
+            'children': children_analysis,
+            'children_count': len(children_analysis),
+            'total_children_withdrawal': total_children_withdrawal,
+            'waste_amount': waste_amount,
+            'waste_percentage': waste_percentage,
+            'efficiency': min(efficiency, 100),  # لا تتجاوز 100%
+            'waste_type': waste_type,
+            'direct_customers': [c for c in children if c.get('meter_type') == 'زبون'],
+            'direct_distribution_boxes': [c for c in children if c.get('meter_type') == 'علبة توزيع'],
+            'direct_main_meters': [c for c in children if c.get('meter_type') == 'رئيسية'],
+            'calculation': f"{meter_withdrawal} - {total_children_withdrawal} = {waste_amount}"
+        }
+        
     def _get_meter_type_arabic(self, meter_type: str) -> str:
         """تحويل نوع العداد إلى العربية"""
         type_map = {
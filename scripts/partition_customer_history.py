@@ -0,0 +1,45 @@
+# scripts/partition_customer_history.py
+"""
+سكربت ترحيل جدول customer_history إلى جدول مقسّم شهرياً حسب created_at
+(يُشغّل مرة واحدة خارج أوقات العمل)، مع خيار أرشفة الأقسام القديمة.
+
+    --archive            نقل الأقسام القديمة إلى archive_tablespace (تبقى قابلة للاستعلام)
+    --export-and-drop    مع --archive: تصديرها إلى CSV مضغوط ثم حذفها من قاعدة البيانات
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def partition_history(archive=False, export_and_drop=False):
+    """ترحيل الجدول ثم (اختيارياً) أرشفة الأقسام القديمة"""
+    from database.models import models
+
+    result = models.partition_customer_history()
+    if not result['success']:
+        logger.error(f"فشل الترحيل: {result['error']}")
+        return
+
+    if result['already_partitioned']:
+        models.ensure_history_partitions()
+    else:
+        logger.info(f"✅ تم ترحيل {result['migrated_rows']} سجل")
+
+    for partition in models.get_history_partitions():
+        logger.info(f"  {partition['name']}: {partition['bounds']} ({partition['size_bytes'] // 1024} KB)")
+
+    if archive:
+        from modules.archive import ArchiveManager
+        archive_result = ArchiveManager().archive_history_partitions(export_and_drop=export_and_drop)
+        if archive_result['success']:
+            logger.info(f"✅ تمت أرشفة {len(archive_result['archived'])} قسم")
+        else:
+            logger.error(f"فشل الأرشفة: {archive_result['error']}")
+
+if __name__ == "__main__":
+    partition_history(archive='--archive' in sys.argv, export_and_drop='--export-and-drop' in sys.argv)
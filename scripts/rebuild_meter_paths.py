@@ -0,0 +1,42 @@
+# scripts/rebuild_meter_paths.py
+"""
+سكربت التحقق من المسار الهرمي المخزن للعدادات (customers.meter_path) وإعادة بنائه.
+بدون خيارات: تحقق فقط. مع --rebuild: إعادة بناء كاملة ثم تحقق.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def check_meter_paths(rebuild=False):
+    """إعادة البناء (اختيارياً) ثم مقارنة المسارات المخزنة بالمحسوبة"""
+    from database.models import models
+
+    if rebuild:
+        result = models.rebuild_meter_paths()
+        if not result['success']:
+            logger.error(f"فشل إعادة البناء: {result['error']}")
+            return
+        logger.info(f"✅ تم تحديث {result['updated']} عداد")
+        if result['unreachable']:
+            logger.warning(f"⚠️ {result['unreachable']} عداد غير متصل بجذر (حلقة في parent_meter_id)")
+
+    verify = models.verify_meter_paths()
+    if not verify['success']:
+        logger.error(f"فشل التحقق: {verify['error']}")
+        return
+
+    if verify['mismatched']:
+        logger.warning(f"⚠️ {len(verify['mismatched'])} من {verify['checked']} عداد بمسار غير مطابق:")
+        for row in verify['mismatched'][:50]:
+            logger.warning(f"  {row['id']} {row['name']}: {row['meter_path']} ← المتوقع {row['expected_path']}")
+    else:
+        logger.info(f"✅ جميع المسارات مطابقة ({verify['checked']} عداد)")
+
+if __name__ == "__main__":
+    check_meter_paths(rebuild='--rebuild' in sys.argv)
@@ -2,6 +2,7 @@
 from auth.permissions import require_permission
 from database.connection import db  # استيراد db من هنا
 from auth.permission_engine import permission_engine
+from database.reference_data import reference_data, USERS
 import logging
 
 logger = logging.getLogger(__name__)
@@ -23,6 +24,7 @@ class UserService:
                 user_id
             ))
         permission_engine.clear_cache(user_id)
+        reference_data.invalidate(USERS)
         return True
 
     @staticmethod
@@ -49,4 +51,5 @@ class UserService:
             """, (user_id,))
 
         permission_engine.clear_cache(user_id)
+        reference_data.invalidate(USERS)
         return True
\ No newline at end of file
@@ -9,9 +9,13 @@ import logging
 from datetime import datetime
 from modules.fast_operations import FastOperations
 from modules.printing import FastPrinter
+from modules.history_manager import HistoryManager
+from utils.tracing import traced_class
+from ui.task_executor import get_task_executor
 
 logger = logging.getLogger(__name__)
 
+@traced_class(prefix='load_')
 class AccountingUI(tk.Frame):
     """واجهة محاسبة - مزيج من الأناقة والوضوح الوظيفي"""
     
@@ -21,6 +25,8 @@ class AccountingUI(tk.Frame):
         self.user_data = user_data
         self.fast_ops = FastOperations()
         self.printer = FastPrinter()
+        self.history_manager = HistoryManager()
+        self.tasks = get_task_executor(self)
         
         # ألوان باستيل محسّنة للتباين والوضوح
         self.colors = {
@@ -54,11 +60,9 @@ class AccountingUI(tk.Frame):
     
     def load_sectors(self):
         """تحميل القطاعات مرة واحدة (بدون تغيير)"""
-        from database.connection import db
+        from database.reference_data import reference_data
         try:
-            with db.get_cursor() as cursor:
-                cursor.execute("SELECT id, name FROM sectors WHERE is_active = TRUE ORDER BY name")
-                self.sectors = cursor.fetchall()
+            self.sectors = reference_data.sectors()
         except Exception as e:
             logger.error(f"خطأ في تحميل القطاعات: {e}")
             self.sectors = []
@@ -414,8 +418,10 @@ class AccountingUI(tk.Frame):
         self.info_canvas.configure(scrollregion=self.info_canvas.bbox('all'))
 
     def bind_tooltip(self, widget, text):
-        """ربط tooltip يظهر أسفل العنصر، وإذا لم تكن مساحة كافية يظهر فوقه"""
+        """ربط tooltip يظهر أسفل العنصر، وإذا لم تكن مساحة كافية يظهر فوقه.
+        text قد يكون نصاً أو دالة تُستدعى عند ظهور التلميح (جلب كسول)."""
         def enter(event):
+            tip_text = text() if callable(text) else text
             # حساب موقع التلميح
             x = widget.winfo_rootx() + 10
             y_below = widget.winfo_rooty() + widget.winfo_height() + 5
@@ -425,7 +431,7 @@ class AccountingUI(tk.Frame):
             temp_tip = tk.Toplevel(widget)
             temp_tip.wm_overrideredirect(True)
             temp_tip.wm_geometry("+0+0")
-            label = tk.Label(temp_tip, text=text, justify='right',
+            label = tk.Label(temp_tip, text=tip_text, justify='right',
                             background="#ffffe0", relief='solid', borderwidth=1,
                             font=("Arial", 10))
             label.pack()
@@ -443,7 +449,7 @@ class AccountingUI(tk.Frame):
             self.tooltip = tk.Toplevel(widget)
             self.tooltip.wm_overrideredirect(True)
             self.tooltip.wm_geometry(f"+{x}+{y}")
-            label = tk.Label(self.tooltip, text=text, justify='right',
+            label = tk.Label(self.tooltip, text=tip_text, justify='right',
                             background="#ffffe0", relief='solid', borderwidth=1,
                             font=("Arial", 10))
             label.pack()
@@ -509,7 +515,12 @@ class AccountingUI(tk.Frame):
     def _perform_search(self, search_term):
         if not search_term:
             return
-        results = self.fast_ops.fast_search_customers(search_term, limit=30)
+        # البحث في الخلفية؛ كل حرف جديد يلغي البحث السابق (بدون طبقة تحميل أثناء الكتابة)
+        self.tasks.submit(self.fast_ops.fast_search_customers, search_term, limit=30,
+                          on_success=self._show_search_results,
+                          key='search', widget=self.results_listbox, overlay=False)
+
+    def _show_search_results(self, results):
         self.results_listbox.delete(0, tk.END)
         self.search_results_data = results
         for customer in results:
@@ -527,8 +538,16 @@ class AccountingUI(tk.Frame):
         
     def select_customer(self, customer_id):
         """تحديد زبون وعرض بياناته (بدون تغيير في المنطق) + تحديث التصنيف"""
+        def on_error(e):
+            logger.error(f"خطأ في تحديد الزبون: {e}")
+            messagebox.showerror("خطأ", f"فشل تحميل بيانات الزبون: {str(e)}")
+
+        self.tasks.submit(self.fast_ops.fast_get_customer_details, customer_id,
+                          on_success=lambda data: self._show_customer(customer_id, data),
+                          on_error=on_error, key='customer', widget=self, overlay=False)
+
+    def _show_customer(self, customer_id, customer_data):
         try:
-            customer_data = self.fast_ops.fast_get_customer_details(customer_id)
             # [تشخيص] طباعة البيانات القادمة من الدالة
             #print("بيانات الزبون:", customer_data)
             
@@ -956,86 +975,54 @@ class AccountingUI(tk.Frame):
 
     def _get_visa_history(self, customer_id):
         """
-        جلب جميع تعديلات التأشيرة للزبون من جدول customer_history.
-        يتم جلب كل السجلات أولاً ثم تصفيتها في بايثون لتجنب مشاكل SQL.
+        جلب تعديلات التأشيرة للزبون عبر HistoryManager
+        (تصفية حسب نوع العملية في قاعدة البيانات + كاش لكل زبون).
         """
         if not customer_id:
             return []
-        try:
-            from database.connection import db
-            with db.get_cursor() as cursor:
-                # جلب كل السجلات لهذا الزبون
-                cursor.execute("""
-                    SELECT created_at, old_value, new_value, notes, transaction_type
-                    FROM customer_history
-                    WHERE customer_id = %s
-                    ORDER BY created_at DESC
-                """, (customer_id,))
-                all_records = cursor.fetchall()
-                
-                # تصفية السجلات التي تتعلق بالتأشيرة
-                visa_records = []
-                for record in all_records:
-                    transaction_type = record.get('transaction_type', '') or ''
-                    notes = record.get('notes', '') or ''
-                    
-                    # التحقق من وجود كلمات مفتاحية تشير إلى تعديل التأشيرة
-                    if ('visa' in transaction_type.lower() or 
-                        'تأشيرة' in transaction_type or
-                        'visa' in notes.lower() or 
-                        'تأشيرة' in notes):
-                        visa_records.append(record)
-                
-                # للتشخيص
-                print(f"عدد سجلات التأشيرة للزبون {customer_id}: {len(visa_records)} (من أصل {len(all_records)})")
-                return visa_records
-                
-        except Exception as e:
-            logger.error(f"خطأ في جلب سجل التأشيرات: {e}")
-            return []
-
-    def bind_visa_tooltip(self, customer_id):
-        visa_label = self.info_labels.get('visa')
-        if not visa_label:
-            return
+        return self.history_manager.get_visa_events(customer_id)
 
+    def _build_visa_tooltip_text(self, customer_id):
         history = self._get_visa_history(customer_id)
-        print(f"عدد سجلات التأشيرة التي تم جلبها: {len(history)}")   # تشخيص
 
         if not history:
-            tooltip_text = "لا توجد تعديلات سابقة على رصيد التأشيرة."
-        else:
-            # ... باقي الكود ...
+            return "لا توجد تعديلات سابقة على رصيد التأشيرة."
 
-            lines = []
-            for record in history:
-                created_at = record['created_at']
-                if isinstance(created_at, datetime):
-                    date_str = created_at.strftime('%Y-%m-%d %H:%M')
-                else:
-                    date_str = str(created_at)
+        lines = []
+        for record in history:
+            created_at = record['created_at']
+            if isinstance(created_at, datetime):
+                date_str = created_at.strftime('%Y-%m-%d %H:%M')
+            else:
+                date_str = str(created_at)
 
-                old_val = record.get('old_value')
-                new_val = record.get('new_value')
-                notes = record.get('notes', '') or ''
+            old_val = record.get('old_value')
+            new_val = record.get('new_value')
+            notes = record.get('notes', '') or ''
 
-                if old_val is not None and new_val is not None:
-                    try:
-                        old_float = float(old_val)
-                        new_float = float(new_val)
-                        diff = new_float - old_float
-                        sign = '+' if diff > 0 else ''
-                        lines.append(f"{date_str}: {old_float:,.0f} → {new_float:,.0f} ({sign}{diff:,.0f})")
-                    except (ValueError, TypeError):
-                        lines.append(f"{date_str}: تعديل (القيم: {old_val} → {new_val})")
-                elif notes:
-                    lines.append(f"{date_str}: {notes}")
-                else:
-                    lines.append(f"{date_str}: تعديل")
+            if old_val is not None and new_val is not None:
+                try:
+                    old_float = float(old_val)
+                    new_float = float(new_val)
+                    diff = new_float - old_float
+                    sign = '+' if diff > 0 else ''
+                    lines.append(f"{date_str}: {old_float:,.0f} → {new_float:,.0f} ({sign}{diff:,.0f})")
+                except (ValueError, TypeError):
+                    lines.append(f"{date_str}: تعديل (القيم: {old_val} → {new_val})")
+            elif notes:
+                lines.append(f"{date_str}: {notes}")
+            else:
+                lines.append(f"{date_str}: تعديل")
+
+        return "\n".join(lines)
 
-            tooltip_text = "\n".join(lines)
+    def bind_visa_tooltip(self, customer_id):
+        visa_label = self.info_labels.get('visa')
+        if not visa_label:
+            return
 
-        self.bind_tooltip(visa_label, tooltip_text)
+        # الجلب يتم عند مرور المؤشر فقط وليس عند اختيار الزبون
+        self.bind_tooltip(visa_label, lambda: self._build_visa_tooltip_text(customer_id))
 
 
     def fast_process(self):
@@ -11,10 +11,14 @@ import webbrowser
 import pandas as pd
 
 from database.connection import db
+from database.reference_data import reference_data
 from auth.session import Session
+from utils.tracing import traced_class
+from ui.virtual_grid import VirtualGrid
 
 logger = logging.getLogger(__name__)
 
+@traced_class(prefix='load_')
 class ActivityLogUI(tk.Frame):
     """
     واجهة عرض السجل التاريخي للعمليات التي قام بها محاسب معين
@@ -139,29 +143,14 @@ class ActivityLogUI(tk.Frame):
                                 padx=10, cursor='hand2')
         btn_export.pack(side='right', padx=5)
 
-        # ========== عرض السجلات (شجرة مع تمرير) ==========
-        tree_container = tk.Frame(main_frame, bg='white')
-        tree_container.pack(fill='both', expand=True)
-
-        # شريط تمرير عمودي
-        v_scroll = ttk.Scrollbar(tree_container, orient='vertical')
-        v_scroll.pack(side='right', fill='y')
-
-        # شريط تمرير أفقي
-        h_scroll = ttk.Scrollbar(tree_container, orient='horizontal')
-        h_scroll.pack(side='bottom', fill='x')
-
+        # ========== عرض السجلات (جدول افتراضي: حتى 10000 سجل دون إنشاء عنصر لكل سجل) ==========
         # الأعمدة (مشابهة لـ ArchiveUI ولكن بدون عمود المستخدم لأنه معروف)
         columns = ('id', 'date', 'customer', 'action', 'old_val', 'new_val', 'amount', 'balance', 'notes')
-        self.tree = ttk.Treeview(tree_container, columns=columns,
-                                  yscrollcommand=v_scroll.set, xscrollcommand=h_scroll.set,
-                                  selectmode='browse', height=20)
-        v_scroll.config(command=self.tree.yview)
-        h_scroll.config(command=self.tree.xview)
+        self.grid_view = VirtualGrid(main_frame, columns, height=20, bg='white')
+        self.grid_view.pack(fill='both', expand=True)
+        self.tree = self.grid_view.tree
 
         # تعريف الرؤوس
-        self.tree.heading('#0', text='#')
-        self.tree.column('#0', width=40, anchor='center')
         self.tree.heading('id', text='ID')
         self.tree.column('id', width=50, anchor='center')
         self.tree.heading('date', text='التاريخ والوقت')
@@ -181,8 +170,6 @@ class ActivityLogUI(tk.Frame):
         self.tree.heading('notes', text='ملاحظات')
         self.tree.column('notes', width=250, anchor='w')
 
-        self.tree.pack(side='left', fill='both', expand=True)
-
         # ربط النقر المزدوج لعرض التفاصيل (يمكن إضافته لاحقاً)
         # self.tree.bind('<Double-1>', self.on_double_click)
 
@@ -207,16 +194,13 @@ class ActivityLogUI(tk.Frame):
     def load_users_list(self):
         """تحميل قائمة المستخدمين (المحاسبين) النشطين"""
         try:
-            with db.get_cursor() as cursor:
-                cursor.execute("SELECT id, username, full_name FROM users WHERE is_active = TRUE ORDER BY full_name")
-                users = cursor.fetchall()
-                user_list = []
-                self.user_map = {}
-                for u in users:
-                    display = f"{u['id']} - {u['full_name']} ({u['username']})"
-                    user_list.append(display)
-                    self.user_map[display] = u['id']
-                self.user_combo['values'] = user_list
+            user_list = []
+            self.user_map = {}
+            for u in reference_data.users():
+                display = f"{u['id']} - {u['full_name']} ({u['username']})"
+                user_list.append(display)
+                self.user_map[display] = u['id']
+            self.user_combo['values'] = user_list
         except Exception as e:
             logger.error(f"خطأ في تحميل قائمة المستخدمين: {e}")
             self.user_map = {}
@@ -258,10 +242,7 @@ class ActivityLogUI(tk.Frame):
             return
         self.current_user_id = user_id
         try:
-            with db.get_cursor() as cursor:
-                cursor.execute("SELECT full_name, username FROM users WHERE id = %s", (user_id,))
-                u = cursor.fetchone()
-                self.current_user_name = u['full_name'] or u['username']
+            self.current_user_name = reference_data.user_display_name(user_id, "مستخدم")
         except Exception as e:
             logger.error(f"خطأ في جلب اسم المستخدم: {e}")
             self.current_user_name = "مستخدم"
@@ -344,9 +325,7 @@ class ActivityLogUI(tk.Frame):
     # عرض السجلات في الشجرة
     # ------------------------------------------------------------
     def display_history(self, records):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
+        rows = []
         for rec in records:
             action_disp = self.transaction_type_map.get(rec['transaction_type'], rec['transaction_type'])
             created_at = rec['created_at']
@@ -372,7 +351,9 @@ class ActivityLogUI(tk.Frame):
                 balance,
                 rec['notes'] or ''
             )
-            self.tree.insert('', 'end', text=rec['id'], values=values)
+            rows.append(values)
+
+        self.grid_view.set_rows(rows)
 
     def format_number(self, val):
         if val is None:
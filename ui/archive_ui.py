@@ -13,10 +13,12 @@ import pandas as pd
 from modules.history_manager import HistoryManager
 from modules.customers import CustomerManager
 from modules.collection_monitor import CollectionMonitor
-from database.connection import db
+from database.reference_data import reference_data
+from utils.tracing import traced_class
 
 logger = logging.getLogger(__name__)
 
+@traced_class(prefix='load_')
 class ArchiveUI(tk.Frame):
     """
     واجهة عرض السجل التاريخي للزبون - بحث، فلترة، تحليل، تصدير
@@ -201,12 +203,9 @@ class ArchiveUI(tk.Frame):
     # ------------------------------------------------------------
     def load_sectors(self):
         try:
-            with db.get_cursor() as cursor:
-                cursor.execute("SELECT id, name FROM sectors WHERE is_active = TRUE ORDER BY name")
-                sectors = cursor.fetchall()
-                sector_names = ['الكل'] + [s['name'] for s in sectors]
-                self.sector_combo['values'] = sector_names
-                self.sector_combo.current(0)
+            sector_names = ['الكل'] + [s['name'] for s in reference_data.sectors()]
+            self.sector_combo['values'] = sector_names
+            self.sector_combo.current(0)
         except Exception as e:
             logger.error(f"خطأ في تحميل القطاعات: {e}")
 
@@ -12,10 +12,13 @@ import webbrowser
 import pandas as pd
 
 from modules.collection_monitor import CollectionMonitor
-from database.connection import db
+from database.reference_data import reference_data
+from utils.tracing import traced_class
+from ui.virtual_grid import VirtualGrid
 
 logger = logging.getLogger(__name__)
 
+@traced_class(prefix='load_')
 class CollectionMonitorUI(tk.Frame):
     def __init__(self, parent, user_data):
         super().__init__(parent)
@@ -82,26 +85,14 @@ class CollectionMonitorUI(tk.Frame):
         self.summary_label = tk.Label(self.summary_frame, text='', font=('Arial', 11))
         self.summary_label.pack()
 
-        # إطار الجدول الرئيسي (شجرة) مع شريط تمرير
-        tree_frame = tk.Frame(main_frame)
-        tree_frame.pack(fill='both', expand=True)
-
-        v_scroll = ttk.Scrollbar(tree_frame, orient='vertical')
-        v_scroll.pack(side='right', fill='y')
-
-        h_scroll = ttk.Scrollbar(tree_frame, orient='horizontal')
-        h_scroll.pack(side='bottom', fill='x')
-
-        # الشجرة - الأعمدة الجديدة: withdrawal, withdrawal_class, paid_weekly, financial_category
+        # الجدول الرئيسي (افتراضي: لا يُنشأ إلا الصفوف الظاهرة مهما كان عدد الزبائن)
+        # الأعمدة الجديدة: withdrawal, withdrawal_class, paid_weekly, financial_category
         columns = ('id', 'name', 'box', 'sector', 'last_payment', 'days', 'weeks', 'category',
                    'balance', 'visa', 'last_reading', 'withdrawal', 'withdrawal_class',
                    'paid_weekly', 'estimated_due', 'financial_cat')
-        self.tree = ttk.Treeview(tree_frame, columns=columns,
-                                  yscrollcommand=v_scroll.set,
-                                  xscrollcommand=h_scroll.set,
-                                  show='headings', height=20)
-        v_scroll.config(command=self.tree.yview)
-        h_scroll.config(command=self.tree.xview)
+        self.grid_view = VirtualGrid(main_frame, columns, height=20)
+        self.grid_view.pack(fill='both', expand=True)
+        self.tree = self.grid_view.tree
 
         # تعريف رؤوس الأعمدة
         col_config = [
@@ -126,20 +117,16 @@ class CollectionMonitorUI(tk.Frame):
             self.tree.heading(col_id, text=heading)
             self.tree.column(col_id, width=width, anchor=anchor)
 
-        self.tree.pack(side='left', fill='both', expand=True)
-
         # شريط الحالة
         self.status_bar = tk.Label(self, text='', bd=1, relief='sunken', anchor='w')
         self.status_bar.pack(side='bottom', fill='x')
 
     def load_sectors(self):
         try:
-            with db.get_cursor() as cursor:
-                cursor.execute("SELECT id, name FROM sectors WHERE is_active = TRUE ORDER BY name")
-                self.sectors = cursor.fetchall()
-                names = ['الكل'] + [s['name'] for s in self.sectors]
-                self.sector_combo['values'] = names
-                self.sector_combo.current(0)
+            self.sectors = reference_data.sectors()
+            names = ['الكل'] + [s['name'] for s in self.sectors]
+            self.sector_combo['values'] = names
+            self.sector_combo.current(0)
         except Exception as e:
             logger.error(f"خطأ في تحميل القطاعات: {e}")
 
@@ -190,15 +177,13 @@ class CollectionMonitorUI(tk.Frame):
         sorted_customers = sorted(data['all_customers'], key=sort_key)
         # ------------------- نهاية الفرز -------------------
 
-        # مسح الشجرة
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        # إدخال البيانات بالترتيب الجديد
+        # إدخال البيانات بالترتيب الجديد (مع وسم التصنيف لتلوين الصف)
+        rows = []
+        tags = []
         for cust in sorted_customers:
             last_payment_str = cust['last_payment'].strftime('%Y-%m-%d') if cust['last_payment'] else 'لا يوجد'
             financial_cat_display = cust.get('financial_category_arabic', cust.get('financial_category', ''))
-            item_id = self.tree.insert('', 'end', values=(
+            rows.append((
                 cust['customer_id'],
                 cust['name'],
                 cust.get('box_number', ''),
@@ -216,8 +201,8 @@ class CollectionMonitorUI(tk.Frame):
                 f"{cust['estimated_due']:.1f}",
                 financial_cat_display
             ))
-            # تطبيق تلوين الصف
-            self.tree.item(item_id, tags=(cust['category_key'],))
+            tags.append((cust['category_key'],))
+        self.grid_view.set_rows(rows, tags)
 
         # تكوين التاجات (الألوان)
         for cat_key, cat_data in data['grouped'].items():
@@ -4,9 +4,11 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import logging
 from datetime import datetime
+from utils.tracing import traced_class
 
 logger = logging.getLogger(__name__)
 
+@traced_class(prefix='load_')
 class CustomerHistoryUI:
     """واجهة عرض السجل التاريخي للزبون"""
     
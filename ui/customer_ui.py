@@ -6,9 +6,14 @@ from datetime import datetime
 from typing import List, Dict, Optional
 from auth.permissions import has_permission, require_permission
 import threading
+from utils.tracing import traced_class
+from ui.task_executor import get_task_executor
+from ui.live_refresh import LiveRefresh
+from database.change_feed import RESET
 
 logger = logging.getLogger(__name__)
 
+@traced_class(prefix='load_')
 class CustomerUI(tk.Frame):
     """واجهة إدارة الزبائن الكاملة مع دعم العدادات الهرمية - نسخة محسنة بصرياً ووظيفياً (مستقرة)"""
 
@@ -17,6 +22,7 @@ class CustomerUI(tk.Frame):
         self.user_data = user_data
         self.customer_manager = None
         self.sectors = []
+        self.tasks = get_task_executor(self)
 
         # إعداد الأنماط لتكبير الصفوف والعناوين
         self.setup_styles()
@@ -27,6 +33,9 @@ class CustomerUI(tk.Frame):
         self.create_widgets()
         self.load_customers()
 
+        # تعديلات محطات العمل الأخرى على الزبائن والقطاعات
+        LiveRefresh(self, ('customers', 'sectors'), self.on_remote_changes)
+
     def setup_styles(self):
         """إعداد التنسيقات العامة للواجهة - تكبير الخطوط وارتفاع الصفوف"""
         style = ttk.Style()
@@ -43,10 +52,8 @@ class CustomerUI(tk.Frame):
 
     def load_sectors(self):
         try:
-            from database.connection import db
-            with db.get_cursor() as cursor:
-                cursor.execute("SELECT id, name FROM sectors WHERE is_active = TRUE ORDER BY name")
-                self.sectors = cursor.fetchall()
+            from database.reference_data import reference_data
+            self.sectors = reference_data.sectors()
         except Exception as e:
             logger.error(f"خطأ في تحميل القطاعات: {e}")
             self.sectors = []
@@ -161,7 +168,7 @@ class CustomerUI(tk.Frame):
         add_filter(search_box, "البحث بالاسم أو الرقم:", self.search_var)
 
         self.sector_var = tk.StringVar(value='الكل')
-        add_filter(search_box, "القطاع:", self.sector_var, ['الكل'] + [s['name'] for s in self.sectors], True)
+        self.sector_combo = add_filter(search_box, "القطاع:", self.sector_var, ['الكل'] + [s['name'] for s in self.sectors], True)
 
         self.meter_type_var = tk.StringVar(value='الكل')
         add_filter(search_box, "نوع العداد:", self.meter_type_var, ['الكل', 'مولدة', 'علبة توزيع', 'رئيسية', 'زبون'], True)
@@ -252,22 +259,32 @@ class CustomerUI(tk.Frame):
             self.show_error_message("مدير الزبائن غير متاح")
             return
 
+        # تحديد sector_id من الاسم إذا لزم
+        if sector_id is None:
+            sector_name = self.sector_var.get()
+            if sector_name and sector_name != 'الكل':
+                for s in self.sectors:
+                    if s['name'] == sector_name:
+                        sector_id = s['id']
+                        break
+
+        def on_error(e):
+            logger.error(f"خطأ في تحميل الزبائن: {e}")
+            self.show_error_message(f"خطأ في تحميل البيانات: {str(e)}")
+
+        # جلب جميع العقد بالترتيب الهرمي في الخلفية؛ بحث جديد يلغي السابق
+        self.tasks.submit(
+            self.customer_manager.get_customer_hierarchy, sector_id=sector_id,
+            on_success=lambda nodes: self.display_customers(nodes, search_term, meter_type_filter, balance_filter),
+            on_error=on_error, key='customers', widget=self.tree
+        )
+
+    def display_customers(self, nodes, search_term="", meter_type_filter="الكل", balance_filter="الكل"):
+        """عرض العقد المحملة في الشجرة بعد تطبيق البحث والفلاتر"""
         for item in self.tree.get_children():
             self.tree.delete(item)
 
         try:
-            # تحديد sector_id من الاسم إذا لزم
-            if sector_id is None:
-                sector_name = self.sector_var.get()
-                if sector_name and sector_name != 'الكل':
-                    for s in self.sectors:
-                        if s['name'] == sector_name:
-                            sector_id = s['id']
-                            break
-
-            # جلب جميع العقد بالترتيب الهرمي
-            nodes = self.customer_manager.get_customer_hierarchy(sector_id=sector_id)
-
             # تطبيق البحث إذا وجد (منطق الكود الأصلي)
             if search_term:
                 search_term_lower = search_term.lower()
@@ -422,6 +439,21 @@ class CustomerUI(tk.Frame):
     def on_filter_changed(self, event=None):
         self.on_search_changed()
 
+    def on_remote_changes(self, changes):
+        """تحديث القائمة عند وصول تغييرات من قناة التغييرات (مع الحفاظ على الفلاتر الحالية)"""
+        if any(c['table'] == 'sectors' for c in changes):
+            self.load_sectors()
+            self.sector_combo['values'] = ['الكل'] + [s['name'] for s in self.sectors]
+
+        sector_name = self.sector_var.get()
+        sector_ids = {s['id'] for s in self.sectors if s['name'] == sector_name}
+        customer_changes = [c for c in changes if c['table'] == 'customers']
+        if sector_ids and customer_changes and all(
+                c['op'] != RESET and c['key'] is not None and c['key'] not in sector_ids
+                for c in customer_changes):
+            return  # التغييرات في قطاعات غير معروضة
+        self.on_search_changed()
+
     def on_double_click(self, event):
         self.show_customer_details()
 
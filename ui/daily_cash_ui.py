@@ -6,9 +6,13 @@ from datetime import datetime, date, timedelta
 import logging
 from modules.daily_cash import DailyCashManager
 from database.connection import db
+from utils.tracing import traced_class
+from database.change_feed import RESET
+from ui.live_refresh import LiveRefresh
 
 logger = logging.getLogger(__name__)
 
+@traced_class(prefix='load_')
 class DailyCashUI(tk.Frame):
 
     def __init__(self, parent, user_data):
@@ -21,6 +25,9 @@ class DailyCashUI(tk.Frame):
         self.create_widgets()
         self.load_current()
 
+        # تحديث الملخص عند تعديل صندوق اليوم المعروض من محطة أخرى
+        LiveRefresh(self, 'daily_cash', self.on_remote_changes)
+
     def create_widgets(self):
         # إطار التاريخ والأزرار
         date_frame = tk.Frame(self)
@@ -114,6 +121,13 @@ class DailyCashUI(tk.Frame):
         else:
             self.status_label.config(text="")
 
+    def on_remote_changes(self, changes):
+        """إعادة قراءة الملخص فقط (بدون create_or_update_daily_cash حتى لا تولد الكتابة إشعاراً جديداً)"""
+        day = self.current_date.isoformat()
+        if any(c['op'] == RESET or c['key'] == day for c in changes):
+            self.refresh_accountants_table()
+            self.update_balance_panel(self.current_date)
+
     def update_balance_panel(self, target_date):
         with db.get_cursor() as cursor:
             cursor.execute("SELECT opening_balance, closing_balance, total_collections, total_expenses, total_profits, total_energy_profits FROM daily_cash WHERE cash_date = %s", (target_date,))
@@ -3,9 +3,11 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import logging
 from datetime import datetime, timedelta
+from utils.tracing import traced_class
 
 logger = logging.getLogger(__name__)
 
+@traced_class(prefix='load_')
 class FinancialCategoryUI:
     """واجهة إدارة التصنيف المالي للزبائن"""
     
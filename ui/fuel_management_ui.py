@@ -7,10 +7,13 @@ import json
 import traceback
 from modules.fuel_management import FuelManagement
 from database.connection import db
+from database.reference_data import reference_data
 from typing import Dict, List, Optional, Any
+from utils.tracing import traced_class
 
 logger = logging.getLogger(__name__)
 
+@traced_class(prefix='load_')
 class FuelManagementUI(tk.Toplevel):
     def __init__(self, parent, user_data):
         super().__init__(parent)
@@ -513,9 +516,7 @@ class FuelManagementUI(tk.Toplevel):
         code_entry.grid(row=1, column=1, padx=10, pady=10)
         tk.Label(main_frame, text="القطاع (اختياري):", font=('Segoe UI', 10), bg='white', fg='black').grid(row=2, column=0, padx=10, pady=10, sticky='e')
         
-        with db.get_cursor() as cursor:
-            cursor.execute("SELECT id, name FROM sectors ORDER BY name")
-            sectors = cursor.fetchall()
+        sectors = reference_data.sectors(active_only=False)
         sector_var = tk.StringVar()
         sector_combo = ttk.Combobox(main_frame, textvariable=sector_var, state='readonly', width=32, font=('Segoe UI', 10))
         sector_combo['values'] = [''] + [f"{s['id']} - {s['name']}" for s in sectors]
@@ -568,9 +569,7 @@ class FuelManagementUI(tk.Toplevel):
         code_entry.grid(row=1, column=1, padx=10, pady=10)
         tk.Label(main_frame, text="القطاع:", font=('Segoe UI', 10), bg='white', fg='black').grid(row=2, column=0, padx=10, pady=10, sticky='e')
         
-        with db.get_cursor() as cursor:
-            cursor.execute("SELECT id, name FROM sectors ORDER BY name")
-            sectors = cursor.fetchall()
+        sectors = reference_data.sectors(active_only=False)
         sector_var = tk.StringVar()
         sector_combo = ttk.Combobox(main_frame, textvariable=sector_var, state='readonly', width=32, font=('Segoe UI', 10))
         sector_combo['values'] = [''] + [f"{s['id']} - {s['name']}" for s in sectors]
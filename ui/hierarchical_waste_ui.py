@@ -7,9 +7,11 @@ import threading
 from datetime import datetime
 import webbrowser
 import json
+from utils.tracing import traced_class
 
 logger = logging.getLogger(__name__)
 
+@traced_class(prefix='load_')
 class HierarchicalWasteUI(tk.Frame):
     """واجهة تحليل الهدر الهرمي متعددة المستويات - الإصدار المحسن"""
     
@@ -56,10 +58,8 @@ class HierarchicalWasteUI(tk.Frame):
             from modules.waste_calculator import HierarchicalWasteCalculator
             self.waste_calculator = HierarchicalWasteCalculator()
             
-            from database.connection import db
-            with db.get_cursor() as cursor:
-                cursor.execute("SELECT id, name FROM sectors WHERE is_active = TRUE ORDER BY name")
-                self.sectors = cursor.fetchall()
+            from database.reference_data import reference_data
+            self.sectors = reference_data.sectors()
                 
         except Exception as e:
             logger.error(f"خطأ في تحميل التبعيات: {e}")
@@ -8,10 +8,12 @@ from datetime import datetime
 # إضافة الاستيرادات الجديدة
 from modules.export_manager import ExportManager
 from auth.permissions import require_permission
+from utils.tracing import traced_class
 
 
 logger = logging.getLogger(__name__)
 
+@traced_class(prefix='load_')
 class ImportManagerUI:
     """واجهة إدارة الاستيراد المتقدمة"""
     
@@ -841,6 +843,14 @@ class ImportManagerUI:
         self.amount_column = tk.StringVar(value='تنزيل تأشيرة')
         tk.Entry(columns_frame, textvariable=self.amount_column, width=15).grid(row=0, column=3, padx=5)
         
+        # القطاع: أرقام العلب تتكرر بين القطاعات، فالمطابقة تتم داخل القطاع المختار فقط
+        tk.Label(columns_frame, text="القطاع:", bg='white').grid(row=1, column=0, padx=5, pady=(10, 0))
+        self.visa_sector_var = tk.StringVar()
+        self.visa_sectors = self.load_visa_sectors()
+        ttk.Combobox(columns_frame, textvariable=self.visa_sector_var,
+                     values=list(self.visa_sectors), state='readonly',
+                     width=20).grid(row=1, column=1, columnspan=2, padx=5, pady=(10, 0), sticky='w')
+        
         # زر تنزيل النموذج
         tk.Button(options_frame, text="📥 تنزيل ملف نموذجي", 
                  command=self.download_visa_template,
@@ -865,13 +875,52 @@ class ImportManagerUI:
         # إطار فارغ لضمان الظهور
         tk.Frame(inner_frame, height=20, bg='white').pack()
 
-    def execute_visa_import(self, file_path):
+    def load_visa_sectors(self):
+        """أسماء القطاعات النشطة -> معرفاتها"""
+        try:
+            from database.reference_data import reference_data
+            return reference_data.sector_ids_by_name(active_only=True)
+        except Exception as e:
+            logger.error(f"خطأ في تحميل القطاعات: {e}")
+            return {}
+    
+    def browse_visa_file(self):
+        """استعراض ملف التأشيرات (واختيار القطاع من اسم الملف إن طابق)"""
+        file_path = filedialog.askopenfilename(
+            title="اختر ملف التأشيرات",
+            filetypes=[("ملفات Excel", "*.xlsx *.xls"), ("جميع الملفات", "*.*")]
+        )
+        if not file_path:
+            return
+        self.visa_file_path.set(file_path)
+        sector_name = os.path.splitext(os.path.basename(file_path))[0].strip()
+        if sector_name in self.visa_sectors:
+            self.visa_sector_var.set(sector_name)
+    
+    def start_visa_import(self):
+        """بدء استيراد التأشيرات للقطاع المختار"""
+        file_path = self.visa_file_path.get()
+        if not file_path or not os.path.exists(file_path):
+            messagebox.showerror("خطأ", "يرجى اختيار ملف صحيح")
+            return
+        
+        sector_id = self.visa_sectors.get(self.visa_sector_var.get())
+        if not sector_id:
+            messagebox.showerror("خطأ", "يرجى اختيار القطاع")
+            return
+        
+        self.create_progress_window()
+        thread = threading.Thread(target=self.execute_visa_import,
+                                 args=(file_path, sector_id))
+        thread.start()
+    
+    def execute_visa_import(self, file_path, sector_id=None):
         """تنفيذ استيراد التأشيرات"""
         try:
             from modules.visa_importer import VisaImporter
             
-            # إنشاء المستورد
-            importer = VisaImporter(user_id=self.user_data.get('id', 1))
+            # إنشاء المستورد (فهرس المعرفات مقصور على القطاع المختار)
+            importer = VisaImporter(user_id=self.user_data.get('id', 1), sector_id=sector_id)
             
             # تحديث شريط التقدم
             self.update_progress("جاري قراءة ملف Excel...", 10)
@@ -9,11 +9,14 @@ import logging
 from datetime import datetime, timedelta
 from modules.invoices import InvoiceManager
 from modules.customers import CustomerManager
-from database.connection import db
+from database.reference_data import reference_data
 from modules.printing import FastPrinter
+from utils.tracing import traced_class
+from ui.task_executor import get_task_executor
 
 logger = logging.getLogger(__name__)
 
+@traced_class(prefix='load_')
 class InvoiceUI(tk.Frame):
     """واجهة إدارة الفواتير"""
 
@@ -27,6 +30,7 @@ class InvoiceUI(tk.Frame):
         self.current_page = 1
         self.page_size = 50
         self.search_filters = {}
+        self.tasks = get_task_executor(self)
         
         self.create_widgets()
         self.load_invoices()
@@ -193,41 +197,44 @@ class InvoiceUI(tk.Frame):
     def load_sectors_for_filter(self):
         """تحميل القطاعات للفلترة"""
         try:
-            with db.get_cursor() as cursor:
-                cursor.execute("SELECT id, name FROM sectors ORDER BY name")
-                sectors = cursor.fetchall()
-                
-                sector_list = ["الكل"]
-                self.sector_filter_dict = {"الكل": None}
-                
-                for sector in sectors:
-                    sector_list.append(sector['name'])
-                    self.sector_filter_dict[sector['name']] = sector['id']
-                
-                self.sector_combo['values'] = sector_list
-                self.sector_combo.current(0)
+            sector_list = ["الكل"]
+            self.sector_filter_dict = {"الكل": None}
+            
+            for sector in reference_data.sectors(active_only=False):
+                sector_list.append(sector['name'])
+                self.sector_filter_dict[sector['name']] = sector['id']
+            
+            self.sector_combo['values'] = sector_list
+            self.sector_combo.current(0)
                 
         except Exception as e:
             logger.error(f"خطأ في تحميل القطاعات للفلترة: {e}")
 
     def load_invoices(self):
-        """تحميل الفواتير للعرض"""
+        """تحميل الفواتير للعرض (الاستعلام في الخلفية؛ تغيير الصفحة أو الفلتر يلغي الطلب السابق)"""
+        # حساب الإزاحة
+        offset = (self.current_page - 1) * self.page_size
+        
+        # تطبيق الفلاتر
+        filters = self.search_filters.copy()
+        filters['limit'] = self.page_size
+        filters['offset'] = offset
+
+        def on_error(e):
+            logger.error(f"خطأ في تحميل الفواتير: {e}")
+            messagebox.showerror("خطأ", f"فشل تحميل الفواتير: {str(e)}")
+        
+        # جلب الفواتير
+        self.tasks.submit(self.invoice_manager.search_invoices, on_success=self.display_invoices,
+                          on_error=on_error, key='invoices', widget=self.tree, **filters)
+
+    def display_invoices(self, invoices):
+        """عرض صفحة الفواتير المحملة في الجدول"""
         try:
             # مسح البيانات القديمة
             for item in self.tree.get_children():
                 self.tree.delete(item)
             
-            # حساب الإزاحة
-            offset = (self.current_page - 1) * self.page_size
-            
-            # تطبيق الفلاتر
-            filters = self.search_filters.copy()
-            filters['limit'] = self.page_size
-            filters['offset'] = offset
-            
-            # جلب الفواتير
-            invoices = self.invoice_manager.search_invoices(**filters)
-            
             # إضافة البيانات للشجرة
             for invoice in invoices:
                 self.tree.insert('', 'end', 
@@ -602,9 +609,16 @@ class InvoiceUI(tk.Frame):
 
     def show_daily_summary(self):
         """عرض ملخص المبيعات اليومية"""
+        def on_error(e):
+            logger.error(f"خطأ في عرض الملخص اليومي: {e}")
+            messagebox.showerror("خطأ", "فشل تحميل الملخص اليومي")
+
+        self.tasks.submit(self.invoice_manager.get_daily_summary,
+                          on_success=self._show_daily_summary, on_error=on_error,
+                          key='daily_summary', widget=self.tree)
+
+    def _show_daily_summary(self, summary):
         try:
-            summary = self.invoice_manager.get_daily_summary()
-            
             summary_text = f"""
             ملخص المبيعات اليومية:
             
@@ -668,6 +682,7 @@ class InvoiceUI(tk.Frame):
             messagebox.showerror("خطأ", "وحدة المعاينة غير متوفرة")
 
 
+@traced_class(prefix='load_')
 class CreateInvoiceDialog(tk.Toplevel):
     """نافذة إنشاء فاتورة جديدة (مع تحسين التمرير)"""
     def __init__(self, parent, user_data):
@@ -822,14 +837,11 @@ class CreateInvoiceDialog(tk.Toplevel):
     def load_sectors(self):
         """تحميل قائمة القطاعات"""
         try:
-            with db.get_cursor() as cursor:
-                cursor.execute("SELECT id, name FROM sectors ORDER BY name")
-                sectors = cursor.fetchall()
-                
-                sector_list = [sector['name'] for sector in sectors]
-                self.sector_dict = {sector['name']: sector['id'] for sector in sectors}
-                
-                self.sector_combo['values'] = sector_list
+            sectors = reference_data.sectors(active_only=False)
+            sector_list = [sector['name'] for sector in sectors]
+            self.sector_dict = {sector['name']: sector['id'] for sector in sectors}
+            
+            self.sector_combo['values'] = sector_list
                 
         except Exception as e:
             logger.error(f"خطأ في تحميل القطاعات: {e}")
@@ -945,6 +957,7 @@ class CreateInvoiceDialog(tk.Toplevel):
         self.destroy()
 
 
+@traced_class(prefix='load_')
 class EditInvoiceDialog(CreateInvoiceDialog):
     """نافذة تعديل فاتورة"""
     def __init__(self, parent, invoice_id, user_data):
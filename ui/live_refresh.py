@@ -0,0 +1,73 @@
+# ui/live_refresh.py
+"""
+ربط شاشة Tk بقناة التغييرات (database/change_feed.py).
+
+الإشعارات تصل في خيط الاستماع، فتُجمع هنا في طابور ويفحصها خيط الواجهة بـ after
+كل ui_refresh_ms؛ كل التغييرات المتراكمة خلال الفترة تُسلَّم في استدعاء واحد.
+يُلغى الاشتراك تلقائياً عند تدمير العنصر.
+
+الاستخدام:
+    LiveRefresh(self, ('customers', 'sectors'), self.on_remote_changes)
+"""
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List
+
+from config.settings import CHANGE_FEED_CONFIG
+from database.change_feed import change_feed
+
+logger = logging.getLogger(__name__)
+
+
+class LiveRefresh:
+    """اشتراك شاشة في تغييرات جداول مع التسليم في خيط الواجهة"""
+
+    def __init__(self, widget, tables: Iterable[str],
+                 callback: Callable[[List[Dict[str, Any]]], None],
+                 interval_ms: int = None):
+        self.widget = widget
+        self.callback = callback
+        self.interval = int(interval_ms or CHANGE_FEED_CONFIG.get('ui_refresh_ms', 500))
+        self.paused = False
+        self._pending: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._after_id = None
+        self._unsubscribe = change_feed.subscribe(tables, self._on_changes)
+        widget.bind('<Destroy>', self._on_destroy, add='+')
+        self._schedule()
+
+    def _on_changes(self, table, changes):
+        # خيط الاستماع: تخزين فقط
+        with self._lock:
+            self._pending.extend(changes)
+
+    def _schedule(self):
+        try:
+            self._after_id = self.widget.after(self.interval, self._poll)
+        except Exception:
+            self._after_id = None
+
+    def _poll(self):
+        if not self.paused:
+            with self._lock:
+                changes, self._pending = self._pending, []
+            if changes:
+                try:
+                    self.callback(changes)
+                except Exception as e:
+                    logger.error(f"خطأ في تحديث الشاشة من قناة التغييرات: {e}", exc_info=True)
+        self._schedule()
+
+    def _on_destroy(self, event):
+        if event.widget is not self.widget:
+            return
+        self.close()
+
+    def close(self):
+        self._unsubscribe()
+        if self._after_id is not None:
+            try:
+                self.widget.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
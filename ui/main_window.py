@@ -3,7 +3,7 @@ import subprocess
 from database.connection import db
 from database.models import models
 from modules.archive import ArchiveManager
-from config.settings import DATABASE_CONFIG
+from config.settings import DATABASE_CONFIG, BACKUP_CONFIG
 
 import tkinter as tk
 from tkinter import ttk, messagebox
@@ -37,6 +37,9 @@ class MainWindow:
         # بدء النسخ الاحتياطي التلقائي
         self.start_auto_backup()
 
+        # توليد لقطات التقارير الأسبوعية خارج أوقات الذروة
+        self.start_report_scheduler()
+
     def start_auto_backup(self):
         """بدء النسخ الاحتياطي التلقائي في الخلفية."""
         from modules.archive import ArchiveManager
@@ -49,6 +52,14 @@ class MainWindow:
         except Exception as e:
             logger.error(f"فشل بدء الجدولة التلقائية: {e}")        
     
+    def start_report_scheduler(self):
+        """بدء مجدول لقطات التقارير الأسبوعية في الخلفية."""
+        try:
+            from modules.report_snapshots import report_scheduler
+            report_scheduler.start()
+        except Exception as e:
+            logger.error(f"فشل بدء مجدول لقطات التقارير: {e}")
+
     def setup_styles(self):
         """إعداد الأنماط"""
         self.style = ttk.Style()
@@ -1055,6 +1066,10 @@ class MainWindow:
                                 bg='#2c3e50', fg='white',
                                 font=('Arial', 9))
         status_label.pack(side='left', padx=10)
+
+        # حالة قناة التغييرات (التحديث الفوري من محطات العمل الأخرى)
+        self.feed_label = tk.Label(self.statusbar, text='', bg='#2c3e50', font=('Arial', 9))
+        self.feed_label.pack(side='left', padx=10)
         
         # تحديث الوقت تلقائياً
         self.update_time()
@@ -1072,6 +1087,12 @@ class MainWindow:
                                  bg='#2c3e50', fg='white',
                                  font=('Arial', 9))
             time_label.pack(side='right', padx=10)
+
+        from database.change_feed import change_feed
+        if change_feed.live:
+            self.feed_label.config(text="● تحديث فوري", fg='#2ecc71')
+        else:
+            self.feed_label.config(text="○ تحديث دوري", fg='#f39c12')
         
         self.root.after(1000, self.update_time)
     
@@ -1318,14 +1339,17 @@ class MainWindow:
 
     def restore_database_from_file(self):
         """استعادة قاعدة البيانات من ملف نسخة احتياطية"""
-        # اختيار الملف
-        filename = filedialog.askopenfilename(
-            title="اختر ملف النسخة الاحتياطية",
-            filetypes=[
-                ("ملفات النسخ الاحتياطي", "*.backup *.sql *.backup.gpg"),
-                ("جميع الملفات", "*.*")
-            ]
-        )
+        # اختيار الملف (أو المجلد لنسخ تنسيق directory)
+        if BACKUP_CONFIG.get('dump_format', 'custom') == 'directory':
+            filename = filedialog.askdirectory(title="اختر مجلد النسخة الاحتياطية")
+        else:
+            filename = filedialog.askopenfilename(
+                title="اختر ملف النسخة الاحتياطية",
+                filetypes=[
+                    ("ملفات النسخ الاحتياطي", "*.backup *.dump *.sql *.backup.gpg *.dump.gpg"),
+                    ("جميع الملفات", "*.*")
+                ]
+            )
         if not filename:
             return
         
@@ -1339,8 +1363,8 @@ class MainWindow:
             return
         
         try:
-            # محاولة استخدام ArchiveManager إذا كان الملف من نوع .backup
-            if filename.endswith('.backup') or filename.endswith('.backup.gpg'):
+            # محاولة استخدام ArchiveManager إذا كان الملف من نوع .backup/.dump أو مجلد نسخة
+            if os.path.isdir(filename) or filename.endswith(('.backup', '.backup.gpg', '.dump', '.dump.gpg')):
                 manager = ArchiveManager()
                 result = manager.restore_backup(filename)
                 if result.get('success'):
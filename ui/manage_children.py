@@ -3,9 +3,11 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import logging
 from typing import List, Dict
+from utils.tracing import traced_class
 
 logger = logging.getLogger(__name__)
 
+@traced_class(prefix='load_')
 class ManageChildrenDialog:
     """نافذة إدارة الأبناء لوالد معين"""
     
@@ -8,10 +8,14 @@ import os
 
 from modules.customers import CustomerManager
 from modules.collection import CollectionManager
+from modules.collection_journal import CollectionJournal, CollectionSync
 from database.connection import db
+from ui.task_executor import get_task_executor
+from utils.tracing import traced_class
 
 logger = logging.getLogger(__name__)
 
+@traced_class(prefix='load_')
 class MobileAccountingUI(tk.Frame):
     """واجهة المحاسبة الجوالة – لوحة تحكم المحصل والإدارة"""
 
@@ -20,6 +24,10 @@ class MobileAccountingUI(tk.Frame):
         self.user_data = user_data
         self.customer_manager = CustomerManager()
         self.collection_manager = CollectionManager()
+        # التحصيل يُسجل محلياً أولاً ثم يُزامن على دفعات
+        self.collection_journal = CollectionJournal()
+        self.collection_sync = CollectionSync(self.collection_journal)
+        self._sync_running = False
 
         self.is_collector = (user_data.get('role') == 'collector')
         self.is_admin = (user_data.get('role') == 'admin')
@@ -64,6 +72,8 @@ class MobileAccountingUI(tk.Frame):
                   bg='#3498db', fg='white').pack(side='left', padx=2)
         tk.Button(cust_toolbar, text='📥 تصدير Excel', command=self.export_to_excel,
                   bg='#27ae60', fg='white').pack(side='left', padx=2)
+        tk.Button(cust_toolbar, text='🔁 مزامنة', command=self.sync_in_background,
+                  bg='#8e44ad', fg='white').pack(side='left', padx=2)
 
         # Notebook للقطاعات
         self.sector_notebook = ttk.Notebook(customers_frame)
@@ -73,21 +83,47 @@ class MobileAccountingUI(tk.Frame):
         self.status_bar = tk.Label(self, text='جاهز', bd=1, relief='sunken', anchor='w')
         self.status_bar.pack(side='bottom', fill='x')
 
-    def load_data(self):
-        collector_id = None
+    def current_collector_id(self):
+        """المحصل المعروض حالياً (المستخدم نفسه أو المختار من القائمة للمدير)"""
         if self.is_collector:
-            collector_id = self.user_data.get('id')
-        elif self.is_admin:
+            return self.user_data.get('id')
+        if self.is_admin:
             selected = self.collector_var.get()
             if selected:
-                collector_id = self.collector_map.get(selected)
+                return self.collector_map.get(selected)
+        return None
 
+    def load_data(self):
+        collector_id = self.current_collector_id()
         if not collector_id:
             self.update_status('يرجى اختيار محصل')
             return
 
-        customers = self.customer_manager.get_customers_by_collector(collector_id)
+        # العرض فوراً من اللقطة المحلية (مع التحصيلات المعلقة)، ثم تحديثها من الخادم في الخلفية
+        self.render_local(collector_id)
+        self.update_status('جاري تحديث بيانات الزبائن...')
+        get_task_executor(self).submit(self.collection_sync.pull_snapshot, collector_id,
+                                       on_success=lambda snapshot: self._on_snapshot_pulled(snapshot, collector_id),
+                                       on_error=lambda error: self._on_snapshot_pulled(
+                                           {'success': False, 'error': str(error)}, collector_id),
+                                       key='collector_snapshot',
+                                       overlay=False, cancellable=False,
+                                       transaction=False)
+
+    def render_local(self, collector_id):
+        """إعادة رسم تبويبات الزبائن من اللقطة المحلية دون أي اتصال بالخادم"""
+        customers = self.collection_journal.get_customers(collector_id)
         self.display_customers(customers, collector_id)
+        return customers
+
+    def _on_snapshot_pulled(self, snapshot, collector_id):
+        if collector_id != self.current_collector_id():
+            return
+        customers = self.render_local(collector_id)
+        if not snapshot['success']:
+            self.update_status(f'⚠️ لا يوجد اتصال - عرض آخر لقطة محفوظة ({len(customers)} زبون)')
+            return
+        self.update_status(f'تم تحديث بيانات {len(customers)} زبون')
         self.update_stats(collector_id)
 
     def display_customers(self, customers, collector_id):
@@ -103,6 +139,9 @@ class MobileAccountingUI(tk.Frame):
 
         self.sector_trees = {}
 
+        # آخر دفعة لكل زبائن المحصل باستعلام واحد
+        last_payments = self.collection_manager.get_last_payments([cust['id'] for cust in customers])
+
         for sector_name in sorted(sectors_dict.keys()):
             cust_list = sectors_dict[sector_name]
             tab_frame = tk.Frame(self.sector_notebook)
@@ -148,7 +187,7 @@ class MobileAccountingUI(tk.Frame):
                 visa_balance = cust.get('visa_balance', 0)
                 last_reading = cust.get('last_counter_reading', '')
                 withdrawal = cust.get('withdrawal_amount', 0)
-                last_payment = self.collection_manager.get_last_payment(cust['id'])
+                last_payment = last_payments.get(cust['id'])
                 last_date = last_payment['payment_datetime'] if last_payment else None
                 last_amount = last_payment['amount'] if last_payment else 0
                 source = last_payment['source'] if last_payment else None
@@ -198,19 +237,7 @@ class MobileAccountingUI(tk.Frame):
 
     def get_last_collection(self, customer_id, collector_id):
         """الحصول على آخر تحصيل لزبون من قبل محصل معين"""
-        try:
-            with db.get_cursor() as cursor:
-                cursor.execute("""
-                    SELECT collection_date, collected_amount
-                    FROM collection_logs
-                    WHERE customer_id = %s AND collector_id = %s
-                    ORDER BY collection_date DESC
-                    LIMIT 1
-                """, (customer_id, collector_id))
-                return cursor.fetchone()
-        except Exception as e:
-            logger.error(f"خطأ في جلب آخر تحصيل: {e}")
-            return None
+        return self.collection_manager.get_last_collections([customer_id], collector_id).get(customer_id)
 
     def update_stats(self, collector_id):
         """تحديث الإحصائيات السريعة"""
@@ -291,7 +318,7 @@ class MobileAccountingUI(tk.Frame):
             try:
                 amount = float(amount_var.get())
                 notes = notes_text.get('1.0', 'end-1c').strip()
-                result = self.collection_manager.record_collection(
+                result = self.collection_journal.record(
                     collector_id=self.user_data['id'],
                     customer_id=customer_id,
                     collected_amount=amount,
@@ -300,7 +327,7 @@ class MobileAccountingUI(tk.Frame):
                 if result['success']:
                     messagebox.showinfo('نجاح', 'تم تسجيل التحصيل بنجاح')
                     dialog.destroy()
-                    self.load_data()  # تحديث البيانات
+                    self.sync_in_background()  # المزامنة ثم تحديث البيانات
                 else:
                     messagebox.showerror('خطأ', result.get('error', 'فشل التسجيل'))
             except ValueError:
@@ -308,6 +335,44 @@ class MobileAccountingUI(tk.Frame):
 
         tk.Button(dialog, text='حفظ', command=save, bg='#27ae60', fg='white').pack(pady=20)
 
+    def sync_in_background(self):
+        """مزامنة دفتر التحصيل المحلي في الخلفية (النتيجة تُسلم في خيط الواجهة)"""
+        if self._sync_running:
+            return
+        self._sync_running = True
+        self.update_status(f'جاري المزامنة... ({self.collection_journal.pending_count()} عملية معلقة)')
+
+        # بدون وحدة عمل شاملة: كل دفعة تلتزم بمعاملتها قبل تعليمها في الدفتر المحلي
+        get_task_executor(self).submit(self.collection_sync.sync,
+                                       collector_id=self.current_collector_id(),
+                                       on_success=self._on_sync_done,
+                                       on_error=self._on_sync_failed,
+                                       overlay=False, cancellable=False,
+                                       transaction=False)
+
+    def _on_sync_failed(self, error):
+        self._sync_running = False
+        logger.error(f"خطأ في مزامنة دفتر التحصيل: {error}")
+        self.update_status(f'⚠️ تعذرت المزامنة - {self.collection_journal.pending_count()} عملية محفوظة محلياً')
+
+    def _on_sync_done(self, report):
+        self._sync_running = False
+        if report['success']:
+            self.update_status(f"✅ تمت المزامنة: {report['applied']} عملية، المعلق: {report['pending']}")
+        else:
+            self.update_status(f"⚠️ تعذرت المزامنة - {report['pending']} عملية محفوظة محلياً")
+
+        if report['conflicts']:
+            details = '\n'.join(f'{uuid[:8]}: {reason}' for uuid, reason in report['conflicts'].items())
+            messagebox.showwarning('تحصيلات مرفوضة', f'رفض الخادم بعض عمليات التحصيل:\n{details}')
+
+        # sync حدّث اللقطة بالفعل: إعادة الرسم منها دون سحب متزامن جديد
+        collector_id = self.current_collector_id()
+        if collector_id:
+            self.render_local(collector_id)
+            if report.get('snapshot', {}).get('success'):
+                self.update_stats(collector_id)
+
     def export_to_excel(self):
         """تصدير البيانات إلى Excel مع ورقة منفصلة لكل قطاع وورقة ملخص"""
         try:
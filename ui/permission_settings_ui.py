@@ -5,9 +5,11 @@ import logging
 from auth.permissions import get_permissions_by_category, get_all_permissions
 from auth.permission_engine import permission_engine
 from database.connection import db
+from utils.tracing import traced_class
 
 logger = logging.getLogger(__name__)
 
+@traced_class(prefix='load_')
 class PermissionSettingsUI:
     """واجهة إعدادات الصلاحيات - مبسطة مع تمرير ذكي"""
     
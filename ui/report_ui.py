@@ -5,11 +5,14 @@ import logging
 from datetime import datetime
 import os
 import webbrowser
+from utils.tracing import traced_class
+from ui.task_executor import get_task_executor
 
 logger = logging.getLogger(__name__)
 
 
 
+@traced_class(prefix='load_')
 class ReportUI(tk.Frame):
     """واجهة التقارير والإحصائيات المحسّنة"""
     
@@ -41,6 +44,8 @@ class ReportUI(tk.Frame):
         
         self.current_report = None
         self.current_report_type = None
+        # استعلامات التقارير تعمل في الخلفية حتى لا تتجمد الواجهة
+        self.tasks = get_task_executor(self)
         self.create_widgets() 
 
     def load_report_manager(self):
@@ -197,6 +202,7 @@ class ReportUI(tk.Frame):
             ("📋 جرد الدورة", self.show_cycle_inventory_report),
             ("👑 تقرير VIP شامل", self.show_vip_full_report),
             ("📱 تقرير محاسبة جوالة شامل", self.show_mobile_accountant_full_report),  # <-- جديد
+            ("📦 التقارير الأسبوعية الجاهزة", self.show_report_snapshots),
         ]
 
         for report_name, command in reports:
@@ -255,17 +261,9 @@ class ReportUI(tk.Frame):
             self.show_error("لم يتم تحميل نظام التقارير")
             return
         
-        self.clear_frames()
-        try:
-            report = self.report_manager.get_negative_balance_lists_report_old_interface()
-            self.display_report_old(report, "قوائم الكسر (قديم)")
-            self.current_report = report
-            self.current_report_type = "negative_balance_old"
-            self.export_excel_btn.config(state='disabled')
-            self.filter_btn.config(state='disabled')
-            self.update_status("تم توليد تقرير قوائم الكسر القديم")
-        except Exception as e:
-            self.show_error(f"خطأ في عرض التقرير: {e}")
+        self._run_report(self.report_manager.get_negative_balance_lists_report_old_interface,
+                         lambda report: self.display_report_old(report, "قوائم الكسر (قديم)"),
+                         "negative_balance_old", "تم توليد تقرير قوائم الكسر القديم", export_enabled=False)
     
     def show_negative_balance_advanced(self):
         """عرض تقرير قوائم الكسر المتقدم"""
@@ -300,17 +298,12 @@ class ReportUI(tk.Frame):
                 sector_id = sector_entry.get().strip()
                 sector_id = int(sector_id) if sector_id else None
                 filter_window.destroy()
-                self.clear_frames()
-                report = self.report_manager.get_negative_balance_lists_report(
-                    sector_id=sector_id
+                self._run_report(
+                    lambda: self.report_manager.get_negative_balance_lists_report(sector_id=sector_id),
+                    self.display_negative_balance_advanced,
+                    "negative_balance_advanced", "تم توليد تقرير قوائم الكسر المتقدم",
+                    filter_enabled=True
                 )
-                self.display_negative_balance_advanced(report)
-                self.current_report = report
-                self.current_report_type = "negative_balance_advanced"
-                self.export_excel_btn.config(state='normal')
-                self.filter_btn.config(state='normal')
-                self.setup_export_options("negative_balance_advanced")
-                self.update_status("تم توليد تقرير قوائم الكسر المتقدم")
             except ValueError:
                 messagebox.showerror("خطأ", "رقم القطاع يجب أن يكون رقماً")
             except Exception as e:
@@ -327,17 +320,9 @@ class ReportUI(tk.Frame):
             self.show_error("لم يتم تحميل نظام التقارير")
             return
         
-        self.clear_frames()
-        try:
-            report = self.report_manager.get_cut_lists_report_old_interface()
-            self.display_cut_lists_old(report)
-            self.current_report = report
-            self.current_report_type = "cut_lists_old"
-            self.export_excel_btn.config(state='disabled')
-            self.filter_btn.config(state='disabled')
-            self.update_status("تم توليد تقرير قوائم القطع القديم")
-        except Exception as e:
-            self.show_error(f"خطأ في عرض التقرير: {e}")
+        self._run_report(self.report_manager.get_cut_lists_report_old_interface,
+                         self.display_cut_lists_old,
+                         "cut_lists_old", "تم توليد تقرير قوائم القطع القديم", export_enabled=False)
     
     def show_cut_lists_advanced(self):
         """عرض تقرير قوائم القطع المتقدم مع فلترة متقدمة"""
@@ -471,29 +456,25 @@ class ReportUI(tk.Frame):
                 sort_by = sort_var.get()
                 
                 filter_window.destroy()
-                self.clear_frames()
                 
                 only_meter_type = "زبون"
                 if include_meter_types:
                     only_meter_type = include_meter_types[0]
                 
-                report = self.report_manager.get_cut_lists_report(
-                    min_balance=min_balance,
-                    max_balance=max_balance,
-                    exclude_categories=exclude_categories,
-                    only_meter_type=only_meter_type,
-                    sector_id=sector_id,   # استخدم sector_id بدلاً من box_id
-                    sort_by=sort_by
+                self._run_report(
+                    lambda: self.report_manager.get_cut_lists_report(
+                        min_balance=min_balance,
+                        max_balance=max_balance,
+                        exclude_categories=exclude_categories,
+                        only_meter_type=only_meter_type,
+                        sector_id=sector_id,   # استخدم sector_id بدلاً من box_id
+                        sort_by=sort_by
+                    ),
+                    self.display_cut_lists_advanced,
+                    "cut_lists_advanced", "تم توليد تقرير قوائم القطع مع الفلترة المتقدمة",
+                    filter_enabled=True, error_prefix="خطأ في التصفية"
                 )
                 
-                self.display_cut_lists_advanced(report)
-                self.current_report = report
-                self.current_report_type = "cut_lists_advanced"
-                self.export_excel_btn.config(state='normal')
-                self.filter_btn.config(state='normal')
-                self.setup_export_options("cut_lists_advanced")
-                self.update_status("تم توليد تقرير قوائم القطع مع الفلترة المتقدمة")
-                
             except ValueError:
                 messagebox.showerror("خطأ", "قيم غير صحيحة. تأكد من إدخال أرقام صحيحة")
             except Exception as e:
@@ -532,17 +513,9 @@ class ReportUI(tk.Frame):
             self.show_error("لم يتم تحميل نظام التقارير")
             return
         
-        self.clear_frames()
-        try:
-            report = self.report_manager.get_free_customers_by_sector_report_old_interface()
-            self.display_free_customers_old(report)
-            self.current_report = report
-            self.current_report_type = "free_customers_old"
-            self.export_excel_btn.config(state='disabled')
-            self.filter_btn.config(state='disabled')
-            self.update_status("تم توليد تقرير الزبائن المجانيين القديم")
-        except Exception as e:
-            self.show_error(f"خطأ في عرض التقرير: {e}")
+        self._run_report(self.report_manager.get_free_customers_by_sector_report_old_interface,
+                         self.display_free_customers_old,
+                         "free_customers_old", "تم توليد تقرير الزبائن المجانيين القديم", export_enabled=False)
     
     def show_free_customers_advanced(self):
         """عرض تقرير الزبائن المجانيين المتقدم"""
@@ -550,18 +523,8 @@ class ReportUI(tk.Frame):
             self.show_error("لم يتم تحميل نظام التقارير")
             return
         
-        self.clear_frames()
-        try:
-            report = self.report_manager.get_free_customers_by_sector_report()
-            self.display_free_customers_advanced(report)
-            self.current_report = report
-            self.current_report_type = "free_customers_advanced"
-            self.export_excel_btn.config(state='normal')
-            self.filter_btn.config(state='normal')
-            self.setup_export_options("free_customers_advanced")
-            self.update_status("تم توليد تقرير الزبائن المجانيين المتقدم")
-        except Exception as e:
-            self.show_error(f"خطأ في عرض التقرير: {e}")
+        self._run_report(self.report_manager.get_free_customers_by_sector_report, self.display_free_customers_advanced,
+                         "free_customers_advanced", "تم توليد تقرير الزبائن المجانيين المتقدم", filter_enabled=True)
     
     def show_dashboard_statistics(self):
         """عرض إحصائيات لوحة التحكم"""
@@ -569,18 +532,9 @@ class ReportUI(tk.Frame):
             self.show_error("لم يتم تحميل نظام التقارير")
             return
         
-        self.clear_frames()
-        try:
-            report = self.report_manager.get_dashboard_statistics()
-            self.display_dashboard_statistics(report)
-            self.current_report = report
-            self.current_report_type = "dashboard"
-            self.export_excel_btn.config(state='normal')
-            self.filter_btn.config(state='disabled')
-            self.setup_export_options("dashboard")
-            self.update_status("تم تحميل إحصائيات لوحة التحكم")
-        except Exception as e:
-            self.show_error(f"خطأ في عرض الإحصائيات: {e}")
+        self._run_report(self.report_manager.get_dashboard_statistics, self.display_dashboard_statistics,
+                         "dashboard", "تم تحميل إحصائيات لوحة التحكم",
+                         error_prefix="خطأ في عرض الإحصائيات")
     
     def show_sales_report(self):
         """عرض تقرير المبيعات"""
@@ -588,18 +542,8 @@ class ReportUI(tk.Frame):
             self.show_error("لم يتم تحميل نظام التقارير")
             return
         
-        self.clear_frames()
-        try:
-            report = self.report_manager.get_sales_report()
-            self.display_sales_report(report)
-            self.current_report = report
-            self.current_report_type = "sales"
-            self.export_excel_btn.config(state='normal')
-            self.filter_btn.config(state='disabled')
-            self.setup_export_options("sales")
-            self.update_status("تم توليد تقرير المبيعات")
-        except Exception as e:
-            self.show_error(f"خطأ في عرض التقرير: {e}")
+        self._run_report(self.report_manager.get_sales_report, self.display_sales_report,
+                         "sales", "تم توليد تقرير المبيعات")
     
     def show_invoice_report(self):
         """عرض تقرير الفواتير"""
@@ -607,18 +551,8 @@ class ReportUI(tk.Frame):
             self.show_error("لم يتم تحميل نظام التقارير")
             return
         
-        self.clear_frames()
-        try:
-            report = self.report_manager.get_invoice_detailed_report()
-            self.display_invoice_report(report)
-            self.current_report = report
-            self.current_report_type = "invoices"
-            self.export_excel_btn.config(state='normal')
-            self.filter_btn.config(state='disabled')
-            self.setup_export_options("invoices")
-            self.update_status("تم توليد تقرير الفواتير")
-        except Exception as e:
-            self.show_error(f"خطأ في عرض التقرير: {e}")
+        self._run_report(self.report_manager.get_invoice_detailed_report, self.display_invoice_report,
+                         "invoices", "تم توليد تقرير الفواتير")
     
     # ============== دوال العرض ==============
     
@@ -997,18 +931,10 @@ class ReportUI(tk.Frame):
 
     def _generate_visa_report(self, sector_id):
         """توليد وعرض تقرير أوراق التأشيرات"""
-        self.clear_frames()
-        try:
-            report = self.report_manager.get_visa_sheets_report(sector_id=sector_id)
-            self.display_visa_report(report)
-            self.current_report = report
-            self.current_report_type = "visa_report"
-            self.export_excel_btn.config(state='normal')
-            self.filter_btn.config(state='disabled')  # لا حاجة لفلترة إضافية حالياً
-            self.setup_export_options("visa_report")
-            self.update_status("تم توليد تقرير أوراق التأشيرات")
-        except Exception as e:
-            self.show_error(f"خطأ في عرض التقرير: {e}")
+        # لا حاجة لفلترة إضافية حالياً
+        self._run_report(lambda: self.report_manager.get_visa_sheets_report(sector_id=sector_id),
+                         self.display_visa_report,
+                         "visa_report", "تم توليد تقرير أوراق التأشيرات")
 
     def display_visa_report(self, report):
         """عرض تقرير أوراق التأشيرات في شجرة (Treeview) مع تجميع هرمي"""
@@ -1086,6 +1012,36 @@ class ReportUI(tk.Frame):
     
     # ============== دوال مساعدة ==============
     
+    def _run_report(self, fetch, display, report_type: str, status: str,
+                    filter_enabled: bool = False, export_enabled: bool = True,
+                    error_prefix: str = "خطأ في عرض التقرير", error_of=None):
+        """
+        تشغيل استعلام التقرير في الخلفية ثم عرضه في خيط الواجهة.
+        طلب تقرير جديد يلغي السابق (مفتاح 'report')، و error_of تستخرج رسالة الفشل
+        من التقارير التي تعيد {'success': False, 'error': ...}.
+        """
+        self.clear_frames()
+        self.status_bar.config(text="جاري توليد التقرير...", fg='#2c3e50')
+
+        def on_success(report):
+            error = error_of(report) if error_of else None
+            if error:
+                self.show_error(error)
+                return
+            display(report)
+            self.current_report = report
+            self.current_report_type = report_type
+            self.export_excel_btn.config(state='normal' if export_enabled else 'disabled')
+            self.filter_btn.config(state='normal' if filter_enabled else 'disabled')
+            if export_enabled:
+                self.setup_export_options(report_type)
+            self.update_status(status)
+
+        self.tasks.submit(fetch, on_success=on_success,
+                          on_error=lambda e: self.show_error(f"{error_prefix}: {e}"),
+                          key='report', widget=self.results_frame,
+                          text="جاري توليد التقرير...", lane='replica')
+
     def clear_frames(self):
         for widget in self.results_frame.winfo_children():
             widget.destroy()
@@ -1135,57 +1091,69 @@ class ReportUI(tk.Frame):
                 filename = f"تقرير_{report_type}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
             if not filename.lower().endswith('.xlsx'):
                 filename += ".xlsx"
-            success = False
-            filepath = ""
+            # نثبت التقرير الحالي: قد يُطلب تقرير آخر قبل انتهاء التصدير في الخلفية
+            report = self.current_report
             if report_type == "negative_balance_advanced":
-                success, filepath = self.report_manager.export_negative_balance_report_to_excel(
-                    self.current_report, filename
+                export = lambda: self.report_manager.export_negative_balance_report_to_excel(
+                    report, filename
                 )
             elif report_type == "cut_lists_advanced":
-                success, filepath = self.report_manager.export_cut_lists_report_to_excel(
-                    self.current_report, filename
+                export = lambda: self.report_manager.export_cut_lists_report_to_excel(
+                    report, filename
                 )
             elif report_type == "free_customers_advanced":
-                success, filepath = self.report_manager.export_free_customers_to_excel(
-                    self.current_report, filename
+                export = lambda: self.report_manager.export_free_customers_to_excel(
+                    report, filename
                 )
             elif report_type in ["sales", "invoices", "dashboard"]:
-                success, filepath = self.report_manager.export_to_excel_generic(
-                    self.current_report, report_type
+                export = lambda: self.report_manager.export_to_excel_generic(
+                    report, report_type
                 )
             elif report_type == "visa_report":
-                success, filepath = self.report_manager.export_visa_report_to_excel(
-                    self.current_report, filename
+                export = lambda: self.report_manager.export_visa_report_to_excel(
+                    report, filename
                 )
             elif report_type == "accountant_collections":   # إضافة هذا الفرع
-                success, filepath = self.report_manager.export_accountant_collections_to_excel(
-                    self.current_report, filename
+                export = lambda: self.report_manager.export_accountant_collections_to_excel(
+                    report, filename
                 )
             elif report_type == 'cycle_inventory':
-                success, filepath = self.report_manager.export_cycle_inventory_to_excel(
-                    self.current_report, filename
+                export = lambda: self.report_manager.export_cycle_inventory_to_excel(
+                    report, filename
                 )
             elif report_type == "vip_full":
-                success, filepath = self.report_manager.export_vip_report_to_excel(
-                    self.current_report, filename
+                export = lambda: self.report_manager.export_vip_report_to_excel(
+                    report, filename
                 )
             elif report_type == "mobile_accountant_full":
-                success, filepath = self.report_manager.export_mobile_accountant_report_to_excel(
-                    self.current_report, filename
-                )    
+                export = lambda: self.report_manager.export_mobile_accountant_report_to_excel(
+                    report, filename
+                )
             else:
                 messagebox.showwarning("تحذير", "نوع التقرير غير مدعوم للتصدير")
                 return
-            if success:
-                messagebox.showinfo("نجاح", f"تم تصدير التقرير بنجاح إلى:\n{filepath}")
-                try:
-                    os.startfile(filepath) if os.name == 'nt' else webbrowser.open(filepath)
-                except:
-                    pass
-                self.update_status("تم تصدير التقرير بنجاح")
-            else:
-                messagebox.showerror("خطأ", f"فشل تصدير التقرير: {filepath}")
-                self.show_error(f"خطأ: {filepath}")
+
+            def on_done(result):
+                success, filepath = result
+                if success:
+                    messagebox.showinfo("نجاح", f"تم تصدير التقرير بنجاح إلى:\n{filepath}")
+                    try:
+                        os.startfile(filepath) if os.name == 'nt' else webbrowser.open(filepath)
+                    except:
+                        pass
+                    self.update_status("تم تصدير التقرير بنجاح")
+                else:
+                    messagebox.showerror("خطأ", f"فشل تصدير التقرير: {filepath}")
+                    self.show_error(f"خطأ: {filepath}")
+
+            def on_error(e):
+                logger.error(f"خطأ في تصدير التقرير: {e}")
+                self.show_error(f"فشل تصدير التقرير: {e}")
+
+            self.tasks.submit(export, on_success=on_done, on_error=on_error,
+                              widget=self.export_frame,
+                              text="جاري التصدير...", cancellable=False,
+                              lane='replica')
         except Exception as e:
             logger.error(f"خطأ في تصدير التقرير: {e}")
             messagebox.showerror("خطأ", f"فشل تصدير التقرير: {str(e)}")
@@ -1318,22 +1286,19 @@ class ReportUI(tk.Frame):
                         break
                 sort_by = sort_var.get()
                 filter_window.destroy()
-                self.clear_frames()
-                report = self.report_manager.get_negative_balance_lists_report(
-                    min_balance=min_balance,
-                    max_balance=max_balance,
-                    exclude_categories=exclude_categories,
-                    include_meter_types=include_meter_types,
-                    sector_id=sector_id,
-                    sort_by=sort_by
+                self._run_report(
+                    lambda: self.report_manager.get_negative_balance_lists_report(
+                        min_balance=min_balance,
+                        max_balance=max_balance,
+                        exclude_categories=exclude_categories,
+                        include_meter_types=include_meter_types,
+                        sector_id=sector_id,
+                        sort_by=sort_by
+                    ),
+                    self.display_negative_balance_advanced,
+                    "negative_balance_advanced", "تم توليد تقرير قوائم الكسر مع الفلترة المتقدمة",
+                    filter_enabled=True, error_prefix="خطأ في التصفية"
                 )
-                self.display_negative_balance_advanced(report)
-                self.current_report = report
-                self.current_report_type = "negative_balance_advanced"
-                self.export_excel_btn.config(state='normal')
-                self.filter_btn.config(state='normal')
-                self.setup_export_options("negative_balance_advanced")
-                self.update_status("تم توليد تقرير قوائم الكسر مع الفلترة المتقدمة")
             except ValueError:
                 messagebox.showerror("خطأ", "قيم غير صحيحة. تأكد من إدخال أرقام صحيحة")
             except Exception as e:
@@ -1417,22 +1382,18 @@ class ReportUI(tk.Frame):
                 acc_id = accountant_dict.get(selected_name) if selected_name != 'الكل' else None
 
                 filter_window.destroy()
-                self.clear_frames()
 
-                report = self.report_manager.get_accountant_collections_report(
-                    accountant_id=acc_id,
-                    start_datetime=start if start else None,
-                    end_datetime=end if end else None
+                self._run_report(
+                    lambda: self.report_manager.get_accountant_collections_report(
+                        accountant_id=acc_id,
+                        start_datetime=start if start else None,
+                        end_datetime=end if end else None
+                    ),
+                    self.display_accountant_collections_report,
+                    "accountant_collections", "تم توليد تقرير جبايات المحاسب",
+                    error_prefix="خطأ في تطبيق الفلترة"
                 )
 
-                self.display_accountant_collections_report(report)
-                self.current_report = report
-                self.current_report_type = "accountant_collections"
-                self.export_excel_btn.config(state='normal')
-                self.filter_btn.config(state='disabled')
-                self.setup_export_options("accountant_collections")
-                self.update_status("تم توليد تقرير جبايات المحاسب")
-
             except Exception as e:
                 self.show_error(f"خطأ في تطبيق الفلترة: {e}")
 
@@ -1614,21 +1575,13 @@ class ReportUI(tk.Frame):
             end = end_var.get().strip()
             include_visa = visa_var.get()
             dialog.destroy()
-            self.clear_frames()
-            try:
-                report = self.report_manager.get_cycle_inventory_report(start, end, include_visa_effect=include_visa)
-                if 'error' in report:
-                    self.show_error(report['error'])
-                    return
-                self.current_report = report
-                self.current_report_type = 'cycle_inventory'
-                self.export_excel_btn.config(state='normal')
-                self.filter_btn.config(state='normal')
-                self.setup_export_options('cycle_inventory')
-                self.display_cycle_inventory_report(report)
-                self.update_status("تم توليد تقرير جرد الدورة")
-            except Exception as e:
-                self.show_error(f"خطأ في توليد التقرير: {e}")
+            self._run_report(
+                lambda: self.report_manager.get_cycle_inventory_report(start, end, include_visa_effect=include_visa),
+                self.display_cycle_inventory_report,
+                'cycle_inventory', "تم توليد تقرير جرد الدورة",
+                filter_enabled=True, error_prefix="خطأ في توليد التقرير",
+                error_of=lambda report: report.get('error')
+            )
 
         btn_frame = tk.Frame(dialog)
         btn_frame.pack(pady=10)
@@ -1655,6 +1608,13 @@ class ReportUI(tk.Frame):
                             font=('Arial', 10), bg='white', fg='gray')
         period_lbl.pack()
 
+        # الأقسام التي فشل جلبها تُعرض فارغة: ننبه المستخدم حتى لا تُقرأ كأصفار
+        failed = report.get('failed_sections') or {}
+        if failed:
+            tk.Label(main_frame,
+                     text=f"⚠️ تعذر جلب بعض الأقسام: {', '.join(failed)}",
+                     font=('Arial', 10, 'bold'), bg='white', fg='#e74c3c').pack()
+
         # إنشاء notebook داخلي لتقسيم الأقسام
         nb = ttk.Notebook(main_frame)
         nb.pack(fill='both', expand=True, pady=10)
@@ -1865,21 +1825,11 @@ class ReportUI(tk.Frame):
 
     def _generate_vip_report(self, sector_id):
         """توليد وعرض تقرير VIP"""
-        self.clear_frames()
-        try:
-            report = self.report_manager.get_vip_full_report(sector_id=sector_id)
-            if not report.get('success'):
-                self.show_error(report.get('error', 'فشل توليد التقرير'))
-                return
-
-            self.display_vip_report(report)
-            self.current_report = report
-            self.current_report_type = "vip_full"
-            self.export_excel_btn.config(state='normal')
-            self.setup_export_options("vip_full")
-            self.update_status("تم توليد تقرير VIP الشامل")
-        except Exception as e:
-            self.show_error(f"خطأ في عرض التقرير: {e}")
+        self._run_report(lambda: self.report_manager.get_vip_full_report(sector_id=sector_id),
+                         self.display_vip_report,
+                         "vip_full", "تم توليد تقرير VIP الشامل",
+                         error_of=lambda report: None if report.get('success')
+                         else report.get('error', 'فشل توليد التقرير'))
 
     def display_vip_report(self, report):
         """عرض تقرير VIP في شجرة هرمية"""
@@ -2000,21 +1950,11 @@ class ReportUI(tk.Frame):
 
     def _generate_mobile_accountant_report(self, sector_id):
         """توليد وعرض تقرير المحاسبة الجوالة"""
-        self.clear_frames()
-        try:
-            report = self.report_manager.get_mobile_accountant_full_report(sector_id=sector_id)
-            if not report.get('success'):
-                self.show_error(report.get('error', 'فشل توليد التقرير'))
-                return
-
-            self.display_mobile_accountant_report(report)
-            self.current_report = report
-            self.current_report_type = "mobile_accountant_full"
-            self.export_excel_btn.config(state='normal')
-            self.setup_export_options("mobile_accountant_full")
-            self.update_status("تم توليد تقرير المحاسبة الجوالة الشامل")
-        except Exception as e:
-            self.show_error(f"خطأ في عرض التقرير: {e}")
+        self._run_report(lambda: self.report_manager.get_mobile_accountant_full_report(sector_id=sector_id),
+                         self.display_mobile_accountant_report,
+                         "mobile_accountant_full", "تم توليد تقرير المحاسبة الجوالة الشامل",
+                         error_of=lambda report: None if report.get('success')
+                         else report.get('error', 'فشل توليد التقرير'))
 
     def display_mobile_accountant_report(self, report):
         """عرض تقرير المحاسبة الجوالة في شجرة هرمية (مثل تقرير VIP)"""
@@ -2089,5 +2029,129 @@ class ReportUI(tk.Frame):
             f"إجمالي التأشيرة: {grand_total.get('total_visa', 0):,.0f}  |  "
             f"إجمالي السحب: {grand_total.get('total_withdrawal', 0):,.0f}"
         )
-        tk.Label(total_frame, text=total_text, font=('Arial', 10, 'bold')).pack()        
+        tk.Label(total_frame, text=total_text, font=('Arial', 10, 'bold')).pack()
 
+    # ============== التقارير الأسبوعية الجاهزة (اللقطات) ==============
+
+    def show_report_snapshots(self):
+        """آخر لقطة لكل تقرير أسبوعي مع حالة البيانات منذ توليدها"""
+        from modules.report_snapshots import report_snapshots
+        self.clear_frames()
+        self.status_bar.config(text="جاري تحميل التقارير الجاهزة...", fg='#2c3e50')
+        self.tasks.submit(lambda: (report_snapshots.list_latest(), report_snapshots.current_watermark()),
+                          on_success=self.display_report_snapshots,
+                          on_error=lambda e: self.show_error(f"خطأ في تحميل التقارير الجاهزة: {e}"),
+                          key='report', widget=self.results_frame,
+                          text="جاري تحميل التقارير الجاهزة...")
+
+    def display_report_snapshots(self, result):
+        from modules.report_snapshots import SNAPSHOT_REPORTS
+        snapshots, watermark = result
+        latest = {snap['report_key']: snap for snap in snapshots}
+        self.current_report = None
+        self.current_report_type = None
+        self.export_excel_btn.config(state='disabled')
+        self.filter_btn.config(state='disabled')
+
+        frame = tk.Frame(self.results_frame, bg='white')
+        frame.pack(fill='both', expand=True, padx=10, pady=10)
+        tk.Label(frame, text="📦 التقارير الأسبوعية الجاهزة", font=('Arial', 14, 'bold'),
+                 bg='white').grid(row=0, column=0, columnspan=6, pady=(0, 10))
+
+        for col, header in enumerate(("التقرير", "النسخة", "تاريخ التوليد", "الحالة")):
+            tk.Label(frame, text=header, font=('Arial', 10, 'bold'), bg='#ecf0f1',
+                     padx=8, pady=4).grid(row=1, column=col, sticky='ew')
+
+        for row, (report_key, spec) in enumerate(SNAPSHOT_REPORTS.items(), start=2):
+            snap = latest.get(report_key)
+            stale = snap is None or snap.get('watermark') != watermark
+            if snap is None:
+                status, color = "لا توجد لقطة", '#7f8c8d'
+            elif stale:
+                status, color = "تغيرت البيانات منذ التوليد", '#e67e22'
+            else:
+                status, color = "محدّث", '#27ae60'
+
+            tk.Label(frame, text=spec['title'], bg='white', anchor='w').grid(row=row, column=0, sticky='ew', padx=4)
+            tk.Label(frame, text=snap['version'] if snap else '-', bg='white').grid(row=row, column=1, padx=4)
+            generated_at = snap['generated_at'].strftime('%Y-%m-%d %H:%M') if snap else '-'
+            tk.Label(frame, text=generated_at, bg='white').grid(row=row, column=2, padx=4)
+            tk.Label(frame, text=status, fg=color, bg='white',
+                     font=('Arial', 10, 'bold')).grid(row=row, column=3, padx=4)
+
+            buttons = tk.Frame(frame, bg='white')
+            buttons.grid(row=row, column=4, sticky='w', padx=4, pady=2)
+            if snap:
+                tk.Button(buttons, text="عرض", width=8,
+                          command=lambda s=snap, t=spec['report_type']: self.open_report_snapshot(s, t)).pack(side='left', padx=2)
+                if snap.get('xlsx_name'):
+                    tk.Button(buttons, text="Excel", width=8,
+                              command=lambda s=snap: self.open_report_snapshot_excel(s)).pack(side='left', padx=2)
+            # إعادة التوليد فقط عند تغير البيانات (أو عدم وجود لقطة)
+            tk.Button(buttons, text="إعادة التوليد", width=12,
+                      state='normal' if stale else 'disabled',
+                      command=lambda k=report_key: self.regenerate_report_snapshot(k)).pack(side='left', padx=2)
+
+        self.update_status(f"تم تحميل {len(latest)} تقرير جاهز")
+
+    def open_report_snapshot(self, snap, report_type):
+        """عرض التقرير من اللقطة المحفوظة دون إعادة تنفيذ استعلاماته"""
+        from modules.report_snapshots import report_snapshots
+        displays = {
+            'cut_lists_advanced': self.display_cut_lists_advanced,
+            'negative_balance_advanced': self.display_negative_balance_advanced,
+            'visa_report': self.display_visa_report,
+            'cycle_inventory': self.display_cycle_inventory_report,
+            'vip_full': self.display_vip_report,
+            'mobile_accountant_full': self.display_mobile_accountant_report,
+        }
+
+        def on_success(snapshot):
+            if snapshot is None:
+                self.show_error("اللقطة غير موجودة (ربما حُذفت نسخة أقدم)")
+                return
+            self.clear_frames()
+            displays[report_type](snapshot['report'])
+            self.current_report = snapshot['report']
+            self.current_report_type = report_type
+            self.export_excel_btn.config(state='normal')
+            self.setup_export_options(report_type)
+            self.update_status(f"لقطة نسخة {snapshot['version']} - "
+                               f"{snapshot['generated_at'].strftime('%Y-%m-%d %H:%M')}")
+
+        self.tasks.submit(lambda: report_snapshots.load(snap['id']), on_success=on_success,
+                          on_error=lambda e: self.show_error(f"خطأ في فتح اللقطة: {e}"),
+                          key='report', widget=self.results_frame, text="جاري فتح اللقطة...")
+
+    def open_report_snapshot_excel(self, snap):
+        from modules.report_snapshots import report_snapshots
+
+        def on_success(filepath):
+            if not filepath:
+                self.show_error("لا يوجد ملف Excel لهذه اللقطة")
+                return
+            try:
+                os.startfile(filepath) if os.name == 'nt' else webbrowser.open(filepath)
+            except Exception:
+                messagebox.showinfo("نجاح", f"تم حفظ الملف في:\n{filepath}")
+            self.update_status(f"تم فتح ملف اللقطة: {filepath}")
+
+        self.tasks.submit(lambda: report_snapshots.save_xlsx(snap['id']), on_success=on_success,
+                          on_error=lambda e: self.show_error(f"خطأ في حفظ ملف اللقطة: {e}"),
+                          widget=self.results_frame, text="جاري تجهيز الملف...", cancellable=False)
+
+    def regenerate_report_snapshot(self, report_key):
+        from modules.report_snapshots import report_snapshots
+
+        def on_success(result):
+            if not result.get('success'):
+                self.show_error(f"فشل توليد التقرير: {result.get('error')}")
+                return
+            self.show_report_snapshots()
+
+        # القراءة والحفظ في وحدة عمل واحدة على الخادم الأساسي (مسار التقارير)
+        self.tasks.submit(lambda: report_snapshots.generate(report_key, user_id=self.user_data.get('id')),
+                          on_success=on_success,
+                          on_error=lambda e: self.show_error(f"فشل توليد التقرير: {e}"),
+                          key='snapshot_regenerate', widget=self.results_frame,
+                          text="جاري توليد التقرير...", cancellable=False, lane='reporting')
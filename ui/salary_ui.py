@@ -6,7 +6,9 @@ from datetime import date, datetime
 from modules.salary_manager import SalaryManager
 from modules.daily_cash import DailyCashManager
 from database.connection import db
+from utils.tracing import traced_class
 
+@traced_class(prefix='load_')
 class SalaryUI(tk.Frame):
     def __init__(self, parent, user_data):
         super().__init__(parent)
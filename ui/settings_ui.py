@@ -4,8 +4,10 @@ from tkinter import ttk, messagebox
 import json
 import os
 from database.connection import db
-from datetime import datetime, timedelta
+from datetime import datetime
+from utils.tracing import traced_class, tracer
 
+@traced_class(prefix='load_')
 class SettingsUI:
     def __init__(self, parent_frame):
         self.parent = parent_frame
@@ -74,11 +76,8 @@ class SettingsUI:
                 cursor.execute("SELECT MIN(cash_date) as first_date FROM daily_cash")
                 first = cursor.fetchone()
                 if first and first['first_date']:
-                    models.recalculate_daily_cash(first['first_date'])
-                    # إعادة حساب الجرد الأسبوعي إذا لزم الأمر
-                    # نحدد بداية الأسبوع لذلك التاريخ
-                    week_start = first['first_date'] - timedelta(days=first['first_date'].weekday())
-                    models.recalculate_week_cash_inventory(week_start)
+                    # إعادة حساب السلسلة كاملة من اليوم الأول (تشمل الجرد الأسبوعي المتأثر)
+                    models.recalculate_daily_cash_chain(first['first_date'])
 
             messagebox.showinfo("نجاح", "تم حفظ الإعدادات")
             return True
@@ -114,6 +113,11 @@ class SettingsUI:
         notebook.add(owners_frame, text="المدراء")
         self.create_owners_tab(owners_frame)
 
+        # تبويب الأداء (التتبع)
+        performance_frame = ttk.Frame(notebook)
+        notebook.add(performance_frame, text="الأداء")
+        self.create_performance_tab(performance_frame)
+
         btn_frame = ttk.Frame(frame)
         btn_frame.pack(pady=10)
         ttk.Button(btn_frame, text="حفظ", command=self.save_settings).pack(side='left', padx=5)
@@ -259,6 +263,67 @@ class SettingsUI:
         self.load_owners()
         messagebox.showinfo("تم", "تم تغيير الحالة")
 
+    def create_performance_tab(self, parent):
+        """تفعيل التتبع أثناء التشغيل وعرض ملخص آخر التتبعات وتصديرها"""
+        frame = ttk.Frame(parent)
+        frame.pack(fill='both', expand=True, padx=10, pady=10)
+
+        top = ttk.Frame(frame)
+        top.pack(fill='x', pady=5)
+        self.tracing_var = tk.BooleanVar(value=tracer.enabled)
+        ttk.Checkbutton(top, text="تفعيل تتبع الأداء (للشاشات التي تُفتح بعد التفعيل)",
+                        variable=self.tracing_var, command=self.toggle_tracing).pack(side='left', padx=5)
+        self.tracing_status = ttk.Label(top, text="")
+        self.tracing_status.pack(side='left', padx=15)
+
+        list_frame = ttk.LabelFrame(frame, text="أبطأ العمليات في آخر التتبعات")
+        list_frame.pack(fill='both', expand=True, pady=5)
+        columns = ('name', 'calls', 'total_ms', 'self_ms', 'sql_ms', 'sql_count')
+        headings = ('العملية', 'الاستدعاءات', 'الزمن الكلي (ms)', 'الزمن الخاص (ms)', 'زمن SQL (ms)', 'الاستعلامات')
+        self.tracing_tree = ttk.Treeview(list_frame, columns=columns, show='headings', height=10)
+        for col, heading in zip(columns, headings):
+            self.tracing_tree.heading(col, text=heading)
+            self.tracing_tree.column(col, width=260 if col == 'name' else 100)
+        self.tracing_tree.pack(fill='both', expand=True, padx=5, pady=5)
+
+        btn_frame = ttk.Frame(frame)
+        btn_frame.pack(fill='x', pady=5)
+        ttk.Button(btn_frame, text="تحديث", command=self.load_tracing_summary).pack(side='left', padx=5)
+        ttk.Button(btn_frame, text="تصدير Flame Graph",
+                   command=lambda: self.export_traces('collapsed')).pack(side='left', padx=5)
+        ttk.Button(btn_frame, text="تصدير Chrome Trace",
+                   command=lambda: self.export_traces('chrome')).pack(side='left', padx=5)
+        ttk.Button(btn_frame, text="مسح", command=self.clear_traces).pack(side='left', padx=5)
+
+        self.load_tracing_summary()
+
+    def toggle_tracing(self):
+        tracer.set_enabled(self.tracing_var.get())
+        self.load_tracing_summary()
+
+    def load_tracing_summary(self):
+        for row in self.tracing_tree.get_children():
+            self.tracing_tree.delete(row)
+        for row in tracer.summary():
+            self.tracing_tree.insert('', 'end', values=(
+                row['name'], row['calls'], row['total_ms'], row['self_ms'], row['sql_ms'], row['sql_count']))
+        state = "مفعل" if tracer.enabled else "معطل"
+        self.tracing_status.config(text=f"التتبع {state} - {len(tracer.traces)} تتبع محفوظ")
+
+    def export_traces(self, fmt):
+        if not tracer.traces:
+            messagebox.showwarning("تنبيه", "لا توجد تتبعات للتصدير")
+            return
+        try:
+            path = tracer.export(fmt)
+            messagebox.showinfo("تم", f"تم التصدير إلى:\n{path}")
+        except Exception as e:
+            messagebox.showerror("خطأ", f"فشل التصدير: {str(e)}")
+
+    def clear_traces(self):
+        tracer.clear()
+        self.load_tracing_summary()
+
     def reset_settings(self):
         if messagebox.askyesno("تأكيد", "هل تريد إعادة تعيين جميع الإعدادات؟"):
             self.settings = {}
@@ -0,0 +1,290 @@
+# ui/task_executor.py
+"""
+منفذ المهام الخلفية لشاشات Tk.
+
+- مجموعة خيوط ثابتة؛ كل مهمة تعمل داخل db.transaction() فتحجز اتصالاً واحداً من
+  المجموعة طوال تنفيذها (كل استدعاءات get_cursor داخلها تستخدمه). المهام التي
+  تلتزم على دفعات بنفسها (مثل مزامنة التحصيل) تُرسل بـ transaction=False.
+- النتائج والتقدم تمر عبر طابور واحد يُفحص بـ after في خيط الواجهة، فلا تُلمس
+  عناصر Tk إلا من الخيط الرئيسي.
+- المهام ذات المفتاح نفسه (key) تلغي السابقة: تُلغى قبل البدء، أو يُلغى استعلامها
+  الجاري على الخادم وتُهمل نتيجتها.
+- LoadingOverlay طبقة تحميل موحدة فوق العنصر المالك مع شريط تقدم وزر إلغاء.
+
+الاستخدام:
+    tasks = get_task_executor(self)
+    tasks.submit(manager.get_report, sector_id, on_success=self.display, key='report', widget=self.results_frame)
+"""
+import logging
+import queue
+import threading
+import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from tkinter import ttk, messagebox
+from typing import Any, Callable, Dict, Optional
+
+from config.settings import UI_TASK_CONFIG
+from database.connection import db
+
+logger = logging.getLogger(__name__)
+
+
+class TaskHandle:
+    """مقبض مهمة: الإلغاء والتقدم والحالة"""
+
+    def __init__(self, executor: 'TaskExecutor', key: Optional[str]):
+        self._executor = executor
+        self.key = key
+        self.future = None
+        self.cancelled = False
+        self.connection = None
+        self.overlay: Optional['LoadingOverlay'] = None
+        self.on_progress = None
+        self._delivered = False
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        """إلغاء المهمة: قبل البدء لا تُنفذ، وأثناء التنفيذ يُلغى الاستعلام الجاري وتُهمل النتيجة"""
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            connection = self.connection
+        if self.future is not None:
+            self.future.cancel()
+        if connection is not None and UI_TASK_CONFIG.get('cancel_running_queries', True):
+            try:
+                connection.cancel()
+            except Exception as e:
+                logger.debug(f"تعذر إلغاء الاستعلام الجاري: {e}")
+
+    def report_progress(self, value: Optional[float] = None, text: Optional[str] = None):
+        """يُستدعى من داخل المهمة (من خيط العمل) لتحديث شريط التقدم"""
+        if not self.cancelled:
+            self._executor._post(('progress', self, value, text))
+
+    def _attach(self, connection):
+        with self._lock:
+            self.connection = connection
+            cancelled = self.cancelled
+        if cancelled:
+            connection.cancel()
+
+    def _detach(self):
+        with self._lock:
+            self.connection = None
+
+
+class LoadingOverlay:
+    """طبقة تحميل فوق عنصر مع نص وشريط تقدم وزر إلغاء اختياري"""
+
+    def __init__(self, widget, text: str = "جاري التحميل...", on_cancel: Optional[Callable] = None):
+        self.frame = tk.Frame(widget, bg='#f8f9fa', highlightthickness=1, highlightbackground='#dcdde1')
+        self.frame.place(relx=0, rely=0, relwidth=1, relheight=1)
+        self.frame.lift()
+
+        inner = tk.Frame(self.frame, bg='#f8f9fa')
+        inner.place(relx=0.5, rely=0.4, anchor='center')
+        self.label = tk.Label(inner, text=text, font=('Arial', 12, 'bold'), bg='#f8f9fa', fg='#2c3e50')
+        self.label.pack(pady=(0, 10))
+        self.progress = ttk.Progressbar(inner, mode='indeterminate', length=260)
+        self.progress.pack()
+        self.progress.start(12)
+        if on_cancel:
+            tk.Button(inner, text="إلغاء", command=on_cancel, bg='#e74c3c', fg='white',
+                      width=10).pack(pady=10)
+
+    def set_progress(self, value: Optional[float] = None, text: Optional[str] = None):
+        try:
+            if value is not None:
+                if str(self.progress.cget('mode')) != 'determinate':
+                    self.progress.stop()
+                    self.progress.config(mode='determinate', maximum=100)
+                self.progress['value'] = max(0, min(100, value))
+            if text:
+                self.label.config(text=text)
+        except tk.TclError:
+            pass
+
+    def close(self):
+        try:
+            self.progress.stop()
+            self.frame.destroy()
+        except tk.TclError:
+            pass
+
+
+class TaskExecutor:
+    """منفذ مهام مرتبط بنافذة Tk الجذرية"""
+
+    def __init__(self, root, workers: Optional[int] = None):
+        self.root = root
+        self.poll_interval = int(UI_TASK_CONFIG.get('poll_interval_ms', 50))
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers or int(UI_TASK_CONFIG.get('workers', 4)),
+            thread_name_prefix='ui-task'
+        )
+        self._queue: 'queue.Queue[tuple]' = queue.Queue()
+        self._active: Dict[str, TaskHandle] = {}
+        self._pending = 0
+        self._polling = False
+
+    # ------------------------------------------------------------------
+    # الواجهة العامة (من خيط الواجهة فقط)
+    # ------------------------------------------------------------------
+    def submit(self, fn: Callable, *args,
+               on_success: Optional[Callable[[Any], None]] = None,
+               on_error: Optional[Callable[[Exception], None]] = None,
+               on_progress: Optional[Callable[[Optional[float], Optional[str]], None]] = None,
+               key: Optional[str] = None,
+               widget=None,
+               overlay: bool = True,
+               text: str = "جاري التحميل...",
+               with_progress: bool = False,
+               cancellable: bool = True,
+               lane: Optional[str] = None,
+               transaction: bool = True,
+               **kwargs) -> TaskHandle:
+        """
+        تنفيذ fn(*args, **kwargs) في الخلفية ثم استدعاء on_success/on_error في خيط الواجهة.
+        with_progress: تمرير المقبض للدالة كمعامل progress (يستدعي progress.report_progress).
+        widget: العنصر المالك - تُعرض فوقه طبقة التحميل وتُهمل النتيجة إن أُغلق قبل انتهائها.
+        lane: مسار الاتصالات ('replica' للتقارير والتصدير، 'reporting' للخادم الأساسي) - الافتراضي المسار التفاعلي.
+        transaction: False لتشغيل المهمة دون وحدة عمل شاملة (كل get_cursor يلتزم بمعاملته).
+        """
+        handle = TaskHandle(self, key)
+        if key is not None:
+            previous = self._active.get(key)
+            if previous is not None:
+                previous.cancel()
+            self._active[key] = handle
+
+        if widget is not None and overlay:
+            handle.overlay = LoadingOverlay(widget, text, on_cancel=handle.cancel if cancellable else None)
+        if with_progress:
+            kwargs['progress'] = handle
+        handle.on_progress = on_progress
+
+        callbacks = (on_success, on_error, widget)
+        self._pending += 1
+        handle.future = self._pool.submit(self._run, handle, callbacks, fn, args, kwargs, lane, transaction)
+        # مهمة أُلغيت قبل أن تبدأ لا تمر بـ _run: نبلغ بانتهائها لإغلاق طبقة التحميل
+        handle.future.add_done_callback(
+            lambda f: f.cancelled() and self._post(('done', handle, callbacks, None, None))
+        )
+        self._ensure_polling()
+        return handle
+
+    def cancel(self, key: str):
+        handle = self._active.pop(key, None)
+        if handle is not None:
+            handle.cancel()
+
+    def shutdown(self):
+        for handle in list(self._active.values()):
+            handle.cancel()
+        self._active.clear()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    # ------------------------------------------------------------------
+    # خيط العمل
+    # ------------------------------------------------------------------
+    def _run(self, handle: TaskHandle, callbacks, fn, args, kwargs, lane=None, transaction=True):
+        if handle.cancelled:
+            self._post(('done', handle, callbacks, None, None))
+            return
+        try:
+            # اتصال واحد لكل المهمة (وحدة عمل)، ويُسجل للمقبض حتى يمكن إلغاء الاستعلام الجاري
+            with db.lane(lane), (db.transaction() if transaction else nullcontext()) as conn:
+                if conn is not None:
+                    handle._attach(conn)
+                try:
+                    result = fn(*args, **kwargs)
+                finally:
+                    handle._detach()
+            self._post(('done', handle, callbacks, result, None))
+        except Exception as e:
+            self._post(('done', handle, callbacks, None, e))
+
+    def _post(self, message: tuple):
+        self._queue.put(message)
+
+    # ------------------------------------------------------------------
+    # التسليم في خيط الواجهة
+    # ------------------------------------------------------------------
+    def _ensure_polling(self):
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_interval, self._poll)
+
+    def _poll(self):
+        try:
+            while True:
+                try:
+                    message = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if message[0] == 'progress':
+                    self._deliver_progress(*message[1:])
+                else:
+                    self._deliver_done(*message[1:])
+        finally:
+            if self._pending > 0:
+                try:
+                    self.root.after(self.poll_interval, self._poll)
+                except tk.TclError:
+                    self._polling = False
+            else:
+                self._polling = False
+
+    @staticmethod
+    def _alive(widget) -> bool:
+        if widget is None:
+            return True
+        try:
+            return bool(widget.winfo_exists())
+        except tk.TclError:
+            return False
+
+    def _deliver_progress(self, handle: TaskHandle, value, text):
+        if handle.cancelled:
+            return
+        if handle.overlay:
+            handle.overlay.set_progress(value, text)
+        if handle.on_progress:
+            handle.on_progress(value, text)
+
+    def _deliver_done(self, handle: TaskHandle, callbacks, result, error):
+        if handle._delivered:
+            return
+        handle._delivered = True
+        self._pending -= 1
+        on_success, on_error, widget = callbacks
+        if handle.overlay:
+            handle.overlay.close()
+        if handle.key is not None and self._active.get(handle.key) is handle:
+            del self._active[handle.key]
+        if handle.cancelled or not self._alive(widget):
+            return
+        try:
+            if error is not None:
+                if on_error:
+                    on_error(error)
+                else:
+                    logger.error(f"خطأ في مهمة خلفية: {error}")
+                    messagebox.showerror("خطأ", str(error))
+            elif on_success:
+                on_success(result)
+        except Exception as e:
+            logger.error(f"خطأ في معالجة نتيجة مهمة خلفية: {e}", exc_info=True)
+
+
+def get_task_executor(widget) -> TaskExecutor:
+    """المنفذ المشترك لنافذة العنصر الجذرية (يُنشأ عند أول استخدام)"""
+    root = widget._root()
+    executor = getattr(root, '_task_executor', None)
+    if executor is None:
+        executor = TaskExecutor(root)
+        root._task_executor = executor
+    return executor
@@ -9,13 +9,16 @@ from datetime import datetime
 from auth.authentication import auth
 from auth.permissions import has_permission, require_permission
 from database.connection import db  # تغيير هنا
+from database.reference_data import reference_data, USERS
 from auth.permission_engine import permission_engine  # تغيير هنا
 import psycopg2
 from auth.session import Session
+from utils.tracing import traced_class
 
 logger = logging.getLogger(__name__)
 
 
+@traced_class(prefix='load_')
 class UsersUI:
     def __init__(self, parent_frame):
         self.parent = parent_frame
@@ -473,6 +476,7 @@ class UsersUI:
                             WHERE id = %s
                         """, (username, full_name, role, email, user_id))
                     cursor.connection.commit()
+                reference_data.invalidate(USERS)
             except Exception as e:
                 logger.error(f"خطأ في تعديل المستخدم: {e}", exc_info=True)
                 try:
@@ -571,6 +575,7 @@ class UsersUI:
                         WHERE id = %s
                     """, (user_id,))
                     cursor.connection.commit()
+                reference_data.invalidate(USERS)
             except Exception as e:
                 logger.error(f"خطأ في تعطيل المستخدم: {e}", exc_info=True)
                 try:
@@ -0,0 +1,387 @@
+# ui/virtual_grid.py
+"""
+جدول افتراضي للبيانات الكبيرة فوق ttk.Treeview.
+
+- البيانات تُحفظ في مخزن أعمدة (قائمة قيم لكل عمود + قائمة وسوم للصفوف)، ولا يُنشأ
+  في الشجرة إلا عدد الصفوف الظاهرة؛ التمرير يعيد تعبئة نفس العناصر من المخزن.
+  لذلك فتح آلاف الصفوف فوري والتمرير سلس مهما كان الحجم.
+- الصف يُعرّف برقمه في المخزن (row)، و"العرض" (view) قائمة أرقام الصفوف الظاهرة
+  بترتيبها بعد الفلترة.
+- set_value للتعديل في المكان، set_tags للتلوين (مع تلوين متناوب اختياري)،
+  find/find_next للبحث النصي، lookup للمطابقة التامة عبر فهرس hash.
+
+الاستخدام:
+    grid = VirtualGrid(parent, ('id', 'name'), stripe_tags=('even', 'odd'))
+    grid.tree.heading('name', text='الاسم')
+    grid.set_rows([(1, 'أحمد'), (2, 'محمد')])
+"""
+import tkinter as tk
+from tkinter import ttk
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union
+
+Column = Union[int, str]
+
+
+class VirtualGrid(tk.Frame):
+    """جدول افتراضي: عناصر الشجرة هي الصفوف الظاهرة فقط"""
+
+    WHEEL_UNITS = 3
+    DEFAULT_ROW_HEIGHT = 20
+    DEFAULT_HEADER_HEIGHT = 25
+
+    def __init__(self, parent, columns: Sequence[str], height: int = 20,
+                 stripe_tags: Optional[Sequence[str]] = None, show: str = 'headings', **kwargs):
+        super().__init__(parent, **kwargs)
+        self.columns = list(columns)
+        self._col_index = {name: i for i, name in enumerate(self.columns)}
+        self.stripe_tags = tuple(stripe_tags) if stripe_tags else None
+
+        self._store: List[list] = [[] for _ in self.columns]
+        self._tags: List[tuple] = []
+        self._view: List[int] = []
+        self._positions: Optional[Dict[int, int]] = None   # row -> موضعه في العرض (يُبنى عند الحاجة)
+        self._lowered: Dict[int, List[str]] = {}            # نصوص البحث لكل عمود
+        self._indexes: Dict[int, Dict[str, List[int]]] = {}  # فهارس المطابقة التامة لكل عمود
+        self._first = 0
+        self._slots: List[str] = []
+        self._attached = 0
+        self._selected: Optional[int] = None
+
+        self.y_scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        self.y_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.x_scrollbar = ttk.Scrollbar(self, orient=tk.HORIZONTAL)
+        self.x_scrollbar.pack(side=tk.BOTTOM, fill=tk.X)
+
+        self.tree = ttk.Treeview(self, columns=self.columns, show=show, height=height,
+                                 selectmode='browse', xscrollcommand=self.x_scrollbar.set)
+        self.x_scrollbar.config(command=self.tree.xview)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self._set_slot_count(height)
+
+        self.tree.bind('<Configure>', self._on_configure, add='+')
+        self.tree.bind('<ButtonPress-1>', self._on_click, add='+')
+        for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+            self.tree.bind(sequence, self._on_wheel)
+        self.tree.bind('<Up>', lambda e: self._on_key_move(-1))
+        self.tree.bind('<Down>', lambda e: self._on_key_move(1))
+        self.tree.bind('<Prior>', lambda e: self._on_key_move(-len(self._slots)))
+        self.tree.bind('<Next>', lambda e: self._on_key_move(len(self._slots)))
+        self.tree.bind('<Home>', lambda e: self._on_key_move(-len(self._view)))
+        self.tree.bind('<End>', lambda e: self._on_key_move(len(self._view)))
+
+    # ------------------------------------------------------------------
+    # البيانات
+    # ------------------------------------------------------------------
+    def set_rows(self, rows: Iterable[Sequence[Any]], tags: Optional[Sequence[tuple]] = None):
+        """تحميل الصفوف (تسلسلات بترتيب الأعمدة) وإعادة العرض من البداية"""
+        rows = list(rows)
+        width = len(self.columns)
+        if rows:
+            self._store = [list(column) for column in zip(*rows)][:width]
+        else:
+            self._store = [[] for _ in self.columns]
+        self._tags = [tuple(t) for t in tags] if tags is not None else [()] * len(rows)
+        self._view = list(range(len(rows)))
+        self._positions = None
+        self._lowered.clear()
+        self._indexes.clear()
+        self._selected = None
+        self._first = 0
+        self.refresh()
+
+    @property
+    def row_count(self) -> int:
+        return len(self._tags)
+
+    @property
+    def view(self) -> List[int]:
+        """أرقام الصفوف الظاهرة بترتيب العرض (لا تُعدل القائمة مباشرة)"""
+        return self._view
+
+    def set_view(self, rows: Optional[Iterable[int]] = None):
+        """تحديد الصفوف الظاهرة وترتيبها (None = كل الصفوف)"""
+        self._view = list(range(self.row_count)) if rows is None else list(rows)
+        self._positions = None
+        if self._selected is not None and self.position(self._selected) is None:
+            self._selected = None
+        self._first = 0
+        self.refresh()
+
+    def _col(self, column: Column) -> int:
+        return column if isinstance(column, int) else self._col_index[column]
+
+    def get_value(self, row: int, column: Column) -> Any:
+        return self._store[self._col(column)][row]
+
+    def get_row(self, row: int) -> tuple:
+        return tuple(values[row] for values in self._store)
+
+    def set_value(self, row: int, column: Column, value: Any):
+        """تعديل خلية في المكان (مع تحديث ذاكرة البحث والفهارس)"""
+        c = self._col(column)
+        old = self._store[c][row]
+        self._store[c][row] = value
+        if c in self._lowered:
+            self._lowered[c][row] = str(value).lower()
+        index = self._indexes.get(c)
+        if index is not None:
+            bucket = index.get(self._key(old))
+            if bucket and row in bucket:
+                bucket.remove(row)
+            index.setdefault(self._key(value), []).append(row)
+        self._render_row(row)
+
+    def get_tags(self, row: int) -> tuple:
+        return self._tags[row]
+
+    def set_tags(self, row: int, tags: Sequence[str]):
+        """وسوم الصف (تتقدم على التلوين المتناوب)"""
+        self._tags[row] = tuple(tags)
+        self._render_row(row)
+
+    def tag_configure(self, tag: str, **options):
+        self.tree.tag_configure(tag, **options)
+
+    # ------------------------------------------------------------------
+    # البحث
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _key(value: Any) -> str:
+        return str(value).strip()
+
+    def _lower_column(self, c: int) -> List[str]:
+        cache = self._lowered.get(c)
+        if cache is None:
+            cache = self._lowered[c] = [str(v).lower() for v in self._store[c]]
+        return cache
+
+    def _matcher(self, text: str, columns: Optional[Sequence[Column]]):
+        text = str(text).lower()
+        indices = [self._col(c) for c in columns] if columns else range(len(self.columns))
+        caches = [self._lower_column(c) for c in indices]
+        return lambda row: any(text in cache[row] for cache in caches)
+
+    def find(self, text: str, columns: Optional[Sequence[Column]] = None,
+             rows: Optional[Iterable[int]] = None) -> List[int]:
+        """الصفوف (من rows أو كل المخزن) التي يحتوي أحد أعمدتها على النص - دون حساسية للأحرف"""
+        match = self._matcher(text, columns)
+        candidates = range(self.row_count) if rows is None else rows
+        return [row for row in candidates if match(row)]
+
+    def find_next(self, text: str, columns: Optional[Sequence[Column]] = None) -> Optional[int]:
+        """أول صف ظاهر مطابق بعد الصف المحدد (مع الالتفاف للبداية)"""
+        n = len(self._view)
+        if not n:
+            return None
+        match = self._matcher(text, columns)
+        current = self.position(self._selected) if self._selected is not None else None
+        start = 0 if current is None else current + 1
+        for step in range(n):
+            row = self._view[(start + step) % n]
+            if match(row):
+                return row
+        return None
+
+    def lookup(self, column: Column, value: Any) -> List[int]:
+        """الصفوف التي تساوي قيمتها في العمود value تماماً (فهرس hash يُبنى عند أول استخدام)"""
+        c = self._col(column)
+        index = self._indexes.get(c)
+        if index is None:
+            index = {}
+            for row, cell in enumerate(self._store[c]):
+                index.setdefault(self._key(cell), []).append(row)
+            self._indexes[c] = index
+        return list(index.get(self._key(value), ()))
+
+    # ------------------------------------------------------------------
+    # التحديد والتنقل
+    # ------------------------------------------------------------------
+    def position(self, row: int) -> Optional[int]:
+        """موضع الصف في العرض الحالي (None إن كان مخفياً)"""
+        if self._positions is None:
+            self._positions = {r: pos for pos, r in enumerate(self._view)}
+        return self._positions.get(row)
+
+    @property
+    def selected_row(self) -> Optional[int]:
+        return self._selected
+
+    def select(self, row: Optional[int]):
+        """تحديد صف والتمرير إليه"""
+        self._selected = row
+        if row is not None:
+            self.see(row)
+        self._render()
+
+    def move_selection(self, delta: int, wrap: bool = False) -> Optional[int]:
+        """نقل التحديد delta صفاً في العرض وإرجاع الصف الجديد"""
+        n = len(self._view)
+        if not n:
+            return None
+        current = self.position(self._selected) if self._selected is not None else None
+        if current is None:
+            target = 0 if delta >= 0 else n - 1
+        elif wrap:
+            target = (current + delta) % n
+        else:
+            target = max(0, min(n - 1, current + delta))
+        row = self._view[target]
+        self.select(row)
+        return row
+
+    def see(self, row: int):
+        pos = self.position(row)
+        if pos is None:
+            return
+        slots = len(self._slots)
+        if pos < self._first:
+            self._scroll_to(pos)
+        elif pos >= self._first + slots:
+            self._scroll_to(pos - slots + 1)
+
+    def row_of_item(self, iid: str) -> Optional[int]:
+        """رقم الصف المعروض حالياً في عنصر الشجرة iid"""
+        try:
+            slot = self._slots.index(iid)
+        except ValueError:
+            return None
+        pos = self._first + slot
+        return self._view[pos] if slot < self._attached and pos < len(self._view) else None
+
+    def item_of_row(self, row: int) -> Optional[str]:
+        """عنصر الشجرة الذي يعرض الصف (None إن لم يكن ظاهراً)"""
+        pos = self.position(row)
+        if pos is None or not (self._first <= pos < self._first + self._attached):
+            return None
+        return self._slots[pos - self._first]
+
+    def row_at(self, y: int) -> Optional[int]:
+        return self.row_of_item(self.tree.identify_row(y))
+
+    def cell_bbox(self, row: int, column: str):
+        """إحداثيات الخلية (column بصيغة '#n' أو اسم العمود) إن كانت ظاهرة"""
+        iid = self.item_of_row(row)
+        return self.tree.bbox(iid, column) if iid else None
+
+    # ------------------------------------------------------------------
+    # التمرير والرسم
+    # ------------------------------------------------------------------
+    def yview(self, *args):
+        """أمر شريط التمرير العمودي"""
+        if not args:
+            return
+        n = len(self._view)
+        if args[0] == 'moveto':
+            self._scroll_to(int(float(args[1]) * n))
+        elif args[0] == 'scroll':
+            amount = int(args[1])
+            step = max(1, len(self._slots) - 1) if args[2] == 'pages' else 1
+            self._scroll_to(self._first + amount * step)
+
+    def _scroll_to(self, first: int):
+        first = max(0, min(first, max(0, len(self._view) - len(self._slots))))
+        if first != self._first:
+            self._first = first
+            self._render()
+
+    def refresh(self):
+        """إعادة رسم الصفوف الظاهرة (بعد تغيير البيانات أو الوسوم)"""
+        self._first = max(0, min(self._first, max(0, len(self._view) - len(self._slots))))
+        self._render()
+
+    def _row_tags(self, row: int, pos: int) -> tuple:
+        tags = self._tags[row]
+        if not tags and self.stripe_tags:
+            return (self.stripe_tags[pos % len(self.stripe_tags)],)
+        return tags
+
+    def _render(self):
+        visible = max(0, min(len(self._slots), len(self._view) - self._first))
+        selected_iid = None
+        for i in range(visible):
+            iid = self._slots[i]
+            pos = self._first + i
+            row = self._view[pos]
+            self.tree.item(iid, values=self.get_row(row), tags=self._row_tags(row, pos))
+            if row == self._selected:
+                selected_iid = iid
+        # إخفاء العناصر الزائدة عن البيانات وإعادة إظهارها عند الحاجة
+        if visible != self._attached:
+            for i in range(min(visible, self._attached), max(visible, self._attached)):
+                if i < visible:
+                    self.tree.move(self._slots[i], '', i)
+                else:
+                    self.tree.detach(self._slots[i])
+            self._attached = visible
+
+        if selected_iid:
+            self.tree.selection_set(selected_iid)
+            self.tree.focus(selected_iid)
+        elif self.tree.selection():
+            self.tree.selection_set(())
+        self._update_scrollbar()
+
+    def _render_row(self, row: int):
+        iid = self.item_of_row(row)
+        if iid:
+            pos = self.position(row)
+            self.tree.item(iid, values=self.get_row(row), tags=self._row_tags(row, pos))
+
+    def _update_scrollbar(self):
+        n = len(self._view)
+        if not n:
+            self.y_scrollbar.set(0, 1)
+        else:
+            self.y_scrollbar.set(self._first / n, min(1.0, (self._first + len(self._slots)) / n))
+
+    def _set_slot_count(self, count: int):
+        if count > len(self._slots):
+            for _ in range(count - len(self._slots)):
+                iid = self.tree.insert('', tk.END)
+                self.tree.detach(iid)
+                self._slots.append(iid)
+        elif count < len(self._slots):
+            self.tree.delete(*self._slots[count:])
+            del self._slots[count:]
+        self._attached = 0
+        for iid in self._slots:
+            self.tree.detach(iid)
+
+    def _row_height(self) -> int:
+        style = self.tree.cget('style') or 'Treeview'
+        try:
+            return int(ttk.Style(self).lookup(style, 'rowheight')) or self.DEFAULT_ROW_HEIGHT
+        except (ValueError, tk.TclError):
+            return self.DEFAULT_ROW_HEIGHT
+
+    def _header_height(self) -> int:
+        if self._attached:
+            bbox = self.tree.bbox(self._slots[0])
+            if bbox:
+                return bbox[1]
+        return self.DEFAULT_HEADER_HEIGHT
+
+    # ------------------------------------------------------------------
+    # الأحداث
+    # ------------------------------------------------------------------
+    def _on_configure(self, event):
+        count = max(1, (event.height - self._header_height()) // self._row_height())
+        if count != len(self._slots):
+            self._set_slot_count(count)
+            self.refresh()
+
+    def _on_click(self, event):
+        row = self.row_at(event.y)
+        if row is not None:
+            self._selected = row
+
+    def _on_wheel(self, event):
+        if getattr(event, 'num', None) == 4 or getattr(event, 'delta', 0) > 0:
+            self._scroll_to(self._first - self.WHEEL_UNITS)
+        else:
+            self._scroll_to(self._first + self.WHEEL_UNITS)
+        return 'break'
+
+    def _on_key_move(self, delta: int):
+        self.move_selection(delta)
+        return 'break'
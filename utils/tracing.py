@@ -0,0 +1,306 @@
+# utils/tracing.py
+"""
+تتبع أداء خفيف (spans) عبر طبقات المدراء والواجهة.
+
+- tracer.span(name) سياق لقياس جزء من الكود، و @traced للدوال.
+- @traced_class يسجل صنفاً ليُغلَّف (كل الدوال العامة أو ما يبدأ ببادئة مثل load_)
+  عند تفعيل التتبع فقط، ويُعاد للأصل عند إيقافه: تكلفة صفرية والتتبع معطل.
+- زمن SQL يُسجل منفصلاً عبر TracingCursor في database/connection.py.
+- آخر التتبعات في ذاكرة دائرية، وتُصدَّر بصيغة collapsed stacks (flame graph)
+  أو Chrome trace JSON (chrome://tracing أو Perfetto).
+
+ملاحظة: الأوامر المربوطة بدالة مرتبطة قبل التفعيل (مثل command=self.load_data في شاشة
+مفتوحة) لا تُتتبع حتى تُفتح الشاشة من جديد.
+"""
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from config.settings import TRACING_CONFIG
+
+logger = logging.getLogger(__name__)
+
+SQL = 'sql'
+CALL = 'call'
+
+
+class Span:
+    __slots__ = ('name', 'kind', 'start_ns', 'end_ns', 'children', 'attrs',
+                 'sql_ns', 'sql_count', 'thread_id', 'root', 'span_count')
+
+    def __init__(self, name, kind, start_ns, attrs=None, root=None):
+        self.name = name
+        self.kind = kind
+        self.start_ns = start_ns
+        self.end_ns = None
+        self.children: List['Span'] = []
+        self.attrs = attrs or {}
+        self.sql_ns = 0          # زمن SQL المنفذ مباشرة داخل هذا الـ span
+        self.sql_count = 0
+        self.thread_id = threading.get_ident()
+        self.root = root or self
+        self.span_count = 1      # يُستخدم في الجذر فقط
+
+    @property
+    def duration_ns(self) -> int:
+        return (self.end_ns or time.perf_counter_ns()) - self.start_ns
+
+    @property
+    def self_ns(self) -> int:
+        """الزمن الخاص (بدون الأبناء ولا SQL)"""
+        children = sum(c.duration_ns for c in self.children if c.kind != SQL)
+        return max(0, self.duration_ns - children - self.sql_ns)
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar('trace_span', default=None)
+
+
+class Tracer:
+    """جامع التتبعات - Thread-safe"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        cfg = dict(TRACING_CONFIG)
+        cfg.update(config or {})
+        self.enabled = False
+        self.max_spans = int(cfg.get('max_spans_per_trace', 5000))
+        self.max_sql_length = int(cfg.get('max_sql_length', 300))
+        self.export_dir = cfg.get('export_dir')
+        self.traces = deque(maxlen=int(cfg.get('buffer_size', 200)))
+        self._lock = threading.RLock()
+        self._registry: List[tuple] = []          # (cls, prefix)
+        self._originals: Dict[tuple, Any] = {}    # (cls, attr) -> الكائن الأصلي في __dict__
+
+    # ------------------------------------------------------------------
+    # التفعيل والإيقاف
+    # ------------------------------------------------------------------
+    def enable(self):
+        with self._lock:
+            if self.enabled:
+                return
+            for cls, prefix in self._registry:
+                self._instrument(cls, prefix)
+            self.enabled = True
+        logger.info(f"تم تفعيل التتبع ({len(self._registry)} صنف)")
+
+    def disable(self):
+        with self._lock:
+            if not self.enabled:
+                return
+            self.enabled = False
+            for (cls, attr), original in self._originals.items():
+                setattr(cls, attr, original)
+            self._originals.clear()
+        logger.info("تم إيقاف التتبع")
+
+    def set_enabled(self, enabled: bool):
+        self.enable() if enabled else self.disable()
+
+    def register(self, cls, prefix: Optional[str] = None):
+        with self._lock:
+            self._registry.append((cls, prefix))
+            if self.enabled:
+                self._instrument(cls, prefix)
+
+    def _instrument(self, cls, prefix):
+        for attr, raw in list(vars(cls).items()):
+            if attr.startswith('_') or (prefix and not attr.startswith(prefix)):
+                continue
+            if (cls, attr) in self._originals:
+                continue
+            name = f"{cls.__name__}.{attr}"
+            if isinstance(raw, staticmethod):
+                wrapped = staticmethod(self._wrap(raw.__func__, name))
+            elif isinstance(raw, classmethod):
+                wrapped = classmethod(self._wrap(raw.__func__, name))
+            elif callable(raw) and not isinstance(raw, type):
+                wrapped = self._wrap(raw, name)
+            else:
+                continue
+            self._originals[(cls, attr)] = raw
+            setattr(cls, attr, wrapped)
+
+    def _wrap(self, func, name):
+        tracer = self
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    # ------------------------------------------------------------------
+    # تسجيل الـ spans
+    # ------------------------------------------------------------------
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """قياس جزء من الكود كـ span متداخل (لا يفعل شيئاً والتتبع معطل)"""
+        if not self.enabled:
+            yield None
+            return
+
+        parent = _current_span.get()
+        span = Span(name, CALL, time.perf_counter_ns(), attrs, parent.root if parent else None)
+        if parent is not None:
+            parent.root.span_count += 1
+            parent.children.append(span)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.attrs['error'] = type(e).__name__
+            raise
+        finally:
+            span.end_ns = time.perf_counter_ns()
+            _current_span.reset(token)
+            if parent is None:
+                self.traces.append(span)
+
+    def record_sql(self, statement, start_ns: int, end_ns: int):
+        """تسجيل استعلام منفذ داخل الـ span الحالي (خارج أي span يُتجاهل)"""
+        parent = _current_span.get()
+        if parent is None:
+            return
+        parent.sql_ns += end_ns - start_ns
+        parent.sql_count += 1
+        root = parent.root
+        if root.span_count < self.max_spans:
+            root.span_count += 1
+            text = statement if isinstance(statement, str) else str(statement)
+            sql_span = Span(SQL, SQL, start_ns, {'statement': ' '.join(text.split())[:self.max_sql_length]}, root)
+            sql_span.end_ns = end_ns
+            parent.children.append(sql_span)
+
+    def clear(self):
+        self.traces.clear()
+
+    # ------------------------------------------------------------------
+    # التحليل والتصدير
+    # ------------------------------------------------------------------
+    def _snapshot(self) -> List[Span]:
+        return list(self.traces)
+
+    def summary(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """إجمالي الزمن وزمن SQL لكل اسم span عبر التتبعات المحفوظة"""
+        totals = defaultdict(lambda: {'calls': 0, 'total_ns': 0, 'self_ns': 0, 'sql_ns': 0, 'sql_count': 0})
+
+        def visit(span):
+            if span.kind == SQL:
+                return
+            t = totals[span.name]
+            t['calls'] += 1
+            t['total_ns'] += span.duration_ns
+            t['self_ns'] += span.self_ns
+            t['sql_ns'] += span.sql_ns
+            t['sql_count'] += span.sql_count
+            for child in span.children:
+                visit(child)
+
+        for trace in self._snapshot():
+            visit(trace)
+
+        rows = [{
+            'name': name,
+            'calls': t['calls'],
+            'total_ms': round(t['total_ns'] / 1e6, 2),
+            'self_ms': round(t['self_ns'] / 1e6, 2),
+            'sql_ms': round(t['sql_ns'] / 1e6, 2),
+            'sql_count': t['sql_count'],
+        } for name, t in totals.items()]
+        rows.sort(key=lambda r: r['total_ms'], reverse=True)
+        return rows[:limit]
+
+    def collapsed_stacks(self) -> str:
+        """صيغة collapsed stacks (سطر لكل مسار: "a;b;sql <ميكروثانية>") لأدوات flame graph"""
+        stacks = defaultdict(int)
+
+        def visit(span, path):
+            if span.kind == SQL:
+                return
+            path = f"{path};{span.name}" if path else span.name
+            stacks[path] += span.self_ns // 1000
+            if span.sql_ns:
+                stacks[f"{path};{SQL}"] += span.sql_ns // 1000
+            for child in span.children:
+                visit(child, path)
+
+        for trace in self._snapshot():
+            visit(trace, '')
+        return '\n'.join(f"{path} {us}" for path, us in sorted(stacks.items()) if us > 0)
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """أحداث Chrome trace (ph='X') بالميكروثانية"""
+        pid = os.getpid()
+        events = []
+
+        def visit(span):
+            args = dict(span.attrs)
+            if span.kind != SQL:
+                args.update(sql_ms=round(span.sql_ns / 1e6, 3), sql_count=span.sql_count)
+            events.append({
+                'name': span.name if span.kind != SQL else args.get('statement', SQL)[:60],
+                'cat': span.kind,
+                'ph': 'X',
+                'ts': span.start_ns / 1000,
+                'dur': span.duration_ns / 1000,
+                'pid': pid,
+                'tid': span.thread_id,
+                'args': args,
+            })
+            for child in span.children:
+                visit(child)
+
+        for trace in self._snapshot():
+            visit(trace)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export(self, fmt: str = 'collapsed', path: Optional[str] = None) -> str:
+        """حفظ التتبعات في ملف (collapsed أو chrome) وإرجاع مساره"""
+        if path is None:
+            os.makedirs(self.export_dir, exist_ok=True)
+            suffix = 'folded' if fmt == 'collapsed' else 'json'
+            path = os.path.join(self.export_dir, f"trace_{datetime.now():%Y%m%d_%H%M%S}.{suffix}")
+        with open(path, 'w', encoding='utf-8') as f:
+            if fmt == 'collapsed':
+                f.write(self.collapsed_stacks())
+            else:
+                json.dump(self.chrome_trace(), f, ensure_ascii=False)
+        logger.info(f"تم تصدير التتبع: {path}")
+        return path
+
+
+tracer = Tracer()
+
+
+def traced(name: Optional[str] = None):
+    """مزخرف لدالة مفردة (فحص سريع للتفعيل عند كل استدعاء)"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def traced_class(cls=None, *, prefix: Optional[str] = None):
+    """تسجيل صنف للتتبع: @traced_class لكل الدوال العامة أو @traced_class(prefix='load_')"""
+    def decorator(klass):
+        tracer.register(klass, prefix)
+        return klass
+    return decorator(cls) if cls is not None else decorator
+
+
+if TRACING_CONFIG.get('enabled'):
+    tracer.enable()